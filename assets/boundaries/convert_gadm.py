@@ -4,8 +4,21 @@ Convert GADM GeoJSON to vn_boundaries.json format
 GADM 4.1 has 63 separate provinces (pre-merge data)
 """
 import json
+import os
+import sys
 from datetime import datetime
 
+# Dùng chung module xử lý geometry trong tools/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'tools'))
+# gadm_levels chỉ cần thư viện chuẩn (geometry_bbox: numpy nếu có, không thì Python thuần)
+from gadm_levels import geometry_bbox, iter_features, normalize_name
+try:
+    from geo_simplify import write_boundary_lods
+    from geo_binary import write_geo_binary, binary_path
+except ImportError: # Thiếu numpy -> không ghi file LOD / nhị phân
+    write_boundary_lods = None
+    write_geo_binary = None
+
 # Name mapping từ GADM (không dấu, viết liền) sang tên chuẩn tiếng Việt
 NAME_MAP = {
     'AnGiang': 'An Giang',
@@ -74,48 +87,13 @@ NAME_MAP = {
     'YênBái': 'Yên Bái',
 }
 
-def calculate_bbox(geometry):
-    """Tính bounding box từ geometry coordinates"""
-    min_lat, max_lat = 90, -90
-    min_lng, max_lng = 180, -180
-    
-    geo_type = geometry.get('type', '')
-    coords = geometry.get('coordinates', [])
-    
-    def process_ring(ring):
-        nonlocal min_lat, max_lat, min_lng, max_lng
-        for point in ring:
-            lng, lat = point[0], point[1]
-            min_lat = min(min_lat, lat)
-            max_lat = max(max_lat, lat)
-            min_lng = min(min_lng, lng)
-            max_lng = max(max_lng, lng)
-    
-    if geo_type == 'Polygon':
-        for ring in coords:
-            process_ring(ring)
-    elif geo_type == 'MultiPolygon':
-        for polygon in coords:
-            for ring in polygon:
-                process_ring(ring)
-    
-    return [min_lat, min_lng, max_lat, max_lng]
-
 def convert_gadm():
-    # Load GADM country data (quốc gia)
-    with open('gadm_vietnam_country.json', 'r', encoding='utf-8') as f:
-        country_data = json.load(f)
-    
-    # Load GADM provinces data (63 tỉnh/thành)
-    with open('gadm_vietnam_provinces.json', 'r', encoding='utf-8') as f:
-        gadm = json.load(f)
-    
     features = []
     
-    # Thêm dữ liệu quốc gia Việt Nam trước
-    for feat in country_data.get('features', []):
+    # Thêm dữ liệu quốc gia Việt Nam trước (đọc streaming từng feature, không nạp cả file)
+    for feat in iter_features('gadm_vietnam_country.json'):
         geometry = feat.get('geometry', {})
-        bbox = calculate_bbox(geometry)
+        bbox = geometry_bbox(geometry)
         
         features.append({
             'name': 'Việt Nam',
@@ -127,15 +105,15 @@ def convert_gadm():
         print(f"  Vietnam (country) (bbox: {bbox[0]:.2f},{bbox[1]:.2f} - {bbox[2]:.2f},{bbox[3]:.2f})")
     
     # Thêm dữ liệu 63 tỉnh/thành
-    for feat in gadm.get('features', []):
+    for feat in iter_features('gadm_vietnam_provinces.json'):
         props = feat.get('properties', {})
         gadm_name = props.get('NAME_1', '')
         
-        # Map to Vietnamese name
-        vn_name = NAME_MAP.get(gadm_name, gadm_name)
+        # Map to Vietnamese name (tên lạ: tách chữ dính liền theo quy tắc chung)
+        vn_name = NAME_MAP.get(gadm_name) or normalize_name(gadm_name)
         
         geometry = feat.get('geometry', {})
-        bbox = calculate_bbox(geometry)
+        bbox = geometry_bbox(geometry)
         
         features.append({
             'name': vn_name,
@@ -165,6 +143,18 @@ def convert_gadm():
     print(f"\n✓ Đã chuyển đổi {len(features)} tỉnh/thành")
     print("  File: vn_boundaries.json")
 
+    # Ghi thêm bản nhị phân (tọa độ lượng tử hóa + delta, đọc bằng mmap)
+    if write_geo_binary is not None:
+        write_geo_binary(output, binary_path('vn_boundaries.json'))
+        print(f"  File: {binary_path('vn_boundaries.json')}")
+
+    # Ghi thêm các mức LOD (simplify theo dải zoom, giữ topology giữa các tỉnh)
+    if write_boundary_lods is not None:
+        print("\nTạo các mức LOD...")
+        write_boundary_lods(output, 'vn_boundaries.json')
+    else:
+        print("⚠️ Chưa cài numpy -> bỏ qua file LOD (pip install numpy)")
+
 if __name__ == "__main__":
     print("Chuyển đổi GADM → vn_boundaries.json")
     print("=" * 50)
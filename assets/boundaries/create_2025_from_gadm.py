@@ -1,12 +1,28 @@
 #!/usr/bin/env python3
 """
 Tạo dữ liệu ranh giới 2025 (34 tỉnh sau sáp nhập) từ GADM smoothed data
+Cần shapely (kéo theo numpy) -> các module geometry trong tools/ luôn dùng được
 """
+import argparse
+import concurrent.futures
+import hashlib
 import json
+import os
+import sys
+import time
 from datetime import datetime
+
+import shapely
 from shapely.geometry import shape, mapping
 from shapely.ops import unary_union
 
+# Dùng chung module xử lý geometry trong tools/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'tools'))
+from geo_arrays import geometry_bbox, iter_parts
+from geo_simplify import write_boundary_lods
+from geo_binary import write_geo_binary, binary_path
+from geo_topojson import write_topology, topology_stats, TOPOLOGY_FILE
+
 # Quy hoạch sáp nhập 2025 (Theo Nghị quyết Quốc hội chính thức - 34 đơn vị)
 # I- 11 tỉnh/TP KHÔNG sáp nhập: Hà Nội, Huế, Lai Châu, Điện Biên, Sơn La, Lạng Sơn, Quảng Ninh, Thanh Hóa, Nghệ An, Hà Tĩnh, Cao Bằng
 # II- 23 tỉnh/TP SAU sáp nhập
@@ -51,62 +67,138 @@ MERGE_2025 = {
     'Tỉnh An Giang': ['An Giang', 'Kiên Giang'],                      # 23. An Giang + Kiên Giang
 }
 
-def calculate_bbox(geometry):
-    """Tính bounding box từ geometry coordinates"""
-    min_lat, max_lat = 90, -90
-    min_lng, max_lng = 180, -180
-    
-    geo_type = geometry.get('type', '')
-    coords = geometry.get('coordinates', [])
-    
-    def process_ring(ring):
-        nonlocal min_lat, max_lat, min_lng, max_lng
-        for point in ring:
-            if isinstance(point, (list, tuple)) and len(point) >= 2:
-                lng, lat = point[0], point[1]
-                min_lat = min(min_lat, lat)
-                max_lat = max(max_lat, lat)
-                min_lng = min(min_lng, lng)
-                max_lng = max(max_lng, lng)
-    
-    if geo_type == 'Polygon':
-        for ring in coords:
-            process_ring(ring)
-    elif geo_type == 'MultiPolygon':
-        for polygon in coords:
-            for ring in polygon:
-                process_ring(ring)
-    
-    return [round(min_lat, 4), round(min_lng, 4), round(max_lat, 4), round(max_lng, 4)]
+def province_2025_map(merge=MERGE_2025):
+    """Tên tỉnh cũ (như trong vn_boundaries.json) -> tên đơn vị 2025"""
+    return {old: new for new, olds in merge.items() for old in olds}
+
+def rollup_2025(units, merge=MERGE_2025):
+    """Gom đơn vị cấp dưới (quận/huyện, xã/phường) lên tỉnh 2025 theo tỉnh cũ chứa chúng.
+    units: [(mã đơn vị, tên tỉnh cũ)] -> ({tên 2025: [mã...]}, [mã không thuộc nhóm nào])"""
+    old_to_new = province_2025_map(merge)
+    groups = {new: [] for new in merge}
+    unplaced = []
+    for unit, old_name in units:
+        new = old_to_new.get(old_name)
+        if new is None:
+            unplaced.append(unit)
+        else:
+            groups[new].append(unit)
+    return groups, unplaced
+
+# Cache kết quả gộp theo hash geometry đầu vào: sửa 1 nhóm -> chỉ gộp lại nhóm đó
+DISSOLVE_CACHE_DIR = '.dissolve_cache'
+DISSOLVE_VERSION = 1 # Tăng khi đổi thuật toán gộp/sửa lỗi -> bỏ toàn bộ cache cũ
+
+def repair_geometry(geom):
+    """Sửa polygon không hợp lệ (tự cắt, vòng xoắn...) trước khi union.
+    Trả về (geometry, lý do lỗi hoặc None nếu vốn đã hợp lệ)"""
+    if geom.is_valid:
+        return geom, None
+    reason = shapely.is_valid_reason(geom)
+    fixed = shapely.make_valid(geom)
+    if fixed.geom_type == 'GeometryCollection': # make_valid có thể sinh thêm cạnh/điểm thừa
+        fixed = unary_union([g for g in fixed.geoms if g.geom_type in ('Polygon', 'MultiPolygon')])
+    if not fixed.is_valid:
+        fixed = fixed.buffer(0)
+    return fixed, reason
 
 def merge_geometries(geometries):
-    """Gộp và xóa đường biên giới chung giữa các geometry bằng Shapely"""
+    """Gộp và xóa đường biên giới chung giữa các geometry bằng Shapely.
+    Geometry lỗi được sửa trước, nên union không bao giờ phải lùi về ghép nối đơn thuần
+    (vẫn giữ biên giới trong). Trả về (GeoJSON, danh sách lỗi đã sửa)"""
+    repairs = []
+    shapely_geoms = []
+    for i, g in enumerate(geometries):
+        geom, reason = repair_geometry(shape(g))
+        if reason:
+            repairs.append(f"#{i}: {reason}")
+        shapely_geoms.append(geom)
+    merged = unary_union(shapely_geoms)
+    merged, reason = repair_geometry(merged)
+    if reason:
+        repairs.append(f"union: {reason}")
+    return mapping(merged), repairs
+
+def dissolve_group(task):
+    """Worker: gộp 1 nhóm sáp nhập -> (tên mới, GeoJSON, số giây, lỗi đã sửa)"""
+    new_name, geometries = task
+    start = time.perf_counter()
+    merged, repairs = merge_geometries(geometries)
+    # Về list thuần để kết quả mới và kết quả đọc từ cache giống hệt nhau
+    merged = json.loads(json.dumps(merged))
+    return new_name, merged, time.perf_counter() - start, repairs
+
+def dissolve_key(geometries):
+    """Key cache = hash geometry đầu vào (+ phiên bản GEOS, vì kết quả union phụ thuộc GEOS)"""
+    raw = json.dumps([DISSOLVE_VERSION, shapely.geos_version_string, geometries],
+                     separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:20]
+
+def _vertex_count(geometries):
+    return sum(len(part) for g in geometries for part in iter_parts(g))
+
+def dissolve_groups(groups, workers=None, cache_dir=DISSOLVE_CACHE_DIR):
+    """Gộp các nhóm {tên mới: [geometry]} song song, có cache theo hash geometry đầu vào.
+    Sửa 1 nhóm trong MERGE_2025 -> chỉ nhóm đó phải gộp lại.
+    Trả về {tên mới: {'geometry', 'seconds', 'cached', 'repairs'}}"""
+    results = {}
+    tasks = []
+    keys = {}
+    if cache_dir and not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    for new_name, geometries in groups.items():
+        keys[new_name] = key = dissolve_key(geometries)
+        path = os.path.join(cache_dir, f"{key}.json") if cache_dir else None
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            results[new_name] = {'geometry': cached['geometry'], 'seconds': 0.0,
+                                 'cached': True, 'repairs': cached['repairs']}
+        else:
+            tasks.append((new_name, geometries))
+
+    # Nhóm lớn chạy trước để các process kết thúc gần cùng lúc
+    tasks.sort(key=lambda t: _vertex_count(t[1]), reverse=True)
+    workers = min(workers or os.cpu_count() or 1, max(len(tasks), 1))
+    if workers <= 1:
+        done = map(dissolve_group, tasks)
+    else:
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+        done = (f.result() for f in concurrent.futures.as_completed(
+            [executor.submit(dissolve_group, t) for t in tasks]))
     try:
-        # Convert GeoJSON dicts to Shapely objects
-        shapely_geoms = [shape(g) for g in geometries]
-        
-        # Perform union (dissolve)
-        merged = unary_union(shapely_geoms)
-        
-        # Convert back to GeoJSON dict
-        return mapping(merged)
-    except Exception as e:
-        print(f"  ❌ Lỗi khi gộp geometry: {e}")
-        # Fallback to simple concatenation if shapely fails
-        all_polygons = []
-        for geom in geometries:
-            geo_type = geom.get('type', '')
-            coords = geom.get('coordinates', [])
-            if geo_type == 'Polygon':
-                all_polygons.append(coords)
-            elif geo_type == 'MultiPolygon':
-                all_polygons.extend(coords)
-        return {
-            'type': 'MultiPolygon',
-            'coordinates': all_polygons
-        }
-
-def create_2025_boundaries():
+        for new_name, merged, seconds, repairs in done:
+            results[new_name] = {'geometry': merged, 'seconds': seconds,
+                                 'cached': False, 'repairs': repairs}
+            if cache_dir:
+                path = os.path.join(cache_dir, f"{keys[new_name]}.json")
+                with open(path + '.part', 'w', encoding='utf-8') as f:
+                    json.dump({'geometry': merged, 'repairs': repairs}, f, ensure_ascii=False)
+                os.replace(path + '.part', path)
+    finally:
+        if workers > 1:
+            executor.shutdown()
+
+    # Xóa kết quả cũ không còn nhóm nào dùng (nhóm đã bị sửa trong MERGE_2025)
+    if cache_dir:
+        used = {f"{key}.json" for key in keys.values()}
+        for name in os.listdir(cache_dir):
+            if name.endswith('.json') and name not in used:
+                os.remove(os.path.join(cache_dir, name))
+    return results
+
+def print_dissolve_timing(results, wall_seconds):
+    """Bảng thời gian gộp của từng nhóm (chậm nhất trước)"""
+    print("\n⏱️  Thời gian gộp từng nhóm:")
+    for new_name, r in sorted(results.items(), key=lambda kv: -kv[1]['seconds']):
+        status = 'cache' if r['cached'] else f"{r['seconds']:.2f}s"
+        print(f"  {new_name:<28} {status:>8}")
+    computed = [r['seconds'] for r in results.values() if not r['cached']]
+    cached = len(results) - len(computed)
+    print(f"  Tổng: {len(computed)} nhóm gộp lại ({sum(computed):.2f}s CPU), "
+          f"{cached} nhóm từ cache, thời gian thực {wall_seconds:.2f}s")
+
+def create_2025_boundaries(workers=None, cache_dir=DISSOLVE_CACHE_DIR):
     # Load dữ liệu từ vn_boundaries.json (đã smoothed)
     with open('vn_boundaries.json', 'r', encoding='utf-8') as f:
         data = json.load(f)
@@ -126,7 +218,7 @@ def create_2025_boundaries():
     
     # Thêm quốc gia Việt Nam trước
     if country_geom:
-        bbox = calculate_bbox(country_geom)
+        bbox = geometry_bbox(country_geom, 4)
         features.append({
             'name': 'Việt Nam',
             'type': 'country',
@@ -138,6 +230,7 @@ def create_2025_boundaries():
     
     # Xử lý từng tỉnh/nhóm sáp nhập
     processed = set()
+    groups = {}
     
     for new_name, old_names in MERGE_2025.items():
         geometries = []
@@ -152,14 +245,21 @@ def create_2025_boundaries():
         if not geometries:
             print(f"  ⚠️ Không tìm thấy: {new_name} (cần: {old_names})")
             continue
-        
-        # Gộp geometry nếu có nhiều tỉnh
+        groups[new_name] = (found, geometries)
+    
+    # Gộp các nhóm nhiều tỉnh song song (có cache), tỉnh giữ nguyên thì dùng luôn geometry cũ
+    start = time.perf_counter()
+    dissolved = dissolve_groups({name: geometries for name, (found, geometries) in groups.items()
+                                 if len(geometries) > 1}, workers, cache_dir)
+    dissolve_seconds = time.perf_counter() - start
+    
+    for new_name, (found, geometries) in groups.items():
         if len(geometries) == 1:
             merged_geom = geometries[0]
         else:
-            merged_geom = merge_geometries(geometries)
+            merged_geom = dissolved[new_name]['geometry']
         
-        bbox = calculate_bbox(merged_geom)
+        bbox = geometry_bbox(merged_geom, 4)
         
         features.append({
             'name': new_name,
@@ -172,13 +272,18 @@ def create_2025_boundaries():
         
         if len(found) > 1:
             print(f"  ✅ {new_name} (gộp từ: {', '.join(found)})")
+            for repair in dissolved[new_name]['repairs']:
+                print(f"     🔧 Đã sửa geometry lỗi {repair}")
         else:
             print(f"  ✅ {new_name}")
     
+    if dissolved:
+        print_dissolve_timing(dissolved, dissolve_seconds)
+    
     # Xử lý các tỉnh còn lại chưa có trong danh sách
     for name, geom in province_map.items():
         if name not in processed:
-            bbox = calculate_bbox(geom)
+            bbox = geometry_bbox(geom, 4)
             features.append({
                 'name': name,
                 'type': 'province',
@@ -208,7 +313,26 @@ def create_2025_boundaries():
     print(f"\n✓ Đã tạo {len(features)} ranh giới ({province_count} tỉnh/thành)")
     print("  File: vn_boundaries_2025.json")
 
+    # Ghi thêm bản nhị phân (tọa độ lượng tử hóa + delta, đọc bằng mmap)
+    write_geo_binary(output, binary_path('vn_boundaries_2025.json'))
+    print(f"  File: {binary_path('vn_boundaries_2025.json')}")
+
+    # Ghi thêm các mức LOD (simplify theo dải zoom, giữ topology giữa các tỉnh)
+    print("\nTạo các mức LOD...")
+    write_boundary_lods(output, 'vn_boundaries_2025.json')
+
+    # Gom bộ 63 tỉnh + bộ 2025 vào 1 file TopoJSON: mỗi đoạn biên dùng chung lưu 1 lần
+    topo = write_topology(['vn_boundaries.json', 'vn_boundaries_2025.json'], TOPOLOGY_FILE,
+                          outputs={'vn_boundaries.json': data, 'vn_boundaries_2025.json': output})
+    stats = topology_stats(topo)
+    print(f"\nTopoJSON: {stats['arcs']} arc, {stats['shared_arcs']} arc dùng chung giữa 2 bộ, "
+          f"{os.path.getsize(TOPOLOGY_FILE) / 1024:.0f} KB → {TOPOLOGY_FILE}")
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tạo ranh giới 2025 (34 tỉnh) từ vn_boundaries.json")
+    parser.add_argument('--workers', type=int, default=None, help="Số process gộp (mặc định: số CPU)")
+    parser.add_argument('--no-cache', action='store_true', help="Gộp lại mọi nhóm, không dùng cache")
+    args = parser.parse_args()
     print("Tạo dữ liệu ranh giới 2025 từ GADM smoothed")
     print("=" * 50)
-    create_2025_boundaries()
+    create_2025_boundaries(args.workers, None if args.no_cache else DISSOLVE_CACHE_DIR)
@@ -0,0 +1,209 @@
+"""
+So sánh tốc độ các phép tính geometry: vòng lặp Python cũ vs numpy (geo_arrays.py).
+
+Dùng:
+    python tools/bench_geometry.py                                  # dữ liệu đường full + ranh giới
+    python tools/bench_geometry.py --roads path/to/vn_roads_full.json
+    python tools/bench_geometry.py --synthetic 100000               # khi chưa tải dữ liệu đường
+"""
+import argparse
+import json
+import math
+import os
+import random
+import time
+
+import numpy as np
+
+from geo_arrays import (EARTH_RADIUS_M, lines_array, array_bbox, group_bboxes, geometry_array,
+                        geometry_bbox, part_lengths)
+
+ROADS_FILE = 'assets/roads/vn_roads_full.json'
+BOUNDARIES_FILE = 'assets/boundaries/vn_boundaries.json'
+
+
+# --- Bản Python thuần (giống các hàm trước khi chuyển sang numpy) ---
+
+def py_segments_bbox(segments):
+    min_lat, min_lon = 90.0, 180.0
+    max_lat, max_lon = -90.0, -180.0
+    for seg in segments:
+        for p in seg:
+            lon, lat = p
+            if lat < min_lat: min_lat = lat
+            if lat > max_lat: max_lat = lat
+            if lon < min_lon: min_lon = lon
+            if lon > max_lon: max_lon = lon
+    return [min_lat, min_lon, max_lat, max_lon]
+
+
+def py_geometry_bbox(geometry):
+    min_lat, max_lat = 90, -90
+    min_lng, max_lng = 180, -180
+    coords = geometry.get('coordinates', [])
+    rings = coords if geometry.get('type') == 'Polygon' else [r for poly in coords for r in poly]
+    for ring in rings:
+        for point in ring:
+            lng, lat = point[0], point[1]
+            min_lat = min(min_lat, lat)
+            max_lat = max(max_lat, lat)
+            min_lng = min(min_lng, lng)
+            max_lng = max(max_lng, lng)
+    return [min_lat, min_lng, max_lat, max_lng]
+
+
+def py_length(segments):
+    total = 0.0
+    for seg in segments:
+        for (lon1, lat1), (lon2, lat2) in zip(seg, seg[1:]):
+            p1, p2 = math.radians(lat1), math.radians(lat2)
+            dp, dl = p2 - p1, math.radians(lon2 - lon1)
+            a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+            total += 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+    return total
+
+
+# --- Dữ liệu ---
+
+def load_features(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f).get('features', [])
+
+
+def synthetic_roads(count, seed=0):
+    """Đường giả lập: phân bố số đoạn/điểm gần giống dữ liệu OSM (nhiều đường ngắn, ít đường rất dài)"""
+    rng = random.Random(seed)
+    features = []
+    for _ in range(count):
+        segments = []
+        for _ in range(min(1 + int(rng.expovariate(0.5)), 40)):
+            lon, lat = rng.uniform(102.5, 109.0), rng.uniform(8.5, 23.0)
+            seg = []
+            for _ in range(min(2 + int(rng.expovariate(0.05)), 2000)):
+                lon += rng.uniform(-1e-3, 1e-3)
+                lat += rng.uniform(-1e-3, 1e-3)
+                seg.append([lon, lat])
+            segments.append(seg)
+        features.append({'geometry': {'type': 'MultiLineString', 'coordinates': segments}})
+    return features
+
+
+def timed(fn, items):
+    start = time.perf_counter()
+    result = [fn(item) for item in items]
+    return time.perf_counter() - start, result
+
+
+def report(name, items, py_fn, np_fn, check):
+    py_time, py_result = timed(py_fn, items)
+    np_time, np_result = timed(np_fn, items)
+    ok = all(check(a, b) for a, b in zip(py_result, np_result))
+    print(f"  {name:<28} python {py_time:8.3f}s   numpy {np_time:8.3f}s   "
+          f"x{py_time / max(np_time, 1e-9):5.1f}   {'✅' if ok else '❌ lệch kết quả'}")
+    return {'name': name, 'python_s': py_time, 'numpy_s': np_time, 'match': ok}
+
+
+def same_bbox(a, b):
+    return np.allclose(a, b)
+
+
+def bench_roads(features, batch_vertices=500_000):
+    segments = [f['geometry']['coordinates'] for f in features]
+    vertices = sum(len(seg) for segs in segments for seg in segs)
+    print(f"Đường: {len(features)} feature, {vertices} điểm")
+
+    # Lô giống write_roads_json (LOD_BATCH_VERTICES)
+    batches, current, count = [], [], 0
+    for segs in segments:
+        current.append(segs)
+        count += sum(len(seg) for seg in segs)
+        if count >= batch_vertices:
+            batches.append(current)
+            current, count = [], 0
+    if current:
+        batches.append(current)
+
+    def old_batch(batch):
+        # Trước: bbox từng feature bằng Python + dựng mảng riêng cho simplify
+        bboxes = [py_segments_bbox(segs) for segs in batch]
+        lines = [seg for segs in batch for seg in segs]
+        arr = np.array([p for line in lines for p in line], dtype=np.float64).reshape(-1, 2)
+        return bboxes, arr
+
+    def new_batch(batch):
+        # Sau: chuyển sang numpy 1 lần, bbox lấy từ chính mảng đó
+        lines = [seg for segs in batch for seg in segs]
+        coords, offsets = lines_array(lines)
+        road_parts = np.cumsum([0] + [len(segs) for segs in batch])
+        return group_bboxes(coords, offsets[road_parts]).tolist(), coords
+
+    results = [
+        report("bbox + mảng simplify (lô)", batches, old_batch, new_batch,
+               lambda a, b: np.allclose(a[0], b[0]) and np.array_equal(a[1], b[1])),
+        report("chiều dài (lô)", batches,
+               lambda batch: [py_length(segs) for segs in batch],
+               lambda batch: lengths_per_road(batch),
+               lambda a, b: np.allclose(a, b, rtol=1e-9, atol=1e-6)),
+        # Từng feature riêng lẻ: chi phí dựng mảng lớn hơn phần tính -> Python thuần vẫn nhanh hơn
+        report("bbox (từng feature)", segments, py_segments_bbox,
+               lambda segs: array_bbox(lines_array(segs)[0]), same_bbox),
+    ]
+    return results
+
+
+def lengths_per_road(batch):
+    lines = [seg for segs in batch for seg in segs]
+    coords, offsets = lines_array(lines)
+    per_line = np.concatenate([[0.0], np.cumsum(part_lengths(coords, offsets))])
+    road_parts = np.cumsum([0] + [len(segs) for segs in batch])
+    return np.diff(per_line[road_parts])
+
+
+def bench_overpass(features, limit=200000):
+    """Chuyển geometry Overpass ({'lat','lon'}) -> [lon, lat]: list comprehension vs numpy.
+    Chunk tạm là JSON nên cần list Python; phải đọc từng dict nên numpy không nhanh hơn."""
+    ways = [[{'lat': lat, 'lon': lon} for lon, lat in seg]
+            for f in features for seg in f['geometry']['coordinates']][:limit]
+    def numpy_convert(way):
+        flat = np.fromiter((v for p in way for v in (p['lon'], p['lat'])), dtype=np.float64)
+        return flat.reshape(-1, 2).tolist()
+    return [report("Overpass -> [lon, lat]", ways,
+                   lambda way: [[p['lon'], p['lat']] for p in way], numpy_convert, list.__eq__)]
+
+
+def bench_boundaries(features):
+    vertices = sum(len(geometry_array(f['geometry'])[0]) for f in features)
+    print(f"Ranh giới: {len(features)} feature, {vertices} điểm")
+    geometries = [f['geometry'] for f in features]
+    return [report("bbox ranh giới", geometries, py_geometry_bbox, geometry_bbox, same_bbox)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark geometry: Python thuần vs numpy")
+    parser.add_argument('--roads', default=ROADS_FILE)
+    parser.add_argument('--boundaries', default=BOUNDARIES_FILE)
+    parser.add_argument('--synthetic', type=int, default=0,
+                        help="Dùng N đường giả lập thay cho file đường")
+    parser.add_argument('--output', help="Ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    results = []
+    if args.synthetic or not os.path.exists(args.roads):
+        if not args.synthetic:
+            print(f"⚠️ Không thấy {args.roads} -> dùng 50000 đường giả lập")
+        roads = synthetic_roads(args.synthetic or 50000)
+    else:
+        roads = load_features(args.roads)
+    results += bench_roads(roads)
+    results += bench_overpass(roads)
+    if os.path.exists(args.boundaries):
+        results += bench_boundaries(load_features(args.boundaries))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"✅ Đã ghi kết quả → {args.output}")
+
+
+if __name__ == '__main__':
+    main()
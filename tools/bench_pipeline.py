@@ -0,0 +1,551 @@
+"""
+Benchmark toàn bộ pipeline dữ liệu địa lý trên dữ liệu giả lập (chạy offline hoàn toàn).
+
+Bộ sinh dữ liệu:
+    synthetic_tiles      payload Overpass `out geom` theo từng ô 0.5°: đường nhiều way nối
+                         đầu-cuối, tên/ref dùng chung giữa các ô, way vắt biên bị 2 ô trả về
+    synthetic_provinces  FeatureCollection kiểu GADM: lưới tỉnh có biên răng cưa dùng chung
+Quy mô (SCALES): tile (1 ô) -> region (4x4 ô) -> country (toàn bộ VN_BOUNDS, 512 ô).
+
+Mỗi benchmark đo: thời gian (tốt nhất / trung bình của --repeat lần), thông lượng
+(đơn vị/giây) và bộ nhớ đỉnh (tracemalloc, 1 lần chạy riêng để không làm chậm phép đo giờ).
+Kết quả ghi ra JSON để so sánh 2 lần chạy bằng lệnh compare.
+
+Dùng:
+    python tools/bench_pipeline.py run --scale region -o bench_region.json
+    python tools/bench_pipeline.py run --scale country --repeat 1 --only end_to_end
+    python tools/bench_pipeline.py compare bench_old.json bench_new.json --threshold 0.1
+    python tools/bench_pipeline.py generate --scale tile --out /tmp/synthetic
+    python tools/bench_pipeline.py model --scale country
+Lệnh model so 2 cách giữ toàn bộ đường trong RAM (dict list lồng nhau / RoadCollection),
+mỗi cách chạy trong 1 process riêng để đo RSS đỉnh thật (ru_maxrss).
+"""
+import argparse
+import concurrent.futures
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import download_vn_roads_full as dl
+from geo_arrays import lines_array, group_bboxes, geometry_bbox
+from geo_binary import GeoBinaryWriter
+from road_collection import RoadCollection, render_features
+from run_metrics import current_rss_mb
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'assets', 'boundaries'))
+try:
+    from create_2025_from_gadm import merge_geometries
+except ImportError: # Thiếu shapely -> bỏ qua benchmark gộp tỉnh
+    merge_geometries = None
+
+TILE_SIZE = 0.5 # độ, giống ô Overpass mặc định
+SCALES = {
+    # tiles: (số hàng, số cột) ô tính từ góc tây nam VN_BOUNDS; provinces: lưới tỉnh
+    'tile': {'tiles': (1, 1), 'provinces': (2, 2)},
+    'region': {'tiles': (4, 4), 'provinces': (4, 4)},
+    'country': {'tiles': (32, 16), 'provinces': (9, 7)}, # 63 tỉnh
+}
+WAYS_PER_TILE = 300
+EDGE_VERTICES = 200 # Số điểm trên mỗi cạnh biên tỉnh
+DUPLICATE_RATE = 0.05 # Tỉ lệ way vắt biên (ô kế tiếp trả về lại)
+NAMES = 3000 # Số tên đường khác nhau (dùng chung cho mọi ô -> có đường trải qua nhiều chunk)
+HIGHWAYS = ['motorway', 'trunk', 'primary', 'secondary', 'tertiary', 'unclassified', 'residential']
+REPEAT = 3
+MODELS = ('nested', 'collection') # dict {key: ways} (merge_processed_data) / RoadCollection
+STAGE_ORDER = ['json_loads', 'process_elements', 'merge_processed_data', 'feature_bbox_python',
+               'feature_bbox_numpy', 'geometry_bbox', 'merge_geometries', 'serialize_json',
+               'serialize_all', 'end_to_end']
+
+
+# --- DỮ LIỆU GIẢ LẬP ---
+
+def tile_grid(scale):
+    """Danh sách bbox (south, west, north, east) các ô của quy mô"""
+    rows, cols = SCALES[scale]['tiles']
+    south, west = dl.VN_BOUNDS[0], dl.VN_BOUNDS[1]
+    return [(south + r * TILE_SIZE, west + c * TILE_SIZE, south + (r + 1) * TILE_SIZE, west + (c + 1) * TILE_SIZE)
+            for r in range(rows) for c in range(cols)]
+
+
+def _road_tags(rng):
+    tags = {'highway': rng.choice(HIGHWAYS)}
+    if rng.random() < 0.9:
+        tags['name'] = f"Đường {rng.randrange(NAMES)}"
+    if rng.random() < 0.2 or 'name' not in tags:
+        tags['ref'] = f"QL{rng.randint(1, 60)}"
+    return tags
+
+
+def tile_elements(bbox, index, ways_per_tile, rng, carry):
+    """Elements Overpass của 1 ô. Mỗi con đường là chuỗi way nối đầu-cuối (chung node),
+    carry: way vắt biên từ ô trước (trả về lại ở ô này, giống Overpass)"""
+    south, west, north, east = bbox
+    elements = list(carry)
+    way_id = index * 10_000_000
+    node_id = index * 100_000_000
+    while len(elements) < ways_per_tile:
+        tags = _road_tags(rng)
+        lat, lon = rng.uniform(south, north), rng.uniform(west, east)
+        heading = rng.uniform(-1, 1), rng.uniform(-1, 1)
+        node_id += 1
+        for _ in range(rng.randint(1, 8)):
+            # Way sau bắt đầu đúng tại node cuối của way trước
+            geometry, nodes = [{'lat': round(lat, 7), 'lon': round(lon, 7)}], [node_id]
+            for _ in range(rng.randint(1, 29)):
+                lat += heading[1] * 2e-4 + rng.uniform(-1e-4, 1e-4)
+                lon += heading[0] * 2e-4 + rng.uniform(-1e-4, 1e-4)
+                node_id += 1
+                geometry.append({'lat': round(lat, 7), 'lon': round(lon, 7)})
+                nodes.append(node_id)
+            way_id += 1
+            elements.append({'type': 'way', 'id': way_id, 'nodes': nodes, 'geometry': geometry,
+                             'tags': dict(tags)})
+    return elements
+
+
+def synthetic_tiles(scale, ways_per_tile=WAYS_PER_TILE, seed=0):
+    """Duyệt (bbox, payload bytes, số way) từng ô - payload giống response Overpass `out geom`.
+    Giữ dạng bytes (như response thật) để quy mô cả nước không chiếm hết RAM"""
+    rng = random.Random(seed)
+    carry = []
+    for index, bbox in enumerate(tile_grid(scale)):
+        elements = tile_elements(bbox, index, ways_per_tile, rng, carry)
+        carry = [el for el in elements if rng.random() < DUPLICATE_RATE]
+        payload = {'version': 0.6, 'generator': 'bench_pipeline', 'elements': elements}
+        yield bbox, json.dumps(payload, ensure_ascii=False).encode('utf-8'), len(elements)
+
+
+def _edge(a, b, vertices, amplitude, rng):
+    """Cạnh răng cưa từ a tới b: lệch vuông góc theo random walk, về 0 ở 2 đầu mút
+    (biên độ tỉ lệ khoảng cách tới góc -> 2 cạnh chung góc không thể cắt nhau)"""
+    steps = np.cumsum(np.array([rng.uniform(-1, 1) for _ in range(vertices)]))
+    steps /= max(np.abs(steps).max(), 1e-9)
+    t = np.linspace(0.0, 1.0, vertices)
+    offset = amplitude * np.sin(np.pi * t) * steps
+    (ax, ay), (bx, by) = a, b
+    length = np.hypot(bx - ax, by - ay)
+    nx, ny = -(by - ay) / length, (bx - ax) / length
+    xs = ax + (bx - ax) * t + nx * offset
+    ys = ay + (by - ay) * t + ny * offset
+    return np.round(np.column_stack([xs, ys]), 4).tolist()
+
+
+def synthetic_provinces(scale, edge_vertices=EDGE_VERTICES, seed=0):
+    """FeatureCollection kiểu GADM: lưới tỉnh, cạnh giữa 2 tỉnh sinh 1 lần và dùng chung"""
+    rng = random.Random(seed)
+    rows, cols = SCALES[scale]['provinces']
+    tiles_rows, tiles_cols = SCALES[scale]['tiles']
+    south, west = dl.VN_BOUNDS[0], dl.VN_BOUNDS[1]
+    dy, dx = tiles_rows * TILE_SIZE / rows, tiles_cols * TILE_SIZE / cols
+    corner = lambda r, c: (round(west + c * dx, 4), round(south + r * dy, 4))
+    amplitude = 0.15 * min(dx, dy)
+    horizontal = {(r, c): _edge(corner(r, c), corner(r, c + 1), edge_vertices, amplitude, rng)
+                  for r in range(rows + 1) for c in range(cols)}
+    vertical = {(r, c): _edge(corner(r, c), corner(r + 1, c), edge_vertices, amplitude, rng)
+                for r in range(rows) for c in range(cols + 1)}
+    features = []
+    for r in range(rows):
+        for c in range(cols):
+            # Ngược chiều kim đồng hồ: đáy -> phải -> đỉnh (đảo) -> trái (đảo)
+            ring = (horizontal[(r, c)] + vertical[(r, c + 1)][1:] + horizontal[(r + 1, c)][::-1][1:]
+                    + vertical[(r, c)][::-1][1:])
+            i = r * cols + c + 1
+            features.append({
+                'type': 'Feature',
+                'properties': {'GID_1': f"VNM.{i}_1", 'GID_0': 'VNM', 'COUNTRY': 'Vietnam',
+                               'NAME_1': f"Tỉnh{i}", 'VARNAME_1': f"Tinh{i}", 'TYPE_1': 'Tỉnh',
+                               'ENGTYPE_1': 'Province', 'ISO_1': f"VN-{i:02d}"},
+                'geometry': {'type': 'Polygon', 'coordinates': [ring]},
+            })
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def merge_groups(provinces, scale):
+    """Nhóm sáp nhập giả lập: 2-3 tỉnh liền nhau trên cùng hàng (giống MERGE_2025)"""
+    rows, cols = SCALES[scale]['provinces']
+    geometries = [f['geometry'] for f in provinces['features']]
+    groups = []
+    for r in range(rows):
+        c = 0
+        while c < cols - 1:
+            size = 3 if (r + c) % 3 == 0 and c + 2 < cols else 2
+            groups.append([geometries[r * cols + k] for k in range(c, c + size)])
+            c += size
+    return groups
+
+
+# --- ĐO ---
+
+def measure(name, fn, items, unit, repeat=REPEAT, memory=True):
+    """Chạy fn() repeat lần (+ 1 lần dưới tracemalloc nếu memory). Trả về dict kết quả"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            fn()
+        times.append(time.perf_counter() - start)
+    peak = None
+    if memory:
+        tracemalloc.start()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                fn()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    best = min(times)
+    result = {
+        'name': name, 'items': items, 'unit': unit, 'repeat': repeat,
+        'best_s': best, 'mean_s': sum(times) / len(times),
+        'throughput': items / best if best > 0 else None,
+        'peak_mb': peak / (1024 * 1024) if peak is not None else None,
+    }
+    mem = f"{result['peak_mb']:8.1f} MB" if peak is not None else '       - MB'
+    print(f"  {name:<22} {best:8.3f}s  (tb {result['mean_s']:.3f}s)  "
+          f"{result['throughput'] or 0:12,.0f} {unit}/s  {mem}")
+    return result
+
+
+def environment():
+    """Thông tin máy / phiên bản để biết 2 lần chạy có so sánh được không"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'commit': commit,
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
+# --- BENCHMARK ---
+
+def run_pipeline(payloads, work_dir, outputs):
+    """End-to-end như download_vn_roads_full: parse + process từng ô -> chunk NDJSON ->
+    k-way merge -> khử trùng + nối đoạn -> ghi JSON (outputs=True: + LOD, .vngb, .rtree, search)"""
+    temp_dir = os.path.join(work_dir, 'chunks')
+    os.makedirs(temp_dir, exist_ok=True)
+    old_temp, dl.TEMP_DIR = dl.TEMP_DIR, temp_dir # reduce_chunks ghi file trung gian vào TEMP_DIR
+    try:
+        paths = []
+        for i, payload in enumerate(payloads):
+            path = os.path.join(temp_dir, f"tile_{i:05d}.ndjson")
+            dl.write_chunk(dl.process_elements(json.loads(payload)['elements']), path)
+            paths.append(path)
+        stats = dl.new_stitch_stats()
+        roads = dl.iter_stitched_roads(dl.iter_merged_roads(paths), stats)
+        return dl.write_roads_json(roads, os.path.join(work_dir, 'roads.json'),
+                                   dl.lod_levels() if outputs else (), outputs, outputs, outputs)
+    finally:
+        dl.TEMP_DIR = old_temp
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def run_benchmarks(scale, ways_per_tile=WAYS_PER_TILE, edge_vertices=EDGE_VERTICES, repeat=REPEAT,
+                   memory=True, only=None, seed=0):
+    wanted = lambda name: not only or name in only
+    results = []
+    start = time.perf_counter()
+    tiles = list(synthetic_tiles(scale, ways_per_tile, seed))
+    payloads = [payload for _, payload, _ in tiles]
+    elements_count = sum(count for _, _, count in tiles)
+    del tiles
+    provinces = synthetic_provinces(scale, edge_vertices, seed)
+    print(f"Dữ liệu {scale}: {len(payloads)} ô, {elements_count:,} way, "
+          f"{sum(map(len, payloads)) / (1024 * 1024):.1f} MB JSON; {len(provinces['features'])} tỉnh "
+          f"({time.perf_counter() - start:.1f}s sinh dữ liệu)")
+
+    if wanted('json_loads'):
+        results.append(measure('json_loads', lambda: [json.loads(p) for p in payloads],
+                               elements_count, 'way', repeat, memory))
+    if wanted('process_elements'):
+        results.append(measure('process_elements',
+                               lambda: [dl.process_elements(json.loads(p)['elements']) for p in payloads],
+                               elements_count, 'way', repeat, memory))
+
+    needs_processed = {'merge_processed_data', 'feature_bbox_python', 'feature_bbox_numpy',
+                       'serialize_json', 'serialize_all'}
+    if not only or needs_processed & set(only):
+        processed = [dl.process_elements(json.loads(p)['elements']) for p in payloads]
+
+        def merge_all():
+            merged = {}
+            for tile in processed:
+                dl.merge_processed_data(merged, tile)
+            return merged
+
+        if wanted('merge_processed_data'):
+            results.append(measure('merge_processed_data', merge_all, elements_count, 'way', repeat, memory))
+        stats = dl.new_stitch_stats()
+        roads = list(dl.iter_stitched_roads(sorted(merge_all().items()), stats))
+        del processed
+        road_segments = [segments for _, segments in roads]
+        vertices = stats['vertices_after']
+
+        def numpy_bboxes():
+            lines = [seg for segments in road_segments for seg in segments]
+            coords, offsets = lines_array(lines)
+            road_parts = np.cumsum([0] + [len(segments) for segments in road_segments])
+            return group_bboxes(coords, offsets[road_parts]).tolist()
+
+        if wanted('feature_bbox_python'):
+            results.append(measure('feature_bbox_python',
+                                   lambda: [dl.calculate_feature_bbox(s) for s in road_segments],
+                                   vertices, 'điểm', repeat, memory))
+        if wanted('feature_bbox_numpy'):
+            results.append(measure('feature_bbox_numpy', numpy_bboxes, vertices, 'điểm', repeat, memory))
+
+        with tempfile.TemporaryDirectory(prefix='bench_') as work_dir:
+            out = os.path.join(work_dir, 'roads.json')
+            if wanted('serialize_json'):
+                results.append(measure('serialize_json', lambda: dl.write_roads_json(iter(roads), out),
+                                       len(roads), 'đường', repeat, memory))
+            if wanted('serialize_all'):
+                results.append(measure('serialize_all', lambda: dl.write_roads_json(
+                    iter(roads), out, dl.lod_levels(), True, True, True), len(roads), 'đường', repeat, memory))
+        del roads, road_segments
+
+    geometries = [f['geometry'] for f in provinces['features']]
+    if wanted('geometry_bbox'):
+        province_vertices = sum(len(f['geometry']['coordinates'][0]) for f in provinces['features'])
+        results.append(measure('geometry_bbox', lambda: [geometry_bbox(g, 4) for g in geometries],
+                               province_vertices, 'điểm', repeat, memory))
+    if wanted('merge_geometries'):
+        if merge_geometries is None:
+            print("  ⚠️ Chưa cài shapely -> bỏ qua merge_geometries")
+        else:
+            groups = merge_groups(provinces, scale)
+            results.append(measure('merge_geometries', lambda: [merge_geometries(g) for g in groups],
+                                   len(groups), 'nhóm', repeat, memory))
+
+    if wanted('end_to_end'):
+        with tempfile.TemporaryDirectory(prefix='bench_') as work_dir:
+            results.append(measure('end_to_end', lambda: run_pipeline(payloads, work_dir, True),
+                                   elements_count, 'way', repeat, memory))
+
+    return {
+        'scale': scale,
+        'params': {'ways_per_tile': ways_per_tile, 'edge_vertices': edge_vertices, 'seed': seed,
+                   'tiles': len(payloads), 'ways': elements_count,
+                   'provinces': len(provinces['features'])},
+        'environment': environment(),
+        'results': results,
+    }
+
+
+# --- MÔ HÌNH TRONG RAM (dict lồng nhau / RoadCollection) ---
+
+def peak_rss_mb():
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def serialize_nested(data, json_path, bin_path):
+    """Cách ghi cũ: gom list lồng nhau theo lô -> lines_array -> json.dumps + GeoBinaryWriter.add từng feature"""
+    json_writer = dl.RoadsJsonWriter(json_path)
+    bin_writer = GeoBinaryWriter(bin_path, dl.roads_header())
+    batch, vertices = [], 0
+
+    def flush():
+        coords, offsets = lines_array([seg for _, segments in batch for seg in segments])
+        road_parts = np.cumsum([0] + [len(segments) for _, segments in batch])
+        for (key, segments), bbox in zip(batch, group_bboxes(coords, offsets[road_parts]).tolist()):
+            feature = dl.make_road_feature(*key, bbox, segments)
+            json_writer.add(feature)
+            bin_writer.add(feature)
+        batch.clear()
+
+    for key, ways in data.items():
+        segments = [way[3] for way in ways]
+        batch.append((key, segments))
+        vertices += sum(map(len, segments))
+        if vertices >= dl.LOD_BATCH_VERTICES:
+            flush()
+            vertices = 0
+    if batch:
+        flush()
+    bin_writer.close()
+    return json_writer.close()
+
+
+def serialize_collection(data, json_path, bin_path):
+    """Cách ghi mới: từng lô view trên mảng phẳng -> render_features + GeoBinaryWriter.add_lines"""
+    json_writer = dl.RoadsJsonWriter(json_path)
+    bin_writer = GeoBinaryWriter(bin_path, dl.roads_header())
+    for roads, coords, offsets, road_parts in data.iter_batches(dl.LOD_BATCH_VERTICES):
+        bboxes = group_bboxes(coords, offsets[road_parts]).tolist()
+        for _, text in render_features(roads, bboxes, coords, offsets, road_parts):
+            json_writer.add_json(text)
+        bin_writer.add_lines(roads, bboxes, coords, offsets, road_parts)
+    bin_writer.close()
+    return json_writer.close()
+
+
+def measure_model(model, scale, ways_per_tile, seed):
+    """Chạy trong process riêng: gộp mọi ô vào 1 mô hình (như global_data), rồi ghi JSON + .vngb"""
+    rss_start = current_rss_mb()
+    data = {} if model == 'nested' else RoadCollection()
+    ways = 0
+    merge_s = 0.0 # Chỉ tính bước gộp vào mô hình (sinh dữ liệu + process_elements giống nhau)
+    for _, payload, count in synthetic_tiles(scale, ways_per_tile, seed):
+        processed = dl.process_elements(json.loads(payload)['elements'])
+        start = time.perf_counter()
+        if model == 'nested':
+            dl.merge_processed_data(data, processed)
+        else:
+            data.add_processed(processed)
+        merge_s += time.perf_counter() - start
+        ways += count
+        del processed
+    rss_built = current_rss_mb()
+    if model == 'nested':
+        vertices = sum(len(way[3]) for ways_ in data.values() for way in ways_)
+    else:
+        vertices = data.vertex_count()
+
+    with tempfile.TemporaryDirectory(prefix='bench_') as work_dir:
+        start = time.perf_counter()
+        serialize = serialize_nested if model == 'nested' else serialize_collection
+        roads = serialize(data, os.path.join(work_dir, 'roads.json'), os.path.join(work_dir, 'roads.vngb'))
+        write_s = time.perf_counter() - start
+        json_mb = os.path.getsize(os.path.join(work_dir, 'roads.json')) / (1024 * 1024)
+    return {
+        'model': model, 'ways': ways, 'roads': roads, 'vertices': vertices,
+        'merge_s': merge_s, 'write_s': write_s, 'json_mb': json_mb,
+        'rss_start_mb': rss_start, 'rss_built_mb': rss_built, 'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def run_models(scale, ways_per_tile=WAYS_PER_TILE, seed=0, models=MODELS):
+    """Mỗi mô hình 1 process mới (spawn) -> RSS đỉnh không bị lẫn giữa 2 lần đo"""
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for model in models:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            results.append(executor.submit(measure_model, model, scale, ways_per_tile, seed).result())
+    print(f"Quy mô {scale}: {results[0]['ways']:,} way, {results[0]['vertices']:,} điểm, "
+          f"{results[0]['roads']:,} con đường")
+    print(f"  {'mô hình':<11} {'gộp':>8} {'way/s':>10} {'RAM giữ':>9} {'B/điểm':>7} {'RSS đỉnh':>9} "
+          f"{'ghi JSON+vngb':>14} {'điểm/s':>11}")
+    for r in results:
+        held = r['rss_built_mb'] - r['rss_start_mb']
+        print(f"  {r['model']:<11} {r['merge_s']:7.2f}s {r['ways'] / max(r['merge_s'], 1e-9):10,.0f} "
+              f"{held:8.0f}M {held * 1024 * 1024 / max(r['vertices'], 1):7.0f} {r['peak_rss_mb']:8.0f}M "
+              f"{r['write_s']:13.2f}s {r['vertices'] / max(r['write_s'], 1e-9):11,.0f}")
+    return results
+
+
+def compare(old, new, threshold):
+    """So 2 file kết quả theo best_s. Trả về số benchmark chậm đi quá threshold"""
+    if old.get('scale') != new.get('scale') or old.get('params') != new.get('params'):
+        print(f"⚠️ Khác quy mô/tham số: {old.get('scale')} {old.get('params')} vs "
+              f"{new.get('scale')} {new.get('params')}")
+    old_results = {r['name']: r for r in old['results']}
+    regressions = 0
+    print(f"  {'benchmark':<22} {'cũ':>9} {'mới':>9} {'thay đổi':>9}   {'RAM cũ':>8} {'RAM mới':>8}")
+    for r in new['results']:
+        o = old_results.get(r['name'])
+        if o is None:
+            print(f"  {r['name']:<22} {'-':>9} {r['best_s']:8.3f}s")
+            continue
+        change = r['best_s'] / o['best_s'] - 1 if o['best_s'] else 0.0
+        mark = ''
+        if change > threshold:
+            mark = '❌ chậm hơn'
+            regressions += 1
+        elif change < -threshold:
+            mark = '✅ nhanh hơn'
+        mem = lambda v: f"{v:7.1f}M" if v is not None else '       -'
+        print(f"  {r['name']:<22} {o['best_s']:8.3f}s {r['best_s']:8.3f}s {change * 100:+8.1f}%   "
+              f"{mem(o.get('peak_mb'))} {mem(r.get('peak_mb'))}  {mark}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pipeline đường/ranh giới trên dữ liệu giả lập")
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p = sub.add_parser('run', help="Chạy benchmark")
+    p.add_argument('--scale', choices=list(SCALES), default='region')
+    p.add_argument('--ways-per-tile', type=int, default=WAYS_PER_TILE)
+    p.add_argument('--edge-vertices', type=int, default=EDGE_VERTICES)
+    p.add_argument('--repeat', type=int, default=REPEAT)
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--only', nargs='+', choices=STAGE_ORDER, help="Chỉ chạy các benchmark này")
+    p.add_argument('--no-memory', action='store_true', help="Không đo bộ nhớ (bỏ lần chạy tracemalloc)")
+    p.add_argument('-o', '--output', help="Ghi kết quả ra file JSON")
+    p = sub.add_parser('compare', help="So sánh 2 file kết quả")
+    p.add_argument('old')
+    p.add_argument('new')
+    p.add_argument('--threshold', type=float, default=0.1, help="Chậm hơn quá tỉ lệ này -> lỗi (mặc định 10%%)")
+    p = sub.add_parser('model', help="So RAM / tốc độ giữ toàn bộ đường: dict lồng nhau vs RoadCollection")
+    p.add_argument('--scale', choices=list(SCALES), default='country')
+    p.add_argument('--ways-per-tile', type=int, default=WAYS_PER_TILE)
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--models', nargs='+', choices=MODELS, default=list(MODELS))
+    p.add_argument('-o', '--output', help="Ghi kết quả ra file JSON")
+    p = sub.add_parser('generate', help="Ghi dữ liệu giả lập ra thư mục")
+    p.add_argument('--scale', choices=list(SCALES), default='tile')
+    p.add_argument('--ways-per-tile', type=int, default=WAYS_PER_TILE)
+    p.add_argument('--edge-vertices', type=int, default=EDGE_VERTICES)
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--out', required=True)
+    args = parser.parse_args()
+
+    if args.cmd == 'run':
+        report = run_benchmarks(args.scale, args.ways_per_tile, args.edge_vertices, args.repeat,
+                                not args.no_memory, args.only, args.seed)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"✅ Đã ghi kết quả → {args.output}")
+    elif args.cmd == 'model':
+        results = run_models(args.scale, args.ways_per_tile, args.seed, args.models)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump({'scale': args.scale, 'environment': environment(), 'models': results},
+                          f, ensure_ascii=False, indent=2)
+            print(f"✅ Đã ghi kết quả → {args.output}")
+    elif args.cmd == 'compare':
+        with open(args.old, 'r', encoding='utf-8') as f:
+            old = json.load(f)
+        with open(args.new, 'r', encoding='utf-8') as f:
+            new = json.load(f)
+        regressions = compare(old, new, args.threshold)
+        if regressions:
+            print(f"❌ {regressions} benchmark chậm hơn quá {args.threshold:.0%}")
+            return 1
+        print("✅ Không có benchmark nào chậm đi")
+    elif args.cmd == 'generate':
+        os.makedirs(args.out, exist_ok=True)
+        count = 0
+        for i, (bbox, payload, _) in enumerate(synthetic_tiles(args.scale, args.ways_per_tile, args.seed)):
+            with open(os.path.join(args.out, f"overpass_{i:05d}.json"), 'wb') as f:
+                f.write(payload)
+            count += 1
+        path = os.path.join(args.out, 'gadm_provinces.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(synthetic_provinces(args.scale, args.edge_vertices, args.seed), f, ensure_ascii=False)
+        print(f"✅ {count} payload Overpass + {path} → {args.out}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,542 @@
+"""
+Điểm vào duy nhất để dựng toàn bộ dữ liệu: các script sinh dữ liệu là các bước (stage)
+trong 1 đồ thị phụ thuộc, chỉ bước nào cũ (stale) mới chạy lại.
+
+Mỗi stage có khóa = hash của:
+    input   nội dung các file đầu vào
+    code    script + mọi module cục bộ nó import (đệ quy, trong tools/ và thư mục script)
+    config  các hằng số cấu hình (NAME_MAP, MERGE_2025, ROAD_TYPES...), đọc bằng ast
+    command dòng lệnh chạy
+Kết quả mỗi khóa được lưu trong .build_cache/store/<stage>/<khóa>/: đổi qua lại giữa
+các phiên bản cũ không phải chạy lại, chỉ chép file về.
+Các stage độc lập (vd. ranh giới 2025 và đường) chạy song song.
+
+Dùng:
+    python tools/build.py                    # dựng mọi stage (chỉ chạy stage cũ)
+    python tools/build.py vector_tiles       # 1 stage + các stage nó phụ thuộc
+    python tools/build.py --dry-run          # xem stage nào cũ và vì sao
+    python tools/build.py --force boundaries # chạy lại dù cache còn mới
+    python tools/build.py --list
+"""
+import argparse
+import ast
+import concurrent.futures
+import fnmatch
+import glob
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+TOOLS_DIR = os.path.join(ROOT, 'tools')
+CACHE_DIR = '.build_cache'
+MANIFEST = os.path.join(CACHE_DIR, 'manifest.json')
+KEEP_VERSIONS = 3 # Số phiên bản kết quả giữ lại cho mỗi stage
+
+# Đường dẫn tính từ thư mục gốc dự án. outputs có thể là glob.
+# config: {file: [tên hằng số]} - giá trị phải là literal Python (dict, list, số, chuỗi)
+STAGES = [
+    {
+        'name': 'boundaries',
+        'description': "GADM → vn_boundaries.json (63 tỉnh) + LOD + .vngb",
+        'cwd': 'assets/boundaries',
+        'command': ['convert_gadm.py'],
+        'inputs': ['assets/boundaries/gadm_vietnam_country.json',
+                   'assets/boundaries/gadm_vietnam_provinces.json'],
+        'outputs': ['assets/boundaries/vn_boundaries.json',
+                    'assets/boundaries/vn_boundaries.vngb',
+                    'assets/boundaries/vn_boundaries_lod*.json'],
+        'config': {'assets/boundaries/convert_gadm.py': ['NAME_MAP'],
+                   'tools/geo_simplify.py': ['LOD_LEVELS', 'MAX_ERROR_PX']},
+    },
+    {
+        'name': 'boundaries_2025',
+        'description': "vn_boundaries.json → vn_boundaries_2025.json (34 tỉnh sau sáp nhập) + TopoJSON",
+        'cwd': 'assets/boundaries',
+        'command': ['create_2025_from_gadm.py'],
+        'deps': ['boundaries'],
+        'inputs': ['assets/boundaries/vn_boundaries.json'],
+        'outputs': ['assets/boundaries/vn_boundaries_2025.json',
+                    'assets/boundaries/vn_boundaries_2025.vngb',
+                    'assets/boundaries/vn_boundaries_2025_lod*.json',
+                    'assets/boundaries/vn_boundaries.topo.json'],
+        'config': {'assets/boundaries/create_2025_from_gadm.py': ['MERGE_2025'],
+                   'tools/geo_simplify.py': ['LOD_LEVELS', 'MAX_ERROR_PX'],
+                   'tools/geo_topojson.py': ['DEFAULT_UNITS_PER_DEGREE']},
+    },
+    {
+        'name': 'admin_levels',
+        'description': "GADM cấp 1-3 → vn_admin_provinces/districts/communes.json + hierarchy (cha-con, tỉnh 2025)",
+        'cwd': '.',
+        'command': ['tools/gadm_levels.py', 'convert',
+                    'assets/boundaries/gadm41_VNM_1.json',
+                    'assets/boundaries/gadm41_VNM_2.json',
+                    'assets/boundaries/gadm41_VNM_3.json',
+                    '--out-dir', 'assets/boundaries'],
+        'deps': ['boundaries'],
+        'inputs': ['assets/boundaries/gadm41_VNM_1.json',
+                   'assets/boundaries/gadm41_VNM_2.json',
+                   'assets/boundaries/gadm41_VNM_3.json'],
+        'outputs': ['assets/boundaries/vn_admin_provinces.json',
+                    'assets/boundaries/vn_admin_districts.json',
+                    'assets/boundaries/vn_admin_communes.json',
+                    'assets/boundaries/vn_admin_hierarchy.json'],
+        'config': {'assets/boundaries/convert_gadm.py': ['NAME_MAP'],
+                   'assets/boundaries/create_2025_from_gadm.py': ['MERGE_2025'],
+                   'tools/gadm_levels.py': ['LEVELS', 'UNIT_TYPES']},
+    },
+    {
+        'name': 'roads',
+        'description': "OSM PBF → vn_roads_full.json + LOD + .vngb + .rtree + .search.json + shard theo tỉnh + trạng thái way (--update)",
+        'cwd': '.',
+        'command': ['tools/download_vn_roads_full.py', '--pbf'],
+        # Lọc đường theo lãnh thổ (polygon 'Việt Nam'), chia shard theo 34 tỉnh 2025
+        'deps': ['boundaries', 'boundaries_2025'],
+        'inputs': ['assets/roads/vietnam-latest.osm.pbf',
+                   'assets/boundaries/vn_boundaries.json',
+                   'assets/boundaries/vn_boundaries_2025.json'],
+        'outputs': ['assets/roads/vn_roads_full.json',
+                    'assets/roads/vn_roads_full.vngb',
+                    'assets/roads/vn_roads_full.rtree',
+                    'assets/roads/vn_roads_full.search.json',
+                    'assets/roads/vn_roads_full_lod*.json',
+                    'assets/roads/vn_roads_full.ways.ndjson',
+                    'assets/roads/vn_roads_full.state.json',
+                    'assets/roads/shards/*.json'],
+        'config': {'tools/download_vn_roads_full.py': ['ROAD_TYPES', 'PBF_FILE', 'OUTPUT_FILE', 'SHARD_MODE'],
+                   'tools/geo_simplify.py': ['LOD_LEVELS', 'MAX_ERROR_PX'],
+                   'tools/road_shards.py': ['GRID_SIZE']},
+    },
+    {
+        'name': 'road_provinces',
+        'description': "Đường × tỉnh (63 + 2025) → vn_roads_full.provinces.ndjson + bảng km theo tỉnh",
+        'cwd': '.',
+        'command': ['tools/road_provinces.py', 'run'],
+        'deps': ['roads', 'boundaries', 'boundaries_2025'],
+        'inputs': ['assets/roads/vn_roads_full.json',
+                   'assets/boundaries/vn_boundaries.json',
+                   'assets/boundaries/vn_boundaries_2025.json'],
+        'outputs': ['assets/roads/vn_roads_full.provinces.ndjson',
+                    'assets/roads/road_provinces_summary.csv'],
+        'config': {'tools/road_provinces.py': ['MIN_LENGTH_M']},
+    },
+    {
+        'name': 'road_graph',
+        'description': "Trạng thái way → đồ thị đường đi được + contraction hierarchies (vn_roads_full.graph.npz)",
+        'cwd': '.',
+        'command': ['tools/road_graph.py', 'build'],
+        'deps': ['roads'],
+        'inputs': ['assets/roads/vn_roads_full.ways.ndjson'],
+        'outputs': ['assets/roads/vn_roads_full.graph.npz'],
+        'config': {'tools/road_graph.py': ['SPEEDS_KMH', 'DEFAULT_SPEED_KMH', 'WITNESS_SETTLE', 'WITNESS_SIMULATE',
+                                           'GRAPH_VERSION']},
+    },
+    {
+        'name': 'road_match',
+        'description': "Chỉ mục đoạn đường cho bắt điểm GPS (vn_roads_full.match.npz)",
+        'cwd': '.',
+        'command': ['tools/road_match.py', 'index'],
+        'deps': ['roads'],
+        'inputs': ['assets/roads/vn_roads_full.json'],
+        'outputs': ['assets/roads/vn_roads_full.match.npz'],
+        'config': {'tools/road_match.py': ['GRID_BOUNDS', 'CELL_SIZE', 'MAX_DISTANCE_M', 'INDEX_VERSION']},
+    },
+    {
+        'name': 'vector_tiles',
+        'description': "Đường + ranh giới → assets/vietnam_vector.mbtiles (MVT)",
+        'cwd': '.',
+        'command': ['tools/vector_tiles.py', 'build',
+                    '--roads', 'assets/roads/vn_roads_full.json',
+                    '--boundaries', 'assets/boundaries/vn_boundaries.json',
+                    '--output', 'assets/vietnam_vector.mbtiles'],
+        'deps': ['roads', 'boundaries'],
+        'inputs': ['assets/roads/vn_roads_full.json',
+                   'assets/roads/vn_roads_full.rtree',
+                   'assets/boundaries/vn_boundaries.json'],
+        'outputs': ['assets/vietnam_vector.mbtiles'],
+        'config': {'tools/vector_tiles.py': ['MIN_ZOOM', 'MAX_ZOOM', 'EXTENT', 'BUFFER',
+                                             'SIMPLIFY_UNITS', 'ROAD_MIN_ZOOM']},
+    },
+]
+STAGE_BY_NAME = {stage['name']: stage for stage in STAGES}
+
+
+# --- HASH ---
+
+class FileHasher:
+    """sha256 nội dung file, nhớ theo (kích thước, mtime) để không đọc lại file lớn"""
+
+    def __init__(self, known=None):
+        self.known = dict(known or {})
+
+    def __call__(self, path):
+        st = os.stat(path)
+        entry = self.known.get(path)
+        if entry and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+            return entry[2]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        self.known[path] = [st.st_size, st.st_mtime_ns, digest.hexdigest()]
+        return digest.hexdigest()
+
+
+def local_imports(path, search_dirs):
+    """Các module cục bộ mà script import (đệ quy), trả về list đường dẫn đã sắp xếp"""
+    seen = set()
+    pending = [path]
+    while pending:
+        current = pending.pop()
+        if current in seen:
+            continue
+        seen.add(current)
+        with open(current, 'r', encoding='utf-8') as f:
+            tree = ast.parse(f.read(), current)
+        names = set()
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names.update(alias.name.split('.')[0] for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                names.add(node.module.split('.')[0])
+        for name in names:
+            for directory in [os.path.dirname(current)] + search_dirs:
+                candidate = os.path.join(directory, name + '.py')
+                if os.path.exists(candidate):
+                    pending.append(os.path.normpath(candidate))
+                    break
+    return sorted(seen)
+
+
+def module_constants(path, names):
+    """Giá trị các hằng số cấp module (literal) đọc bằng ast - không import, không chạy script"""
+    with open(path, 'r', encoding='utf-8') as f:
+        tree = ast.parse(f.read(), path)
+    values = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign):
+            for target in node.targets:
+                if isinstance(target, ast.Name) and target.id in names:
+                    values[target.id] = ast.literal_eval(node.value)
+    missing = set(names) - set(values)
+    if missing:
+        raise ValueError(f"{path}: không tìm thấy hằng số {sorted(missing)}")
+    return values
+
+
+def digest(obj):
+    return hashlib.sha256(json.dumps(obj, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def rel(path):
+    return os.path.relpath(path, ROOT).replace(os.sep, '/')
+
+
+def stage_script(stage):
+    return os.path.normpath(os.path.join(ROOT, stage['cwd'], stage['command'][0]))
+
+
+def missing_inputs(stage, upstream=()):
+    """Input chưa có trên đĩa và cũng không phải kết quả của các stage upstream (sẽ sinh ra khi dựng lại)"""
+    patterns = [pattern for s in upstream for pattern in s['outputs']]
+    return [p for p in stage['inputs'] if not os.path.exists(os.path.join(ROOT, p))
+            and not any(fnmatch.fnmatch(p, pattern) for pattern in patterns)]
+
+
+def stage_components(stage, hasher):
+    """Hash từng thành phần của khóa stage (None nếu thiếu file input)"""
+    missing = missing_inputs(stage)
+    if missing:
+        return None, missing
+    code = {rel(p): hasher(p) for p in local_imports(stage_script(stage), [TOOLS_DIR])}
+    config = {}
+    for path, names in stage.get('config', {}).items():
+        for name, value in module_constants(os.path.join(ROOT, path), names).items():
+            config[f"{path}:{name}"] = digest(value)
+    return {
+        'inputs': {p: hasher(os.path.join(ROOT, p)) for p in stage['inputs']},
+        'code': code,
+        'config': config,
+        'command': digest(stage['command']),
+    }, []
+
+
+def stale_reasons(old, new):
+    """Những gì đã đổi so với lần dựng trước (để in ra cho người dùng)"""
+    if not old:
+        return ["chưa dựng lần nào"]
+    reasons = []
+    for kind, label in (('config', 'config'), ('inputs', 'input'), ('code', 'code')):
+        before, after = old.get(kind, {}), new.get(kind, {})
+        changed = sorted(k for k in set(before) | set(after) if before.get(k) != after.get(k))
+        if changed:
+            names = [k.split(':')[-1] if kind == 'config' else os.path.basename(k) for k in changed]
+            reasons.append(f"{label}: {', '.join(names[:4])}{'...' if len(names) > 4 else ''}")
+    if old.get('command') != new.get('command'):
+        reasons.append("lệnh chạy")
+    return reasons
+
+
+# --- KẾT QUẢ / CACHE ---
+
+def expand_outputs(stage):
+    paths = []
+    for pattern in stage['outputs']:
+        matches = sorted(glob.glob(os.path.join(ROOT, pattern)))
+        paths.extend(rel(p) for p in matches)
+    return paths
+
+
+def store_dir(stage_name, key):
+    return os.path.join(ROOT, CACHE_DIR, 'store', stage_name, key)
+
+
+def save_outputs(stage, key, outputs):
+    """Chép kết quả vào store (ghi thư mục .part rồi đổi tên: không bao giờ có bản dở dang)"""
+    target = store_dir(stage['name'], key)
+    tmp = target + '.part'
+    shutil.rmtree(tmp, ignore_errors=True)
+    for path in outputs:
+        dst = os.path.join(tmp, path)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        shutil.copy2(os.path.join(ROOT, path), dst)
+    shutil.rmtree(target, ignore_errors=True)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    os.replace(tmp, target)
+    prune_store(stage['name'])
+
+
+def stored_files(stage_name, key):
+    base = store_dir(stage_name, key)
+    return sorted(os.path.relpath(os.path.join(d, f), base).replace(os.sep, '/')
+                  for d, _, files in os.walk(base) for f in files)
+
+
+def restore_outputs(stage, key, outputs):
+    source = store_dir(stage['name'], key)
+    for path in outputs:
+        dst = os.path.join(ROOT, path)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        shutil.copy2(os.path.join(source, path), dst + '.part')
+        os.replace(dst + '.part', dst)
+
+
+def prune_store(stage_name):
+    base = os.path.join(ROOT, CACHE_DIR, 'store', stage_name)
+    versions = sorted((os.path.getmtime(os.path.join(base, d)), d) for d in os.listdir(base)
+                      if not d.endswith('.part'))
+    for _, name in versions[:-KEEP_VERSIONS]:
+        shutil.rmtree(os.path.join(base, name), ignore_errors=True)
+
+
+def load_manifest():
+    path = os.path.join(ROOT, MANIFEST)
+    if not os.path.exists(path):
+        return {'stages': {}, 'files': {}}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(manifest):
+    path = os.path.join(ROOT, MANIFEST)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.part', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(path + '.part', path)
+
+
+# --- CHẠY ---
+
+def select_stages(names):
+    """Các stage được chọn + mọi stage chúng phụ thuộc, theo thứ tự khai báo"""
+    unknown = set(names) - set(STAGE_BY_NAME)
+    if unknown:
+        raise SystemExit(f"Không có stage: {', '.join(sorted(unknown))} (xem --list)")
+    wanted = set()
+    pending = list(names or STAGE_BY_NAME)
+    while pending:
+        name = pending.pop()
+        if name not in wanted:
+            wanted.add(name)
+            pending.extend(STAGE_BY_NAME[name].get('deps', []))
+    return [s for s in STAGES if s['name'] in wanted]
+
+
+def run_command(stage, log_path):
+    """Chạy script của stage, ghi toàn bộ output vào file log. Trả về (mã thoát, giây)"""
+    start = time.time()
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    env = dict(os.environ, PYTHONUNBUFFERED='1')
+    with open(log_path, 'w', encoding='utf-8') as log:
+        proc = subprocess.run([sys.executable] + stage['command'], cwd=os.path.join(ROOT, stage['cwd']),
+                              stdout=log, stderr=subprocess.STDOUT, env=env)
+    return proc.returncode, time.time() - start
+
+
+class Builder:
+    def __init__(self, stages, jobs=None, force=(), dry_run=False):
+        self.stages = stages
+        self.jobs = jobs or min(len(stages), os.cpu_count() or 1) or 1
+        self.force = set(force)
+        self.dry_run = dry_run
+        self.manifest = load_manifest()
+        self.hasher = FileHasher(self.manifest.get('files'))
+        self.results = {} # tên -> dict(status, seconds, reason)
+
+    def check(self, stage):
+        """(khóa, thành phần, trạng thái, lý do): 'fresh' | 'restore' | 'run' | 'missing'"""
+        components, missing = stage_components(stage, self.hasher)
+        if components is None:
+            return None, None, 'missing', f"thiếu input: {', '.join(missing)}"
+        key = digest(components)
+        previous = self.manifest['stages'].get(stage['name'], {})
+        if stage['name'] in self.force:
+            return key, components, 'run', "--force"
+        if previous.get('key') == key:
+            outputs = previous.get('outputs', {})
+            if outputs and all(os.path.exists(os.path.join(ROOT, p)) and
+                               self.hasher(os.path.join(ROOT, p)) == h for p, h in outputs.items()):
+                return key, components, 'fresh', "cache còn mới"
+        reasons = stale_reasons(previous.get('components'), components)
+        if previous.get('key') == key:
+            reasons = ["file kết quả bị sửa/xóa"]
+        if os.path.isdir(store_dir(stage['name'], key)) and not self.dry_run:
+            return key, components, 'restore', '; '.join(reasons)
+        return key, components, 'run', '; '.join(reasons)
+
+    def execute(self, stage):
+        """Chạy trong thread: kiểm tra khóa -> bỏ qua / khôi phục / chạy script"""
+        start = time.time()
+        key, components, status, reason = self.check(stage)
+        result = {'status': status, 'reason': reason, 'seconds': 0.0}
+        if self.dry_run and status in ('run', 'restore'):
+            result['status'] = 'stale'
+        if status in ('fresh', 'missing') or self.dry_run:
+            result['seconds'] = time.time() - start
+            return result
+        name = stage['name']
+        if status == 'restore':
+            outputs = stored_files(name, key)
+            restore_outputs(stage, key, outputs)
+        else:
+            log_path = os.path.join(ROOT, CACHE_DIR, 'logs', f"{name}.log")
+            code, seconds = run_command(stage, log_path)
+            result['run_seconds'] = seconds
+            if code != 0:
+                result.update(status='failed', reason=f"mã thoát {code}, xem {rel(log_path)}",
+                              seconds=time.time() - start)
+                return result
+            outputs = expand_outputs(stage)
+            if not outputs:
+                result.update(status='failed', reason="không sinh ra file kết quả nào",
+                              seconds=time.time() - start)
+                return result
+            save_outputs(stage, key, outputs)
+        result['seconds'] = time.time() - start
+        result['update'] = {
+            'key': key,
+            'components': components,
+            'outputs': {p: self.hasher(os.path.join(ROOT, p)) for p in outputs},
+            'seconds': result.get('run_seconds', self.manifest['stages'].get(name, {}).get('seconds')),
+        }
+        return result
+
+    def run(self):
+        """Lập lịch theo đồ thị phụ thuộc: stage sẵn sàng khi mọi stage phụ thuộc đã xong"""
+        pending = {s['name']: s for s in self.stages}
+        running = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            while pending or running:
+                selected = set(pending) | set(running.values()) | set(self.results)
+                for name, stage in list(pending.items()):
+                    deps = [d for d in stage.get('deps', []) if d in selected]
+                    failed = [d for d in deps if self.results.get(d, {}).get('status') in ('failed', 'missing', 'skipped')]
+                    if failed:
+                        self.results[name] = {'status': 'skipped', 'seconds': 0.0,
+                                              'reason': f"stage phụ thuộc không dựng được: {', '.join(failed)}"}
+                        del pending[name]
+                        print(f"  ⏭️  {name}: bỏ qua ({self.results[name]['reason']})")
+                    elif all(d in self.results for d in deps):
+                        del pending[name]
+                        stale = [d for d in deps if self.results[d]['status'] == 'stale']
+                        if stale: # --dry-run: input của stage này sẽ đổi khi dựng lại stage trước
+                            missing = missing_inputs(stage, [STAGE_BY_NAME[d] for d in stale])
+                            if missing: # Dựng lại stage trước cũng không sinh ra -> sẽ thiếu input
+                                self.results[name] = {'status': 'missing', 'seconds': 0.0,
+                                                      'reason': f"thiếu input: {', '.join(missing)}"}
+                            else:
+                                self.results[name] = {'status': 'stale', 'seconds': 0.0,
+                                                      'reason': f"sau khi dựng lại {', '.join(stale)}"}
+                            continue
+                        running[executor.submit(self.execute, stage)] = name
+                        if not self.dry_run:
+                            print(f"  ▶️  {name}: bắt đầu", flush=True)
+                if not running:
+                    continue
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    result = future.result()
+                    self.results[name] = result
+                    update = result.pop('update', None)
+                    if update:
+                        entry = self.manifest['stages'].setdefault(name, {})
+                        versions = entry.get('versions', {})
+                        versions[update['key']] = sorted(update['outputs'])
+                        entry.update(update, versions=dict(list(versions.items())[-KEEP_VERSIONS:]))
+                        self.manifest['files'] = self.hasher.known
+                        save_manifest(self.manifest)
+                    if not self.dry_run:
+                        print(f"  {ICONS[result['status']]} {name}: {LABELS[result['status']]} "
+                              f"({result['seconds']:.1f}s) {result.get('reason', '')}", flush=True)
+        return self.results
+
+
+ICONS = {'fresh': '✅', 'restore': '♻️ ', 'run': '🔨', 'failed': '❌', 'missing': '⚠️ ', 'skipped': '⏭️ ',
+         'stale': '🕓'}
+LABELS = {'fresh': 'mới', 'restore': 'khôi phục từ cache', 'run': 'đã chạy', 'failed': 'lỗi',
+          'missing': 'thiếu input', 'skipped': 'bỏ qua', 'stale': 'cần dựng lại'}
+
+
+def print_report(stages, results, total):
+    print("\n=== THỜI GIAN TỪNG STAGE ===")
+    print(f"  {'Stage':<18} {'Trạng thái':<20} {'Giây':>8}  Lý do")
+    for stage in stages:
+        result = results.get(stage['name'], {})
+        status = result.get('status', '?')
+        print(f"  {stage['name']:<18} {LABELS.get(status, status):<20} {result.get('seconds', 0):8.1f}  "
+              f"{result.get('reason', '')}")
+    serial = sum(r.get('seconds', 0) for r in results.values())
+    print(f"  Tổng: {total:.1f}s (tuần tự sẽ là {serial:.1f}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dựng dữ liệu theo đồ thị phụ thuộc, chỉ chạy lại stage cũ")
+    parser.add_argument('stages', nargs='*', help="Stage cần dựng (mặc định: tất cả)")
+    parser.add_argument('--jobs', '-j', type=int, help="Số stage chạy song song")
+    parser.add_argument('--force', nargs='+', default=[], metavar='STAGE', help="Chạy lại dù cache còn mới")
+    parser.add_argument('--dry-run', action='store_true', help="Chỉ báo stage nào cũ và vì sao")
+    parser.add_argument('--list', action='store_true', help="Liệt kê các stage")
+    args = parser.parse_args()
+
+    if args.list:
+        for stage in STAGES:
+            deps = ', '.join(stage.get('deps', [])) or '-'
+            print(f"  {stage['name']:<18} (sau: {deps}) {stage['description']}")
+        return 0
+
+    stages = select_stages(args.stages)
+    print(f"=== BUILD: {', '.join(s['name'] for s in stages)} ===")
+    start = time.time()
+    builder = Builder(stages, args.jobs, args.force, args.dry_run)
+    results = builder.run()
+    print_report(stages, results, time.time() - start)
+    return 1 if any(r['status'] == 'failed' for r in results.values()) else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -1,17 +1,64 @@
-import requests
+import argparse
+import asyncio
 import json
 import time
 import os
-import concurrent.futures
+import heapq
+import itertools
+import shutil
 from math import floor, ceil
 
+from tile_cache import TileCache, query_hash, tile_key
+from tiling import CountryMask, plan_tiles, split_tile, can_split, tile_bbox
+from line_merge import endpoint_id, dedupe_ways, stitch_ways
+import road_search
+import run_metrics
+
+try:
+    import numpy
+except ImportError: # Thiếu numpy -> chỉ ghi file JSON full, không có LOD / nhị phân / chỉ mục
+    numpy = None
+
+if numpy is not None: # Lỗi import trong chính các module dưới đây không bị nuốt
+    from geo_arrays import group_bboxes
+    from geo_simplify import lod_levels, lod_path, simplify_road_arrays
+    from road_collection import RoadCollection, render_features
+    from geo_binary import GeoBinaryWriter, binary_path
+    from spatial_index import write_index, index_path
+    import pbf_roads
+    import road_shards
+    import road_updates
+else:
+    RoadCollection = None
+    lod_levels = None
+    GeoBinaryWriter = None
+    write_index = None
+    pbf_roads = None
+    road_shards = None
+    road_updates = None
+
+from overpass_client import OverpassClient, aiohttp
+
 # --- CẤU HÌNH ---
 OUTPUT_FILE = 'assets/roads/vn_roads_full.json'
 TEMP_DIR = 'assets/roads/temp_chunks'
+CACHE_DIR = 'assets/roads/tile_cache' # Cache response từng ô + manifest (giữ lại giữa các lần chạy)
+BOUNDARIES_FILE = 'assets/boundaries/vn_boundaries.json' # Lấy polygon 'Việt Nam' để bỏ ô biển/nước ngoài
+BOUNDARIES_2025_FILE = 'assets/boundaries/vn_boundaries_2025.json' # 34 tỉnh 2025 cho --shards province
+SHARD_DIR = 'assets/roads/shards'
+PATCH_DIR = 'assets/roads/patches' # Patch giữa 2 bản khi chạy --update (xem tools/road_updates.py)
+PBF_FILE = 'assets/roads/vietnam-latest.osm.pbf' # Extract OSM cho chế độ --pbf (Geofabrik)
+METRICS_FILE = 'assets/roads/run_metrics.ndjson' # Số liệu từng ô / request / RSS (xem tools/run_metrics.py)
+PROFILE_FILE = 'assets/roads/profile.folded' # Kết quả --profile (collapsed stack, mở bằng speedscope.app)
+SHARD_MODE = 'province' # Chia shard theo tỉnh 2025 / ô lưới / không chia (xem tools/road_shards.py)
 
 # Phạm vi Việt Nam (mở rộng)
 VN_BOUNDS = (8.0, 102.0, 24.0, 110.0) # min_lat, min_lon, max_lat, max_lon
-GRID_SIZE = 0.5 # Kích thước ô lưới (độ). 0.5x0.5 độ là an toàn để tránh timeout
+# Ô lưới không còn cố định 0.5 độ: xem tools/tiling.py (quadtree 2° -> 0.125°)
+
+# Giới hạn mỗi query. Ô vượt giới hạn (timeout / quá nhiều dữ liệu) sẽ được chia 4
+QUERY_TIMEOUT = 180                  # giây (phía server)
+QUERY_MAXSIZE = 256 * 1024 * 1024    # bytes RAM phía server cho 1 query
 
 # Loại đường cần tải
 # Chi tiết nhất: bao gồm cả residential, unclassified, service...
@@ -29,8 +76,17 @@ SERVERS = [
     "https://z.overpass-api.de/api/interpreter",
 ]
 
-# Số luồng tải song song (đừng để quá cao kẻo bị ban IP)
-MAX_WORKERS = 10 
+# Giới hạn cho MỖI server (đừng để quá cao kẻo bị ban IP), xem tools/overpass_client.py
+PER_SERVER_CONCURRENCY = 2 # Request đồng thời
+PER_SERVER_RATE = 0.5      # Request/giây (token bucket)
+PER_SERVER_BURST = 2
+
+# Số điểm gom lại mỗi lượt simplify LOD (numpy xử lý theo lô -> nhanh, RAM vẫn giới hạn)
+LOD_BATCH_VERTICES = 500_000
+
+# Số file chunk tối đa mở cùng lúc khi merge (tránh vượt giới hạn file descriptor)
+# Nếu nhiều hơn, merge theo nhiều lượt (multi-pass)
+MAX_OPEN_CHUNKS = 64
 
 # --- HÀM HỖ TRỢ ---
 
@@ -41,38 +97,69 @@ def ensure_dir(directory):
 def get_bbox_str(lat, lon, size):
     return f"{lat},{lon},{lat+size},{lon+size}"
 
-def fetch_tile(lat, lon, size, server_index):
-    bbox = get_bbox_str(lat, lon, size)
-    
+def build_query(bbox):
     # Thêm bộ lọc area["ISO3166-1"="VN"] để chỉ lấy đường trong lãnh thổ Việt Nam
     # Kết hợp với bounding box của ô lưới hiện tại
-    query = f"""
-    [out:json][timeout:180];
+    return f"""
+    [out:json][timeout:{QUERY_TIMEOUT}][maxsize:{QUERY_MAXSIZE}];
     area["ISO3166-1"="VN"]->.searchArea;
     (
       way["highway"~"^({ROAD_TYPES_STR})$"](area.searchArea)({bbox});
     );
     out geom;
     """
-    
-    server = SERVERS[server_index % len(SERVERS)]
-    try:
-        response = requests.post(server, data={'data': query}, timeout=200)
-        if response.status_code == 200:
-            return response.json()
-        elif response.status_code == 429: # Too Many Requests
-            time.sleep(5)
-            return fetch_tile(lat, lon, size, server_index + 1) # Retry with different server
-        else:
-            print(f"Error {response.status_code} fetching {bbox} from {server}")
-            return None
-    except Exception as e:
-        print(f"Exception fetching {bbox}: {e}")
-        return None
+
+def build_adiff_query(since):
+    """Augmented diff từ mốc since tới hiện tại, cùng bộ lọc với build_query (cả lãnh thổ, không chia ô)"""
+    return f"""
+    [out:xml][timeout:{QUERY_TIMEOUT}][maxsize:{QUERY_MAXSIZE}][adiff:"{since}"];
+    area["ISO3166-1"="VN"]->.searchArea;
+    (
+      way["highway"~"^({ROAD_TYPES_STR})$"](area.searchArea);
+    );
+    out geom;
+    """
+
+def current_query_hash():
+    """Hash mẫu câu query (không phụ thuộc bbox) -> đổi query là cache cũ hết hiệu lực"""
+    return query_hash(build_query('{bbox}'))
+
+def tile_cache_key(lat, lon, size):
+    """Key cache của 1 ô: bbox + tập loại đường + hash câu query"""
+    bbox = (lat, lon, lat + size, lon + size)
+    return tile_key(bbox, ROAD_TYPES, current_query_hash())
+
+def is_overloaded_response(data):
+    """Overpass trả 200 nhưng kèm remark khi query bị ngắt giữa chừng (dữ liệu không đủ)"""
+    remark = data.get('remark', '') if isinstance(data, dict) else ''
+    return 'timed out' in remark or 'out of memory' in remark
+
+async def fetch_tiles(tiles, servers, handle, observer=None):
+    """Tải các ô qua OverpassClient (asyncio). handle(tile, FetchResult) -> list ô con cần tải thêm
+    handle (parse JSON, ghi chunk, cache) chạy trong thread riêng để không chặn các request khác.
+    observer: nhận số liệu từng lần gửi HTTP (xem OverpassClient)"""
+    async with OverpassClient(servers, PER_SERVER_CONCURRENCY, PER_SERVER_RATE, PER_SERVER_BURST,
+                              timeout=QUERY_TIMEOUT + 20, observer=observer) as client:
+        async def fetch(tile):
+            return tile, await client.fetch(build_query(get_bbox_str(*tile)))
+
+        # Hàng đợi động: ô bị chia sẽ sinh thêm ô con trong lúc đang chạy
+        running = {asyncio.create_task(fetch(tile)) for tile in tiles}
+        while running:
+            done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                tile, result = task.result()
+                children = await asyncio.to_thread(handle, tile, result, len(running))
+                running.update(asyncio.create_task(fetch(child)) for child in children)
+        return client.server_summary()
 
 def process_elements(elements):
-    """Chuyển đổi dữ liệu raw từ Overpass sang cấu trúc trung gian"""
-    processed = {} # key: (name, ref, type) -> list of segments
+    """Chuyển đổi dữ liệu raw từ Overpass sang cấu trúc trung gian
+    Mỗi way giữ lại id + node đầu/cuối để khử trùng và nối đoạn khi merge,
+    danh sách node để cập nhật tăng dần (dời node, xem road_updates.py):
+    [way_id, first_node, last_node, coords, nodes]
+    """
+    processed = {} # key: (name, ref, type) -> list of ways
     
     for el in elements:
         tags = el.get('tags', {})
@@ -91,12 +178,16 @@ def process_elements(elements):
         # Convert geometry to list of [lon, lat]
         coords = [[p['lon'], p['lat']] for p in geometry]
         
+        nodes = el.get('nodes')
+        way = [el.get('id'), endpoint_id(nodes, coords, True), endpoint_id(nodes, coords, False), coords,
+               nodes or []]
+        
         # Key để gom nhóm các đoạn đường cùng tên
         key = (name, ref, highway)
         
         if key not in processed:
             processed[key] = []
-        processed[key].append(coords)
+        processed[key].append(way)
         
     return processed
 
@@ -107,6 +198,7 @@ def merge_processed_data(main_dict, new_dict):
         main_dict[key].extend(segments)
 
 def calculate_feature_bbox(segments):
+    """bbox bằng Python thuần, chỉ dùng khi thiếu numpy (bình thường: geo_arrays.group_bboxes)"""
     min_lat, min_lon = 90.0, 180.0
     max_lat, max_lon = -90.0, -180.0
     for seg in segments:
@@ -118,99 +210,607 @@ def calculate_feature_bbox(segments):
             if lon > max_lon: max_lon = lon
     return [min_lat, min_lon, max_lat, max_lon]
 
+# --- CHUNK TẠM TRÊN ĐĨA (EXTERNAL MERGE) ---
+
+def chunk_path(idx):
+    return os.path.join(TEMP_DIR, f"tile_{idx:05d}.ndjson")
+
+def clear_chunks():
+    """Xóa các chunk cũ còn sót lại từ lần chạy trước"""
+    for fname in os.listdir(TEMP_DIR):
+        if fname.endswith('.ndjson') or fname.endswith('.part'):
+            os.remove(os.path.join(TEMP_DIR, fname))
+
+def write_chunk(processed, path):
+    """Ghi kết quả process_elements của 1 ô ra file NDJSON, sắp xếp theo key
+    Mỗi dòng: [[name, ref, highway], ways] (xem process_elements)
+    """
+    tmp_path = path + '.part'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for key in sorted(processed):
+            f.write(json.dumps([list(key), processed[key]], ensure_ascii=False))
+            f.write('\n')
+    os.replace(tmp_path, path) # Ghi atomic: không bao giờ có chunk dở dang
+
+def iter_chunk(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            key, segments = json.loads(line)
+            yield tuple(key), segments
+
+def merge_sorted_streams(streams):
+    """K-way merge các luồng (key, segments) đã sắp xếp, gộp các bản ghi cùng key"""
+    merged = heapq.merge(*streams, key=lambda item: item[0])
+    for key, group in itertools.groupby(merged, key=lambda item: item[0]):
+        segments = []
+        for _, segs in group:
+            segments.extend(segs)
+        yield key, segments
+
+def reduce_chunks(paths):
+    """Merge nhiều lượt cho đến khi số chunk <= MAX_OPEN_CHUNKS"""
+    level = 0
+    while len(paths) > MAX_OPEN_CHUNKS:
+        next_paths = []
+        for i in range(0, len(paths), MAX_OPEN_CHUNKS):
+            batch = paths[i:i + MAX_OPEN_CHUNKS]
+            out_path = os.path.join(TEMP_DIR, f"merge_{level}_{i // MAX_OPEN_CHUNKS:05d}.ndjson")
+            with open(out_path + '.part', 'w', encoding='utf-8') as f:
+                for key, segments in merge_sorted_streams([iter_chunk(p) for p in batch]):
+                    f.write(json.dumps([list(key), segments], ensure_ascii=False))
+                    f.write('\n')
+            os.replace(out_path + '.part', out_path)
+            for p in batch:
+                os.remove(p)
+            next_paths.append(out_path)
+        paths = next_paths
+        level += 1
+    return paths
+
+def iter_merged_roads(paths):
+    """Trả về lần lượt từng con đường (key, segments) đã gộp từ tất cả các chunk
+    Bộ nhớ chỉ giữ 1 con đường tại 1 thời điểm (+ 1 dòng đệm cho mỗi chunk)
+    """
+    paths = reduce_chunks(sorted(paths))
+    return merge_sorted_streams([iter_chunk(p) for p in paths])
+
+def iter_stitched_roads(roads, stats, state=None):
+    """Khử trùng way theo id rồi nối các đoạn chung đầu mút thành polyline liền
+    Way sắp theo id trước khi nối: kết quả không phụ thuộc thứ tự ô / chunk
+    (cập nhật tăng dần ra đúng như dựng lại từ đầu)
+    stats: dict cộng dồn số part/vertex trước và sau khi nối (để báo cáo)
+    state: road_updates.StateWriter nhận các way đã khử trùng (trạng thái cho lần --update sau)
+    """
+    for key, ways in roads:
+        stats['parts_before'] += len(ways)
+        stats['vertices_before'] += sum(len(w[3]) for w in ways)
+        ways = dedupe_ways(ways)
+        ways.sort(key=lambda w: (w[0] is None, w[0] or 0))
+        stats['ways'] += len(ways)
+        if state is not None:
+            state.add(key, ways)
+        segments = stitch_ways(ways)
+        stats['parts_after'] += len(segments)
+        stats['vertices_after'] += sum(len(seg) for seg in segments)
+        yield key, segments
+
+def new_stitch_stats():
+    return {'parts_before': 0, 'vertices_before': 0, 'ways': 0, 'parts_after': 0, 'vertices_after': 0}
+
+def print_stitch_stats(stats):
+    def pct(after, before):
+        return f"{(1 - after / before) * 100:.1f}%" if before else "-"
+    print(f"Nối đoạn: {stats['parts_before']} part ({stats['ways']} way sau khử trùng) -> "
+          f"{stats['parts_after']} polyline (giảm {pct(stats['parts_after'], stats['parts_before'])})")
+    print(f"Vertex:   {stats['vertices_before']} -> {stats['vertices_after']} "
+          f"(giảm {pct(stats['vertices_after'], stats['vertices_before'])})")
+
+def roads_header(lod=None):
+    header = {
+        "version": "1.0",
+        "generated": time.strftime("%Y-%m-%d"),
+        "source": "OpenStreetMap Overpass (Full Detail)",
+    }
+    if lod is not None:
+        header["lod"] = lod
+    return header
+
+class RoadsJsonWriter:
+    """Ghi file JSON đích theo kiểu streaming (không giữ toàn bộ features trong RAM)
+    Mỗi feature nằm trên 1 dòng; add() trả về vị trí byte (offset, length) của feature
+    để dựng chỉ mục không gian (spatial_index.py)."""
+
+    def __init__(self, output_file, lod=None):
+        self.output_file = output_file
+        self.tmp_path = output_file + '.part'
+        self.total = 0
+        self.offset = 0
+        self.f = open(self.tmp_path, 'wb')
+        self._write('{\n')
+        for key, value in roads_header(lod).items():
+            self._write(f'  {json.dumps(key)}: {json.dumps(value, ensure_ascii=False)},\n')
+        self._write('  "features": [')
+
+    def _write(self, text):
+        data = text.encode('utf-8')
+        self.f.write(data)
+        self.offset += len(data)
+        return len(data)
+
+    def add(self, feature):
+        return self.add_json(json.dumps(feature, ensure_ascii=False))
+
+    def add_json(self, text):
+        """Ghi 1 feature đã ở dạng text JSON (road_collection.render_features)"""
+        self._write(',\n    ' if self.total else '\n    ')
+        start = self.offset
+        length = self._write(text)
+        self.total += 1
+        return start, length
+
+    def close(self):
+        self._write('\n  ],\n')
+        # "total" đặt sau features vì chỉ biết khi đã stream xong
+        self._write(f'  "total": {self.total}\n')
+        self._write('}\n')
+        self.f.close()
+        os.replace(self.tmp_path, self.output_file)
+        return self.total
+
+def make_road_feature(name, ref, road_type, bbox, segments):
+    return {
+        "name": name,
+        "ref": ref,
+        "road_type": road_type,
+        "bbox": bbox,
+        "geometry": {
+            "type": "MultiLineString",
+            "coordinates": segments
+        }
+    }
+
+def write_roads_json(roads, output_file, lods=(), binary=False, index=False, search=False, shards=None):
+    """Ghi file full + các file LOD (vn_roads_full_lod0.json...) trong cùng 1 lượt stream
+    Đường được gom theo lô LOD_BATCH_VERTICES điểm vào 1 RoadCollection (mảng tọa độ phẳng,
+    xem road_collection.py) rồi dùng chung mảng đó cho bbox, simplify mọi LOD, ghi JSON và .vngb.
+    binary=True: ghi thêm bản nhị phân mmap được (vn_roads_full.vngb, xem geo_binary.py)
+    index=True: ghi thêm chỉ mục R-tree theo bbox (vn_roads_full.rtree, xem spatial_index.py)
+    search=True: ghi thêm chỉ mục tìm kiếm tên/ref (vn_roads_full.search.json, xem road_search.py)
+    shards: road_shards.ShardWriter nhận từng lô feature (dùng lại mảng numpy của lô)
+    """
+    writer = RoadsJsonWriter(output_file)
+    bin_writer = GeoBinaryWriter(binary_path(output_file), roads_header()) if binary else None
+    lod_writers = [(lod, RoadsJsonWriter(lod_path(output_file, lod['level']), lod)) for lod in lods]
+    tolerances = [lod['tolerance'] for lod, _ in lod_writers]
+    batch = RoadCollection() if RoadCollection is not None else None
+    index_bboxes = []
+    index_offsets = []
+    search_records = []
+
+    def record(key, bbox, offset):
+        if index:
+            index_bboxes.append(bbox)
+            index_offsets.append(offset)
+        if search:
+            search_records.append((key[0], key[1]))
+
+    def flush():
+        if not len(batch):
+            return
+        coords, offsets, road_parts = batch.arrays()
+        bboxes = group_bboxes(coords, offsets[road_parts]).tolist()
+        texts = []
+        for i, text in render_features(batch.roads, bboxes, coords, offsets, road_parts):
+            record(batch.roads[i].key, bboxes[i], writer.add_json(text))
+            if shards is not None:
+                texts.append(text)
+        if bin_writer is not None:
+            bin_writer.add_lines(batch.roads, bboxes, coords, offsets, road_parts)
+        if shards is not None:
+            props = [{'name': r.name, 'ref': r.ref, 'road_type': r.road_type, 'bbox': bbox}
+                     for r, bbox in zip(batch.roads, bboxes)]
+            shards.add_batch(props, (coords, offsets), road_parts, texts)
+        if lod_writers:
+            per_lod = simplify_road_arrays(coords, offsets, road_parts, tolerances)
+            for (lod, lod_writer), simplified in zip(lod_writers, per_lod):
+                for _, text in render_features(batch.roads, bboxes, *simplified):
+                    lod_writer.add_json(text)
+        batch.clear()
+
+    pending, pending_vertices = [], 0 # Gom cả lô rồi mới trải phẳng vào batch (1 lần numpy / lô)
+    for key, segments in roads:
+        if batch is None: # Không có numpy: tính bbox bằng vòng lặp Python, ghi ngay
+            feature = make_road_feature(*key, calculate_feature_bbox(segments), segments)
+            record(key, feature['bbox'], writer.add(feature))
+            continue
+        pending.append((key, segments))
+        pending_vertices += sum(map(len, segments))
+        if pending_vertices >= LOD_BATCH_VERTICES:
+            batch.add_many(pending)
+            flush()
+            pending, pending_vertices = [], 0
+    if batch is not None:
+        batch.add_many(pending)
+        flush()
+
+    for lod, lod_writer in lod_writers:
+        count = lod_writer.close()
+        print(f"  LOD{lod['level']} (zoom {lod['min_zoom']}-{lod['max_zoom']}): {count} con đường, "
+              f"{os.path.getsize(lod_writer.output_file) / (1024*1024):.2f} MB → {lod_writer.output_file}")
+    if bin_writer is not None:
+        bin_writer.close()
+        print(f"  Nhị phân: {os.path.getsize(bin_writer.path) / (1024*1024):.2f} MB → {bin_writer.path}")
+    if shards is not None:
+        shards.close()
+    total = writer.close()
+    if index:
+        # Chỉ số feature trùng với thứ tự trong .vngb; offset là vị trí byte trong file JSON
+        path = index_path(output_file)
+        nodes = write_index(path, index_bboxes, index_offsets)
+        print(f"  Chỉ mục R-tree: {nodes} nút, {os.path.getsize(path) / (1024*1024):.2f} MB → {path}")
+    if search:
+        path = road_search.index_path(output_file)
+        search_index = road_search.write_search_index(path, search_records)
+        print(f"  Chỉ mục tìm kiếm: {len(search_index['refs'])} ref, {len(search_index['names'])} tên, "
+              f"{os.path.getsize(path) / (1024*1024):.2f} MB → {path}")
+    return total
+
 # --- MAIN ---
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Tải dữ liệu đường Việt Nam theo ô lưới (có cache)")
+    parser.add_argument('--offline', action='store_true',
+                        help="Không gọi mạng, chỉ dựng lại file JSON từ cache các ô đã tải")
+    parser.add_argument('--pbf', nargs='?', const=PBF_FILE, metavar='FILE',
+                        help="Đọc đường từ file OSM PBF cục bộ thay cho Overpass "
+                             f"(mặc định {PBF_FILE}, tải tại download.geofabrik.de)")
+    parser.add_argument('--update', action='store_true',
+                        help="Cập nhật tăng dần từ lần dựng trước: chỉ lấy way đổi từ mốc osm_timestamp "
+                             "(Overpass adiff, hoặc --osc / --adiff), ghi kèm patch vào " + PATCH_DIR)
+    parser.add_argument('--osc', nargs='+', metavar='FILE',
+                        help="--update từ file osmChange (.osc / .osc.gz) theo thứ tự; node thiếu tọa độ "
+                             "tra trong file --pbf của lần dựng trước")
+    parser.add_argument('--adiff', metavar='FILE',
+                        help="--update từ augmented diff Overpass đã tải sẵn (XML)")
+    parser.add_argument('--since', metavar='TIMESTAMP',
+                        help="Mốc bắt đầu cho --update (mặc định osm_timestamp trong file trạng thái)")
+    parser.add_argument('--workers', type=int,
+                        help="Số process đọc PBF (mặc định: số CPU)")
+    parser.add_argument('--servers', nargs='+', metavar='URL',
+                        help="Server Overpass thay cho SERVERS (vd. stub: tools/overpass_stub.py)")
+    parser.add_argument('--no-lod', action='store_true',
+                        help="Không ghi các file LOD (đã simplify theo dải zoom)")
+    parser.add_argument('--no-binary', action='store_true',
+                        help="Không ghi bản nhị phân .vngb")
+    parser.add_argument('--no-index', action='store_true',
+                        help="Không ghi chỉ mục không gian .rtree")
+    parser.add_argument('--no-search', action='store_true',
+                        help="Không ghi chỉ mục tìm kiếm tên/ref (.search.json)")
+    parser.add_argument('--shards', choices=['province', 'grid', 'none'], default=SHARD_MODE,
+                        help=f"Chia thêm shard theo tỉnh 2025 / ô lưới vào {SHARD_DIR} (mặc định {SHARD_MODE})")
+    parser.add_argument('--metrics', default=METRICS_FILE, metavar='FILE',
+                        help=f"File NDJSON số liệu từng ô/request/RSS (mặc định {METRICS_FILE})")
+    parser.add_argument('--no-metrics', action='store_true', help="Không ghi file số liệu")
+    parser.add_argument('--profile', nargs='?', const=PROFILE_FILE, metavar='FILE',
+                        help=f"Chạy kèm profiler lấy mẫu, ghi collapsed stack (mặc định {PROFILE_FILE})")
+    return parser.parse_args()
+
+def write_outputs(chunk_files, args, state_meta=None):
+    """Merge các chunk và ghi file JSON cuối cùng (+ LOD / nhị phân / chỉ mục)
+    state_meta: osm_timestamp / source ghi vào trạng thái mức way (xem tools/road_updates.py)"""
+    print(f"\nĐang merge {len(chunk_files)} chunk và tạo file JSON cuối cùng...")
+    lods = []
+    if not args.no_lod:
+        if lod_levels is None:
+            print("⚠️ Chưa cài numpy -> bỏ qua file LOD (pip install numpy)")
+        else:
+            lods = lod_levels()
+    binary = not args.no_binary and GeoBinaryWriter is not None
+    index = not args.no_index and write_index is not None
+    shards = None
+    if args.shards != 'none':
+        if road_shards is None or road_shards.shapely is None:
+            print("⚠️ Chưa cài numpy/shapely -> bỏ qua chia shard (pip install numpy shapely)")
+        elif args.shards == 'province' and not os.path.exists(BOUNDARIES_2025_FILE):
+            print(f"⚠️ Không có {BOUNDARIES_2025_FILE} -> bỏ qua chia shard theo tỉnh (hoặc dùng --shards grid)")
+        else:
+            shards = road_shards.ShardWriter(SHARD_DIR, args.shards, BOUNDARIES_2025_FILE,
+                                             bounds=VN_BOUNDS, header=roads_header())
+    state = None
+    if road_updates is not None:
+        meta = dict(state_meta or {})
+        meta['road_types'] = ROAD_TYPES
+        state = road_updates.StateWriter(OUTPUT_FILE, meta)
+    stats = new_stitch_stats()
+    total = write_roads_json(iter_stitched_roads(iter_merged_roads(chunk_files), stats, state), OUTPUT_FILE,
+                             lods, binary, index, not args.no_search, shards)
+    clear_chunks()
+    print_stitch_stats(stats)
+    if state is not None:
+        saved = state.close()
+        print(f"  Trạng thái cập nhật: {saved['ways']} way, mốc OSM {saved.get('osm_timestamp') or '?'} "
+              f"→ {state.state_file}")
+    print(f"\n✅ HOÀN TẤT! Đã lưu {total} con đường vào {OUTPUT_FILE}")
+    print(f"File size: {os.path.getsize(OUTPUT_FILE) / (1024*1024):.2f} MB")
+
+def build_from_pbf(args, mask, metrics):
+    """Chế độ offline hoàn toàn: đọc file PBF cục bộ (xem tools/pbf_roads.py), không dùng cache ô"""
+    if pbf_roads is None:
+        print("Lỗi: Chưa cài thư viện 'numpy'.")
+        print("Vui lòng chạy: pip install numpy")
+        return
+    if not os.path.exists(args.pbf):
+        print(f"❌ Không tìm thấy {args.pbf}")
+        print("Tải file tại: https://download.geofabrik.de/asia/vietnam-latest.osm.pbf")
+        return
+    print(f"Đọc {args.pbf} ({os.path.getsize(args.pbf) / (1024*1024):.1f} MB)...")
+    clear_chunks()
+    chunk_files = []
+    stats = {}
+    start_time = time.time()
+    with metrics.phase('pbf'):
+        for processed in pbf_roads.iter_road_chunks(args.pbf, ROAD_TYPES, mask, args.workers, stats=stats):
+            path = chunk_path(len(chunk_files))
+            write_chunk(processed, path)
+            chunk_files.append(path)
+    pbf_roads.print_stats(stats, time.time() - start_time, args.pbf)
+    timestamp = pbf_roads.replication_timestamp(args.pbf)
+    if timestamp is None:
+        print("⚠️ File PBF không ghi mốc thời gian (osmosis_replication_timestamp) -> --update cần --since")
+    with metrics.phase('write'):
+        write_outputs(chunk_files, args, {'source': 'pbf', 'osm_timestamp': timestamp})
+
 def main():
-    print("=== TOOL TẢI DỮ LIỆU ĐƯỜNG VIỆT NAM FULL (Multithreaded) ===")
+    args = parse_args()
+    print("=== TOOL TẢI DỮ LIỆU ĐƯỜNG VIỆT NAM FULL (asyncio) ===")
     ensure_dir(os.path.dirname(OUTPUT_FILE))
     ensure_dir(TEMP_DIR)
+    metrics = run_metrics.NullRecorder() if args.no_metrics else run_metrics.MetricsRecorder(args.metrics)
+    sampler = run_metrics.StackSampler().start() if args.profile else None
+    try:
+        with metrics:
+            run(args, metrics)
+    finally:
+        if sampler is not None:
+            sampler.stop()
+            run_metrics.print_profile(sampler, args.profile)
+    if metrics.path:
+        print(f"\n=== SỐ LIỆU CHẠY ({metrics.path}) ===")
+        for line in run_metrics.summarize(run_metrics.load_events(metrics.path)):
+            print(line)
+
+def fetch_changes(since, servers):
+    """Tải augmented diff từ mốc since (1 query cho cả lãnh thổ) -> road_updates.Changes hoặc None"""
+    async def fetch():
+        async with OverpassClient(servers, 1, PER_SERVER_RATE, PER_SERVER_BURST,
+                                  timeout=QUERY_TIMEOUT + 20) as client:
+            return await client.fetch(build_adiff_query(since))
+
+    result = asyncio.run(fetch())
+    if result.raw is None:
+        print(f"❌ Không tải được thay đổi từ Overpass: {result.error}")
+        return None
+    try:
+        return road_updates.parse_adiff(result.raw)
+    except (ValueError, SyntaxError) as e: # ParseError của ElementTree là SyntaxError
+        print(f"❌ Augmented diff lỗi: {e}")
+        return None
+
+def run_update(args, mask, metrics):
+    """--update: áp thay đổi OSM từ mốc lần dựng trước lên trạng thái mức way, ghi lại file đích
+    như lần dựng đầy đủ rồi ghi patch (cũ -> mới) cho app (xem tools/road_updates.py)"""
+    if road_updates is None:
+        print("Lỗi: Chưa cài thư viện 'numpy'.")
+        print("Vui lòng chạy: pip install numpy")
+        return
+    state = road_updates.load_state(OUTPUT_FILE)
+    if state is None or not os.path.exists(OUTPUT_FILE):
+        print(f"❌ Chưa có trạng thái {road_updates.state_path(OUTPUT_FILE)} -> chạy dựng đầy đủ 1 lần trước")
+        return
+    if state.get('road_types') != ROAD_TYPES:
+        print(f"❌ ROAD_TYPES đã đổi so với lần dựng trước ({state.get('road_types')}) -> cần dựng lại đầy đủ")
+        return
+    since = args.since or state.get('osm_timestamp')
+    if not since:
+        print("❌ Lần dựng trước không có mốc thời gian OSM -> chỉ định --since 2026-10-01T00:00:00Z")
+        return
+    print(f"Cập nhật từ mốc {since} (lần dựng trước: {state.get('source')}, {state.get('ways')} way)")
+
+    with metrics.phase('changes'):
+        if args.osc:
+            changes = road_updates.read_osc(args.osc)
+        elif args.adiff:
+            changes = road_updates.read_adiff(args.adiff)
+        elif aiohttp is None:
+            print("Lỗi: Chưa cài thư viện 'aiohttp'.")
+            print("Vui lòng chạy: pip install aiohttp")
+            return
+        else:
+            changes = fetch_changes(since, args.servers or SERVERS)
+            if changes is None:
+                return
+    until = changes.timestamp or since
+    print(f"Thay đổi tới mốc {until}: {changes.summary()}")
+
+    clear_chunks()
+    base_chunk, added_chunk = chunk_path(0), chunk_path(1)
+    with metrics.phase('apply'):
+        try:
+            processed, stats = road_updates.apply_changes(
+                road_updates.ways_path(OUTPUT_FILE), changes, ROAD_TYPES, process_elements, base_chunk,
+                mask, args.pbf if args.osc else None, args.workers)
+        except ValueError as e:
+            print(f"❌ {e}")
+            clear_chunks()
+            return
+        write_chunk(processed, added_chunk)
+    road_updates.print_apply_stats(stats)
+
+    # Giữ bản cũ (hard link, file mới được ghi qua .part + os.replace) để so ra patch
+    previous = OUTPUT_FILE + '.prev'
+    if os.path.exists(previous):
+        os.remove(previous)
+    try:
+        os.link(OUTPUT_FILE, previous)
+    except OSError:
+        shutil.copyfile(OUTPUT_FILE, previous)
+    try:
+        with metrics.phase('write'):
+            write_outputs([base_chunk, added_chunk], args,
+                          {'source': 'update', 'osm_timestamp': until, 'base': state.get('source')})
+        with metrics.phase('patch'):
+            path = road_updates.patch_path(OUTPUT_FILE, since, until, PATCH_DIR)
+            removed, modified, added = road_updates.write_patch(previous, OUTPUT_FILE, path, since, until)
+    finally:
+        os.remove(previous)
+    print(f"Patch: xóa {removed}, sửa {modified}, thêm {added} đường, "
+          f"{os.path.getsize(path) / 1024:.1f} KB → {path}")
+
+def run(args, metrics):
+    mask = CountryMask(BOUNDARIES_FILE)
+    if args.update:
+        run_update(args, mask, metrics)
+        return
+    if args.pbf:
+        build_from_pbf(args, mask, metrics)
+        return
+    cache = TileCache(CACHE_DIR)
+    
+    def key_of(tile):
+        return tile_cache_key(*tile)
     
-    # Tạo danh sách các ô lưới (Tiles)
-    tasks = []
-    lat = VN_BOUNDS[0]
-    idx = 0
-    while lat < VN_BOUNDS[2]:
-        lon = VN_BOUNDS[1]
-        while lon < VN_BOUNDS[3]:
-            tasks.append((lat, lon, idx))
-            lon += GRID_SIZE
-            idx += 1
-        lat += GRID_SIZE
+    qhash = current_query_hash()
+    
+    # Lập kế hoạch ô lưới (quadtree, bỏ ô ngoài lãnh thổ, dùng kinh nghiệm từ manifest)
+    hints = cache.hints(qhash)
+    tasks = plan_tiles(VN_BOUNDS, mask, hints, lambda t: cache.is_ok(key_of(t)))
         
-    print(f"Tổng số ô lưới cần tải: {len(tasks)}")
+    # Chỉ tải các ô chưa có trong cache hoặc lần trước bị lỗi
+    cached = [t for t in tasks if cache.is_ok(key_of(t))]
+    pending = [t for t in tasks if not cache.is_ok(key_of(t))]
+    print(f"Tổng số ô lưới: {len(tasks)} (đã có trong cache: {len(cached)}, cần tải: {len(pending)})")
+    
+    # Không giữ dữ liệu trong RAM: mỗi ô xong là ghi ngay ra chunk trên đĩa,
+    # cuối cùng merge k-way các chunk (đã sắp xếp theo key) ra file đích.
+    clear_chunks()
+    chunk_files = []
+    total_segments = 0
+    osm_base = None # Mốc dữ liệu cũ nhất trong các ô -> --update lấy thay đổi từ đây
+    
+    def add_tile_chunk(data):
+        """Ghi 1 ô ra chunk, trả về (chunk_data, số giây xử lý + ghi)"""
+        nonlocal total_segments, osm_base
+        start = time.monotonic()
+        stamp = data.get('osm3s', {}).get('timestamp_osm_base')
+        if stamp and (osm_base is None or stamp < osm_base):
+            osm_base = stamp
+        chunk_data = process_elements(data.get('elements', []))
+        path = chunk_path(len(chunk_files))
+        write_chunk(chunk_data, path)
+        chunk_files.append(path)
+        total_segments += sum(len(ways) for ways in chunk_data.values())
+        return chunk_data, time.monotonic() - start
     
-    # Dictionary toàn cục để lưu kết quả (Key: (name, ref, type))
-    # Lưu ý: Với dữ liệu full VN, dict này có thể rất lớn RAM. 
-    # Nếu RAM không đủ, cần lưu temp file rồi merge sau. 
-    # Ở đây giả định PC có đủ RAM (>4GB free).
-    global_data = {} 
+    def tile_label(tile):
+        lat, lon, size = tile
+        return f"{lat},{lon},{size}"
+    
+    with metrics.phase('cache'):
+        for tile in cached:
+            start = time.monotonic()
+            data = cache.load(key_of(tile))
+            parse_seconds = time.monotonic() - start
+            _, merge_seconds = add_tile_chunk(data)
+            metrics.record('tile', tile=tile_label(tile), outcome='cache', elements=len(data.get('elements', [])),
+                           parse=round(parse_seconds, 4), merge=round(merge_seconds, 4))
+    if cached:
+        print(f"Đã dựng {len(cached)} chunk từ cache ({total_segments} đoạn)")
+    
+    if args.offline:
+        if pending:
+            print(f"⚠️ Chế độ offline: bỏ qua {len(pending)} ô chưa có trong cache")
+        pending = []
+    elif pending and aiohttp is None:
+        print("Lỗi: Chưa cài thư viện 'aiohttp'.")
+        print("Vui lòng chạy: pip install aiohttp")
+        return
     
     completed = 0
+    failed = 0
+    splits = 0
     start_time = time.time()
     
-    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        future_to_tile = {
-            executor.submit(fetch_tile, t[0], t[1], GRID_SIZE, t[2]): t 
-            for t in tasks
-        }
+    def handle(tile, result, remaining):
+        """Xử lý 1 ô vừa tải xong, trả về các ô con nếu ô bị chia"""
+        nonlocal completed, failed, splits
+        lat, lon, size = tile
+        completed += 1
+        raw, error, overloaded, seconds = result.raw, result.error, result.overloaded, result.seconds
+        event = {'tile': tile_label(tile), 'server': result.server, 'attempts': result.attempts,
+                 'wait': round(result.wait, 4), 'total': round(seconds, 4),
+                 'http': round(result.http_seconds, 4) if result.http_seconds is not None else None,
+                 'bytes': len(raw) if raw is not None else None}
         
-        for future in concurrent.futures.as_completed(future_to_tile):
-            lat, lon, _ = future_to_tile[future]
-            completed += 1
-            data = future.result()
+        data = None
+        if raw is not None:
+            start = time.monotonic()
+            try:
+                data = json.loads(raw)
+            except ValueError as e:
+                error = f"JSON lỗi: {e}"
+            event['parse'] = round(time.monotonic() - start, 4)
+        if data is not None and is_overloaded_response(data):
+            overloaded, error, data = True, data.get('remark'), None
+        
+        progress = f"[{completed}/{completed + remaining}]"
+        if data and 'elements' in data:
+            cache.store(key_of(tile), tile_bbox(tile), ROAD_TYPES, qhash,
+                        raw, len(data['elements']), seconds)
+            chunk_data, merge_seconds = add_tile_chunk(data)
+            metrics.record('tile', **event, outcome='ok', elements=len(data['elements']),
+                           merge=round(merge_seconds, 4))
             
-            if data and 'elements' in data:
-                elements = data['elements']
-                chunk_data = process_elements(elements)
-                merge_processed_data(global_data, chunk_data)
-                
-                # Feedback
-                elapsed = time.time() - start_time
-                print(f"[{completed}/{len(tasks)}] Xong ô {lat},{lon}. "
-                      f"Tìm thấy: {len(chunk_data)} con đường mới trong ô. "
-                      f"Tổng đường (đã gộp): {len(global_data)}. "
-                      f"Thời gian: {elapsed:.1f}s")
-            else:
-                print(f"[{completed}/{len(tasks)}] ❌ Lỗi hoặc rỗng ô {lat},{lon}")
-
-    # Chuyển đổi sang format JSON đích
-    print("\nĐang gộp và tạo file JSON cuối cùng...")
-    final_features = []
+            # Feedback
+            elapsed = time.time() - start_time
+            print(f"{progress} Xong ô {lat},{lon} ({size}°). "
+                  f"Tìm thấy: {len(chunk_data)} con đường trong ô. "
+                  f"Tổng đoạn (trên đĩa): {total_segments}. "
+                  f"Thời gian: {elapsed:.1f}s")
+            return []
+        if overloaded and can_split(tile):
+            splits += 1
+            cache.mark_split(key_of(tile), tile_bbox(tile), ROAD_TYPES, qhash, error, seconds)
+            children = split_tile(tile, mask)
+            metrics.record('tile', **event, outcome='split', error=error, children=len(children))
+            print(f"{progress} ✂️ Ô {lat},{lon} ({size}°) quá tải -> chia thành {len(children)} ô")
+            return children
+        failed += 1
+        cache.mark_failed(key_of(tile), tile_bbox(tile), ROAD_TYPES, qhash,
+                          error or "Không có elements", seconds)
+        metrics.record('tile', **event, outcome='failed', error=error or "Không có elements")
+        print(f"{progress} ❌ Lỗi hoặc rỗng ô {lat},{lon} ({size}°): {error}")
+        return []
     
-    for (name, ref, road_type), segments in global_data.items():
-        bbox = calculate_feature_bbox(segments)
-        feature = {
-            "name": name,
-            "ref": ref,
-            "road_type": road_type,
-            "bbox": bbox,
-            "geometry": {
-                "type": "MultiLineString",
-                "coordinates": segments
-            }
-        }
-        final_features.append(feature)
-        
-    # Tạo output object
-    output = {
-        "version": "1.0",
-        "generated": time.strftime("%Y-%m-%d"),
-        "source": "OpenStreetMap Overpass (Full Detail)",
-        "total": len(final_features),
-        "features": final_features
-    }
+    if pending:
+        def observe(request):
+            metrics.record('request', **request)
+        with metrics.phase('download'):
+            summary = asyncio.run(fetch_tiles(pending, args.servers or SERVERS, handle, observe))
+        if not metrics.path: # Có metrics thì tóm tắt server (kèm thời gian chờ) in ở cuối
+            print("\nServer Overpass:")
+            for line in summary:
+                print(line)
+
+    if splits:
+        print(f"\n✂️ Đã chia nhỏ {splits} ô quá tải (lần chạy sau sẽ dùng luôn ô con).")
+    if failed:
+        print(f"\n⚠️ {failed} ô bị lỗi (đã ghi vào manifest). Chạy lại script để tải tiếp các ô này.")
+
+    with metrics.phase('write'):
+        write_outputs(chunk_files, args, {'source': 'overpass', 'osm_timestamp': osm_base, 'query_hash': qhash})
     
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        json.dump(output, f, ensure_ascii=False, indent=2)
-        
-    print(f"\n✅ HOÀN TẤT! Đã lưu {len(final_features)} con đường vào {OUTPUT_FILE}")
-    print(f"File size: {os.path.getsize(OUTPUT_FILE) / (1024*1024):.2f} MB")
+    ok, failed_total, cache_bytes = cache.summary()
+    print(f"Cache: {ok} ô OK, {failed_total} ô lỗi, {cache_bytes / (1024*1024):.1f} MB tại {CACHE_DIR}")
 
 if __name__ == '__main__':
-    # Kiểm tra requests
-    try:
-        import requests
-        main()
-    except ImportError:
-        print("Lỗi: Chưa cài thư viện 'requests'.")
-        print("Vui lòng chạy: pip install requests")
+    main()
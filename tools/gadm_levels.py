@@ -0,0 +1,676 @@
+"""
+Chuyển GADM nhiều cấp (tỉnh / quận-huyện / xã-phường) theo kiểu streaming, có liên kết cha-con.
+
+GADM cấp 3 đủ độ phân giải (~10 nghìn xã) nặng hàng trăm MB, nên không json.load cả file:
+  - file 1 feature / dòng (GDAL ghi GADM như vậy; .zip / .gz được giải nén ra file tạm trước) được chia
+    thành các khoảng byte ~CHUNK_BYTES tại ranh giới dòng, mỗi process tự đọc + parse khoảng của nó
+  - file dạng khác: iter_feature_texts quét theo từng khối, cắt ra text của từng feature (regex chỉ
+    dừng ở { } " nên mảng tọa độ được bỏ qua ở tốc độ C), các lô text gửi cho process pool
+  - process parse + chuẩn hóa tên + tính bbox; geometry ghi lại nguyên text nguồn (không encode lại)
+  - mỗi cấp ghi streaming ra 1 file, 1 feature / dòng, theo đúng thứ tự file vào
+Tên GADM viết liền ('BàRịa-VũngTàu', 'ChưPrông', 'Phường12', loại 'Thịxã') được tách lại bằng
+normalize_name; cấp tỉnh ưu tiên NAME_MAP của convert_gadm.py để trùng tên với vn_boundaries.json.
+
+Kết quả (--out-dir, mặc định assets/boundaries):
+  vn_admin_provinces.json, vn_admin_districts.json, vn_admin_communes.json
+      feature: name, full_name ('Huyện Ba Vì'), type, admin_level, gadm_id, parent_id,
+               province, district, province_2025, bbox, geometry
+  vn_admin_hierarchy.json  mọi đơn vị (không geometry): name, level, parent, children, province_2025
+                           + rollup_2025: tỉnh 2025 -> tỉnh cũ gộp vào, số quận/huyện, xã/phường
+Tỉnh 2025 của mỗi đơn vị suy ra từ tỉnh cũ chứa nó (MERGE_2025, create_2025_from_gadm.py).
+
+Dùng:
+    python tools/gadm_levels.py convert gadm41_VNM_1.json gadm41_VNM_2.json gadm41_VNM_3.json.zip
+    python tools/gadm_levels.py info assets/boundaries/vn_admin_hierarchy.json "Ba Vì"
+    python tools/gadm_levels.py selftest                  # GADM giả 63 tỉnh / ~750 huyện / ~12 nghìn xã
+"""
+import argparse
+import collections
+import concurrent.futures
+import gzip
+import io
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+from datetime import datetime
+
+from run_metrics import current_rss_mb
+try:
+    from geo_arrays import geometry_bbox
+except ImportError: # Thiếu numpy -> bbox bằng Python thuần (cùng kết quả, chậm hơn)
+    def geometry_bbox(geometry, digits=None):
+        """bbox [south, west, north, east] của Polygon/MultiPolygon"""
+        coords = geometry.get('coordinates', [])
+        rings = coords if geometry.get('type') == 'Polygon' else [r for polygon in coords for r in polygon]
+        lngs = [point[0] for ring in rings for point in ring]
+        lats = [point[1] for ring in rings for point in ring]
+        if not lngs:
+            return [90.0, 180.0, -90.0, -180.0]
+        bbox = [min(lats), min(lngs), max(lats), max(lngs)]
+        return [round(v, digits) for v in bbox] if digits is not None else bbox
+
+BOUNDARIES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'assets', 'boundaries')
+OUTPUT_DIR = 'assets/boundaries'
+OUTPUT_PREFIX = 'vn_admin'
+HIERARCHY_FILE = f'{OUTPUT_PREFIX}_hierarchy.json'
+# Cấp GADM -> (type, admin_level OSM, hậu tố file)
+LEVELS = {
+    1: ('province', 4, 'provinces'),
+    2: ('district', 6, 'districts'),
+    3: ('commune', 8, 'communes'),
+}
+# TYPE_n của GADM viết liền chữ thường, không tách được theo chữ hoa
+UNIT_TYPES = {'Thànhphố': 'Thành phố', 'Thịxã': 'Thị xã', 'Thịtrấn': 'Thị trấn'}
+READ_CHARS = 1 << 20 # Mỗi lần đọc file nguồn
+CHUNK_BYTES = 8 << 20 # Kích thước mỗi lô (khoảng byte / text) cho 1 process
+PROBE_BYTES = 1 << 16 # Phần đầu / cuối file đọc để nhận ra dạng 1 feature / dòng
+TOKEN = re.compile(r'[{}"]')
+STRING = re.compile(r'"(?:[^"\\]|\\.)*"', re.DOTALL)
+SPACE = re.compile(r'\s*')
+FEATURES_OPEN = re.compile(rb'"features"\s*:\s*\[\s*$')
+FEATURES_CLOSE = re.compile(rb'\n[ \t]*\]')
+GEOMETRY_KEY = re.compile(r'"geometry"\s*:\s*')
+
+
+# --- ĐỌC STREAMING ---
+
+def open_binary(path):
+    """Mở file GeoJSON dạng byte: .gz, .zip (member .json đầu tiên) hoặc file thường"""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if path.endswith('.zip'):
+        archive = zipfile.ZipFile(path)
+        members = [n for n in archive.namelist() if n.endswith(('.json', '.geojson'))]
+        if not members:
+            raise ValueError(f"{path}: không có file .json trong zip")
+        return archive.open(members[0])
+    return open(path, 'rb')
+
+
+def open_text(path):
+    """Mở file GeoJSON dạng text (như open_binary)"""
+    return io.TextIOWrapper(open_binary(path), encoding='utf-8')
+
+
+def iter_feature_texts(path, read_chars=READ_CHARS):
+    """Text JSON của từng phần tử trong mảng "features" của FeatureCollection, đọc dần từng khối.
+    Chỉ đếm độ sâu { } ngoài chuỗi; khóa "features" nhận ra ở cấp object gốc"""
+    with open_text(path) as f:
+        buf, pos, depth, key, start = '', 0, 0, None, None
+        while True:
+            m = TOKEN.search(buf, pos)
+            if m is not None:
+                token = m.group()
+                if token == '{':
+                    depth += 1
+                    if depth == 2 and key == 'features':
+                        start = m.start()
+                    pos = m.end()
+                    continue
+                if token == '}':
+                    depth -= 1
+                    if depth == 1 and start is not None:
+                        yield buf[start:m.end()]
+                        start = None
+                    pos = m.end()
+                    continue
+                s = STRING.match(buf, m.start())
+                # Cần thấy cả ký tự sau chuỗi mới biết chuỗi có phải khóa không
+                after = SPACE.match(buf, s.end()).end() if s else len(buf)
+                if after < len(buf):
+                    if depth == 1 and buf[after] == ':':
+                        key = s.group()[1:-1]
+                    pos = s.end()
+                    continue
+            # Hết token trong khối: đọc thêm, bỏ phần đã xử lý (giữ feature đang dở)
+            chunk = f.read(read_chars)
+            if not chunk:
+                break
+            resume = m.start() if m is not None else len(buf)
+            keep = min(start, resume) if start is not None else resume
+            buf = buf[keep:] + chunk
+            pos = resume - keep
+            if start is not None:
+                start -= keep
+        if start is not None or depth:
+            raise ValueError(f"{path}: JSON bị cắt cụt (còn {depth} object chưa đóng)")
+
+
+def iter_features(path):
+    """Feature (dict) của FeatureCollection, parse từng cái một"""
+    for text in iter_feature_texts(path):
+        yield json.loads(text)
+
+
+def feature_lines(path, probe_bytes=PROBE_BYTES):
+    """(byte đầu, byte cuối) vùng feature nếu file là FeatureCollection 1 feature / dòng (dòng '"features": ['
+    trong probe_bytes đầu, dòng sau là trọn 1 Feature, vùng kết thúc ở dòng ']' cuối file); không thì None"""
+    with open(path, 'rb') as f:
+        while True:
+            line = f.readline(probe_bytes)
+            if not line or f.tell() > probe_bytes:
+                return None
+            if FEATURES_OPEN.search(line):
+                break
+        first = f.tell()
+        try:
+            feature = json.loads(f.readline().strip().rstrip(b','))
+        except ValueError:
+            return None
+        if not isinstance(feature, dict) or feature.get('type') != 'Feature':
+            return None
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(first, size - probe_bytes))
+        tail_start = f.tell()
+        closes = list(FEATURES_CLOSE.finditer(f.read()))
+    return (first, tail_start + closes[-1].start() + 1) if closes else None
+
+
+def iter_line_ranges(path, first, end, chunk_bytes=CHUNK_BYTES):
+    """Chia [first, end) thành các khoảng byte ~chunk_bytes, cắt tại cuối dòng: (path, đầu, cuối)"""
+    with open(path, 'rb') as f:
+        start = first
+        while start < end:
+            f.seek(min(start + chunk_bytes, end))
+            f.readline()
+            stop = min(f.tell(), end)
+            yield path, start, stop
+            start = stop
+
+
+def read_feature_lines(path, start, end):
+    """Text các feature trong khoảng byte [start, end) của file 1 feature / dòng"""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start).decode('utf-8')
+    texts = []
+    for line in data.split('\n'):
+        line = line.strip()
+        if line:
+            texts.append(line[:-1].rstrip() if line.endswith(',') else line)
+    return texts
+
+
+# --- CHUẨN HÓA / CHUYỂN ĐỔI ---
+
+def normalize_name(raw, overrides=None):
+    """Tên GADM viết liền -> tên có dấu cách: 'ChưPrông' -> 'Chư Prông', 'Phường12' -> 'Phường 12',
+    'BàRịa-VũngTàu' -> 'Bà Rịa - Vũng Tàu'. overrides (vd. NAME_MAP) được ưu tiên"""
+    raw = (raw or '').strip()
+    if overrides and raw in overrides:
+        return overrides[raw]
+    if raw in UNIT_TYPES:
+        return UNIT_TYPES[raw]
+    if raw in ('', 'NA', 'n.a.'):
+        return ''
+    out = []
+    prev = ''
+    for ch in raw:
+        if prev and ((ch.isupper() and prev.islower()) or (ch.isdigit() and prev.isalpha()) or
+                     (ch.isalpha() and prev.isdigit()) or (prev == '.' and ch.isalpha())):
+            out.append(' ')
+        out.append(ch)
+        prev = ch
+    name = re.sub(r'\s*-\s*', ' - ', ''.join(out))
+    return re.sub(r'\s+', ' ', name).strip()
+
+
+def feature_level(props):
+    """Cấp GADM của feature = n lớn nhất có GID_n"""
+    for level in sorted(LEVELS, reverse=True):
+        if props.get(f'GID_{level}'):
+            return level
+    raise ValueError(f"Feature không có GID_1..GID_{max(LEVELS)}: {sorted(props)}")
+
+
+def convert_feature(feature, overrides=None, province_2025=None):
+    """Feature GADM -> (cấp, feature đầu ra, bản ghi (gadm_id, cấp, tên, cha, tỉnh cũ, tỉnh 2025))"""
+    props = feature.get('properties') or {}
+    level = feature_level(props)
+    names = [normalize_name(props.get(f'NAME_{i}'), overrides if i == 1 else None) for i in range(1, level + 1)]
+    gid = props[f'GID_{level}']
+    name = names[-1] or gid
+    unit_type, admin_level, _ = LEVELS[level]
+    geometry = feature.get('geometry') or {}
+    parent = props.get(f'GID_{level - 1}') if level > 1 else None
+    new_province = (province_2025 or {}).get(names[0])
+    out = {'name': name}
+    if level > 1:
+        kind = normalize_name(props.get(f'TYPE_{level}'))
+        out['full_name'] = f"{kind} {name}" if kind else name
+    out.update({'type': unit_type, 'admin_level': admin_level, 'gadm_id': gid})
+    if level > 1:
+        out['parent_id'] = parent
+        out['province'] = names[0]
+    if level > 2:
+        out['district'] = names[1]
+    if new_province:
+        out['province_2025'] = new_province
+    out['bbox'] = geometry_bbox(geometry)
+    out['geometry'] = geometry
+    return level, out, (gid, level, name, parent, names[0], new_province)
+
+
+_context = None # (overrides, province_2025) của mỗi process (initializer)
+
+
+def _init_worker(overrides, province_2025):
+    global _context
+    _context = (overrides, province_2025)
+
+
+def geometry_text(text, feature):
+    """Text nguồn của geometry nếu lấy ra chắc chắn được (geometry là khóa cuối, "geometry" chỉ xuất hiện 1 lần,
+    nằm trên 1 dòng), không thì None"""
+    if next(reversed(feature), None) != 'geometry' or not isinstance(feature['geometry'], dict):
+        return None
+    keys = list(GEOMETRY_KEY.finditer(text))
+    if len(keys) != 1:
+        return None
+    raw = text[keys[0].end():text.rindex('}')].rstrip()
+    return raw if '\n' not in raw else None
+
+
+def _convert_chunk(chunk):
+    """Worker: lô (path, đầu, cuối) hoặc list text feature -> [(cấp, text JSON 1 dòng, bản ghi)]"""
+    result = []
+    for text in read_feature_lines(*chunk) if isinstance(chunk, tuple) else chunk:
+        feature = json.loads(text)
+        level, out, record = convert_feature(feature, *_context)
+        geometry = out.pop('geometry')
+        raw = geometry_text(text, feature) or json.dumps(geometry, ensure_ascii=False)
+        result.append((level, f'{json.dumps(out, ensure_ascii=False)[:-1]}, "geometry": {raw}}}', record))
+    return result
+
+
+def iter_chunks(paths, work_dir, chunk_bytes=CHUNK_BYTES):
+    """Lô của lần lượt các file: khoảng byte (path, đầu, cuối) nếu file 1 feature / dòng (.zip / .gz giải nén
+    ra work_dir trước), không thì list text feature (~chunk_bytes ký tự)"""
+    for i, path in enumerate(paths):
+        if path.endswith(('.gz', '.zip')):
+            plain = os.path.join(work_dir, f"{i}_{os.path.basename(path).rsplit('.', 1)[0]}")
+            with open_binary(path) as src, open(plain, 'wb') as dst:
+                shutil.copyfileobj(src, dst, READ_CHARS)
+            path = plain
+        lines = feature_lines(path)
+        if lines is not None:
+            yield from iter_line_ranges(path, *lines, chunk_bytes)
+            continue
+        chunk, size = [], 0
+        for text in iter_feature_texts(path):
+            chunk.append(text)
+            size += len(text)
+            if size >= chunk_bytes:
+                yield chunk
+                chunk, size = [], 0
+        if chunk:
+            yield chunk
+
+
+# --- GHI ---
+
+def level_path(out_dir, level, prefix=OUTPUT_PREFIX):
+    return os.path.join(out_dir, f"{prefix}_{LEVELS[level][2]}.json")
+
+
+class LevelWriter:
+    """Ghi file 1 cấp theo kiểu streaming (giống RoadsJsonWriter): 1 feature / dòng, total ở cuối"""
+
+    def __init__(self, path, level, source):
+        self.path = path
+        self.tmp_path = path + '.part'
+        self.total = 0
+        self.f = open(self.tmp_path, 'w', encoding='utf-8')
+        header = {'version': '1.0', 'generated': datetime.now().strftime('%Y-%m-%d'), 'source': source,
+                  'level': level, 'type': LEVELS[level][0]}
+        self.f.write('{\n')
+        for key, value in header.items():
+            self.f.write(f'  {json.dumps(key)}: {json.dumps(value, ensure_ascii=False)},\n')
+        self.f.write('  "features": [')
+
+    def add_json(self, text):
+        self.f.write(',\n    ' if self.total else '\n    ')
+        self.f.write(text)
+        self.total += 1
+
+    def close(self):
+        self.f.write(f'\n  ],\n  "total": {self.total}\n}}\n')
+        self.f.close()
+        os.replace(self.tmp_path, self.path)
+        return self.total
+
+
+def build_hierarchy(units, rollup=None, merge_sources=None):
+    """units {gadm_id: (cấp, tên, cha, tỉnh cũ, tỉnh 2025)} -> (hierarchy, mồ côi, rollup 2025)
+    children theo thứ tự gặp trong file"""
+    children = collections.defaultdict(list)
+    orphans = []
+    for gid, (level, _, parent, _, _) in units.items():
+        if parent is None:
+            continue
+        if parent in units and units[parent][0] == level - 1:
+            children[parent].append(gid)
+        else:
+            orphans.append(gid)
+    out = {gid: {'name': name, 'level': level, 'parent': parent, 'children': children.get(gid, []),
+                 'province_2025': new_province}
+           for gid, (level, name, parent, _, new_province) in units.items()}
+    summary = {}
+    if rollup is not None:
+        groups, unplaced = rollup([(gid, u[3]) for gid, u in units.items() if u[0] > 1])
+        for new_name, gids in groups.items():
+            counts = collections.Counter(units[gid][0] for gid in gids)
+            summary[new_name] = {'merged_from': (merge_sources or {}).get(new_name, []),
+                                 'districts': counts.get(2, 0), 'communes': counts.get(3, 0)}
+        if unplaced:
+            summary[''] = {'merged_from': [], 'districts': sum(units[g][0] == 2 for g in unplaced),
+                           'communes': sum(units[g][0] == 3 for g in unplaced)}
+    return out, orphans, summary
+
+
+def convert(paths, out_dir=OUTPUT_DIR, workers=None, overrides=None, province_2025=None, rollup=None,
+            merge_sources=None, chunk_bytes=CHUNK_BYTES, source="GADM 4.1 (geodata.ucdavis.edu)"):
+    """Chuyển các file GADM (mọi cấp, thứ tự bất kỳ) -> file từng cấp + hierarchy. Trả về dict số liệu"""
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+    workers = workers or os.cpu_count() or 1
+    writers = {}
+    units = {}
+    duplicates = 0
+
+    def consume(result):
+        nonlocal duplicates
+        for level, text, (gid, _, name, parent, province, new_province) in result:
+            if level not in writers:
+                writers[level] = LevelWriter(level_path(out_dir, level), level, source)
+            writers[level].add_json(text)
+            if gid in units:
+                duplicates += 1
+            units[gid] = (level, name, parent, province, new_province)
+
+    start = time.time()
+    work_dir = tempfile.mkdtemp(prefix='gadm_levels_', dir=out_dir) # File giải nén từ .zip / .gz
+    tasks = iter_chunks(paths, work_dir, chunk_bytes)
+    peak_rss = current_rss_mb()
+    try:
+        if workers == 1:
+            _init_worker(overrides, province_2025)
+            for chunk in tasks:
+                consume(_convert_chunk(chunk))
+                peak_rss = max(peak_rss, current_rss_mb())
+        else:
+            with concurrent.futures.ProcessPoolExecutor(
+                    max_workers=workers, initializer=_init_worker, initargs=(overrides, province_2025)) as executor:
+                # Giới hạn số lô đang chờ để không đọc cả file vào RAM; ghi theo đúng thứ tự
+                in_flight = collections.deque()
+                for chunk in tasks:
+                    in_flight.append(executor.submit(_convert_chunk, chunk))
+                    if len(in_flight) >= 2 * workers:
+                        consume(in_flight.popleft().result())
+                        peak_rss = max(peak_rss, current_rss_mb())
+                while in_flight:
+                    consume(in_flight.popleft().result())
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    counts = {level: writer.close() for level, writer in sorted(writers.items())}
+
+    hierarchy, orphans, summary = build_hierarchy(units, rollup, merge_sources)
+    output = {
+        'version': '1.0',
+        'generated': datetime.now().strftime('%Y-%m-%d'),
+        'source': source,
+        'levels': {str(level): {'type': LEVELS[level][0], 'count': count,
+                                'file': os.path.basename(level_path(out_dir, level))}
+                   for level, count in counts.items()},
+        'units': hierarchy,
+        'rollup_2025': summary,
+        'orphans': orphans,
+    }
+    path = os.path.join(out_dir, HIERARCHY_FILE)
+    with open(path + '.part', 'w', encoding='utf-8') as f:
+        json.dump(output, f, ensure_ascii=False)
+    os.replace(path + '.part', path)
+    return {'counts': counts, 'orphans': len(orphans), 'duplicates': duplicates, 'seconds': time.time() - start,
+            'peak_rss_mb': peak_rss, 'rollup': summary}
+
+
+def load_merge_config():
+    """(NAME_MAP, tỉnh cũ -> 2025, hàm rollup, {tỉnh 2025: tỉnh cũ}) từ các script ranh giới.
+    Thiếu shapely (create_2025_from_gadm cần) -> không gắn tỉnh 2025"""
+    sys.path.insert(0, BOUNDARIES_DIR)
+    from convert_gadm import NAME_MAP
+    try:
+        from create_2025_from_gadm import MERGE_2025, province_2025_map, rollup_2025
+    except ImportError:
+        print("⚠️ Thiếu shapely -> bỏ qua gắn tỉnh 2025 (pip install shapely)")
+        return NAME_MAP, None, None, None
+    return NAME_MAP, province_2025_map(), rollup_2025, MERGE_2025
+
+
+def print_stats(stats):
+    for level, count in stats['counts'].items():
+        print(f"  Cấp {level} ({LEVELS[level][0]}): {count}")
+    print(f"  {stats['seconds']:.1f}s, RSS đỉnh process chính {stats['peak_rss_mb']:.0f} MB")
+    if stats['orphans'] or stats['duplicates']:
+        print(f"  ⚠️ {stats['orphans']} đơn vị không tìm thấy cấp cha, {stats['duplicates']} gadm_id trùng")
+    for new_name, row in sorted(stats['rollup'].items()):
+        print(f"  {new_name or '(không thuộc tỉnh 2025 nào)':<28} {row['districts']:>4} quận/huyện "
+              f"{row['communes']:>6} xã/phường  ← {', '.join(row['merged_from'])}")
+
+
+# --- KIỂM TRA ---
+
+NAME_CASES = [
+    ('BàRịa-VũngTàu', 'Bà Rịa - Vũng Tàu'), ('ChưPrông', 'Chư Prông'), ('Phường12', 'Phường 12'),
+    ('ĐắkGlong', 'Đắk Glong'), ('Thịxã', 'Thị xã'), ('NA', ''),
+    ('IaGrai', 'Ia Grai'), ('TP.HồChíMinh', 'TP. Hồ Chí Minh'), ('Côn Đảo', 'Côn Đảo'),
+]
+
+
+def sample_gadm(out_dir, names, grid=(7, 9), districts=(3, 4), communes=(4, 4), edge_vertices=25):
+    """GADM giả 3 cấp (tỉnh -> huyện -> xã lồng nhau theo lưới, tên viết liền kiểu GADM).
+    Mỗi cấp 1 kiểu file: 1 feature/dòng, JSON thụt lề (có "crs" trước features), .zip.
+    Trả về [đường dẫn cấp 1, 2, 3]"""
+    rows, cols = grid
+    south, west, size = 8.5, 102.2, 1.5
+
+    def box(x0, y0, x1, y1):
+        n = edge_vertices
+        ring = [[x0 + (x1 - x0) * i / n, y0] for i in range(n)] + [[x1, y0 + (y1 - y0) * i / n] for i in range(n)] + \
+            [[x1 - (x1 - x0) * i / n, y1] for i in range(n)] + [[x0, y1 - (y1 - y0) * i / n] for i in range(n)]
+        ring = [[round(x, 5), round(y, 5)] for x, y in ring]
+        return {'type': 'Polygon', 'coordinates': [ring + [ring[0]]]}
+
+    levels = {1: [], 2: [], 3: []}
+    syllables = ['Ba', 'Vì', 'Đông', 'Anh', 'Mỹ', 'Tho', 'Chư', 'Prông', 'Krông', 'Bông', 'Phú', 'Xuyên']
+    for p in range(rows * cols):
+        r, c = divmod(p, cols)
+        px, py = west + c * size * 0.9, south + r * size * 1.1
+        props = {'GID_1': f"VNM.{p + 1}_1", 'GID_0': 'VNM', 'COUNTRY': 'Vietnam', 'NAME_1': names[p % len(names)],
+                 'TYPE_1': 'Tỉnh'}
+        levels[1].append((props, box(px, py, px + size * 0.9, py + size * 1.1)))
+        dw, dh = size * 0.9 / districts[1], size * 1.1 / districts[0]
+        for d in range(districts[0] * districts[1]):
+            dr, dc = divmod(d, districts[1])
+            dx, dy = px + dc * dw, py + dr * dh
+            district = syllables[(p + d) % 12] + syllables[(p * 7 + d * 5 + 1) % 12] + (str(d) if d > 5 else '')
+            d_props = dict(props, GID_2=f"VNM.{p + 1}.{d + 1}_1", NAME_2=district,
+                           TYPE_2=['Huyện', 'Quận', 'Thịxã', 'Thànhphố'][d % 4])
+            levels[2].append((d_props, box(dx, dy, dx + dw, dy + dh)))
+            cw, ch = dw / communes[1], dh / communes[0]
+            for k in range(communes[0] * communes[1]):
+                kr, kc = divmod(k, communes[1])
+                cx, cy = dx + kc * cw, dy + kr * ch
+                commune = f"Phường{k + 1}" if d % 4 == 1 else syllables[(d + k) % 12] + syllables[(k * 3) % 12]
+                levels[3].append((dict(d_props, GID_3=f"VNM.{p + 1}.{d + 1}.{k + 1}_1", NAME_3=commune,
+                                       TYPE_3=['Xã', 'Phường', 'Thịtrấn'][k % 3]),
+                                  box(cx, cy, cx + cw, cy + ch)))
+    paths = []
+    for level, items in levels.items():
+        features = [{'type': 'Feature', 'properties': props, 'geometry': geometry} for props, geometry in items]
+        path = os.path.join(out_dir, f"gadm41_VNM_{level}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            if level == 2:
+                json.dump({'type': 'FeatureCollection', 'name': 'gadm41_VNM_2',
+                           'crs': {'type': 'name', 'properties': {'name': 'urn:ogc:def:crs:OGC:1.3:CRS84'}},
+                           'features': features}, f, ensure_ascii=False, indent=1)
+            else:
+                f.write('{"type":"FeatureCollection", "features": [\n')
+                f.write(',\n'.join(json.dumps(feat, ensure_ascii=False, separators=(',', ':')) for feat in features))
+                f.write('\n]}\n')
+        if level == 3:
+            with zipfile.ZipFile(path + '.zip', 'w', zipfile.ZIP_DEFLATED) as archive:
+                archive.write(path, os.path.basename(path))
+            os.remove(path)
+            path += '.zip'
+        paths.append(path)
+    return paths
+
+
+def selftest(args):
+    """Đối chiếu đọc streaming với json.load, chạy convert 1 và nhiều process, kiểm tra liên kết cha-con"""
+    name_map, province_2025, rollup, merge = load_merge_config()
+    errors = 0
+    for raw, expected in NAME_CASES:
+        got = normalize_name(raw)
+        if got != expected:
+            errors += 1
+            print(f"  ❌ normalize_name({raw!r}) = {got!r}, cần {expected!r}")
+
+    work = tempfile.mkdtemp(prefix='gadm_levels_')
+    try:
+        start = time.time()
+        paths = sample_gadm(work, sorted(name_map), edge_vertices=args.edge_vertices)
+        size = sum(os.path.getsize(p) for p in paths)
+        print(f"GADM giả: {size / (1024 * 1024):.1f} MB ({time.time() - start:.1f}s) - {work}")
+
+        for path in paths:
+            with open_text(path) as f:
+                expected = json.load(f)['features']
+            streamed = list(iter_features(path))
+            small = list(iter_feature_texts(path, read_chars=4096)) # Khối nhỏ: token vắt qua ranh giới khối
+            if streamed != expected or [json.loads(t) for t in small] != expected:
+                errors += 1
+                print(f"  ❌ {os.path.basename(path)}: đọc streaming khác json.load")
+            lines = None if path.endswith(('.gz', '.zip')) else feature_lines(path)
+            if lines is not None: # Khoảng byte nhỏ: nhiều khoảng, ranh giới rơi giữa dòng
+                ranged = [t for r in iter_line_ranges(path, *lines, chunk_bytes=4096) for t in read_feature_lines(*r)]
+                if [json.loads(t) for t in ranged] != expected:
+                    errors += 1
+                    print(f"  ❌ {os.path.basename(path)}: đọc theo khoảng byte khác json.load")
+        print(f"  Đọc streaming / theo khoảng byte = json.load ({', '.join(os.path.basename(p) for p in paths)})")
+
+        results = {}
+        for workers in (1, args.workers):
+            out_dir = os.path.join(work, f"out_{workers}")
+            stats = convert(paths, out_dir, workers, name_map, province_2025, rollup, merge, args.chunk_bytes)
+            results[workers] = out_dir
+            total = sum(stats['counts'].values())
+            print(f"  {workers} process: {total} đơn vị, {stats['seconds']:.1f}s ({total / stats['seconds']:,.0f}/s), "
+                  f"RSS đỉnh {stats['peak_rss_mb']:.0f} MB")
+        for name in sorted(os.listdir(results[1])):
+            with open(os.path.join(results[1], name), 'rb') as a, \
+                    open(os.path.join(results[args.workers], name), 'rb') as b:
+                if a.read() != b.read():
+                    errors += 1
+                    print(f"  ❌ {name}: kết quả 1 process khác {args.workers} process")
+
+        with open(os.path.join(results[1], HIERARCHY_FILE), 'r', encoding='utf-8') as f:
+            hierarchy = json.load(f)
+        units = hierarchy['units']
+        levels = {}
+        for level in LEVELS:
+            with open(level_path(results[1], level), 'r', encoding='utf-8') as f:
+                levels[level] = json.load(f)['features']
+        for level, features in levels.items():
+            for feat in features:
+                unit = units[feat['gadm_id']]
+                parent = feat.get('parent_id')
+                if level > 1 and (parent not in units or feat['gadm_id'] not in units[parent]['children']):
+                    errors += 1
+                    print(f"  ❌ {feat['gadm_id']}: liên kết cha {parent} sai")
+                if normalize_name(feat['name']) != feat['name'] or unit['name'] != feat['name']:
+                    errors += 1
+                    print(f"  ❌ {feat['gadm_id']}: tên chưa chuẩn hóa {feat['name']!r}")
+                if province_2025 and level > 1 and feat.get('province_2025') != province_2025.get(feat['province']):
+                    errors += 1
+                    print(f"  ❌ {feat['gadm_id']}: tỉnh 2025 {feat.get('province_2025')!r}")
+        if hierarchy['orphans']:
+            errors += 1
+            print(f"  ❌ {len(hierarchy['orphans'])} đơn vị mồ côi")
+        if rollup:
+            summary = hierarchy['rollup_2025']
+            rolled = sum(row['communes'] for name, row in summary.items() if name)
+            if rolled != len(levels[3]) or len(summary) != len(set(province_2025.values())):
+                errors += 1
+                print(f"  ❌ rollup 2025: {rolled}/{len(levels[3])} xã, {len(summary)} tỉnh")
+            print(f"  Rollup 2025: {len(summary)} tỉnh mới, {rolled} xã/phường")
+        sample = levels[3][min(5, len(levels[3]) - 1)]
+        print(f"  Ví dụ: {sample['full_name']} ({sample['district']}, {sample['province']} → "
+              f"{sample.get('province_2025')})")
+    finally:
+        if not args.keep:
+            shutil.rmtree(work, ignore_errors=True)
+    print(f"{'✅' if not errors else '❌'} selftest: {errors} lỗi")
+    return 1 if errors else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chuyển GADM nhiều cấp (tỉnh/huyện/xã) streaming + cha-con")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('convert', help="File GADM (cấp bất kỳ, .json/.gz/.zip) -> file từng cấp + hierarchy")
+    p.add_argument('inputs', nargs='+')
+    p.add_argument('--out-dir', default=OUTPUT_DIR)
+    p.add_argument('--workers', type=int, default=None, help="Số process (mặc định: số CPU)")
+    p.add_argument('--chunk-bytes', type=int, default=CHUNK_BYTES)
+    p = sub.add_parser('info', help="Tra 1 đơn vị trong hierarchy theo tên hoặc gadm_id")
+    p.add_argument('hierarchy')
+    p.add_argument('query')
+    p = sub.add_parser('selftest', help="Kiểm tra trên GADM giả 3 cấp")
+    p.add_argument('--workers', type=int, default=2)
+    p.add_argument('--edge-vertices', type=int, default=25, help="Số điểm mỗi cạnh ô (tăng để thử file lớn)")
+    p.add_argument('--chunk-bytes', type=int, default=1 << 20)
+    p.add_argument('--keep', action='store_true', help="Giữ thư mục tạm")
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        missing = [p for p in args.inputs if not os.path.exists(p)]
+        if missing:
+            print(f"❌ Không có {', '.join(missing)}")
+            return 1
+        name_map, province_2025, rollup, merge = load_merge_config()
+        print(f"Chuyển {len(args.inputs)} file GADM → {args.out_dir}")
+        stats = convert(args.inputs, args.out_dir, args.workers, name_map, province_2025, rollup, merge,
+                        args.chunk_bytes)
+        print_stats(stats)
+        print(f"✅ → {', '.join(level_path(args.out_dir, level) for level in stats['counts'])}, "
+              f"{os.path.join(args.out_dir, HIERARCHY_FILE)}")
+    elif args.command == 'info':
+        with open(args.hierarchy, 'r', encoding='utf-8') as f:
+            units = json.load(f)['units']
+        matches = [gid for gid, u in units.items() if args.query in (gid, u['name'])]
+        if not matches:
+            print(f"❌ Không tìm thấy {args.query!r}")
+            return 1
+        for gid in matches:
+            chain = []
+            current = gid
+            while current:
+                chain.append(units[current]['name'])
+                current = units[current]['parent']
+            unit = units[gid]
+            print(f"{gid}: {' / '.join(reversed(chain))} (cấp {unit['level']}, {len(unit['children'])} đơn vị con, "
+                  f"2025: {unit['province_2025'] or '-'})")
+    elif args.command == 'selftest':
+        return selftest(args)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
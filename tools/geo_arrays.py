@@ -0,0 +1,100 @@
+"""
+Các phép tính geometry vector hóa bằng numpy (dùng chung cho đường và ranh giới).
+
+Mọi geometry được trải phẳng 1 lần thành:
+    coords  mảng float64 (n, 2) [lon, lat] liền nhau
+    offsets mảng int64 (k + 1): part i là coords[offsets[i]:offsets[i+1]]
+("part" = 1 ring của polygon hoặc 1 polyline). Sau đó bbox, chiều dài
+đều là vài phép numpy, không còn vòng lặp Python trên từng điểm.
+"""
+from itertools import chain
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8 # Bán kính trung bình (IUGG)
+EMPTY_BBOX = [90.0, 180.0, -90.0, -180.0] # Giống giá trị khởi tạo của các hàm cũ
+
+
+def iter_parts(geometry):
+    """Duyệt các part (ring / polyline) của Polygon, MultiPolygon, LineString, MultiLineString"""
+    geo_type = geometry.get('type', '')
+    coords = geometry.get('coordinates', [])
+    if geo_type == 'LineString':
+        return [coords]
+    if geo_type in ('Polygon', 'MultiLineString'):
+        return coords
+    if geo_type == 'MultiPolygon':
+        return [ring for polygon in coords for ring in polygon]
+    return []
+
+
+def lines_array(lines):
+    """list polyline [[lon, lat], ...] -> (coords (n, 2), offsets)"""
+    lengths = np.fromiter(map(len, lines), dtype=np.int64, count=len(lines))
+    offsets = np.zeros(len(lines) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    flat = np.fromiter(chain.from_iterable(chain.from_iterable(lines)), dtype=np.float64,
+                       count=2 * int(offsets[-1]))
+    return flat.reshape(-1, 2), offsets
+
+
+def geometry_array(geometry):
+    return lines_array(iter_parts(geometry))
+
+
+def array_bbox(coords, digits=None):
+    """[south, west, north, east] của mảng (n, 2) [lon, lat]"""
+    if not len(coords):
+        return list(EMPTY_BBOX)
+    lon_min, lat_min = coords.min(axis=0).tolist()
+    lon_max, lat_max = coords.max(axis=0).tolist()
+    bbox = [lat_min, lon_min, lat_max, lon_max]
+    if digits is not None:
+        bbox = [round(v, digits) for v in bbox]
+    return bbox
+
+
+def group_bboxes(coords, point_offsets):
+    """bbox [south, west, north, east] của từng nhóm điểm coords[point_offsets[i]:point_offsets[i+1]]
+    (vd. mỗi nhóm là mọi polyline của 1 con đường) -> mảng (k, 4)"""
+    point_offsets = np.asarray(point_offsets, dtype=np.int64)
+    result = np.tile(np.array(EMPTY_BBOX), (len(point_offsets) - 1, 1))
+    nonempty = np.diff(point_offsets) > 0
+    if nonempty.any():
+        # Nhóm rỗng bị bỏ qua nên mỗi khoảng reduceat đúng bằng 1 nhóm không rỗng
+        starts = point_offsets[:-1][nonempty]
+        end = point_offsets[-1]
+        lo = np.minimum.reduceat(coords[:end], starts)
+        hi = np.maximum.reduceat(coords[:end], starts)
+        result[nonempty] = np.column_stack([lo[:, 1], lo[:, 0], hi[:, 1], hi[:, 0]])
+    return result
+
+
+def geometry_bbox(geometry, digits=None):
+    """bbox [south, west, north, east] của geometry GeoJSON (digits: làm tròn)"""
+    return array_bbox(geometry_array(geometry)[0], digits)
+
+
+def segment_lengths(coords):
+    """Chiều dài (mét, haversine) giữa các điểm liên tiếp: (n - 1,)"""
+    rad = np.radians(coords)
+    dlon = np.diff(rad[:, 0])
+    dlat = np.diff(rad[:, 1])
+    lat1, lat2 = rad[:-1, 1], rad[1:, 1]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def part_lengths(coords, offsets):
+    """Chiều dài (mét, haversine) của từng part"""
+    if len(coords) < 2:
+        return np.zeros(len(offsets) - 1)
+    seg = segment_lengths(coords)
+    # Bỏ đoạn nối điểm cuối part này với điểm đầu part sau
+    bridges = offsets[1:-1] - 1
+    seg[bridges[(bridges >= 0) & (bridges < len(seg))]] = 0.0
+    result = np.zeros(len(offsets) - 1)
+    multi = np.diff(offsets) >= 2
+    if multi.any():
+        result[multi] = np.add.reduceat(seg, offsets[:-1][multi])
+    return result
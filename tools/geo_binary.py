@@ -0,0 +1,480 @@
+"""
+Định dạng nhị phân gọn, mmap được cho dữ liệu đường / ranh giới (.vngb).
+
+So với JSON: tọa độ lượng tử hóa (mặc định 1e-5 độ ≈ 1.1 m) và lưu dạng delta
+trong mảng int16 liền nhau; tên/ref/loại đường lưu 1 lần trong bảng chuỗi.
+Reader mmap file và giải mã từng feature khi cần, không phải parse cả file.
+
+Bố cục (little-endian, mỗi section căn lề 8 byte):
+    HEADER      magic 'VNGB', version, số lượng, offset các section
+    STRINGS     u32 offsets[n+1] + khối utf-8
+    FEATURES    FEATURE_DTYPE[n]  (name/ref/road_type/props là chỉ số chuỗi)
+    PARTS       PART_DTYPE[n]     (mỗi part = 1 polyline hoặc 1 ring)
+    DELTAS      int16[n, 2]       (dx, dy) của các part thường
+    WIDE        int32[n, 2]       (dx, dy) của part có bước > int16 (hiếm)
+    META        JSON header gốc (version, generated, source, lod...)
+
+Dùng:
+    python tools/geo_binary.py encode vn_roads_full.json vn_roads_full.vngb
+    python tools/geo_binary.py decode vn_roads_full.vngb out.json
+    python tools/geo_binary.py verify vn_roads_full.json vn_roads_full.vngb
+    python tools/geo_binary.py info vn_roads_full.vngb
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+MAGIC = b'VNGB'
+FORMAT_VERSION = 1
+DEFAULT_UNITS_PER_DEGREE = 100_000 # 1e-5 độ
+
+HEADER_STRUCT = struct.Struct('<4sHHIIIIII7Q')
+
+GEOM_TYPES = ['LineString', 'MultiLineString', 'Polygon', 'MultiPolygon']
+
+FEATURE_DTYPE = np.dtype([
+    ('name', '<u4'),
+    ('ref', '<u4'),
+    ('road_type', '<u4'),
+    ('props', '<u4'),        # JSON các thuộc tính còn lại (type, admin_level, gadm_id...)
+    ('geom_type', '<u4'),    # chỉ số trong GEOM_TYPES
+    ('part_start', '<u4'),
+    ('part_count', '<u4'),
+    ('_pad', '<u4'),
+    ('bbox', '<f8', (4,)),   # giữ nguyên bbox gốc [south, west, north, east]
+])
+
+PART_FLAG_NEW_POLYGON = 1    # ring này là vỏ ngoài của 1 polygon mới
+PART_FLAG_WIDE = 2           # delta nằm trong mảng WIDE (int32)
+
+PART_DTYPE = np.dtype([
+    ('delta_start', '<u4'),
+    ('n_points', '<u4'),
+    ('x0', '<i4'),
+    ('y0', '<i4'),
+    ('flags', '<u4'),
+])
+
+INT16_MAX = 32767
+FEATURE_KEYS = ('name', 'ref', 'road_type', 'bbox', 'geometry')
+
+
+def _align(f):
+    pad = (-f.tell()) % 8
+    if pad:
+        f.write(b'\0' * pad)
+    return f.tell()
+
+
+def _geometry_parts(geometry):
+    """Trả về list (coords, flags) theo thứ tự lưu"""
+    geo_type = geometry.get('type', '')
+    coords = geometry.get('coordinates', [])
+    if geo_type == 'LineString':
+        return [(coords, 0)]
+    if geo_type == 'MultiLineString':
+        return [(line, 0) for line in coords]
+    if geo_type == 'Polygon':
+        return [(ring, PART_FLAG_NEW_POLYGON if i == 0 else 0) for i, ring in enumerate(coords)]
+    if geo_type == 'MultiPolygon':
+        return [(ring, PART_FLAG_NEW_POLYGON if i == 0 else 0)
+                for polygon in coords for i, ring in enumerate(polygon)]
+    raise ValueError(f"Không hỗ trợ geometry: {geo_type}")
+
+
+class GeoBinaryWriter:
+    """Ghi .vngb theo kiểu streaming: bảng feature/part/delta ghi ra file tạm,
+    chỉ bảng chuỗi (đã intern) nằm trong RAM."""
+
+    def __init__(self, path, meta=None, units_per_degree=DEFAULT_UNITS_PER_DEGREE):
+        self.path = path
+        self.meta = dict(meta or {})
+        self.units = units_per_degree
+        self.strings = ['']
+        self.string_index = {'': 0}
+        tmp_dir = os.path.dirname(os.path.abspath(path))
+        self._features = tempfile.TemporaryFile(dir=tmp_dir)
+        self._parts = tempfile.TemporaryFile(dir=tmp_dir)
+        self._deltas = tempfile.TemporaryFile(dir=tmp_dir)
+        self._wide = tempfile.TemporaryFile(dir=tmp_dir)
+        self.feature_count = 0
+        self.part_count = 0
+        self.delta_count = 0
+        self.wide_count = 0
+
+    def intern(self, s):
+        idx = self.string_index.get(s)
+        if idx is None:
+            idx = len(self.strings)
+            self.strings.append(s)
+            self.string_index[s] = idx
+        return idx
+
+    def add(self, feature):
+        geometry = feature.get('geometry', {})
+        geo_type = geometry.get('type', '')
+        parts = [(c, flags) for c, flags in _geometry_parts(geometry) if len(c) > 0]
+        props = {k: v for k, v in feature.items() if k not in FEATURE_KEYS}
+
+        rec = np.zeros(1, dtype=FEATURE_DTYPE)
+        rec['name'] = self.intern(feature.get('name', '') or '')
+        rec['ref'] = self.intern(feature.get('ref', '') or '')
+        rec['road_type'] = self.intern(feature.get('road_type', '') or '')
+        rec['props'] = self.intern(json.dumps(props, ensure_ascii=False) if props else '')
+        rec['geom_type'] = GEOM_TYPES.index(geo_type)
+        rec['part_start'] = self.part_count
+        rec['part_count'] = len(parts)
+        rec['bbox'] = feature.get('bbox') or [0.0, 0.0, 0.0, 0.0]
+        self._features.write(rec.tobytes())
+        self.feature_count += 1
+
+        if not parts:
+            return
+        part_recs = np.zeros(len(parts), dtype=PART_DTYPE)
+        for i, (coords, flags) in enumerate(parts):
+            q = np.rint(np.asarray(coords, dtype=np.float64)[:, :2] * self.units).astype(np.int64)
+            d = np.diff(q, axis=0)
+            part_recs[i]['n_points'] = len(q)
+            part_recs[i]['x0'] = q[0, 0]
+            part_recs[i]['y0'] = q[0, 1]
+            if len(d) and np.abs(d).max() > INT16_MAX:
+                part_recs[i]['flags'] = flags | PART_FLAG_WIDE
+                part_recs[i]['delta_start'] = self.wide_count
+                self._wide.write(d.astype('<i4').tobytes())
+                self.wide_count += len(d)
+            else:
+                part_recs[i]['flags'] = flags
+                part_recs[i]['delta_start'] = self.delta_count
+                self._deltas.write(d.astype('<i2').tobytes())
+                self.delta_count += len(d)
+        self._parts.write(part_recs.tobytes())
+        self.part_count += len(parts)
+
+    def add_lines(self, roads, bboxes, coords, offsets, road_parts):
+        """Ghi 1 lô đường MultiLineString thẳng từ mảng phẳng (road_collection.RoadCollection.arrays()),
+        lượng tử hóa và tính delta cho cả lô bằng numpy. Kết quả giống hệt add() từng feature.
+        roads: các record có name/ref/road_type; segment phải có >= 1 điểm"""
+        if not len(roads):
+            return
+        recs = np.zeros(len(roads), dtype=FEATURE_DTYPE)
+        # Intern theo đúng thứ tự add() (name, ref, road_type từng đường) -> cùng bảng chuỗi
+        strings = [(self.intern(r.name or ''), self.intern(r.ref or ''), self.intern(r.road_type or ''))
+                   for r in roads]
+        recs['name'], recs['ref'], recs['road_type'] = np.array(strings, dtype=np.uint32).T
+        recs['geom_type'] = GEOM_TYPES.index('MultiLineString')
+        recs['part_start'] = self.part_count + road_parts[:-1]
+        recs['part_count'] = np.diff(road_parts)
+        recs['bbox'] = bboxes
+        self._features.write(recs.tobytes())
+        self.feature_count += len(roads)
+
+        n_parts = len(offsets) - 1
+        if not n_parts:
+            return
+        q = np.rint(coords * self.units).astype(np.int64)
+        n_points = np.diff(offsets)
+        # Delta trong từng part: bỏ bước nối điểm cuối part này với điểm đầu part sau
+        d = np.diff(q, axis=0)
+        within = np.ones(len(d), dtype=bool)
+        within[offsets[1:-1] - 1] = False
+        d = d[within]
+        n_deltas = n_points - 1
+        delta_offsets = np.concatenate([[0], np.cumsum(n_deltas)])
+        wide = np.zeros(n_parts, dtype=bool)
+        has_delta = n_deltas > 0
+        if has_delta.any():
+            wide[has_delta] = np.maximum.reduceat(np.abs(d).max(axis=1), delta_offsets[:-1][has_delta]) > INT16_MAX
+
+        parts = np.zeros(n_parts, dtype=PART_DTYPE)
+        parts['n_points'] = n_points
+        parts['x0'] = q[offsets[:-1], 0]
+        parts['y0'] = q[offsets[:-1], 1]
+        parts['flags'] = np.where(wide, PART_FLAG_WIDE, 0)
+        narrow_counts = np.where(wide, 0, n_deltas)
+        wide_counts = np.where(wide, n_deltas, 0)
+        parts['delta_start'] = np.where(wide, self.wide_count + np.cumsum(wide_counts) - wide_counts,
+                                        self.delta_count + np.cumsum(narrow_counts) - narrow_counts)
+        delta_wide = np.repeat(wide, n_deltas)
+        self._deltas.write(d[~delta_wide].astype('<i2').tobytes())
+        self._wide.write(d[delta_wide].astype('<i4').tobytes())
+        self.delta_count += int(narrow_counts.sum())
+        self.wide_count += int(wide_counts.sum())
+        self._parts.write(parts.tobytes())
+        self.part_count += n_parts
+
+    def close(self):
+        tmp_path = self.path + '.part'
+        with open(tmp_path, 'wb') as f:
+            f.write(b'\0' * HEADER_STRUCT.size)
+
+            strings_offset = _align(f)
+            blobs = [s.encode('utf-8') for s in self.strings]
+            offsets = np.zeros(len(blobs) + 1, dtype='<u4')
+            offsets[1:] = np.cumsum([len(b) for b in blobs])
+            f.write(offsets.tobytes())
+            f.write(b''.join(blobs))
+
+            sections = []
+            for tmp in (self._features, self._parts, self._deltas, self._wide):
+                sections.append(_align(f))
+                tmp.seek(0)
+                while True:
+                    buf = tmp.read(1 << 20)
+                    if not buf:
+                        break
+                    f.write(buf)
+                tmp.close()
+
+            meta_offset = _align(f)
+            f.write(json.dumps(self.meta, ensure_ascii=False).encode('utf-8'))
+            end = f.tell()
+
+            f.seek(0)
+            f.write(HEADER_STRUCT.pack(
+                MAGIC, FORMAT_VERSION, 0, self.units,
+                self.feature_count, len(self.strings), self.part_count,
+                self.delta_count, self.wide_count,
+                strings_offset, sections[0], sections[1], sections[2], sections[3],
+                meta_offset, end))
+        os.replace(tmp_path, self.path)
+        return self.feature_count
+
+
+class GeoBinaryReader:
+    """Đọc .vngb qua mmap; các bảng là view numpy (không copy)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, _, self.units, n_features, n_strings, n_parts, n_deltas, n_wide,
+         strings_off, features_off, parts_off, deltas_off, wide_off, meta_off, end
+         ) = HEADER_STRUCT.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: không phải file VNGB")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{path}: phiên bản {version} không hỗ trợ")
+        buf = self._mm
+        self.string_offsets = np.frombuffer(buf, '<u4', n_strings + 1, strings_off)
+        self._string_blob = strings_off + self.string_offsets.nbytes
+        self.features = np.frombuffer(buf, FEATURE_DTYPE, n_features, features_off)
+        self.parts = np.frombuffer(buf, PART_DTYPE, n_parts, parts_off)
+        self.deltas = np.frombuffer(buf, '<i2', n_deltas * 2, deltas_off).reshape(-1, 2)
+        self.wide = np.frombuffer(buf, '<i4', n_wide * 2, wide_off).reshape(-1, 2)
+        self.meta = json.loads(bytes(buf[meta_off:end]).decode('utf-8'))
+        self._end = end
+        self._string_cache = {}
+
+    def close(self):
+        # Các view numpy giữ tham chiếu tới mmap -> bỏ chúng trước khi đóng
+        self.string_offsets = self.features = self.parts = self.deltas = self.wide = None
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.features)
+
+    def string(self, idx):
+        s = self._string_cache.get(idx)
+        if s is None:
+            start = self._string_blob + int(self.string_offsets[idx])
+            stop = self._string_blob + int(self.string_offsets[idx + 1])
+            s = self._string_cache[idx] = bytes(self._mm[start:stop]).decode('utf-8')
+        return s
+
+    def part_coords(self, p):
+        """Tọa độ [[lon, lat], ...] của part p"""
+        part = self.parts[p]
+        n = int(part['n_points'])
+        source = self.wide if part['flags'] & PART_FLAG_WIDE else self.deltas
+        start = int(part['delta_start'])
+        q = np.empty((n, 2), dtype=np.int64)
+        q[0] = (part['x0'], part['y0'])
+        if n > 1:
+            np.cumsum(source[start:start + n - 1], axis=0, out=q[1:])
+            q[1:] += q[0]
+        return (q / self.units).tolist()
+
+    def feature(self, i):
+        """Giải mã feature thứ i về đúng dict như trong file JSON"""
+        rec = self.features[i]
+        part_start = int(rec['part_start'])
+        geo_type = GEOM_TYPES[int(rec['geom_type'])]
+        parts = [(self.part_coords(p), int(self.parts[p]['flags']))
+                 for p in range(part_start, part_start + int(rec['part_count']))]
+        if geo_type == 'LineString':
+            coordinates = parts[0][0] if parts else []
+        elif geo_type == 'MultiLineString':
+            coordinates = [c for c, _ in parts]
+        else:
+            polygons = []
+            for c, flags in parts:
+                if flags & PART_FLAG_NEW_POLYGON or not polygons:
+                    polygons.append([])
+                polygons[-1].append(c)
+            coordinates = polygons[0] if geo_type == 'Polygon' and polygons else polygons
+        feature = {}
+        name, ref, road_type = (self.string(int(rec[k])) for k in ('name', 'ref', 'road_type'))
+        props = self.string(int(rec['props']))
+        feature['name'] = name
+        if ref or road_type:
+            feature['ref'] = ref
+            feature['road_type'] = road_type
+        if props:
+            feature.update(json.loads(props))
+        feature['bbox'] = rec['bbox'].tolist()
+        feature['geometry'] = {'type': geo_type, 'coordinates': coordinates}
+        return feature
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.feature(i)
+
+    def validate(self):
+        """Kiểm tra tính toàn vẹn (chỉ số, kích thước các bảng). Trả về list lỗi"""
+        errors = []
+        n_parts = len(self.parts)
+        ends = self.features['part_start'].astype(np.int64) + self.features['part_count']
+        if len(ends) and ends.max() > n_parts:
+            errors.append("feature trỏ tới part ngoài phạm vi")
+        n_strings = len(self.string_offsets) - 1
+        for field in ('name', 'ref', 'road_type', 'props'):
+            if len(self.features) and self.features[field].max() >= n_strings:
+                errors.append(f"chỉ số chuỗi '{field}' ngoài phạm vi")
+        if np.any(np.diff(self.string_offsets.astype(np.int64)) < 0):
+            errors.append("bảng offset chuỗi không tăng dần")
+        if np.any(self.features['geom_type'] >= len(GEOM_TYPES)):
+            errors.append("geom_type không hợp lệ")
+        wide = (self.parts['flags'] & PART_FLAG_WIDE) != 0
+        n_delta = np.maximum(self.parts['n_points'].astype(np.int64) - 1, 0)
+        stop = self.parts['delta_start'].astype(np.int64) + n_delta
+        if np.any(stop[~wide] > len(self.deltas)):
+            errors.append("part trỏ tới delta ngoài phạm vi")
+        if np.any(stop[wide] > len(self.wide)):
+            errors.append("part trỏ tới delta (wide) ngoài phạm vi")
+        if np.any(self.parts['n_points'] == 0):
+            errors.append("part rỗng")
+        return errors
+
+
+def write_geo_binary(output, path, units_per_degree=DEFAULT_UNITS_PER_DEGREE):
+    """Ghi dict output (giống file JSON) ra .vngb"""
+    writer = GeoBinaryWriter(path, {k: v for k, v in output.items() if k != 'features'},
+                             units_per_degree)
+    for feat in output.get('features', []):
+        writer.add(feat)
+    return writer.close()
+
+
+def binary_path(json_path):
+    return os.path.splitext(json_path)[0] + '.vngb'
+
+
+def verify_roundtrip(json_path, bin_path):
+    """So sánh file JSON với file nhị phân: thuộc tính khớp tuyệt đối,
+    tọa độ sai lệch không quá nửa bước lượng tử. Trả về list lỗi"""
+    with open(json_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    errors = []
+    with GeoBinaryReader(bin_path) as reader:
+        errors.extend(reader.validate())
+        tol = 0.5 / reader.units + 1e-9
+        features = data.get('features', [])
+        if len(features) != len(reader):
+            errors.append(f"số feature khác nhau: {len(features)} != {len(reader)}")
+        for i, (expected, actual) in enumerate(zip(features, reader)):
+            for key, value in expected.items():
+                if key == 'geometry':
+                    continue
+                if key == 'bbox':
+                    value = [float(v) for v in value]
+                if actual.get(key) != value:
+                    errors.append(f"feature {i}: '{key}' khác: {value!r} != {actual.get(key)!r}")
+            eg, ag = expected['geometry'], actual['geometry']
+            if eg['type'] != ag['type']:
+                errors.append(f"feature {i}: geometry type khác")
+                continue
+            e_parts = [c for c, _ in _geometry_parts(eg) if c]
+            a_parts = [c for c, _ in _geometry_parts(ag)]
+            if [len(c) for c in e_parts] != [len(c) for c in a_parts]:
+                errors.append(f"feature {i}: số điểm khác nhau")
+                continue
+            for ec, ac in zip(e_parts, a_parts):
+                diff = np.abs(np.asarray(ec, dtype=np.float64)[:, :2] - np.asarray(ac))
+                if diff.size and diff.max() > tol:
+                    errors.append(f"feature {i}: tọa độ lệch {diff.max():.2e} độ")
+                    break
+            if len(errors) > 20:
+                errors.append("... (dừng sau 20 lỗi)")
+                break
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chuyển đổi / kiểm tra định dạng nhị phân VNGB")
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p = sub.add_parser('encode', help="JSON -> VNGB")
+    p.add_argument('json_path')
+    p.add_argument('bin_path', nargs='?')
+    p.add_argument('--units', type=int, default=DEFAULT_UNITS_PER_DEGREE, help="Số bước lượng tử / độ")
+    p = sub.add_parser('decode', help="VNGB -> JSON")
+    p.add_argument('bin_path')
+    p.add_argument('json_path')
+    p = sub.add_parser('verify', help="Kiểm tra round-trip JSON <-> VNGB")
+    p.add_argument('json_path')
+    p.add_argument('bin_path', nargs='?')
+    p = sub.add_parser('info', help="Thông tin file VNGB")
+    p.add_argument('bin_path')
+    args = parser.parse_args()
+
+    if args.cmd == 'encode':
+        bin_path = args.bin_path or binary_path(args.json_path)
+        start = time.time()
+        with open(args.json_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        count = write_geo_binary(data, bin_path, args.units)
+        json_size = os.path.getsize(args.json_path)
+        bin_size = os.path.getsize(bin_path)
+        print(f"✅ {count} feature → {bin_path} ({bin_size / (1024*1024):.2f} MB, "
+              f"{json_size / max(bin_size, 1):.1f}x nhỏ hơn JSON, {time.time() - start:.1f}s)")
+    elif args.cmd == 'decode':
+        with GeoBinaryReader(args.bin_path) as reader:
+            output = dict(reader.meta)
+            output['features'] = list(reader)
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(output, f, ensure_ascii=False)
+        print(f"✅ {len(output['features'])} feature → {args.json_path}")
+    elif args.cmd == 'verify':
+        bin_path = args.bin_path or binary_path(args.json_path)
+        errors = verify_roundtrip(args.json_path, bin_path)
+        if errors:
+            for e in errors:
+                print(f"❌ {e}")
+            sys.exit(1)
+        print(f"✅ {bin_path} khớp với {args.json_path}")
+    elif args.cmd == 'info':
+        with GeoBinaryReader(args.bin_path) as reader:
+            print(f"File: {args.bin_path} ({os.path.getsize(args.bin_path) / (1024*1024):.2f} MB)")
+            print(f"Meta: {json.dumps(reader.meta, ensure_ascii=False)}")
+            print(f"Feature: {len(reader)}, part: {len(reader.parts)}, chuỗi: {len(reader.string_offsets) - 1}")
+            print(f"Delta int16: {len(reader.deltas)}, delta int32: {len(reader.wide)}, "
+                  f"lượng tử: 1/{reader.units} độ")
+            errors = reader.validate()
+            print("Toàn vẹn: OK" if not errors else f"Toàn vẹn: {len(errors)} lỗi: {errors}")
+
+
+if __name__ == '__main__':
+    main()
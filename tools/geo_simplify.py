@@ -0,0 +1,231 @@
+"""
+Đơn giản hóa geometry theo nhiều mức chi tiết (LOD) gắn với dải zoom bản đồ.
+
+- Ranh giới tỉnh: simplify trên các arc dùng chung (geo_topology) -> giữ topology,
+  tỉnh kề nhau không bị hở/chồng.
+- Đường: simplify từng polyline, giữ nguyên 2 đầu mút (chỗ nối các đường).
+
+Thuật toán Douglas-Peucker, phần tính khoảng cách vector hóa bằng numpy.
+File LOD có cùng schema với file gốc, thêm khối "lod" ở header:
+    vn_boundaries.json -> vn_boundaries_lod0.json, vn_boundaries_lod1.json, ...
+"""
+import json
+import os
+
+import numpy as np
+
+from geo_arrays import lines_array
+from geo_topology import ArcTopology
+
+# (min_zoom, max_zoom). Zoom lớn hơn dải cuối cùng dùng file gốc (full độ phân giải)
+LOD_LEVELS = [
+    (0, 7),
+    (8, 10),
+    (11, 13),
+]
+
+TILE_SIZE_PX = 256
+MAX_ERROR_PX = 1.0 # Sai số tối đa cho phép (pixel) ở zoom lớn nhất của dải
+
+
+def tolerance_for_zoom(zoom):
+    """Sai số (độ) tương ứng MAX_ERROR_PX pixel tại mức zoom (Web Mercator, ở xích đạo)"""
+    return 360.0 / (TILE_SIZE_PX * 2 ** zoom) * MAX_ERROR_PX
+
+
+def lod_levels():
+    return [
+        {'level': i, 'min_zoom': zmin, 'max_zoom': zmax, 'tolerance': tolerance_for_zoom(zmax)}
+        for i, (zmin, zmax) in enumerate(LOD_LEVELS)
+    ]
+
+
+def lod_path(path, level):
+    base, ext = os.path.splitext(path)
+    return f"{base}_lod{level}{ext}"
+
+
+def _dp_keep(points, starts, ends, tolerance):
+    """Douglas-Peucker cho nhiều polyline cùng lúc (vector hóa theo "đợt").
+
+    points: mảng (n, 2) đã scale về đơn vị độ vĩ, các polyline nằm liền nhau
+    starts/ends: chỉ số điểm đầu/cuối (bao gồm) của từng polyline
+    Mỗi vòng lặp xử lý TẤT CẢ các khoảng (i, j) đang chờ của mọi polyline bằng
+    vài phép numpy, nên chi phí Python không phụ thuộc số điểm hay số polyline.
+    """
+    keep = np.zeros(len(points), dtype=bool)
+    keep[starts] = True
+    keep[ends] = True
+    tol2 = tolerance * tolerance
+    I = np.asarray(starts, dtype=np.int64)
+    J = np.asarray(ends, dtype=np.int64)
+    while True:
+        active = (J - I) >= 2
+        I, J = I[active], J[active]
+        if len(I) == 0:
+            break
+        inner = J - I - 1
+        offsets = np.cumsum(inner) - inner
+        rid = np.repeat(np.arange(len(I)), inner)
+        idx = np.arange(int(inner.sum())) - offsets[rid] + I[rid] + 1
+
+        a = points[I][rid]
+        ab = points[J][rid] - a
+        ap = points[idx] - a
+        len2 = np.einsum('ij,ij->i', ab, ab)
+        # Khoảng cách tới đoạn thẳng (không phải đường thẳng vô hạn)
+        t = np.einsum('ij,ij->i', ap, ab) / np.where(len2 > 0, len2, 1.0)
+        t = np.clip(np.where(len2 > 0, t, 0.0), 0.0, 1.0)
+        d = ap - t[:, None] * ab
+        dist2 = np.einsum('ij,ij->i', d, d)
+
+        best = np.maximum.reduceat(dist2, offsets)
+        # Vị trí max đầu tiên của mỗi khoảng
+        hits = np.flatnonzero(dist2 == best[rid])
+        hit_rid = rid[hits]
+        first = np.ones(len(hits), dtype=bool)
+        first[1:] = hit_rid[1:] != hit_rid[:-1]
+        M = np.empty(len(I), dtype=np.int64)
+        M[hit_rid[first]] = idx[hits[first]]
+
+        split = best > tol2
+        Ms = M[split]
+        keep[Ms] = True
+        I = np.concatenate([I[split], Ms])
+        J = np.concatenate([Ms, J[split]])
+    return keep
+
+
+def simplify_lines_multi(lines, tolerances):
+    """Simplify nhiều polyline [[lon, lat], ...] với nhiều mức sai số,
+    chỉ chuyển sang numpy 1 lần. Trả về list (theo tolerances) các list polyline.
+    Luôn giữ điểm đầu và cuối của mỗi polyline.
+    """
+    if not lines:
+        return [[] for _ in tolerances]
+    arr, offsets = lines_array(lines)
+    results = []
+    for kept, kept_offsets in simplify_arrays_multi(arr, offsets, tolerances):
+        pieces = np.split(kept, kept_offsets[1:-1])
+        results.append([piece.tolist() for piece in pieces])
+    return results
+
+
+def simplify_arrays_multi(arr, offsets, tolerances):
+    """Như simplify_lines_multi nhưng vào/ra đều là mảng phẳng: list (coords, offsets) theo tolerances"""
+    lengths = np.diff(offsets)
+    starts = offsets[:-1]
+    ends = offsets[1:] - 1
+    # Co kinh độ theo cos(vĩ độ) để sai số đồng đều theo 2 trục
+    scaled = arr.copy()
+    scaled[:, 0] *= np.cos(np.radians(arr[:, 1]))
+    nonempty = lengths > 0
+    results = []
+    for tolerance in tolerances:
+        keep = _dp_keep(scaled, starts[nonempty], ends[nonempty], tolerance)
+        kept_before = np.concatenate([[0], np.cumsum(keep)])
+        kept_offsets = np.zeros(len(offsets), dtype=np.int64)
+        np.cumsum(kept_before[ends + 1] - kept_before[starts], out=kept_offsets[1:])
+        results.append((arr[keep], kept_offsets))
+    return results
+
+
+def simplify_lines(lines, tolerance):
+    """Simplify nhiều polyline trong 1 lượt, luôn giữ điểm đầu và cuối"""
+    return simplify_lines_multi(lines, [tolerance])[0]
+
+
+def simplify_line(coords, tolerance):
+    """Simplify 1 polyline [[lon, lat], ...], luôn giữ điểm đầu và cuối"""
+    if len(coords) <= 2:
+        return coords
+    return simplify_lines([coords], tolerance)[0]
+
+
+def simplify_ring(coords, tolerance):
+    """Ring khép kín: cắt tại điểm xa điểm đầu nhất rồi simplify 2 nửa, giữ >= 4 điểm"""
+    if len(coords) <= 4:
+        return coords
+    arr = np.asarray(coords, dtype=np.float64)
+    far = int(np.argmax(((arr - arr[0]) ** 2).sum(axis=1)))
+    first = simplify_line(coords[:far + 1], tolerance)
+    second = simplify_line(coords[far:], tolerance)
+    ring = first + second[1:]
+    if len(ring) < 4:
+        # Giữ hình dạng tối thiểu (tam giác) thay vì để suy biến
+        third = len(coords) // 3
+        ring = [coords[0], coords[third], coords[2 * third], coords[-1]]
+    return ring
+
+
+def simplify_topology(topology, tolerance):
+    """Simplify mỗi arc dùng chung đúng 1 lần"""
+    result = []
+    for arc in topology.arcs:
+        if arc[0] == arc[-1]:
+            result.append(simplify_ring(arc, tolerance))
+        else:
+            result.append(simplify_line(arc, tolerance))
+    return result
+
+
+def count_vertices(geometry):
+    coords = geometry.get('coordinates', [])
+    if geometry.get('type') == 'Polygon':
+        return sum(len(r) for r in coords)
+    if geometry.get('type') == 'MultiPolygon':
+        return sum(len(r) for poly in coords for r in poly)
+    if geometry.get('type') == 'MultiLineString':
+        return sum(len(line) for line in coords)
+    return len(coords)
+
+
+def write_boundary_lods(output, path):
+    """Ghi các file LOD cho dữ liệu ranh giới (dict output giống file gốc)"""
+    features = output.get('features', [])
+    topology = ArcTopology([f.get('geometry', {}) for f in features])
+    full_vertices = sum(count_vertices(f.get('geometry', {})) for f in features)
+    print(f"  Topology: {len(topology.arcs)} arc dùng chung, {len(topology.junctions)} điểm nối")
+
+    for lod in lod_levels():
+        arcs = simplify_topology(topology, lod['tolerance'])
+        lod_features = []
+        for g, feat in enumerate(features):
+            geometry = topology.build_geometry(g, arcs)
+            if not geometry['coordinates']:
+                geometry = feat.get('geometry', {}) # Không để mất cả tỉnh
+            lod_feat = dict(feat)
+            lod_feat['geometry'] = geometry
+            lod_features.append(lod_feat)
+
+        lod_output = {k: v for k, v in output.items() if k != 'features'}
+        lod_output['lod'] = lod
+        lod_output['features'] = lod_features
+        out_path = lod_path(path, lod['level'])
+        with open(out_path, 'w', encoding='utf-8') as f:
+            json.dump(lod_output, f, ensure_ascii=False)
+
+        vertices = sum(count_vertices(f['geometry']) for f in lod_features)
+        print(f"  LOD{lod['level']} (zoom {lod['min_zoom']}-{lod['max_zoom']}, "
+              f"tol {lod['tolerance']:.5f}°): {full_vertices} -> {vertices} điểm, "
+              f"{os.path.getsize(out_path) / 1024:.0f} KB → {out_path}")
+
+
+def simplify_road_arrays(coords, offsets, road_parts, tolerances):
+    """Simplify mọi đường trong 1 lượt numpy, trên mảng phẳng (road_collection.RoadCollection.arrays()):
+    list (coords, offsets, road_parts) theo tolerances. Bỏ polyline còn 2 điểm ngắn hơn sai số
+    (không nhìn thấy ở dải zoom này).
+    Đường không còn segment nào có road_parts[i] == road_parts[i + 1]"""
+    results = []
+    for tolerance, (kept, kept_offsets) in zip(tolerances, simplify_arrays_multi(coords, offsets, tolerances)):
+        lengths = np.diff(kept_offsets)
+        two = kept_offsets[:-1][lengths == 2]
+        tiny = np.zeros(len(lengths), dtype=bool)
+        tiny[lengths == 2] = (np.abs(kept[two] - kept[two + 1]) < tolerance).all(axis=1)
+        counts = lengths[~tiny]
+        point_keep = np.repeat(~tiny, lengths)
+        new_offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=new_offsets[1:])
+        seg_kept = np.concatenate([[0], np.cumsum(~tiny)])
+        results.append((kept[point_keep], new_offsets, seg_kept[road_parts]))
+    return results
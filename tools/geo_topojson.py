@@ -0,0 +1,371 @@
+"""
+Mã hóa ranh giới dạng TopoJSON: mỗi đoạn biên dùng chung chỉ lưu 1 lần.
+
+vn_boundaries.json / vn_boundaries_2025.json lưu nguyên ranh giới của từng tỉnh,
+nên mỗi đoạn biên giữa 2 tỉnh bị ghi 2 lần (và 2 bộ 63 / 34 tỉnh lại lặp nhau).
+Ở đây cả 2 bộ được gom vào 1 topology (geo_topology.ArcTopology):
+    arcs     các cung dùng chung, lượng tử hóa (mặc định 1e-5 độ) + mã hóa delta
+    objects  mỗi file nguồn là 1 GeometryCollection, mỗi tỉnh là list tham chiếu arc
+Đoạn biên của tỉnh 2025 trùng tọa độ với tỉnh cũ dùng lại đúng arc của tỉnh cũ, nên sau
+lượng tử hóa 2 bộ vẫn khớp nhau tuyệt đối (số arc dùng chung: xem lệnh info).
+File theo đúng chuẩn TopoJSON 1.0 (đọc được bằng topojson-client), thuộc tính
+của tỉnh nằm trong "properties", thông tin file gốc (version, source...) trong "meta".
+
+Dùng:
+    python tools/geo_topojson.py encode vn_boundaries.json vn_boundaries_2025.json -o vn_boundaries.topo.json
+    python tools/geo_topojson.py decode vn_boundaries.topo.json vn_boundaries_2025 out.json
+    python tools/geo_topojson.py verify vn_boundaries.topo.json vn_boundaries.json vn_boundaries_2025.json
+    python tools/geo_topojson.py info vn_boundaries.topo.json
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+from geo_arrays import lines_array
+from geo_topology import ArcTopology
+
+DEFAULT_UNITS_PER_DEGREE = 100_000 # 1e-5 độ ≈ 1.1 m, giống geo_binary
+TOPOLOGY_FILE = 'vn_boundaries.topo.json'
+
+
+def object_name(path):
+    """Tên object trong topology = tên file nguồn bỏ đuôi (vd. 'vn_boundaries_2025')"""
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def quantize_arcs(arcs, translate, units):
+    """Arc [[lon, lat], ...] -> arc delta nguyên [[x0, y0], [dx, dy], ...].
+    Bỏ điểm trùng nhau sau lượng tử hóa, mỗi arc giữ tối thiểu 2 điểm"""
+    coords, offsets = lines_array(arcs)
+    q = np.round((coords - translate) * units).astype(np.int64)
+    keep = np.ones(len(q), dtype=bool)
+    keep[1:] = np.any(q[1:] != q[:-1], axis=1)
+    keep[offsets[:-1]] = True # Điểm đầu mỗi arc (so với arc trước thì không tính)
+    result = []
+    for start, end in zip(offsets[:-1], offsets[1:]):
+        points = q[start:end][keep[start:end]]
+        if len(points) < 2:
+            points = np.vstack([points, q[end - 1:end]])
+        deltas = points.copy()
+        deltas[1:] -= points[:-1]
+        result.append(deltas.tolist())
+    return result
+
+
+def decode_arcs_array(arcs):
+    """Arc delta -> (tọa độ nguyên tuyệt đối (n, 2) nối liền, offsets): arc i là [offsets[i]:offsets[i+1]].
+    cumsum 1 lượt cho mọi arc rồi trừ tổng tích lũy trước điểm đầu mỗi arc"""
+    lengths = np.fromiter(map(len, arcs), dtype=np.int64, count=len(arcs))
+    offsets = np.zeros(len(arcs) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    deltas = np.array([p for arc in arcs for p in arc], dtype=np.int64).reshape(-1, 2)
+    values = np.cumsum(deltas, axis=0)
+    if not len(values):
+        return values, offsets
+    starts = offsets[:-1]
+    base = np.where((starts > 0)[:, None], values[np.maximum(starts - 1, 0)], 0)
+    return values - np.repeat(base, lengths, axis=0), offsets
+
+
+def _ring_refs(topology, g):
+    """Tham chiếu arc theo polygon của geometry g: [[ring_refs, ...], ...]"""
+    polygons = {}
+    for pi, ri, k in topology.ring_refs[g]:
+        if ri == 0:
+            polygons[pi] = []
+        if pi in polygons: # Vỏ ngoài bị suy biến -> bỏ cả polygon
+            polygons[pi].append(list(topology.ring_arcs[k]))
+    return [rings for _, rings in sorted(polygons.items())]
+
+
+def encode_topology(collections, units_per_degree=DEFAULT_UNITS_PER_DEGREE):
+    """{tên object: dict output (giống file JSON ranh giới)} -> dict TopoJSON"""
+    entries = [(name, feat) for name, output in collections.items()
+               for feat in output.get('features', [])]
+    topology = ArcTopology([feat.get('geometry', {}) for _, feat in entries])
+    points = np.array([p for arc in topology.arcs for p in arc], dtype=np.float64).reshape(-1, 2)
+    translate = points.min(axis=0) if len(points) else np.zeros(2)
+    scale = 1.0 / units_per_degree
+
+    objects = {}
+    for name, output in collections.items():
+        objects[name] = {
+            'type': 'GeometryCollection',
+            'meta': {k: v for k, v in output.items() if k != 'features'},
+            'geometries': [],
+        }
+    for g, (name, feat) in enumerate(entries):
+        polygons = _ring_refs(topology, g)
+        properties = {k: v for k, v in feat.items() if k != 'geometry'}
+        if feat.get('geometry', {}).get('type') == 'Polygon' and len(polygons) <= 1:
+            geometry = {'type': 'Polygon', 'arcs': polygons[0] if polygons else []}
+        else:
+            geometry = {'type': 'MultiPolygon', 'arcs': polygons}
+        geometry['properties'] = properties
+        objects[name]['geometries'].append(geometry)
+
+    return {
+        'type': 'Topology',
+        'transform': {'scale': [scale, scale], 'translate': [float(v) for v in translate]},
+        'objects': objects,
+        'arcs': quantize_arcs(topology.arcs, translate, units_per_degree),
+    }
+
+
+class TopologyDecoder:
+    """Dựng lại các file ranh giới từ TopoJSON. Mọi arc được giải mã 1 lần bằng numpy
+    rồi dùng chung cho mọi tỉnh (các ring cùng trỏ tới list điểm của arc, chỉ nên đọc)"""
+
+    def __init__(self, topo):
+        self.topo = topo
+        transform = topo['transform']
+        self.scale = transform['scale']
+        self.translate = transform['translate']
+        self.quantized, self.offsets = decode_arcs_array(topo['arcs'])
+        # Số chữ số thập phân đủ biểu diễn đúng 1 bước lượng tử
+        digits = max(0, math.ceil(-math.log10(min(self.scale)))) + 1
+        coords = np.round(self.quantized * self.scale + self.translate, digits)
+        self.arcs = self._split(coords.tolist())
+        self._quantized_arcs = None
+
+    def _split(self, flat):
+        bounds = self.offsets.tolist()
+        return [flat[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+    @staticmethod
+    def _join(arcs, refs):
+        ring = []
+        for ref in refs:
+            arc = arcs[ref] if ref >= 0 else arcs[~ref][::-1]
+            ring.extend(arc[1:] if ring else arc)
+        return ring
+
+    def ring_quantized(self, refs):
+        """Ring tọa độ nguyên (không có điểm đóng) ghép từ list tham chiếu arc"""
+        if self._quantized_arcs is None:
+            self._quantized_arcs = self._split(list(map(tuple, self.quantized.tolist())))
+        ring = self._join(self._quantized_arcs, refs)
+        if len(ring) > 1 and ring[0] == ring[-1]:
+            ring.pop()
+        return ring
+
+    def ring(self, refs):
+        ring = self._join(self.arcs, refs)
+        if ring and ring[0] != ring[-1]:
+            ring.append(ring[0])
+        return ring
+
+    def geometry(self, geom):
+        if geom['type'] == 'Polygon':
+            return {'type': 'Polygon', 'coordinates': [self.ring(refs) for refs in geom['arcs']]}
+        return {'type': 'MultiPolygon',
+                'coordinates': [[self.ring(refs) for refs in polygon] for polygon in geom['arcs']]}
+
+    def decode(self, name):
+        """Object name -> dict output giống file JSON ranh giới gốc"""
+        obj = self.topo['objects'][name]
+        output = dict(obj.get('meta', {}))
+        features = []
+        for geom in obj['geometries']:
+            feat = dict(geom.get('properties', {}))
+            feat['geometry'] = self.geometry(geom)
+            features.append(feat)
+        output['features'] = features
+        return output
+
+
+def load_topology(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def decode_topology(topo, name):
+    return TopologyDecoder(topo).decode(name)
+
+
+def write_topology(json_paths, path, units_per_degree=DEFAULT_UNITS_PER_DEGREE, outputs=None):
+    """Gom các file ranh giới vào 1 file TopoJSON (ghi .part rồi đổi tên).
+    outputs: {đường dẫn: dict output} đã có sẵn trong bộ nhớ (khỏi đọc lại file)"""
+    collections = {}
+    for json_path in json_paths:
+        data = (outputs or {}).get(json_path)
+        if data is None:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        collections[object_name(json_path)] = data
+    topo = encode_topology(collections, units_per_degree)
+    with open(path + '.part', 'w', encoding='utf-8') as f:
+        json.dump(topo, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(path + '.part', path)
+    return topo
+
+
+def topology_stats(topo):
+    """Số arc, số điểm, số arc mỗi object dùng và số arc dùng chung giữa các object"""
+    used = {}
+    for name, obj in topo['objects'].items():
+        refs = set()
+        for geom in obj['geometries']:
+            polygons = [geom['arcs']] if geom['type'] == 'Polygon' else geom['arcs']
+            for polygon in polygons:
+                for ring in polygon:
+                    refs.update(r if r >= 0 else ~r for r in ring)
+        used[name] = refs
+    shared = set.intersection(*used.values()) if len(used) > 1 else set()
+    return {
+        'arcs': len(topo['arcs']),
+        'points': sum(len(arc) for arc in topo['arcs']),
+        'objects': {name: {'features': len(topo['objects'][name]['geometries']), 'arcs': len(refs)}
+                    for name, refs in used.items()},
+        'shared_arcs': len(shared),
+    }
+
+
+def _quantized_ring(ring, translate, units):
+    """Ring gốc -> tọa độ nguyên, bỏ điểm lặp liên tiếp (kể cả vòng quanh) và điểm đóng"""
+    points = []
+    for p in ring:
+        q = (round((p[0] - translate[0]) * units), round((p[1] - translate[1]) * units))
+        if not points or points[-1] != q:
+            points.append(q)
+    while len(points) > 1 and points[0] == points[-1]:
+        points.pop()
+    return points
+
+
+def _same_cycle(a, b):
+    """2 ring (không có điểm đóng) giống nhau sai khác điểm bắt đầu"""
+    if len(a) != len(b):
+        return False
+    if not a:
+        return True
+    return any(b[i:] + b[:i] == a for i, p in enumerate(b) if p == a[0])
+
+
+def _dedupe_cycle(points):
+    out = [p for i, p in enumerate(points) if i == 0 or p != points[i - 1]]
+    while len(out) > 1 and out[0] == out[-1]:
+        out.pop()
+    return out
+
+
+def verify_topology(topo_path, json_paths):
+    """So sánh TopoJSON với các file ranh giới gốc: thuộc tính khớp tuyệt đối,
+    mỗi ring là đúng ring gốc sau lượng tử hóa (có thể bắt đầu từ điểm khác). Trả về list lỗi"""
+    topo = load_topology(topo_path)
+    decoder = TopologyDecoder(topo)
+    units = 1.0 / decoder.scale[0]
+    translate = decoder.translate
+    errors = []
+    for json_path in json_paths:
+        name = object_name(json_path)
+        if name not in topo['objects']:
+            errors.append(f"thiếu object '{name}'")
+            continue
+        with open(json_path, 'r', encoding='utf-8') as f:
+            features = json.load(f).get('features', [])
+        geometries = topo['objects'][name]['geometries']
+        if len(features) != len(geometries):
+            errors.append(f"{name}: số feature khác nhau: {len(features)} != {len(geometries)}")
+            continue
+        for feat, geom in zip(features, geometries):
+            label = f"{name}/{feat.get('name')}"
+            expected = {k: v for k, v in feat.items() if k != 'geometry'}
+            if geom.get('properties') != expected:
+                errors.append(f"{label}: thuộc tính khác")
+            eg = feat.get('geometry', {})
+            e_polygons = eg.get('coordinates', [])
+            if eg.get('type') == 'Polygon':
+                e_polygons = [e_polygons]
+            a_polygons = [geom['arcs']] if geom['type'] == 'Polygon' else geom['arcs']
+            e_rings = [_quantized_ring(r, translate, units) for poly in e_polygons for r in poly]
+            a_rings = [_dedupe_cycle(decoder.ring_quantized(refs)) for poly in a_polygons for refs in poly]
+            e_rings = [r for r in e_rings if len(r) >= 3]
+            a_rings = [r for r in a_rings if len(r) >= 3]
+            if len(e_rings) != len(a_rings):
+                errors.append(f"{label}: số ring khác nhau: {len(e_rings)} != {len(a_rings)}")
+            elif not all(_same_cycle(e, a) for e, a in zip(e_rings, a_rings)):
+                errors.append(f"{label}: tọa độ khác ranh giới gốc (sau lượng tử hóa)")
+            if len(errors) > 20:
+                errors.append("... (dừng sau 20 lỗi)")
+                return errors
+    return errors
+
+
+def _compact_size(data):
+    return len(json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mã hóa / kiểm tra ranh giới dạng TopoJSON (arc dùng chung)")
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p = sub.add_parser('encode', help="Các file JSON ranh giới -> 1 file TopoJSON")
+    p.add_argument('json_paths', nargs='+')
+    p.add_argument('-o', '--output', default=None, help=f"File ra (mặc định: {TOPOLOGY_FILE} cạnh file đầu)")
+    p.add_argument('--units', type=int, default=DEFAULT_UNITS_PER_DEGREE, help="Số bước lượng tử / độ")
+    p = sub.add_parser('decode', help="1 object trong TopoJSON -> file JSON ranh giới")
+    p.add_argument('topo_path')
+    p.add_argument('name', help="Tên object, vd. vn_boundaries_2025")
+    p.add_argument('json_path')
+    p = sub.add_parser('verify', help="Kiểm tra TopoJSON khớp các file JSON gốc")
+    p.add_argument('topo_path')
+    p.add_argument('json_paths', nargs='+')
+    p = sub.add_parser('info', help="Thống kê arc / object, so sánh kích thước và thời gian đọc")
+    p.add_argument('topo_path')
+    args = parser.parse_args()
+
+    if args.cmd == 'encode':
+        output = args.output or os.path.join(os.path.dirname(args.json_paths[0]), TOPOLOGY_FILE)
+        start = time.time()
+        topo = write_topology(args.json_paths, output, args.units)
+        stats = topology_stats(topo)
+        source_size = sum(os.path.getsize(p) for p in args.json_paths)
+        size = os.path.getsize(output)
+        print(f"✅ {stats['arcs']} arc ({stats['points']} điểm), {stats['shared_arcs']} arc dùng chung "
+              f"giữa các object → {output}")
+        print(f"   {size / 1024:.0f} KB ({source_size / max(size, 1):.1f}x nhỏ hơn "
+              f"{source_size / 1024:.0f} KB JSON gốc, {time.time() - start:.1f}s)")
+    elif args.cmd == 'decode':
+        output = decode_topology(load_topology(args.topo_path), args.name)
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(output, f, ensure_ascii=False)
+        print(f"✅ {len(output['features'])} feature → {args.json_path}")
+    elif args.cmd == 'verify':
+        errors = verify_topology(args.topo_path, args.json_paths)
+        if errors:
+            for e in errors:
+                print(f"❌ {e}")
+            return 1
+        print(f"✅ {args.topo_path} khớp với {', '.join(args.json_paths)}")
+    elif args.cmd == 'info':
+        start = time.perf_counter()
+        topo = load_topology(args.topo_path)
+        decoder = TopologyDecoder(topo)
+        decoded = {name: decoder.decode(name) for name in topo['objects']}
+        decode_seconds = time.perf_counter() - start
+        stats = topology_stats(topo)
+        size = os.path.getsize(args.topo_path)
+        print(f"File: {args.topo_path} ({size / 1024:.0f} KB), lượng tử: 1/{1 / decoder.scale[0]:.0f} độ")
+        print(f"Arc: {stats['arcs']} ({stats['points']} điểm), dùng chung giữa các object: {stats['shared_arcs']}")
+        for name, s in stats['objects'].items():
+            plain = _compact_size(decoded[name])
+            print(f"  {name}: {s['features']} feature, {s['arcs']} arc, "
+                  f"JSON thường (không thụt lề) {plain / 1024:.0f} KB")
+        plain = sum(_compact_size(d) for d in decoded.values())
+        print(f"Tổng JSON thường: {plain / 1024:.0f} KB -> TopoJSON {size / 1024:.0f} KB "
+              f"({plain / max(size, 1):.1f}x nhỏ hơn)")
+        plain_bytes = json.dumps(list(decoded.values()), ensure_ascii=False, separators=(',', ':'))
+        start = time.perf_counter()
+        json.loads(plain_bytes)
+        print(f"Đọc + dựng lại mọi object: {decode_seconds * 1000:.0f} ms "
+              f"(json.loads JSON thường: {(time.perf_counter() - start) * 1000:.0f} ms)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,139 @@
+"""
+Tách ranh giới polygon thành các cung (arc) dùng chung, kiểu TopoJSON.
+
+Hai tỉnh liền kề có chung 1 đoạn biên -> đoạn đó chỉ được lưu/xử lý 1 lần.
+Nhờ vậy khi simplify từng arc, 2 tỉnh vẫn khớp nhau tuyệt đối (không hở, không chồng).
+
+Quy ước tham chiếu arc giống TopoJSON: i >= 0 là arc i, ~i (= -i-1) là arc i đảo chiều.
+"""
+
+
+def iter_rings(geometry):
+    """Duyệt (polygon_index, ring_index, ring) của Polygon / MultiPolygon"""
+    geo_type = geometry.get('type', '')
+    coords = geometry.get('coordinates', [])
+    if geo_type == 'Polygon':
+        polygons = [coords]
+    elif geo_type == 'MultiPolygon':
+        polygons = coords
+    else:
+        polygons = []
+    for pi, polygon in enumerate(polygons):
+        for ri, ring in enumerate(polygon):
+            yield pi, ri, ring
+
+
+def _ring_points(ring):
+    """Ring dạng tuple, bỏ điểm đóng (điểm cuối trùng điểm đầu) và điểm lặp liên tiếp"""
+    points = []
+    for p in ring:
+        pt = (p[0], p[1])
+        if not points or points[-1] != pt:
+            points.append(pt)
+    if len(points) > 1 and points[0] == points[-1]:
+        points.pop()
+    return points
+
+
+def find_junctions(rings):
+    """Điểm nối: điểm có nhiều hơn 2 điểm kề khác nhau (chỗ các ranh giới rẽ nhánh)"""
+    neighbours = {}
+    for points in rings:
+        n = len(points)
+        for i, p in enumerate(points):
+            s = neighbours.get(p)
+            if s is None:
+                s = neighbours[p] = set()
+            s.add(points[i - 1])
+            s.add(points[(i + 1) % n])
+    return {p for p, s in neighbours.items() if len(s) > 2}
+
+
+class ArcTopology:
+    """Tập arc dùng chung + cách ghép lại từng ring của từng feature"""
+
+    def __init__(self, geometries):
+        # rings[k] = list điểm (đã bỏ điểm đóng), ring_refs[g] = [(pi, ri, k)]
+        self.rings = []
+        self.ring_refs = []
+        for geometry in geometries:
+            refs = []
+            for pi, ri, ring in iter_rings(geometry):
+                points = _ring_points(ring)
+                if len(points) < 3:
+                    continue
+                refs.append((pi, ri, len(self.rings)))
+                self.rings.append(points)
+            self.ring_refs.append(refs)
+        self.geo_types = [g.get('type', '') for g in geometries]
+
+        self.junctions = find_junctions(self.rings)
+        self.arcs = []
+        self._arc_index = {}
+        # ring_arcs[k] = list tham chiếu arc để dựng lại ring k
+        self.ring_arcs = [self._cut_ring(points) for points in self.rings]
+
+    def _add_arc(self, points):
+        key = tuple(points)
+        idx = self._arc_index.get(key)
+        if idx is not None:
+            return idx
+        rkey = key[::-1]
+        idx = self._arc_index.get(rkey)
+        if idx is not None:
+            return ~idx
+        idx = len(self.arcs)
+        self.arcs.append(list(points))
+        self._arc_index[key] = idx
+        return idx
+
+    def _cut_ring(self, points):
+        n = len(points)
+        cuts = [i for i, p in enumerate(points) if p in self.junctions]
+        if not cuts:
+            # Ring không có điểm nối (đảo, hoặc ring trùng khớp toàn bộ với ring khác):
+            # xoay về điểm nhỏ nhất để 2 ring giống nhau cho ra cùng 1 arc
+            start = min(range(n), key=lambda i: points[i])
+            rotated = points[start:] + points[:start]
+            return [self._add_arc(rotated + [rotated[0]])]
+        refs = []
+        for c, start in enumerate(cuts):
+            end = cuts[(c + 1) % len(cuts)]
+            if end > start:
+                arc = points[start:end + 1]
+            else:
+                arc = points[start:] + points[:end + 1]
+            refs.append(self._add_arc(arc))
+        return refs
+
+    def arc_points(self, ref, arcs=None):
+        arcs = self.arcs if arcs is None else arcs
+        return arcs[ref] if ref >= 0 else arcs[~ref][::-1]
+
+    def build_ring(self, k, arcs=None):
+        """Ghép lại ring k từ các arc (có thể là arc đã simplify)"""
+        ring = []
+        for ref in self.ring_arcs[k]:
+            points = [tuple(p) for p in self.arc_points(ref, arcs)]
+            ring.extend(points[1:] if ring else points)
+        if ring and ring[0] != ring[-1]:
+            ring.append(ring[0])
+        return [list(p) for p in ring]
+
+    def build_geometry(self, g, arcs=None, min_ring_points=4):
+        """Dựng lại geometry thứ g. Ring bị suy biến (< 4 điểm) sẽ bị bỏ;
+        nếu mất cả vỏ ngoài thì bỏ luôn polygon đó."""
+        polygons = {}
+        for pi, ri, k in self.ring_refs[g]:
+            ring = self.build_ring(k, arcs)
+            if len(ring) < min_ring_points:
+                if ri == 0:
+                    polygons[pi] = None
+                continue
+            if polygons.get(pi, []) is None:
+                continue
+            polygons.setdefault(pi, []).append(ring)
+        polygons = [rings for _, rings in sorted(polygons.items()) if rings]
+        if self.geo_types[g] == 'Polygon' and len(polygons) <= 1:
+            return {'type': 'Polygon', 'coordinates': polygons[0] if polygons else []}
+        return {'type': 'MultiPolygon', 'coordinates': polygons}
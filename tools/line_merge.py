@@ -0,0 +1,121 @@
+"""
+Gộp các way OSM của cùng một con đường thành ít polyline liền mạch nhất.
+
+Mỗi way là 1 cạnh nối 2 node đầu/cuối. Với mỗi thành phần liên thông, số
+polyline tối thiểu phủ hết các cạnh (mỗi cạnh đúng 1 lần) là
+max(1, số_node_bậc_lẻ / 2). Ta đạt được con số đó bằng cách:
+  1. nối tạm các node bậc lẻ theo cặp bằng "cạnh ảo"
+  2. tìm chu trình Euler (Hierholzer)
+  3. cắt chu trình tại các cạnh ảo
+"""
+from collections import defaultdict
+
+
+def endpoint_id(node_ids, coords, first):
+    """Id node đầu/cuối: ưu tiên node id OSM, nếu không có thì dùng tọa độ"""
+    if node_ids:
+        return node_ids[0] if first else node_ids[-1]
+    lon, lat = coords[0] if first else coords[-1]
+    return f"{lon},{lat}"
+
+
+def dedupe_ways(ways):
+    """Bỏ way trùng id (way nằm vắt qua biên 2 ô sẽ được cả 2 ô trả về)
+    ways: list [way_id, first_node, last_node, coords(, nodes)]
+    """
+    seen = set()
+    result = []
+    for way in ways:
+        way_id = way[0]
+        if way_id is not None:
+            if way_id in seen:
+                continue
+            seen.add(way_id)
+        result.append(way)
+    return result
+
+
+def _euler_circuit(start, adj, ends, used, ptr):
+    """Hierholzer (không đệ quy). Trả về list (node, cạnh đi tới node) theo thứ tự"""
+    stack = [(start, None)]
+    path = []
+    while stack:
+        node, edge = stack[-1]
+        edges = adj[node]
+        i = ptr[node]
+        while i < len(edges) and used[edges[i]]:
+            i += 1
+        ptr[node] = i
+        if i == len(edges):
+            stack.pop()
+            path.append((node, edge))
+        else:
+            eid = edges[i]
+            used[eid] = True
+            a, b = ends[eid]
+            stack.append((b if node == a else a, eid))
+    path.reverse()
+    return path
+
+
+def stitch_ways(ways):
+    """Gộp list [way_id, first_node, last_node, coords] -> list polyline (list [lon, lat])"""
+    ends = [(w[1], w[2]) for w in ways]
+    n_real = len(ends)
+    adj = defaultdict(list)
+    for eid, (a, b) in enumerate(ends):
+        adj[a].append(eid)
+        adj[b].append(eid)
+
+    # Tìm thành phần liên thông, thêm cạnh ảo nối các node bậc lẻ theo cặp
+    component_start = []
+    seen = set()
+    for node in list(adj):
+        if node in seen:
+            continue
+        seen.add(node)
+        stack = [node]
+        odd = []
+        while stack:
+            v = stack.pop()
+            if len(adj[v]) % 2:
+                odd.append(v)
+            for eid in adj[v]:
+                a, b = ends[eid]
+                w = b if v == a else a
+                if w not in seen:
+                    seen.add(w)
+                    stack.append(w)
+        for i in range(0, len(odd), 2):
+            a, b = odd[i], odd[i + 1]
+            ends.append((a, b))
+            adj[a].append(len(ends) - 1)
+            adj[b].append(len(ends) - 1)
+        component_start.append(odd[0] if odd else node)
+
+    used = [False] * len(ends)
+    ptr = defaultdict(int)
+    lines = []
+    for start in component_start:
+        circuit = _euler_circuit(start, adj, ends, used, ptr)
+        steps = [(circuit[i - 1][0], circuit[i][1]) for i in range(1, len(circuit))]
+        # Xoay chu trình để bắt đầu ngay sau 1 cạnh ảo (nếu có)
+        for i, (_, eid) in enumerate(steps):
+            if eid >= n_real:
+                steps = steps[i + 1:] + steps[:i + 1]
+                break
+
+        current = []
+        for from_node, eid in steps:
+            if eid >= n_real:
+                if current:
+                    lines.append(current)
+                current = []
+                continue
+            coords = ways[eid][3]
+            if ends[eid][0] != from_node:
+                coords = coords[::-1]
+            current.extend(coords[1:] if current else coords)
+        if current:
+            lines.append(current)
+    return lines
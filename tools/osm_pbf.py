@@ -0,0 +1,258 @@
+"""
+Đọc file OSM PBF (*.osm.pbf) bằng Python + numpy, theo từng blob độc lập.
+
+File PBF là chuỗi blob: [int32 độ dài][BlobHeader][Blob (zlib)]. Mỗi blob OSMData
+giải nén ra 1 PrimitiveBlock tự đủ (có bảng chuỗi riêng), nên các process khác nhau
+có thể đọc các blob khác nhau chỉ từ (offset, size) -> song song hóa theo blob.
+
+Các trường "packed" (id/lat/lon của DenseNodes, refs của Way) được giải mã varint
+bằng numpy (vector hóa), không lặp từng byte bằng Python.
+Định dạng: https://wiki.openstreetmap.org/wiki/PBF_Format
+"""
+import struct
+import zlib
+
+import numpy as np
+
+BLOB_HEADER = 'OSMHeader'
+BLOB_DATA = 'OSMData'
+SUPPORTED_FEATURES = {'OsmSchema-V0.6', 'DenseNodes', 'HistoricalInformation'}
+
+
+# --- PROTOBUF TỐI GIẢN ---
+
+def read_varint(buf, pos):
+    b = buf[pos]
+    if b < 0x80: # Đa số varint chỉ 1 byte (key, độ dài ngắn)
+        return b, pos + 1
+    result = shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7F) << shift
+        if b < 0x80:
+            return result, pos
+        shift += 7
+
+
+def iter_fields(buf, pos=0, end=None):
+    """Duyệt (field, wire_type, value) của 1 message.
+    wire_type 2 (bytes/message/packed): value là (start, end) trong buf"""
+    end = len(buf) if end is None else end
+    while pos < end:
+        key = buf[pos]
+        if key < 0x80:
+            pos += 1
+        else:
+            key, pos = read_varint(buf, pos)
+        field, wire = key >> 3, key & 7
+        if wire == 0:
+            value, pos = read_varint(buf, pos)
+        elif wire == 2:
+            length, pos = read_varint(buf, pos)
+            value = (pos, pos + length)
+            pos += length
+        elif wire == 1:
+            value = buf[pos:pos + 8]
+            pos += 8
+        elif wire == 5:
+            value = buf[pos:pos + 4]
+            pos += 4
+        else:
+            raise ValueError(f"Wire type {wire} không hỗ trợ")
+        yield field, wire, value
+
+
+def decode_packed(buf, start, end):
+    """Các varint liền nhau trong buf[start:end] -> mảng uint64 (vector hóa)"""
+    b = np.frombuffer(buf, dtype=np.uint8, count=end - start, offset=start)
+    if not len(b):
+        return np.zeros(0, dtype=np.uint64)
+    ends = np.flatnonzero(b < 0x80)
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    pos_in_varint = np.arange(len(b)) - np.repeat(starts, ends - starts + 1)
+    parts = (b & 0x7F).astype(np.uint64) << (7 * pos_in_varint).astype(np.uint64)
+    return np.bitwise_or.reduceat(parts, starts)
+
+
+def zigzag(values):
+    """sint64 (zigzag) -> int64"""
+    return (values >> np.uint64(1)).astype(np.int64) ^ -(values & np.uint64(1)).astype(np.int64)
+
+
+def decode_delta_runs(buf, ranges):
+    """Nhiều mảng packed sint64 mã hóa delta (vd. refs của các way) giải mã trong 1 lượt numpy:
+    trả về (giá trị nối liền, offsets) - mảng i là values[offsets[i]:offsets[i+1]]"""
+    offsets = np.zeros(len(ranges) + 1, dtype=np.int64)
+    if not ranges:
+        return np.zeros(0, dtype=np.int64), offsets
+    joined = b''.join(buf[start:end] for start, end in ranges)
+    byte_ends = np.cumsum([end - start for start, end in ranges])
+    terminators = np.flatnonzero(np.frombuffer(joined, dtype=np.uint8) < 0x80)
+    offsets[1:] = np.searchsorted(terminators, byte_ends, side='left')
+    values = np.cumsum(zigzag(decode_packed(joined, 0, len(joined))))
+    if not len(values):
+        return values, offsets
+    # cumsum chạy liền qua các mảng: trừ tổng tích lũy trước điểm bắt đầu mỗi mảng
+    starts = offsets[:-1]
+    base = np.where(starts > 0, values[np.maximum(starts - 1, 0)], 0)
+    return values - np.repeat(base, np.diff(offsets)), offsets
+
+
+def decode_packed_python(buf, start, end):
+    """Bản Python cho mảng ngắn (vài phần tử): nhanh hơn dựng mảng numpy"""
+    values = []
+    pos = start
+    while pos < end:
+        value, pos = read_varint(buf, pos)
+        values.append(value)
+    return values
+
+
+# --- BLOB ---
+
+def index_blobs(path):
+    """Danh sách (loại blob, offset dữ liệu, độ dài) - chỉ đọc header, bỏ qua phần dữ liệu"""
+    blobs = []
+    with open(path, 'rb') as f:
+        while True:
+            head = f.read(4)
+            if len(head) < 4:
+                break
+            (header_len,) = struct.unpack('>I', head)
+            header = f.read(header_len)
+            blob_type, datasize = None, 0
+            for field, _, value in iter_fields(header):
+                if field == 1:
+                    blob_type = header[value[0]:value[1]].decode('utf-8')
+                elif field == 3:
+                    datasize = value
+            blobs.append((blob_type, f.tell(), datasize))
+            f.seek(datasize, 1)
+    return blobs
+
+
+def read_blob(path, offset, size):
+    """Đọc + giải nén 1 blob -> bytes của PrimitiveBlock / HeaderBlock"""
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        blob = f.read(size)
+    for field, _, value in iter_fields(blob):
+        data = blob[value[0]:value[1]] if isinstance(value, tuple) else None
+        if field == 1: # raw
+            return data
+        if field == 3: # zlib_data
+            return zlib.decompress(data)
+        if field in (4, 5, 6, 7):
+            raise ValueError("Blob nén lzma/bzip2/lz4/zstd chưa hỗ trợ (chỉ zlib)")
+    raise ValueError("Blob rỗng")
+
+
+def header_features(data):
+    """required_features của HeaderBlock"""
+    return [data[v[0]:v[1]].decode('utf-8') for f, _, v in iter_fields(data) if f == 4]
+
+
+def header_replication_timestamp(data):
+    """osmosis_replication_timestamp của HeaderBlock (giây epoch, mốc dữ liệu của extract) hoặc None"""
+    for field, wire, value in iter_fields(data):
+        if field == 32 and wire == 0:
+            return value
+    return None
+
+
+class PrimitiveBlock:
+    """1 khối dữ liệu đã giải nén: bảng chuỗi + các nhóm node / way"""
+
+    def __init__(self, data):
+        self.data = data
+        self.strings = []
+        self.groups = []
+        self.granularity = 100
+        self.lat_offset = 0
+        self.lon_offset = 0
+        for field, _, value in iter_fields(data):
+            if field == 1:
+                self.strings = [data[s:e] for f, _, (s, e) in iter_fields(data, *value) if f == 1]
+            elif field == 2:
+                self.groups.append(value)
+            elif field == 17:
+                self.granularity = value
+            elif field == 19:
+                self.lat_offset = _signed(value)
+            elif field == 20:
+                self.lon_offset = _signed(value)
+
+    def string_index(self, text):
+        """Chỉ số của chuỗi trong bảng chuỗi (-1 nếu không có)"""
+        try:
+            return self.strings.index(text.encode('utf-8') if isinstance(text, str) else text)
+        except ValueError:
+            return -1
+
+    def _coords(self, raw, offset):
+        return (offset + self.granularity * raw) * 1e-9
+
+    def dense_nodes(self):
+        """Duyệt (ids, lats, lons) dạng mảng numpy của từng nhóm DenseNodes"""
+        data = self.data
+        for start, end in self.groups:
+            for field, _, value in iter_fields(data, start, end):
+                if field == 2:
+                    arrays = {}
+                    for f, _, v in iter_fields(data, *value):
+                        if f in (1, 8, 9):
+                            arrays[f] = np.cumsum(zigzag(decode_packed(data, *v)))
+                    if 1 in arrays:
+                        yield arrays[1], self._coords(arrays[8], self.lat_offset), \
+                            self._coords(arrays[9], self.lon_offset)
+                elif field == 1: # Node không nén (hiếm)
+                    node = {}
+                    for f, _, v in iter_fields(data, *value):
+                        if f in (1, 8, 9):
+                            node[f] = _zigzag_int(v)
+                    yield np.array([node[1]]), self._coords(np.array([node[8]]), self.lat_offset), \
+                        self._coords(np.array([node[9]]), self.lon_offset)
+
+    def has_ways(self):
+        return any(field == 3 for start, end in self.groups
+                   for field, _, _ in iter_fields(self.data, start, end))
+
+    def has_nodes(self):
+        return any(field in (1, 2) for start, end in self.groups
+                   for field, _, _ in iter_fields(self.data, start, end))
+
+    def ways(self):
+        """Duyệt (way_id, keys, vals, (refs_start, refs_end)) - keys/vals là chỉ số bảng chuỗi.
+        refs chưa giải mã: gọi ways_refs() 1 lần cho các way cần dùng."""
+        data = self.data
+        for start, end in self.groups:
+            for field, _, value in iter_fields(data, start, end):
+                if field != 3:
+                    continue
+                way_id, keys, vals, refs = 0, (), (), (0, 0)
+                for f, _, v in iter_fields(data, *value):
+                    if f == 1:
+                        way_id = v
+                    elif f == 2:
+                        keys = decode_packed_python(data, *v)
+                    elif f == 3:
+                        vals = decode_packed_python(data, *v)
+                    elif f == 8:
+                        refs = v
+                yield way_id, keys, vals, refs
+
+    def ways_refs(self, ranges):
+        """refs của nhiều way cùng lúc -> (node ids nối liền, offsets), xem decode_delta_runs"""
+        return decode_delta_runs(self.data, ranges)
+
+
+def _signed(value):
+    """int64 được mã hóa varint không zigzag"""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _zigzag_int(value):
+    return (value >> 1) ^ -(value & 1)
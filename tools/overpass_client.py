@@ -0,0 +1,347 @@
+"""
+Client Overpass bất đồng bộ (asyncio + aiohttp) dùng cho download_vn_roads_full.py.
+
+- Mỗi server 1 ClientSession riêng, giữ kết nối keep-alive (không mở kết nối mới mỗi ô)
+- Mỗi server giới hạn số request đồng thời + token bucket (request/giây)
+- 429 / lỗi 5xx / mất kết nối: server bị "nghỉ" (cooldown), ô được thử lại trên server khác
+  với backoff lũy thừa có jitter, số lần thử có giới hạn
+- Ghi nhận độ trễ từng server (EWMA): ô mới luôn được gửi tới server khỏe và nhanh nhất còn slot
+
+Kiểm tra với server Overpass giả lập (overpass_stub.py):
+    python tools/overpass_client.py selftest
+"""
+import asyncio
+import collections
+import random
+import sys
+import time
+
+from run_metrics import format_percentiles
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+DEFAULT_CONCURRENCY = 2 # Request đồng thời tối đa mỗi server (Overpass công cộng cho ~2 slot/IP)
+DEFAULT_RATE = 1.0 # Request/giây mỗi server (token bucket)
+DEFAULT_BURST = 2
+MAX_RETRIES = 4
+BACKOFF_BASE = 2.0 # giây
+BACKOFF_MAX = 60.0
+LATENCY_ALPHA = 0.3 # Hệ số EWMA cho độ trễ
+
+# wait: tổng thời gian chờ slot + token bucket, http_seconds: độ trễ HTTP của lần gửi cuối
+FetchResult = collections.namedtuple('FetchResult', 'raw error overloaded seconds server attempts wait http_seconds')
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_MAX):
+    """Backoff lũy thừa có jitter, không vượt quá cap"""
+    delay = min(cap, base * 2 ** attempt)
+    return random.uniform(delay / 2, delay)
+
+
+class TokenBucket:
+    """rate token/giây, tối đa capacity token. reserve() trả về số giây phải chờ (đã giữ chỗ)"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class ServerState:
+    def __init__(self, url, concurrency, rate, burst):
+        self.url = url
+        self.concurrency = concurrency
+        self.bucket = TokenBucket(rate, burst)
+        self.session = None
+        self.active = 0
+        self.latency = None # EWMA (giây) của các request thành công
+        self.failures = 0 # Lỗi liên tiếp
+        self.cooldown_until = 0.0
+        self.stats = collections.Counter()
+        self.latencies = []
+
+    def healthy(self, now):
+        return now >= self.cooldown_until
+
+    def expected_latency(self):
+        # Server chưa thử lần nào được ưu tiên để có số liệu
+        base = self.latency if self.latency is not None else 0.0
+        return base * (1 + self.active)
+
+    def record_success(self, seconds):
+        self.failures = 0
+        self.latencies.append(seconds)
+        self.latency = seconds if self.latency is None else \
+            LATENCY_ALPHA * seconds + (1 - LATENCY_ALPHA) * self.latency
+
+    def record_failure(self, cooldown):
+        self.failures += 1
+        self.cooldown_until = max(self.cooldown_until, time.monotonic() + cooldown)
+
+
+class OverpassClient:
+    """Dùng trong `async with OverpassClient(servers) as client: await client.fetch(query)`
+
+    observer(dict): gọi sau mỗi lần gửi HTTP với server, status, wait, seconds, bytes, error
+    (dùng để ghi metrics, xem run_metrics.py)"""
+
+    def __init__(self, servers, concurrency=DEFAULT_CONCURRENCY, rate=DEFAULT_RATE, burst=DEFAULT_BURST,
+                 timeout=200, max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX,
+                 observer=None):
+        if aiohttp is None:
+            raise RuntimeError("Chưa cài aiohttp (pip install aiohttp)")
+        self.servers = [ServerState(url, concurrency, rate, burst) for url in servers]
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.observer = observer
+        self._cond = None
+
+    async def __aenter__(self):
+        self._cond = asyncio.Condition()
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        for server in self.servers:
+            connector = aiohttp.TCPConnector(limit=server.concurrency, keepalive_timeout=60)
+            server.session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self
+
+    async def __aexit__(self, *exc):
+        for server in self.servers:
+            await server.session.close()
+
+    async def _acquire(self):
+        """Chờ tới khi có server khỏe còn slot, chọn server có độ trễ kỳ vọng thấp nhất"""
+        async with self._cond:
+            while True:
+                now = time.monotonic()
+                free = [s for s in self.servers if s.active < s.concurrency and s.healthy(now)]
+                if free:
+                    server = min(free, key=ServerState.expected_latency)
+                    server.active += 1
+                    break
+                # Chờ 1 slot được trả lại, hoặc server đầu tiên hết cooldown
+                waits = [s.cooldown_until - now for s in self.servers if not s.healthy(now)]
+                try:
+                    await asyncio.wait_for(self._cond.wait(), min(waits) if waits else None)
+                except asyncio.TimeoutError:
+                    pass
+        delay = server.bucket.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return server
+
+    async def _release(self, server):
+        async with self._cond:
+            server.active -= 1
+            self._cond.notify_all()
+
+    def _penalize(self, server, cooldown=None):
+        """Cho server nghỉ: theo Retry-After nếu có, không thì backoff theo số lỗi liên tiếp"""
+        if cooldown is None:
+            cooldown = backoff_delay(server.failures, self.backoff_base, self.backoff_max)
+        server.record_failure(cooldown)
+
+    def _observe(self, server, status, wait, seconds, body=None, error=None):
+        if self.observer is not None:
+            self.observer({'server': server.url, 'status': status, 'wait': round(wait, 4),
+                           'seconds': round(seconds, 4), 'bytes': len(body) if body is not None else None,
+                           'error': error})
+
+    async def fetch(self, query):
+        """POST query tới server tốt nhất. Trả về FetchResult
+        overloaded=True chỉ khi server báo query quá nặng (HTTP 504) -> nên chia nhỏ ô.
+        Hết thời gian phía client (server treo/chết) -> cho server nghỉ, thử server khác"""
+        start = time.monotonic()
+        error = None
+        waited = 0.0
+        http_seconds = None
+        for attempt in range(self.max_retries + 1):
+            queued = time.monotonic()
+            server = await self._acquire()
+            server.stats['requests'] += 1
+            sent = time.monotonic()
+            wait = sent - queued
+            waited += wait
+            body = None
+            try:
+                async with server.session.post(server.url, data={'data': query}) as response:
+                    status = response.status
+                    retry_after = response.headers.get('Retry-After')
+                    body = await response.read()
+            except asyncio.TimeoutError:
+                server.stats['timeout'] += 1
+                self._penalize(server)
+                error = f"Timeout ({server.url})"
+                status = 'timeout'
+            except aiohttp.ClientError as e:
+                server.stats['error'] += 1
+                self._penalize(server)
+                error = f"{type(e).__name__}: {e} ({server.url})"
+                status = None
+            finally:
+                await self._release(server)
+            http_seconds = time.monotonic() - sent
+            if status == 'timeout':
+                self._observe(server, status, wait, http_seconds)
+                continue
+            self._observe(server, status, wait, http_seconds, body, None if status else error)
+
+            if status == 200:
+                server.stats['ok'] += 1
+                server.record_success(http_seconds)
+                return FetchResult(body, None, False, time.monotonic() - start, server.url, attempt + 1,
+                                   waited, http_seconds)
+            if status == 504: # Gateway Timeout: query quá nặng, không phải lỗi server
+                server.stats['overloaded'] += 1
+                return FetchResult(None, f"HTTP 504 ({server.url})", True,
+                                   time.monotonic() - start, server.url, attempt + 1, waited, http_seconds)
+            if status == 429: # Too Many Requests: cho server nghỉ, thử server khác ngay
+                server.stats['rate_limited'] += 1
+                self._penalize(server, _retry_after(retry_after, self.backoff_max))
+                error = f"HTTP 429 ({server.url})"
+                continue
+            if status is not None and status < 500:
+                # 4xx khác (query sai...): thử lại cũng vô ích
+                server.stats['error'] += 1
+                return FetchResult(None, f"HTTP {status} ({server.url})", False,
+                                   time.monotonic() - start, server.url, attempt + 1, waited, http_seconds)
+            if status is not None:
+                server.stats['error'] += 1
+                self._penalize(server)
+                error = f"HTTP {status} ({server.url})"
+            # Lần thử sau chờ trong _acquire: sang server khác ngay nếu có, hoặc đợi server hết cooldown
+        return FetchResult(None, error, False, time.monotonic() - start, None, self.max_retries + 1,
+                           waited, http_seconds)
+
+    def server_summary(self):
+        lines = []
+        for s in self.servers:
+            lines.append(f"  {s.url}: {s.stats['ok']}/{s.stats['requests']} OK, "
+                         f"{s.stats['rate_limited']} lần 429, {s.stats['error']} lỗi, "
+                         f"{s.stats['overloaded']} quá tải, {s.stats['timeout']} timeout, "
+                         f"trễ {format_percentiles(s.latencies)}")
+        return lines
+
+
+def _retry_after(value, cap):
+    """Header Retry-After (giây) -> số giây nghỉ, có trần"""
+    try:
+        return min(max(float(value), 0.0), cap)
+    except (TypeError, ValueError):
+        return None
+
+
+# --- TỰ KIỂM TRA VỚI SERVER GIẢ LẬP ---
+
+async def _selftest():
+    from overpass_stub import StubOverpass
+
+    def check(ok, message):
+        print(f"{'✅' if ok else '❌'} {message}")
+        return ok
+
+    results = []
+    query = '[out:json];way["highway"](21.0,105.0,21.5,105.5);out geom;'
+
+    # 1. Kết nối được giữ lại (keep-alive) giữa các request
+    with StubOverpass() as stub:
+        async with OverpassClient([stub.url], concurrency=2, rate=1000, burst=1000) as client:
+            fetched = await asyncio.gather(*(client.fetch(query) for _ in range(20)))
+        results.append(check(all(r.raw for r in fetched) and stub.connections <= 2,
+                             f"Pool kết nối: 20 request qua {stub.connections} kết nối"))
+
+    # 2. 429 + Retry-After: chờ rồi thử lại, không đệ quy vô hạn
+    with StubOverpass(script=[{'status': 429, 'retry_after': 0.3}] * 2) as stub:
+        async with OverpassClient([stub.url], rate=1000, burst=1000, backoff_base=0.01) as client:
+            r = await client.fetch(query)
+        results.append(check(r.raw is not None and r.attempts == 3 and r.seconds >= 0.6,
+                             f"429: thành công sau {r.attempts} lần thử, {r.seconds:.2f}s"))
+
+    # 3. Ưu tiên server nhanh
+    with StubOverpass(delay=0.01) as fast, StubOverpass(delay=0.2) as slow:
+        async with OverpassClient([slow.url, fast.url], concurrency=1, rate=1000, burst=1000) as client:
+            for _ in range(15):
+                await client.fetch(query)
+        results.append(check(fast.count > 3 * slow.count,
+                             f"Chọn server nhanh: nhanh {fast.count} request, chậm {slow.count} request"))
+
+    # 4. Server chết (không kết nối được) -> các ô vẫn xong qua server còn sống
+    with StubOverpass() as alive:
+        dead = 'http://127.0.0.1:9/api/interpreter'
+        async with OverpassClient([dead, alive.url], rate=1000, burst=1000, backoff_base=0.01) as client:
+            fetched = await asyncio.gather(*(client.fetch(query) for _ in range(10)))
+        results.append(check(all(r.raw for r in fetched),
+                             f"Server chết: 10/10 ô thành công qua server còn lại "
+                             f"({client.servers[0].stats['error']} lỗi kết nối)"))
+
+    # 5. 504 -> quá tải (để chia ô); 400 -> lỗi vĩnh viễn, không thử lại
+    with StubOverpass(script=[{'status': 504}, {'status': 400}]) as stub:
+        async with OverpassClient([stub.url], rate=1000, burst=1000) as client:
+            r1 = await client.fetch(query)
+            r2 = await client.fetch(query)
+        results.append(check(r1.overloaded and not r2.overloaded and r2.attempts == 1 and stub.count == 2,
+                             "504 -> quá tải, 400 -> lỗi không thử lại"))
+
+    # 6. Lỗi 500 liên tục: số lần thử và thời gian chờ có giới hạn
+    with StubOverpass(script=[{'status': 500}] * 100) as stub:
+        async with OverpassClient([stub.url], rate=1000, burst=1000, max_retries=3,
+                                  backoff_base=0.05, backoff_max=0.1) as client:
+            r = await client.fetch(query)
+        results.append(check(r.raw is None and stub.count == 4 and r.seconds < 2,
+                             f"500 liên tục: dừng sau {stub.count} lần thử ({r.seconds:.2f}s)"))
+
+    # 7. Token bucket: 1 request/0.1s
+    with StubOverpass() as stub:
+        async with OverpassClient([stub.url], concurrency=4, rate=10, burst=1) as client:
+            t = time.monotonic()
+            await asyncio.gather(*(client.fetch(query) for _ in range(6)))
+            elapsed = time.monotonic() - t
+        results.append(check(elapsed >= 0.45, f"Token bucket 10 req/s: 6 request mất {elapsed:.2f}s"))
+
+    # 8. observer nhận đúng 1 sự kiện mỗi lần gửi HTTP (dùng cho metrics)
+    events = []
+    with StubOverpass(script=[{'status': 429, 'retry_after': 0.1}]) as stub:
+        async with OverpassClient([stub.url], rate=1000, burst=1000, observer=events.append) as client:
+            r = await client.fetch(query)
+        results.append(check([e['status'] for e in events] == [429, 200] and events[-1]['bytes'] == len(r.raw)
+                             and r.wait >= 0.1 and r.http_seconds is not None,
+                             f"Observer: {len(events)} sự kiện, chờ {r.wait:.2f}s, HTTP {r.http_seconds:.3f}s"))
+
+    # 9. Server treo (quá timeout phía client) -> cho nghỉ, sang server khác, không coi là quá tải
+    with StubOverpass(script=[{'status': 200, 'delay': 1.0}] * 10) as hung, StubOverpass() as alive:
+        async with OverpassClient([hung.url, alive.url], timeout=0.3, rate=1000, burst=1000,
+                                  backoff_base=5) as client:
+            fetched = [await client.fetch(query) for _ in range(5)]
+        results.append(check(all(r.raw and not r.overloaded for r in fetched) and hung.count == 1
+                             and client.servers[0].stats['timeout'] == 1,
+                             f"Server treo: 5/5 ô thành công qua server còn lại, "
+                             f"server treo nhận {hung.count} request"))
+
+    return all(results)
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] != 'selftest':
+        print("Dùng: python tools/overpass_client.py selftest")
+        raise SystemExit(2)
+    if aiohttp is None:
+        print("❌ Chưa cài aiohttp (pip install aiohttp)")
+        raise SystemExit(1)
+    if not asyncio.run(_selftest()):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+"""
+Server Overpass giả lập (chỉ dùng thư viện chuẩn) để thử tool tải đường mà không gọi mạng.
+
+Trả về JSON kiểu Overpass `out geom` với vài con đường sinh ngẫu nhiên (cố định theo bbox),
+có thể cấu hình độ trễ, 429, 504 cho ô lớn, hoặc 1 kịch bản status cho từng request.
+
+Dùng trong code:
+    with StubOverpass(delay=0.1, script=[{'status': 429, 'retry_after': 1}]) as stub:
+        ... gửi request tới stub.url ...
+Chạy độc lập (rồi trỏ tool tải tới nó):
+    python tools/overpass_stub.py --port 8765 --delay 0.2 --overload-size 1.0 --rate-limit 5
+    python tools/download_vn_roads_full.py --servers http://127.0.0.1:8765/api/interpreter
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BBOX_RE = re.compile(r'\(\s*(-?[\d.]+)\s*,\s*(-?[\d.]+)\s*,\s*(-?[\d.]+)\s*,\s*(-?[\d.]+)\s*\)\s*;')
+HIGHWAYS = ['motorway', 'trunk', 'primary', 'secondary', 'tertiary']
+
+
+def parse_bbox(query):
+    match = BBOX_RE.search(query)
+    return tuple(float(v) for v in match.groups()) if match else None
+
+
+def fake_elements(bbox, ways_per_degree2=40):
+    """Các way giả trong bbox, cố định theo bbox (cùng bbox -> cùng dữ liệu)"""
+    south, west, north, east = bbox
+    seed = int(hashlib.sha1(repr(bbox).encode()).hexdigest()[:8], 16)
+    rng = random.Random(seed)
+    count = max(1, int((north - south) * (east - west) * ways_per_degree2))
+    elements = []
+    for i in range(count):
+        lat, lon = rng.uniform(south, north), rng.uniform(west, east)
+        geometry = []
+        nodes = []
+        for j in range(rng.randint(2, 12)):
+            geometry.append({'lat': round(lat + j * 0.001, 7), 'lon': round(lon + j * 0.001, 7)})
+            nodes.append(seed * 100 + i * 20 + j)
+        ref = f"QL{rng.randint(1, 60)}" if rng.random() < 0.3 else ''
+        elements.append({
+            'type': 'way', 'id': seed * 1000 + i, 'nodes': nodes, 'geometry': geometry,
+            'tags': {'highway': rng.choice(HIGHWAYS), 'name': f"Đường {rng.randint(1, 500)}", 'ref': ref},
+        })
+    return elements
+
+
+class StubOverpass:
+    """
+    delay          giây trễ mỗi request
+    script         list hành động dùng lần lượt cho các request đầu tiên, mỗi hành động là dict:
+                   {'status': 429, 'retry_after': 1}, {'status': 504}, {'status': 200, 'delay': 2},
+                   {'status': 200, 'remark': 'runtime error: Query timed out ...'}
+    overload_size  ô có cạnh lớn hơn giá trị này (độ) -> 504 (để thử chia ô)
+    rate_limit     số request tối đa mỗi giây, vượt -> 429
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, delay=0.0, script=None, overload_size=None, rate_limit=None):
+        self.delay = delay
+        self.script = list(script or [])
+        self.overload_size = overload_size
+        self.rate_limit = rate_limit
+        self.lock = threading.Lock()
+        self.count = 0
+        self.connections = 0
+        self.log = [] # (thời điểm, bbox, status)
+        self._window = []
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self.url = f"http://{host}:{self.httpd.server_address[1]}/api/interpreter"
+        self._thread = None
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1' # Giữ kết nối (keep-alive)
+
+            def setup(self):
+                super().setup()
+                with stub.lock:
+                    stub.connections += 1
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                form = urllib.parse.parse_qs(self.rfile.read(length).decode('utf-8'))
+                query = form.get('data', [''])[0]
+                status, headers, body = stub.respond(query)
+                try:
+                    self.send_response(status)
+                    for key, value in headers.items():
+                        self.send_header(key, value)
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True # Client đã bỏ đi (hết timeout phía client)
+
+        return Handler
+
+    def respond(self, query):
+        bbox = parse_bbox(query)
+        now = time.monotonic()
+        with self.lock:
+            self.count += 1
+            action = self.script.pop(0) if self.script else {}
+            if self.rate_limit and not action:
+                self._window = [t for t in self._window if now - t < 1.0]
+                if len(self._window) >= self.rate_limit:
+                    action = {'status': 429, 'retry_after': 1}
+                else:
+                    self._window.append(now)
+        if not action and self.overload_size and bbox and \
+                max(bbox[2] - bbox[0], bbox[3] - bbox[1]) > self.overload_size:
+            action = {'status': 504}
+
+        time.sleep(action.get('delay', self.delay))
+        status = action.get('status', 200)
+        headers = {'Content-Type': 'application/json'}
+        if status == 429 and 'retry_after' in action:
+            headers['Retry-After'] = str(action['retry_after'])
+        if status == 200:
+            data = {'version': 0.6, 'generator': 'overpass_stub', 'elements': []}
+            if action.get('remark'):
+                data['remark'] = action['remark']
+            elif bbox:
+                data['elements'] = fake_elements(bbox)
+            body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        else:
+            body = f"status {status}".encode()
+            headers['Content-Type'] = 'text/plain'
+        with self.lock:
+            self.log.append((now, bbox, status))
+        return status, headers, body
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server Overpass giả lập")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--delay', type=float, default=0.0)
+    parser.add_argument('--overload-size', type=float, help="Ô có cạnh lớn hơn (độ) -> 504")
+    parser.add_argument('--rate-limit', type=int, help="Số request/giây, vượt -> 429")
+    parser.add_argument('--script', help="File JSON: list hành động cho các request đầu tiên")
+    args = parser.parse_args()
+
+    script = None
+    if args.script:
+        with open(args.script, 'r', encoding='utf-8') as f:
+            script = json.load(f)
+    stub = StubOverpass(args.host, args.port, args.delay, script, args.overload_size, args.rate_limit)
+    print(f"Stub Overpass tại {stub.url} (Ctrl+C để dừng)")
+    try:
+        stub.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.httpd.server_close()
+        print(f"Đã phục vụ {stub.count} request qua {stub.connections} kết nối")
+
+
+if __name__ == '__main__':
+    main()
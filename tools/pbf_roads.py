@@ -0,0 +1,395 @@
+"""
+Nạp đường từ file OSM PBF cục bộ (vd. vietnam-latest.osm.pbf của Geofabrik) thay cho Overpass:
+không cần mạng, không bị giới hạn tốc độ, cùng file -> cùng kết quả.
+
+Trong PBF, node luôn đứng trước way, nên 1 lượt đọc duy nhất buộc phải giữ tọa độ của MỌI node
+(~100 triệu node cho VN). Thay vào đó đọc theo blob, 2 lượt, mỗi lượt song song bằng process pool:
+  1. Duyệt mọi blob, giữ các way highway thuộc road_types có name hoặc ref (id + danh sách node)
+  2. Chỉ đọc lại các blob có node, giữ tọa độ của đúng các node mà các way trên cần
+RAM chỉ tỉ lệ với số đường được chọn, không tỉ lệ với kích thước file.
+
+Dùng:
+    python tools/download_vn_roads_full.py --pbf assets/roads/vietnam-latest.osm.pbf
+    python tools/pbf_roads.py stats vietnam-latest.osm.pbf
+    python tools/pbf_roads.py sample /tmp/sample.osm.pbf --ways 50000   # cần pyosmium
+    python tools/pbf_roads.py verify /tmp/sample.osm.pbf                 # so với pyosmium
+
+Kết quả cùng cấu trúc với process_elements của download_vn_roads_full.py:
+    {(name, ref, highway): [[way_id, first_node, last_node, coords, nodes], ...]}
+"""
+import argparse
+import collections
+import concurrent.futures
+import json
+import os
+import random
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+try:
+    import osmium # pyosmium: chỉ dùng để sinh file mẫu và đối chiếu (sample / verify)
+except ImportError:
+    osmium = None
+
+from osm_pbf import BLOB_DATA, BLOB_HEADER, SUPPORTED_FEATURES, PrimitiveBlock, \
+    header_features, header_replication_timestamp, index_blobs, read_blob
+
+WAYS_PER_CHUNK = 20_000 # Số way mỗi lô trả về (mỗi lô -> 1 chunk NDJSON trên đĩa)
+COORD_DIGITS = 7 # Giống độ chính xác của Overpass (out geom)
+
+_needed_nodes = None # Id node cần giữ (đã sắp xếp), đặt trong từng process ở lượt 2
+
+
+# --- LƯỢT 1: WAY ---
+
+def scan_ways(task):
+    """1 blob -> (có node không, danh sách way khớp, mảng refs nối liền)
+    Mỗi way: [way_id, name, ref, highway, số node]"""
+    path, offset, size, road_types = task
+    block = PrimitiveBlock(read_blob(path, offset, size))
+    strings = block.strings
+    k_highway, k_name, k_ref = (block.string_index(k) for k in ('highway', 'name', 'ref'))
+    wanted = {block.string_index(t) for t in road_types} - {-1}
+    ways, ranges = [], []
+    if k_highway >= 0 and wanted:
+        for way_id, keys, vals, raw_refs in block.ways():
+            tags = dict(zip(keys, vals))
+            if tags.get(k_highway) not in wanted:
+                continue
+            name = strings[tags[k_name]].decode('utf-8') if k_name in tags else ''
+            ref = strings[tags[k_ref]].decode('utf-8') if k_ref in tags else ''
+            if not name and not ref:
+                continue
+            ways.append([way_id, name, ref, strings[tags[k_highway]].decode('utf-8')])
+            ranges.append(raw_refs)
+    # Giải mã refs của mọi way khớp trong 1 lượt numpy (từng way riêng lẻ chậm hơn nhiều)
+    refs, offsets = block.ways_refs(ranges)
+    for way, count in zip(ways, np.diff(offsets).tolist()):
+        way.append(count)
+    return block.has_nodes(), ways, refs
+
+
+# --- LƯỢT 2: NODE ---
+
+def _init_nodes(needed):
+    global _needed_nodes
+    _needed_nodes = needed
+
+
+def scan_nodes(task):
+    """1 blob -> (ids, lons, lats) của các node nằm trong _needed_nodes"""
+    path, offset, size = task
+    block = PrimitiveBlock(read_blob(path, offset, size))
+    found = []
+    for ids, lats, lons in block.dense_nodes():
+        pos = np.searchsorted(_needed_nodes, ids)
+        pos[pos == len(_needed_nodes)] = 0
+        keep = _needed_nodes[pos] == ids
+        if keep.any():
+            found.append((ids[keep], lons[keep], lats[keep]))
+    if not found:
+        return np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0)
+    return tuple(np.concatenate(parts) for parts in zip(*found))
+
+
+def map_blobs(fn, tasks, workers, initializer=None, initargs=()):
+    """Chạy fn trên từng blob qua process pool, trả kết quả theo đúng thứ tự blob.
+    Giới hạn số blob đang xử lý để RAM không tăng theo kích thước file."""
+    if workers <= 1:
+        if initializer:
+            initializer(*initargs)
+        yield from map(fn, tasks)
+        return
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=initializer,
+                                                initargs=initargs) as executor:
+        in_flight = collections.deque()
+        for task in tasks:
+            in_flight.append(executor.submit(fn, task))
+            if len(in_flight) >= 2 * workers:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
+# --- GHÉP ---
+
+def data_blobs(path):
+    """(offset, size) các blob OSMData, kiểm tra HeaderBlock trước"""
+    blobs = index_blobs(path)
+    for blob_type, offset, size in blobs:
+        if blob_type == BLOB_HEADER:
+            missing = set(header_features(read_blob(path, offset, size))) - SUPPORTED_FEATURES
+            if missing:
+                raise ValueError(f"PBF cần tính năng chưa hỗ trợ: {sorted(missing)}")
+    return [(offset, size) for blob_type, offset, size in blobs if blob_type == BLOB_DATA]
+
+
+def replication_timestamp(path):
+    """Mốc dữ liệu OSM của file ('2026-10-18T20:00:00Z', từ HeaderBlock) hoặc None nếu không ghi"""
+    for blob_type, offset, size in index_blobs(path):
+        if blob_type == BLOB_HEADER:
+            seconds = header_replication_timestamp(read_blob(path, offset, size))
+            if seconds is not None:
+                return datetime.fromtimestamp(seconds, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    return None
+
+
+def read_nodes(path, node_blobs, needed, workers):
+    """Lượt đọc node: (ids đã sắp xếp, lons, lats) của các node trong needed (mảng id đã sắp xếp)"""
+    ids, lons, lats = [], [], []
+    tasks = ((path, offset, size) for offset, size in node_blobs)
+    for blob_ids, blob_lons, blob_lats in map_blobs(scan_nodes, tasks, workers, _init_nodes, (needed,)):
+        ids.append(blob_ids)
+        lons.append(blob_lons)
+        lats.append(blob_lats)
+    ids = np.concatenate(ids) if ids else np.zeros(0, dtype=np.int64)
+    order = np.argsort(ids, kind='stable')
+    ids = ids[order]
+    lons = np.round(np.concatenate(lons)[order], COORD_DIGITS) if len(ids) else np.zeros(0)
+    lats = np.round(np.concatenate(lats)[order], COORD_DIGITS) if len(ids) else np.zeros(0)
+    return ids, lons, lats
+
+
+def lookup_nodes(path, node_ids, workers=None):
+    """{node_id: [lon, lat]} của các node cần tra (node không có trong file thì bỏ qua)
+    Dùng khi cập nhật từ file .osc: way đổi tag / thêm node cũ cần tọa độ từ extract gốc"""
+    needed = np.unique(np.asarray(list(node_ids), dtype=np.int64))
+    if not len(needed):
+        return {}
+    ids, lons, lats = read_nodes(path, data_blobs(path), needed, workers or os.cpu_count() or 1)
+    return dict(zip(ids.tolist(), np.column_stack([lons, lats]).tolist()))
+
+
+def iter_road_chunks(path, road_types, mask=None, workers=None, ways_per_chunk=WAYS_PER_CHUNK,
+                     stats=None):
+    """Đọc PBF, trả về từng lô {(name, ref, highway): ways} (xem đầu file)
+    mask: tiling.CountryMask - bỏ way không có node nào trong lãnh thổ (như area của Overpass)
+    stats: dict nhận số liệu (số blob, số way, số node, thời gian từng lượt)"""
+    workers = workers or os.cpu_count() or 1
+    stats = {} if stats is None else stats
+    start = time.time()
+    blobs = data_blobs(path)
+
+    # Lượt 1: way
+    ways, refs, node_blobs = [], [], []
+    tasks = ((path, offset, size, tuple(road_types)) for offset, size in blobs)
+    for (offset, size), (has_nodes, blob_ways, blob_refs) in zip(blobs, map_blobs(scan_ways, tasks, workers)):
+        if has_nodes:
+            node_blobs.append((offset, size))
+        ways.extend(blob_ways)
+        refs.append(blob_refs)
+    refs = np.concatenate(refs) if refs else np.zeros(0, dtype=np.int64)
+    offsets = np.zeros(len(ways) + 1, dtype=np.int64)
+    np.cumsum([w[4] for w in ways], out=offsets[1:])
+    needed = np.unique(refs)
+    stats.update(blobs=len(blobs), node_blobs=len(node_blobs), ways=len(ways),
+                 needed_nodes=len(needed), ways_seconds=time.time() - start)
+
+    # Lượt 2: tọa độ node cần dùng
+    start = time.time()
+    ids, lons, lats = read_nodes(path, node_blobs, needed, workers)
+    stats.update(found_nodes=len(ids), nodes_seconds=time.time() - start)
+
+    # Node -> tọa độ cho từng way (node không có trong file, vd. bị cắt ở biên extract, bị bỏ)
+    pos = np.searchsorted(ids, refs)
+    pos[pos == len(ids)] = 0
+    present = (ids[pos] == refs) if len(ids) else np.zeros(len(refs), dtype=bool)
+    inside = present.copy()
+    if mask is not None and len(ids):
+        node_inside = mask.contains_points(lons, lats)
+        if node_inside is not None:
+            inside &= node_inside[pos]
+    counts = np.diff(offsets)
+    nonempty = counts > 0
+    present_count = np.zeros(len(ways), dtype=np.int64)
+    any_inside = np.zeros(len(ways), dtype=bool)
+    if nonempty.any():
+        starts = offsets[:-1][nonempty]
+        present_count[nonempty] = np.add.reduceat(present, starts)
+        any_inside[nonempty] = np.logical_or.reduceat(inside, starts)
+    keep = (present_count >= 2) & any_inside
+
+    kept = 0
+    for first in range(0, len(ways), ways_per_chunk):
+        last = min(first + ways_per_chunk, len(ways))
+        base, end = offsets[first], offsets[last]
+        # tolist theo lô: nhanh hơn từng way, RAM vẫn giới hạn theo kích thước lô
+        chunk_coords = np.column_stack([lons[pos[base:end]], lats[pos[base:end]]]).tolist() \
+            if len(ids) else []
+        chunk_refs = refs[base:end].tolist()
+        processed = {}
+        for i in np.flatnonzero(keep[first:last]).tolist():
+            way_id, name, ref, highway, count = ways[first + i]
+            lo = int(offsets[first + i] - base)
+            hi = lo + count
+            coords, way_refs = chunk_coords[lo:hi], chunk_refs[lo:hi]
+            if present_count[first + i] < count:
+                mask_way = present[base + lo:base + hi].tolist()
+                coords = [c for c, ok in zip(coords, mask_way) if ok]
+                way_refs = [r for r, ok in zip(way_refs, mask_way) if ok]
+            processed.setdefault((name, ref, highway), []).append([way_id, way_refs[0], way_refs[-1], coords, way_refs])
+            kept += 1
+        if processed:
+            yield processed
+    stats.update(kept_ways=kept)
+
+
+# --- KIỂM TRA ---
+
+DEFAULT_ROAD_TYPES = ["motorway", "trunk", "primary", "secondary", "tertiary"]
+SAMPLE_HIGHWAYS = DEFAULT_ROAD_TYPES + ["residential", "service"]
+
+
+def collect(chunks):
+    """Gộp các lô thành 1 dict, way trong mỗi key sắp xếp theo id"""
+    result = {}
+    for processed in chunks:
+        for key, ways in processed.items():
+            result.setdefault(key, []).extend(ways)
+    for ways in result.values():
+        ways.sort(key=lambda w: w[0])
+    return result
+
+
+def sample_osm(ways=10_000, seed=0):
+    """Dữ liệu giả trải khắp VN, có đường vô danh / ngoài road_types:
+    ({node_id: (lon, lat)}, [(way_id, refs, tags), ...])"""
+    rng = random.Random(seed)
+    nodes, way_list = {}, []
+    next_node = 1
+    for way_id in range(1, ways + 1):
+        lat, lon = rng.uniform(8.5, 23.3), rng.uniform(102.2, 109.4)
+        refs = []
+        for j in range(rng.randint(2, 30)):
+            if nodes and rng.random() < 0.05: # Node dùng chung giữa các way (giao lộ)
+                refs.append(rng.randrange(1, next_node))
+                continue
+            nodes[next_node] = (round(lon + j * 0.0013, 7), round(lat + j * 0.0007, 7))
+            refs.append(next_node)
+            next_node += rng.randint(1, 3)
+        tags = {'highway': rng.choice(SAMPLE_HIGHWAYS)}
+        if rng.random() < 0.8:
+            tags['name'] = f"Đường {rng.randint(1, 2000)}"
+        if rng.random() < 0.3:
+            tags['ref'] = f"QL{rng.randint(1, 60)}"
+        way_list.append((way_id * 7, refs, tags))
+    return nodes, way_list
+
+
+def write_osm(path, nodes, way_list, timestamp=None):
+    """Ghi node + way ra file OSM (định dạng theo đuôi file) bằng pyosmium
+    timestamp: ghi vào header (osmosis_replication_timestamp) như extract của Geofabrik"""
+    if os.path.exists(path):
+        os.remove(path)
+    header = osmium.io.Header()
+    if timestamp:
+        header.set('osmosis_replication_timestamp', timestamp)
+    writer = osmium.SimpleWriter(path, header=header)
+    try:
+        for node_id in sorted(nodes):
+            writer.add_node(osmium.osm.mutable.Node(id=node_id, location=nodes[node_id], tags={}))
+        for way_id, refs, tags in way_list:
+            writer.add_way(osmium.osm.mutable.Way(id=way_id, nodes=refs, tags=tags))
+    finally:
+        writer.close()
+
+
+def write_sample(path, ways=10_000, seed=0):
+    """Sinh file PBF giả (xem sample_osm) bằng pyosmium"""
+    nodes, way_list = sample_osm(ways, seed)
+    write_osm(path, nodes, way_list)
+    return len(nodes), len(way_list)
+
+
+def reference_roads(path, road_types):
+    """Cùng kết quả như iter_road_chunks (không lọc lãnh thổ) nhưng đọc bằng pyosmium"""
+    result = {}
+    wanted = set(road_types)
+    for obj in osmium.FileProcessor(path).with_locations():
+        if not obj.is_way():
+            continue
+        highway = obj.tags.get('highway', '')
+        name, ref = obj.tags.get('name', ''), obj.tags.get('ref', '')
+        if highway not in wanted or (not name and not ref):
+            continue
+        nodes = [n for n in obj.nodes if n.location.valid()]
+        if len(nodes) < 2:
+            continue
+        coords = [[round(n.location.lon, COORD_DIGITS), round(n.location.lat, COORD_DIGITS)] for n in nodes]
+        result.setdefault((name, ref, highway), []).append([obj.id, nodes[0].ref, nodes[-1].ref, coords,
+                                                          [n.ref for n in nodes]])
+    for ways in result.values():
+        ways.sort(key=lambda w: w[0])
+    return result
+
+
+def print_stats(stats, seconds, path):
+    size = os.path.getsize(path) / (1024 * 1024)
+    print(f"  {stats['blobs']} blob ({stats['node_blobs']} có node), {size:.1f} MB")
+    print(f"  Lượt 1 (way):  {stats['ways']} way khớp, cần {stats['needed_nodes']} node, "
+          f"{stats['ways_seconds']:.2f}s")
+    print(f"  Lượt 2 (node): tìm thấy {stats['found_nodes']} node, {stats['nodes_seconds']:.2f}s")
+    print(f"  Giữ lại {stats['kept_ways']} way, tổng {seconds:.2f}s ({size / seconds:.1f} MB/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Đọc đường từ file OSM PBF cục bộ")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('stats', help="Đọc file PBF, in số liệu và thời gian")
+    p.add_argument('pbf')
+    p.add_argument('--workers', type=int)
+    p.add_argument('--output', help="Ghi kết quả ra file NDJSON (mỗi dòng [[name, ref, highway], ways])")
+    p = sub.add_parser('sample', help="Sinh file PBF giả để thử (cần pyosmium)")
+    p.add_argument('output')
+    p.add_argument('--ways', type=int, default=10_000)
+    p.add_argument('--seed', type=int, default=0)
+    p = sub.add_parser('verify', help="So kết quả với pyosmium (cần pyosmium)")
+    p.add_argument('pbf')
+    p.add_argument('--workers', type=int)
+    args = parser.parse_args()
+
+    if args.command in ('sample', 'verify') and osmium is None:
+        print("Lỗi: Chưa cài thư viện 'osmium'.")
+        print("Vui lòng chạy: pip install osmium")
+        return 1
+
+    if args.command == 'stats':
+        stats = {}
+        start = time.time()
+        roads = collect(iter_road_chunks(args.pbf, DEFAULT_ROAD_TYPES, workers=args.workers, stats=stats))
+        print_stats(stats, time.time() - start, args.pbf)
+        print(f"  {len(roads)} con đường (name, ref, highway)")
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                for key in sorted(roads):
+                    f.write(json.dumps([list(key), roads[key]], ensure_ascii=False))
+                    f.write('\n')
+            print(f"  → {args.output}")
+        return 0
+
+    if args.command == 'sample':
+        node_count, way_count = write_sample(args.output, args.ways, args.seed)
+        print(f"✅ {node_count} node, {way_count} way → {args.output} "
+              f"({os.path.getsize(args.output) / (1024 * 1024):.1f} MB)")
+        return 0
+
+    stats = {}
+    start = time.time()
+    ours = collect(iter_road_chunks(args.pbf, DEFAULT_ROAD_TYPES, workers=args.workers, stats=stats))
+    print_stats(stats, time.time() - start, args.pbf)
+    start = time.time()
+    expected = reference_roads(args.pbf, DEFAULT_ROAD_TYPES)
+    print(f"  pyosmium: {sum(map(len, expected.values()))} way, {time.time() - start:.2f}s")
+    if ours != expected:
+        diff = sorted(set(ours) ^ set(expected)) or \
+            [k for k in sorted(ours) if ours[k] != expected[k]]
+        print(f"❌ Khác pyosmium ở {len(diff)} con đường, vd. {diff[:3]}")
+        return 1
+    print(f"✅ Khớp pyosmium: {len(ours)} con đường, {sum(map(len, ours.values()))} way")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
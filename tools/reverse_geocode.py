@@ -0,0 +1,336 @@
+"""
+Tra ngược tọa độ -> tỉnh/thành (63 tỉnh cũ và 34 đơn vị 2025) cho hàng triệu điểm.
+
+Mỗi file ranh giới được nạp thành 1 ProvinceLocator:
+  - lưới ô CELL_SIZE độ phủ cả nước, dựng sẵn 1 lần:
+      ô nằm trọn trong 1 tỉnh  -> trả lời luôn, không cần kiểm tra điểm-trong-đa-giác
+      ô cắt ranh giới          -> chỉ kiểm tra các tỉnh cắt ô đó (shapely.intersects_xy, vector hóa)
+  - điểm trên đường biên được tính cho tỉnh đầu tiên chứa nó.
+
+Dùng:
+    python tools/reverse_geocode.py run points.csv -o points_province.csv
+    python tools/reverse_geocode.py run points.ndjson -o out.ndjson --workers 4
+    python tools/reverse_geocode.py point 21.0285 105.8542
+    python tools/reverse_geocode.py bench --points 2000000
+CSV cần cột lat, lon (đổi bằng --lat-col/--lon-col); NDJSON cần khóa lat, lon.
+Kết quả thêm 2 cột/khóa: province_old, province_new (rỗng nếu nằm ngoài lãnh thổ).
+"""
+import argparse
+import collections
+import concurrent.futures
+import csv
+import io
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+try:
+    import shapely
+    from shapely.geometry import shape
+except ImportError:
+    shapely = None
+
+BOUNDARIES_FILE = 'assets/boundaries/vn_boundaries.json'
+BOUNDARIES_2025_FILE = 'assets/boundaries/vn_boundaries_2025.json'
+CELL_SIZE = 0.05 # Độ (~5.5 km): ~44 nghìn ô cho cả nước
+CHUNK_LINES = 100_000 # Số dòng mỗi lô gửi cho 1 process
+OUTSIDE = -1
+MIXED = -2
+
+
+class ProvinceLocator:
+    """Điểm -> chỉ số tỉnh trong 1 file ranh giới (bỏ qua feature quốc gia)"""
+
+    def __init__(self, boundaries_file, cell_size=CELL_SIZE):
+        with open(boundaries_file, 'r', encoding='utf-8') as f:
+            features = [feat for feat in json.load(f).get('features', [])
+                        if feat.get('type') == 'province']
+        self.names = [feat['name'] for feat in features]
+        self.polygons = [shape(feat['geometry']) for feat in features]
+        for polygon in self.polygons:
+            shapely.prepare(polygon)
+        self.cell_size = cell_size
+        self._build_grid()
+
+    def _build_grid(self):
+        cs = self.cell_size
+        xmin, ymin, xmax, ymax = shapely.total_bounds(self.polygons)
+        self.x0, self.y0 = xmin, ymin
+        self.nx = int(np.ceil((xmax - xmin) / cs)) + 1
+        self.ny = int(np.ceil((ymax - ymin) / cs)) + 1
+        owner = np.full(self.nx * self.ny, OUTSIDE, dtype=np.int32)
+        candidates = collections.defaultdict(list) # ô -> các tỉnh cắt ô
+
+        for p, polygon in enumerate(self.polygons):
+            bx0, by0, bx1, by1 = polygon.bounds
+            ix = np.arange(int((bx0 - xmin) // cs), int((bx1 - xmin) // cs) + 1)
+            iy = np.arange(int((by0 - ymin) // cs), int((by1 - ymin) // cs) + 1)
+            gx, gy = np.meshgrid(ix, iy)
+            gx, gy = gx.ravel(), gy.ravel()
+            boxes = shapely.box(xmin + gx * cs, ymin + gy * cs, xmin + (gx + 1) * cs, ymin + (gy + 1) * cs)
+            cells = gy * self.nx + gx
+            touched = shapely.intersects(polygon, boxes)
+            full = touched & shapely.covers(polygon, boxes)
+            owner[cells[full]] = p
+            for cell in cells[touched & ~full].tolist():
+                candidates[cell].append(p)
+
+        # Ô cắt ranh giới (và không nằm trọn trong tỉnh nào) -> bảng ứng viên dạng ma trận bool
+        mixed_cells = [cell for cell in candidates if owner[cell] == OUTSIDE]
+        self.mixed_row = np.full(len(owner), -1, dtype=np.int32)
+        self.mixed_row[mixed_cells] = np.arange(len(mixed_cells), dtype=np.int32)
+        self.members = np.zeros((len(mixed_cells), len(self.polygons)), dtype=bool)
+        for row, cell in enumerate(mixed_cells):
+            self.members[row, candidates[cell]] = True
+        owner[mixed_cells] = MIXED
+        self.owner = owner
+
+    def locate(self, lats, lons):
+        """Mảng chỉ số tỉnh (int32, -1 nếu ngoài lãnh thổ) cho mảng lat/lon"""
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        result = np.full(len(lats), OUTSIDE, dtype=np.int32)
+        ix = np.floor((lons - self.x0) / self.cell_size)
+        iy = np.floor((lats - self.y0) / self.cell_size)
+        inside = (ix >= 0) & (ix < self.nx) & (iy >= 0) & (iy < self.ny) # NaN -> False
+        pts = np.flatnonzero(inside)
+        cells = iy[pts].astype(np.int64) * self.nx + ix[pts].astype(np.int64)
+        owner = self.owner[cells]
+        result[pts] = np.where(owner >= 0, owner, OUTSIDE)
+
+        mixed = owner == MIXED
+        pts, rows = pts[mixed], self.mixed_row[cells[mixed]]
+        x, y = lons[pts], lats[pts]
+        pending = np.ones(len(pts), dtype=bool)
+        for p in np.flatnonzero(self.members[rows].any(axis=0)):
+            sel = np.flatnonzero(pending & self.members[rows, p])
+            if not len(sel):
+                continue
+            hit = sel[shapely.intersects_xy(self.polygons[p], x[sel], y[sel])]
+            result[pts[hit]] = p
+            pending[hit] = False
+        return result
+
+    def name(self, index):
+        return self.names[index] if index >= 0 else ''
+
+    def stats(self):
+        full = int((self.owner >= 0).sum())
+        return {'cells': len(self.owner), 'full': full, 'mixed': len(self.members)}
+
+
+class ReverseGeocoder:
+    """Tra cùng lúc tỉnh cũ (63) và đơn vị mới (2025)"""
+
+    def __init__(self, old_file=BOUNDARIES_FILE, new_file=BOUNDARIES_2025_FILE, cell_size=CELL_SIZE):
+        self.old = ProvinceLocator(old_file, cell_size)
+        self.new = ProvinceLocator(new_file, cell_size)
+
+    def locate(self, lats, lons):
+        return self.old.locate(lats, lons), self.new.locate(lats, lons)
+
+    def names(self, lats, lons):
+        old, new = self.locate(lats, lons)
+        old_names = self.old.names + ['']
+        new_names = self.new.names + ['']
+        # Chỉ số -1 trỏ tới phần tử rỗng cuối list
+        return [old_names[i] for i in old.tolist()], [new_names[i] for i in new.tolist()]
+
+
+# --- XỬ LÝ FILE THEO LÔ (PROCESS POOL) ---
+
+_geocoder = None # Mỗi process nạp ranh giới 1 lần (initializer)
+
+
+def _init_worker(old_file, new_file, cell_size):
+    global _geocoder
+    _geocoder = ReverseGeocoder(old_file, new_file, cell_size)
+
+
+def _parse_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float('nan')
+
+
+def geocode_csv_lines(lines, lat_col, lon_col):
+    """Các dòng CSV (không header) -> text CSV có thêm 2 cột tỉnh cũ/mới"""
+    rows = list(csv.reader(lines))
+    lats = [_parse_float(row[lat_col]) if len(row) > lat_col else float('nan') for row in rows]
+    lons = [_parse_float(row[lon_col]) if len(row) > lon_col else float('nan') for row in rows]
+    old, new = _geocoder.names(lats, lons)
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator='\n')
+    writer.writerows(row + [o, n] for row, o, n in zip(rows, old, new))
+    return out.getvalue()
+
+
+def geocode_ndjson_lines(lines, lat_key, lon_key):
+    """Các dòng NDJSON -> NDJSON có thêm province_old, province_new"""
+    records = [json.loads(line) for line in lines if line.strip()]
+    lats = [_parse_float(r.get(lat_key)) for r in records]
+    lons = [_parse_float(r.get(lon_key)) for r in records]
+    old, new = _geocoder.names(lats, lons)
+    out = []
+    for record, o, n in zip(records, old, new):
+        record['province_old'] = o
+        record['province_new'] = n
+        out.append(json.dumps(record, ensure_ascii=False))
+    return '\n'.join(out) + '\n' if out else ''
+
+
+def _run_chunk(task):
+    fmt, lines, lat, lon = task
+    if fmt == 'csv':
+        return len(lines), geocode_csv_lines(lines, lat, lon)
+    return len(lines), geocode_ndjson_lines(lines, lat, lon)
+
+
+def iter_line_chunks(f, size):
+    chunk = []
+    for line in f:
+        chunk.append(line)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def geocode_file(input_path, output_path, fmt=None, workers=None, lat_field='lat', lon_field='lon',
+                 old_file=BOUNDARIES_FILE, new_file=BOUNDARIES_2025_FILE, cell_size=CELL_SIZE,
+                 chunk_lines=CHUNK_LINES):
+    """Stream file CSV/NDJSON qua process pool, giữ nguyên thứ tự dòng. Trả về số điểm đã xử lý"""
+    if fmt is None:
+        fmt = 'ndjson' if input_path.endswith(('.ndjson', '.jsonl')) else 'csv'
+    workers = workers or os.cpu_count() or 1
+    src = sys.stdin if input_path == '-' else open(input_path, 'r', encoding='utf-8', newline='')
+    dst = sys.stdout if output_path == '-' else open(output_path, 'w', encoding='utf-8', newline='')
+    try:
+        lat, lon = lat_field, lon_field
+        if fmt == 'csv':
+            header = next(csv.reader([src.readline()]))
+            if lat_field not in header or lon_field not in header:
+                raise ValueError(f"CSV thiếu cột '{lat_field}' hoặc '{lon_field}' (có: {header})")
+            lat, lon = header.index(lat_field), header.index(lon_field)
+            csv.writer(dst, lineterminator='\n').writerow(header + ['province_old', 'province_new'])
+        tasks = ((fmt, chunk, lat, lon) for chunk in iter_line_chunks(src, chunk_lines))
+
+        total = 0
+        if workers == 1:
+            _init_worker(old_file, new_file, cell_size)
+            for count, text in map(_run_chunk, tasks):
+                dst.write(text)
+                total += count
+            return total
+
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_worker,
+                initargs=(old_file, new_file, cell_size)) as executor:
+            # Giới hạn số lô đang chờ để không đọc cả file vào RAM; ghi theo đúng thứ tự
+            in_flight = collections.deque()
+            for task in tasks:
+                in_flight.append(executor.submit(_run_chunk, task))
+                if len(in_flight) >= 2 * workers:
+                    count, text = in_flight.popleft().result()
+                    dst.write(text)
+                    total += count
+            while in_flight:
+                count, text = in_flight.popleft().result()
+                dst.write(text)
+                total += count
+        return total
+    finally:
+        if src is not sys.stdin:
+            src.close()
+        if dst is not sys.stdout:
+            dst.close()
+
+
+# --- KIỂM TRA / BENCHMARK ---
+
+def random_points(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.uniform(8.4, 23.5, count), rng.uniform(102.0, 109.6, count)
+
+
+def verify_locator(locator, lats, lons):
+    """So với kiểm tra trực tiếp từng tỉnh: kết quả lưới phải là 1 tỉnh chứa điểm (hoặc -1 nếu không có)"""
+    result = locator.locate(lats, lons)
+    hits = np.stack([shapely.intersects_xy(polygon, lons, lats) for polygon in locator.polygons], axis=1)
+    ok = np.where(result >= 0, hits[np.arange(len(result)), np.maximum(result, 0)], ~hits.any(axis=1))
+    return int((~ok).sum())
+
+
+def bench(args):
+    start = time.time()
+    geocoder = ReverseGeocoder(args.old, args.new, args.cell_size)
+    print(f"Nạp ranh giới + dựng lưới: {time.time() - start:.2f}s")
+    for label, locator in (('63 tỉnh', geocoder.old), ('2025', geocoder.new)):
+        s = locator.stats()
+        print(f"  {label}: {len(locator.names)} tỉnh, {s['cells']} ô, {s['full']} ô trọn 1 tỉnh, "
+              f"{s['mixed']} ô cắt ranh giới")
+
+    lats, lons = random_points(args.points)
+    start = time.perf_counter()
+    old, new = geocoder.locate(lats, lons)
+    elapsed = time.perf_counter() - start
+    print(f"Tra {args.points} điểm (1 process, chưa tính đọc/ghi file): "
+          f"{elapsed:.2f}s = {args.points / elapsed:,.0f} điểm/s "
+          f"({int((old >= 0).sum())} điểm trong lãnh thổ)")
+
+    sample = min(args.points, 50_000)
+    bad = verify_locator(geocoder.old, lats[:sample], lons[:sample]) + \
+        verify_locator(geocoder.new, lats[:sample], lons[:sample])
+    print(f"{'✅' if not bad else '❌'} Đối chiếu {sample} điểm với kiểm tra trực tiếp: {bad} sai lệch")
+    if bad:
+        raise SystemExit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tra ngược tọa độ -> tỉnh/thành (63 tỉnh và 2025)")
+    parser.add_argument('--old', default=BOUNDARIES_FILE, help="File ranh giới 63 tỉnh")
+    parser.add_argument('--new', default=BOUNDARIES_2025_FILE, help="File ranh giới 2025")
+    parser.add_argument('--cell-size', type=float, default=CELL_SIZE)
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p = sub.add_parser('run', help="Xử lý file CSV / NDJSON ('-' = stdin/stdout)")
+    p.add_argument('input')
+    p.add_argument('-o', '--output', default='-')
+    p.add_argument('--format', choices=('csv', 'ndjson'))
+    p.add_argument('--workers', type=int, default=None, help="Số process (mặc định: số CPU)")
+    p.add_argument('--lat-col', default='lat')
+    p.add_argument('--lon-col', default='lon')
+    p.add_argument('--chunk-lines', type=int, default=CHUNK_LINES)
+    p = sub.add_parser('point', help="Tra 1 điểm")
+    p.add_argument('lat', type=float)
+    p.add_argument('lon', type=float)
+    p = sub.add_parser('bench', help="Đo tốc độ trên điểm ngẫu nhiên + đối chiếu kết quả")
+    p.add_argument('--points', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    if shapely is None:
+        print("❌ Cần shapely >= 2.0 (pip install shapely)")
+        raise SystemExit(1)
+
+    if args.cmd == 'run':
+        start = time.time()
+        total = geocode_file(args.input, args.output, args.format, args.workers, args.lat_col,
+                             args.lon_col, args.old, args.new, args.cell_size, args.chunk_lines)
+        elapsed = time.time() - start
+        print(f"✅ {total} điểm trong {elapsed:.1f}s ({total / max(elapsed, 1e-9):,.0f} điểm/s)",
+              file=sys.stderr)
+    elif args.cmd == 'point':
+        geocoder = ReverseGeocoder(args.old, args.new, args.cell_size)
+        old, new = geocoder.names([args.lat], [args.lon])
+        print(f"63 tỉnh: {old[0] or '(ngoài lãnh thổ)'}")
+        print(f"2025:    {new[0] or '(ngoài lãnh thổ)'}")
+    elif args.cmd == 'bench':
+        bench(args)
+
+
+if __name__ == '__main__':
+    main()
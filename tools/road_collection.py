@@ -0,0 +1,202 @@
+"""
+Tập đường gọn trong RAM cho giai đoạn merge / ghi file (thay cho dict {key: [[[lon, lat], ...], ...]}).
+
+Mỗi điểm trong list lồng nhau tốn ~100+ byte (list 2 phần tử + 2 float object); ở đây:
+    roads      list RoadRecord (__slots__), name/ref/road_type đã intern (dùng chung 1 object)
+    coords     array('d') phẳng [lon, lat, lon, lat, ...]  -> 16 byte / điểm
+    seg_ends   array('q') vị trí điểm kết thúc của từng segment
+    seg_road   array('q') segment thuộc đường nào (cho phép gộp nhiều lần vào cùng 1 key)
+Thêm theo lô (add_many / add_processed): cả lô trải phẳng 1 lần rồi nối vào buffer.
+arrays() trả về view numpy không copy (geo_arrays: coords (n, 2), offsets) để tính bbox,
+simplify, ghi .vngb theo lô; render_features() ghi JSON thẳng từ mảng phẳng,
+không dựng lại list lồng nhau (kết quả giống hệt json.dumps của feature dạng dict).
+
+Đo bộ nhớ / tốc độ so với dict list lồng nhau:
+    python tools/bench_pipeline.py model --scale country
+"""
+import sys
+from array import array
+from json.encoder import encode_basestring
+
+import numpy as np
+
+from geo_arrays import lines_array
+
+RENDER_VERTICES = 4096 # Số điểm mỗi lần dựng chuỗi tọa độ (giới hạn RAM tạm, vừa cache CPU)
+GEOMETRY_PREFIX = '"geometry": {"type": "MultiLineString", "coordinates": '
+
+
+class RoadRecord:
+    __slots__ = ('name', 'ref', 'road_type')
+
+    def __init__(self, name, ref, road_type):
+        self.name = name
+        self.ref = ref
+        self.road_type = road_type
+
+    @property
+    def key(self):
+        return (self.name, self.ref, self.road_type)
+
+
+class RoadCollection:
+    def __init__(self):
+        self.roads = []
+        self.coords = array('d')
+        self.seg_ends = array('q')
+        self.seg_road = array('q')
+        self._index = {}
+        self._strings = {}
+        self._grouped = True # seg_road không giảm: segment của mỗi đường liền nhau, theo thứ tự đường
+
+    def _intern(self, s):
+        return self._strings.setdefault(s, s)
+
+    def __len__(self):
+        return len(self.roads)
+
+    def vertex_count(self):
+        return len(self.coords) // 2
+
+    def segment_count(self):
+        return len(self.seg_ends)
+
+    def add(self, key, segments):
+        """Thêm các segment [[lon, lat], ...] cho đường key = (name, ref, road_type).
+        Key đã có -> nối thêm segment vào đường đó (giống merge_processed_data)"""
+        return self.add_many([(key, segments)])[0]
+
+    def add_many(self, items):
+        """add() cho cả lô (key, segments), trả về chỉ số đường của từng item"""
+        items = list(items)
+        roads = self._road_ids(key for key, _ in items)
+        self._append(roads, [len(segments) for _, segments in items],
+                     [seg for _, segments in items for seg in segments])
+        return roads
+
+    def add_processed(self, processed):
+        """Gộp kết quả process_elements của 1 ô ({key: [[way_id, first, last, coords], ...]})"""
+        self._append(self._road_ids(processed), list(map(len, processed.values())),
+                     [way[3] for ways in processed.values() for way in ways])
+
+    def _road_ids(self, keys):
+        index = self._index
+        return [index[key] if key in index else self._new_road(key) for key in keys]
+
+    def _new_road(self, key):
+        road = self._index[key] = len(self.roads)
+        self.roads.append(RoadRecord(*map(self._intern, key)))
+        return road
+
+    def _append(self, roads, counts, lines):
+        """Nối cả lô vào buffer 1 lần: mọi điểm trải phẳng bằng 1 lần np.fromiter (lines_array),
+        không lặp Python theo từng segment / từng điểm"""
+        if not lines:
+            return
+        coords, offsets = lines_array(lines)
+        seg_road = np.repeat(np.array(roads, dtype=np.int64), counts)
+        # arrays() cần segment xếp theo đường: lô làm seg_road giảm ở đâu đó -> sắp xếp lại khi cần
+        if self._grouped and ((self.seg_road and seg_road[0] < self.seg_road[-1]) or
+                              (seg_road[1:] < seg_road[:-1]).any()):
+            self._grouped = False
+        self.seg_ends.frombytes((offsets[1:] + len(self.coords) // 2).tobytes())
+        self.seg_road.frombytes(seg_road.tobytes())
+        self.coords.frombytes(coords.tobytes())
+
+    def _group(self):
+        """Sắp xếp lại segment theo đường (stable) sau khi có key được gộp nhiều lần"""
+        ends = np.frombuffer(self.seg_ends, dtype=np.int64)
+        starts = np.concatenate([[0], ends[:-1]])
+        order = np.argsort(np.frombuffer(self.seg_road, dtype=np.int64), kind='stable')
+        lengths = (ends - starts)[order]
+        # Chỉ số điểm theo thứ tự mới: mỗi segment là 1 dải liên tục starts[order[i]] + 0..len-1
+        new_starts = np.cumsum(lengths) - lengths
+        point_idx = np.repeat(starts[order] - new_starts, lengths) + np.arange(int(lengths.sum()))
+        coords = np.frombuffer(self.coords, dtype=np.float64).reshape(-1, 2)[point_idx]
+        self.coords = array('d', coords.tobytes())
+        self.seg_ends = array('q', np.cumsum(lengths).tobytes())
+        self.seg_road = array('q', np.frombuffer(self.seg_road, dtype=np.int64)[order].tobytes())
+        self._grouped = True
+
+    def arrays(self):
+        """(coords (n, 2), offsets điểm của segment (k + 1), road_parts segment của đường (r + 1))
+        coords là view trên buffer (không copy) - hết hiệu lực khi add()/clear()"""
+        if not self._grouped:
+            self._group()
+        coords = np.frombuffer(self.coords, dtype=np.float64).reshape(-1, 2)
+        offsets = np.zeros(len(self.seg_ends) + 1, dtype=np.int64)
+        offsets[1:] = np.frombuffer(self.seg_ends, dtype=np.int64)
+        road_parts = np.zeros(len(self.roads) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(np.frombuffer(self.seg_road, dtype=np.int64), minlength=len(self.roads)),
+                  out=road_parts[1:])
+        return coords, offsets, road_parts
+
+    def iter_batches(self, max_vertices):
+        """Chia thành các lô liên tiếp ~max_vertices điểm: (roads, coords, offsets, road_parts)
+        đều là view (offsets/road_parts đã trừ gốc) - để render/ghi từng lô, không copy cả tập"""
+        coords, offsets, road_parts = self.arrays()
+        road_vertices = offsets[road_parts]
+        first = 0
+        while first < len(self.roads):
+            last = int(np.searchsorted(road_vertices, road_vertices[first] + max_vertices, side='right')) - 1
+            last = min(max(last, first + 1), len(self.roads))
+            parts = road_parts[first:last + 1]
+            segs = offsets[parts[0]:parts[-1] + 1]
+            yield (self.roads[first:last], coords[segs[0]:segs[-1]], segs - segs[0], parts - parts[0])
+            first = last
+
+    def segments(self, i):
+        """Segment của đường i dạng list lồng nhau (chỉ dùng khi cần tương thích)"""
+        coords, offsets, road_parts = self.arrays()
+        return [coords[offsets[s]:offsets[s + 1]].tolist() for s in range(road_parts[i], road_parts[i + 1])]
+
+    def __iter__(self):
+        """(key, segments) như luồng đường cũ"""
+        coords, offsets, road_parts = self.arrays()
+        for i, road in enumerate(self.roads):
+            yield road.key, [coords[offsets[s]:offsets[s + 1]].tolist()
+                             for s in range(road_parts[i], road_parts[i + 1])]
+
+    def nbytes(self):
+        """Ước lượng bộ nhớ: buffer + record + bảng intern"""
+        buffers = sum(a.itemsize * len(a) for a in (self.coords, self.seg_ends, self.seg_road))
+        records = sum(sys.getsizeof(r) for r in self.roads[:1]) * len(self.roads)
+        strings = sum(sys.getsizeof(s) for s in self._strings)
+        return buffers + records + strings + sys.getsizeof(self._index) + sys.getsizeof(self.roads)
+
+    def clear(self):
+        """Xóa đường, giữ lại bảng intern (tên/ref lặp lại giữa các lô)"""
+        self.roads = []
+        self.coords = array('d')
+        self.seg_ends = array('q')
+        self.seg_road = array('q')
+        self._index = {}
+        self._grouped = True
+
+
+def render_features(roads, bboxes, coords, offsets, road_parts):
+    """Duyệt (i, text JSON của feature i) thẳng từ mảng phẳng; bỏ đường không còn segment.
+    Số viết bằng repr, chuỗi bằng encode_basestring như json.dumps(ensure_ascii=False)
+    -> kết quả giống hệt từng byte. Chuỗi tọa độ dựng theo từng đoạn RENDER_VERTICES điểm"""
+    road_vertices = offsets[road_parts]
+    bounds = offsets.tolist()
+    parts = road_parts.tolist()
+    first = 0
+    while first < len(roads):
+        end = int(np.searchsorted(road_vertices, road_vertices[first] + RENDER_VERTICES, side='right')) - 1
+        end = min(max(end, first + 1), len(roads))
+        base = bounds[parts[first]]
+        values = list(map(repr, coords[base:bounds[parts[end]]].ravel().tolist()))
+        points = list(map(', '.join, zip(values[0::2], values[1::2])))
+        lines = ['[[' + '], ['.join(points[a - base:b - base]) + ']]'
+                 for a, b in zip(bounds[parts[first]:parts[end]], bounds[parts[first] + 1:parts[end] + 1])]
+        seg_base = parts[first]
+        for i in range(first, end):
+            if parts[i] == parts[i + 1]:
+                continue
+            road = roads[i]
+            yield i, (f'{{"name": {encode_basestring(road.name)}, "ref": {encode_basestring(road.ref)}, '
+                      f'"road_type": {encode_basestring(road.road_type)}, '
+                      f'"bbox": [{", ".join(map(repr, bboxes[i]))}], '
+                      f'{GEOMETRY_PREFIX}[{", ".join(lines[parts[i] - seg_base:parts[i + 1] - seg_base])}]}}}}')
+        first = end
@@ -0,0 +1,668 @@
+"""
+Đồ thị đường đi được (routable) + contraction hierarchies (CH) cho truy vấn đường ngắn nhất.
+
+File vn_roads_full.json đã gộp way theo tên (MultiLineString), mất id node và kết nối; đồ thị
+dựng từ trạng thái mức way vn_roads_full.ways.ndjson (road_updates.py) còn đủ id node OSM:
+  node   giao lộ (node OSM thuộc >= 2 way / xuất hiện 2 lần) + đầu mút way
+  cạnh   đoạn way giữa 2 node liên tiếp: length_m (haversine), weight = giây theo tốc độ loại đường
+         (SPEEDS_KMH); hình dạng là dải [edge_first, edge_last] trong mảng coords các vertex
+  Đồ thị vô hướng: pipeline chỉ giữ name/ref/highway (không có tag oneway / cấm rẽ)
+Mọi mảng ở dạng CSR numpy, lưu 1 file .npz (vn_roads_full.graph.npz).
+
+CH: co lần lượt từng node theo thứ tự ưu tiên (edge difference, số cạnh gốc, số node kề đã co), ước lượng
+bằng witness search ngắn (WITNESS_SIMULATE node); co xong 1 node thì ước lượng lại các node kề, node lấy ra
+khỏi heap được tính lại lười với witness search đầy đủ (Dijkstra giới hạn WITNESS_SETTLE node) - thêm shortcut
+khi không tìm được đường thay thế. verify báo lỗi khi số shortcut / cạnh vượt MAX_SHORTCUT_RATIO.
+Đồ thị "lên" (cạnh tới node co sau) lưu CSR: cạnh gốc (up_edge) hoặc shortcut (up_mid = node ở giữa, để bung
+lại lộ trình).
+Truy vấn (Router): Dijkstra 2 chiều chỉ đi lên, mỗi chiều dừng khi min hàng đợi >= kết quả tốt nhất;
+one-to-many: 1 lượt lên từ mỗi đích ghi bucket tại các node đã duyệt, 1 lượt lên từ nguồn quét bucket.
+
+Dùng:
+    python tools/road_graph.py build --road-types motorway trunk primary
+    python tools/road_graph.py route 21.0285 105.8542 10.7769 106.7009
+    python tools/road_graph.py verify --pairs 200      # so CH với Dijkstra thường
+    python tools/road_graph.py bench                   # mạng giả cỡ trunk/primary toàn quốc
+"""
+import argparse
+import heapq
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from array import array
+from itertools import chain
+
+import numpy as np
+
+from geo_arrays import EARTH_RADIUS_M, segment_lengths
+from road_updates import iter_rows, ways_path
+
+ROADS_FILE = 'assets/roads/vn_roads_full.json'
+GRAPH_FILE = 'assets/roads/vn_roads_full.graph.npz'
+GRAPH_VERSION = 1
+# Tốc độ giả định theo loại đường (km/h), gần tốc độ tối đa ngoài khu dân cư
+SPEEDS_KMH = {'motorway': 90, 'trunk': 70, 'primary': 60, 'secondary': 50, 'tertiary': 40}
+DEFAULT_SPEED_KMH = 30
+WITNESS_SETTLE = 500 # Số node tối đa mỗi witness search khi co (nhỏ: sót witness -> thừa shortcut)
+WITNESS_SIMULATE = 100 # ... khi chỉ ước lượng ưu tiên (node kề của node vừa co)
+MAX_SHORTCUT_RATIO = 2.0 # verify: số shortcut / cạnh gốc vượt mức này -> thứ tự co kém (mạng thật ~1)
+INF = float('inf')
+
+
+def graph_path(output_file):
+    return os.path.splitext(output_file)[0] + '.graph.npz'
+
+
+# --- DỰNG ĐỒ THỊ ---
+
+def load_ways(ways_file, road_types=None):
+    """ways.ndjson -> (ids (V,), coords (V, 2), way_starts (W + 1,), way_road (W,), roads [key])
+    Way không có danh sách node (trạng thái cũ) dùng id âm theo tọa độ"""
+    ids, coords, starts, way_road, roads = array('q'), array('d'), array('q', [0]), array('q'), []
+    synthetic = {}
+    for key, ways in iter_rows(ways_file):
+        if road_types and key[2] not in road_types:
+            continue
+        road = len(roads)
+        roads.append(key)
+        for way in ways:
+            points = way[3]
+            nodes = way[4] if len(way) > 4 else []
+            if len(nodes) != len(points):
+                nodes = [synthetic.setdefault((lon, lat), -len(synthetic) - 1) for lon, lat in points]
+            ids.extend(nodes)
+            coords.extend(chain.from_iterable(points))
+            starts.append(len(ids))
+            way_road.append(road)
+    return (np.frombuffer(ids, dtype=np.int64), np.frombuffer(coords, dtype=np.float64).reshape(-1, 2),
+            np.frombuffer(starts, dtype=np.int64), np.frombuffer(way_road, dtype=np.int64), roads)
+
+
+def build_graph(ids, coords, starts, way_road, roads, speeds=SPEEDS_KMH):
+    """Tách way tại giao lộ -> dict mảng đồ thị (xem đầu file), chưa có CH"""
+    uniq, inverse, counts = np.unique(ids, return_inverse=True, return_counts=True)
+    is_node = counts[inverse] >= 2
+    ways = len(starts) - 1
+    nonempty = np.diff(starts) > 0
+    is_node[starts[:-1][nonempty]] = True
+    is_node[starts[1:][nonempty] - 1] = True
+    chosen, first = np.unique(inverse[is_node], return_index=True)
+    node_index = np.full(len(uniq), -1, dtype=np.int64)
+    node_index[chosen] = np.arange(len(chosen))
+    vertex_node = node_index[inverse]
+    node_vertex = np.flatnonzero(is_node)[first]
+
+    # Chiều dài cộng dồn theo vertex (đoạn nối 2 way liền nhau trong mảng = 0)
+    seg = segment_lengths(coords) if len(coords) >= 2 else np.zeros(0)
+    bridges = starts[1:-1] - 1
+    seg[bridges[(bridges >= 0) & (bridges < len(seg))]] = 0.0
+    cum = np.concatenate([[0.0], np.cumsum(seg)])
+
+    way_of = np.repeat(np.arange(ways), np.diff(starts))
+    pos = np.flatnonzero(is_node)
+    a, b = pos[:-1], pos[1:]
+    same = way_of[a] == way_of[b]
+    a, b = a[same], b[same]
+    u, v = vertex_node[a], vertex_node[b]
+    loop = u == v # Way khép kín quanh 1 node: không giúp gì cho đường ngắn nhất
+    a, b, u, v = a[~loop], b[~loop], u[~loop], v[~loop]
+    length = cum[b] - cum[a]
+    edge_road = way_road[way_of[a]]
+    road_speed = np.array([speeds.get(key[2], DEFAULT_SPEED_KMH) for key in roads] or [1.0], dtype=np.float64)
+    weight = length / (road_speed[edge_road] / 3.6)
+    return {
+        'node_lon': coords[node_vertex, 0], 'node_lat': coords[node_vertex, 1], 'node_osm': uniq[chosen],
+        'coords': coords, 'edge_u': u, 'edge_v': v, 'edge_first': a, 'edge_last': b,
+        'edge_length': length, 'edge_weight': weight, 'edge_road': edge_road,
+    }
+
+
+# --- CONTRACTION HIERARCHIES ---
+
+def contract(node_count, edge_u, edge_v, edge_weight, settle_limit=WITNESS_SETTLE, simulate_limit=WITNESS_SIMULATE,
+             progress=None):
+    """Co toàn bộ node -> (rank, up_src, up_dst, up_weight, up_mid, up_edge)
+    Cạnh song song giữa 2 node chỉ giữ cạnh nhẹ nhất (cạnh gốc: up_mid = -1, up_edge = chỉ số cạnh)"""
+    adj = [{} for _ in range(node_count)] # node -> {node kề: (weight, mid, edge, số cạnh gốc)}
+    for e, (u, v, w) in enumerate(zip(edge_u.tolist(), edge_v.tolist(), edge_weight.tolist())):
+        current = adj[u].get(v)
+        if current is None or w < current[0]:
+            adj[u][v] = adj[v][u] = (w, -1, e, 1)
+    weight = [{u: entry[0] for u, entry in a.items()} for a in adj] # Bản sao chỉ có weight cho witness search
+    deleted = [0] * node_count
+
+    def witness(source, skip, targets, limit, settle):
+        """Dijkstra giới hạn (settle node) từ source, không qua skip: khoảng cách (tạm) tới các target"""
+        dist = {source: 0.0}
+        heap = [(0.0, source)]
+        remaining = len(targets)
+        while heap and settle:
+            d, x = heapq.heappop(heap)
+            if d > dist[x]:
+                continue
+            if x in targets:
+                remaining -= 1
+                if not remaining:
+                    break
+            settle -= 1
+            for y, w in weight[x].items():
+                nd = d + w
+                if nd <= limit and nd < dist.get(y, INF) and y != skip:
+                    dist[y] = nd
+                    heapq.heappush(heap, (nd, y))
+        return dist
+
+    def shortcuts(v, settle):
+        """Shortcut cần thêm khi co v: [(u, w, weight, số cạnh gốc)]; cạnh trực tiếp u-w đủ nhẹ thì bỏ qua search"""
+        neighbors = [(u, entry[0], entry[3]) for u, entry in adj[v].items()]
+        needed = []
+        for i, (u, wu, hu) in enumerate(neighbors[:-1]):
+            direct = weight[u]
+            targets = {w: (wu + ww, hu + hw) for w, ww, hw in neighbors[i + 1:] if direct.get(w, INF) > wu + ww}
+            if targets:
+                dist = witness(u, v, targets, max(via for via, _ in targets.values()), settle)
+                needed.extend((u, w, via, h) for w, (via, h) in targets.items() if dist.get(w, INF) > via)
+        return needed
+
+    def priority(v, needed):
+        """2 x edge difference + chênh lệch số cạnh gốc + 2 x số node kề đã co (nhỏ = co trước)"""
+        removed = sum(entry[3] for entry in adj[v].values())
+        return (2 * (len(needed) - len(adj[v])) + sum(shortcut[3] for shortcut in needed) - removed
+                + 2 * deleted[v])
+
+    current = [priority(v, shortcuts(v, simulate_limit)) for v in range(node_count)]
+    heap = [(p, v) for v, p in enumerate(current)]
+    heapq.heapify(heap)
+    rank = np.zeros(node_count, dtype=np.int64)
+    up = ([], [], [], [], [])
+    order = 0
+    while heap:
+        p, v = heapq.heappop(heap)
+        if p != current[v] or adj[v] is None: # Mục cũ trong heap
+            continue
+        # Cập nhật lười: tính lại với witness search đầy đủ, ưu tiên đã tăng -> xếp lại; không thì co luôn
+        needed = shortcuts(v, settle_limit)
+        p = current[v] = priority(v, needed)
+        if heap and p > heap[0][0]:
+            heapq.heappush(heap, (p, v))
+            continue
+        for u, w, via, h in needed:
+            adj[u][w] = adj[w][u] = (via, v, -1, h)
+            weight[u][w] = weight[w][u] = via
+        for u, (w, mid, e, _) in adj[v].items():
+            for column, value in zip(up, (v, u, w, mid, e)):
+                column.append(value)
+            del adj[u][v], weight[u][v]
+            deleted[u] += 1
+        neighbors = adj[v]
+        adj[v] = weight[v] = None
+        rank[v] = order
+        order += 1
+        for u in neighbors: # Node kề đổi bậc / số node đã co: ước lượng lại ngay
+            p = priority(u, shortcuts(u, simulate_limit))
+            if p != current[u]:
+                current[u] = p
+                heapq.heappush(heap, (p, u))
+        if progress and order % 10_000 == 0:
+            progress(order, node_count)
+    up_src, up_dst, up_mid, up_edge = (np.array(c, dtype=np.int64) for c in (up[0], up[1], up[3], up[4]))
+    return rank, up_src, up_dst, np.array(up[2], dtype=np.float64), up_mid, up_edge
+
+
+def csr(src, node_count, *columns):
+    """Sắp các cạnh theo node nguồn -> (offsets (n + 1,), các cột đã sắp)"""
+    order = np.argsort(src, kind='stable')
+    offsets = np.zeros(node_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=node_count), out=offsets[1:])
+    return (offsets,) + tuple(c[order] for c in columns)
+
+
+def build(ways_file, out_path, road_types=None, settle_limit=WITNESS_SETTLE, verbose=True):
+    """ways.ndjson -> file .npz (đồ thị + CH). Trả về dict số liệu"""
+    stats = {}
+    start = time.time()
+    ids, coords, starts, way_road, roads = load_ways(ways_file, road_types)
+    stats['load_seconds'] = time.time() - start
+    start = time.time()
+    graph = build_graph(ids, coords, starts, way_road, roads)
+    node_count = len(graph['node_lon'])
+    stats.update(ways=len(starts) - 1, vertices=len(ids), nodes=node_count, edges=len(graph['edge_u']),
+                 graph_seconds=time.time() - start)
+    if verbose:
+        print(f"  {stats['ways']} way, {stats['vertices']} vertex -> {node_count} node, {stats['edges']} cạnh "
+              f"({stats['load_seconds'] + stats['graph_seconds']:.1f}s)")
+
+    def progress(done, total):
+        print(f"  CH: đã co {done}/{total} node ({time.time() - start:.0f}s)")
+
+    start = time.time()
+    rank, up_src, up_dst, up_weight, up_mid, up_edge = contract(
+        node_count, graph['edge_u'], graph['edge_v'], graph['edge_weight'], settle_limit,
+        progress=progress if verbose else None)
+    up_offsets, up_targets, up_weights, up_mids, up_edges = csr(up_src, node_count, up_dst, up_weight, up_mid,
+                                                                up_edge)
+    stats.update(shortcuts=int((up_mid >= 0).sum()), ch_seconds=time.time() - start)
+    directory = os.path.dirname(out_path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    tmp_path = out_path + '.part.npz' # np.savez tự thêm đuôi .npz
+    np.savez(tmp_path, version=np.array(GRAPH_VERSION), roads=np.array(json.dumps(roads, ensure_ascii=False)),
+             speeds=np.array(json.dumps(SPEEDS_KMH)), rank=rank, up_offsets=up_offsets, up_targets=up_targets,
+             up_weights=up_weights, up_mid=up_mids, up_edge=up_edges, **graph)
+    os.replace(tmp_path, out_path)
+    stats['bytes'] = os.path.getsize(out_path)
+    if verbose:
+        print(f"  CH: {stats['shortcuts']} shortcut ({stats['shortcuts'] / max(stats['edges'], 1):.2f}/cạnh), "
+              f"{stats['ch_seconds']:.1f}s")
+        print(f"✅ {stats['bytes'] / (1024 * 1024):.1f} MB → {out_path}")
+    return stats
+
+
+# --- TRUY VẤN ---
+
+class Router:
+    """Truy vấn đường ngắn nhất trên file .npz (đồ thị lên của CH giữ ở list Python cho nhanh)"""
+
+    def __init__(self, path=GRAPH_FILE):
+        with np.load(path) as data:
+            if int(data['version']) != GRAPH_VERSION:
+                raise ValueError(f"{path}: phiên bản đồ thị {int(data['version'])} (cần {GRAPH_VERSION})")
+            arrays = {name: data[name] for name in data.files}
+        self.roads = [tuple(key) for key in json.loads(str(arrays.pop('roads')))]
+        self.node_lon, self.node_lat = arrays['node_lon'], arrays['node_lat']
+        self.coords = arrays['coords']
+        self.edge_u, self.edge_v = arrays['edge_u'], arrays['edge_v']
+        self.edge_first, self.edge_last = arrays['edge_first'], arrays['edge_last']
+        self.edge_length, self.edge_weight = arrays['edge_length'], arrays['edge_weight']
+        self.edge_road = arrays['edge_road']
+        self.rank = arrays['rank']
+        self._offsets = arrays['up_offsets'].tolist()
+        self._targets = arrays['up_targets'].tolist()
+        self._weights = arrays['up_weights'].tolist()
+        self._mid = arrays['up_mid'].tolist()
+        self._edge = arrays['up_edge'].tolist()
+        self._cos = np.cos(np.radians(self.node_lat))
+
+    def __len__(self):
+        return len(self.node_lon)
+
+    def nearest_node(self, lat, lon):
+        """(node gần điểm nhất, khoảng cách mét) - xấp xỉ phẳng cục bộ, đủ cho việc bắt điểm"""
+        dx = (self.node_lon - lon) * self._cos
+        dy = self.node_lat - lat
+        node = int(np.argmin(dx * dx + dy * dy))
+        return node, float(np.hypot(dx[node], dy[node]) * np.radians(1) * EARTH_RADIUS_M)
+
+    def _upward(self, source):
+        """Dijkstra đầy đủ trên đồ thị lên từ source (stall-on-demand): {node đã duyệt, không bị stall: giây}"""
+        offsets, targets, weights = self._offsets, self._targets, self._weights
+        dist = {source: 0.0}
+        settled = {}
+        heap = [(0.0, source)]
+        while heap:
+            d, x = heapq.heappop(heap)
+            if d > dist[x]:
+                continue
+            edges = range(offsets[x], offsets[x + 1])
+            for i in edges:
+                if dist.get(targets[i], INF) + weights[i] < d:
+                    break
+            else:
+                settled[x] = d
+                for i in edges:
+                    y = targets[i]
+                    nd = d + weights[i]
+                    if nd < dist.get(y, INF):
+                        dist[y] = nd
+                        heapq.heappush(heap, (nd, y))
+        return settled
+
+    def _search(self, source, target):
+        """Dijkstra 2 chiều đi lên -> (giây, node gặp, parent 2 chiều) ; không tới được -> giây = inf"""
+        offsets, targets, weights = self._offsets, self._targets, self._weights
+        dist = ({source: 0.0}, {target: 0.0})
+        parent = ({source: None}, {target: None})
+        heaps = ([(0.0, source)], [(0.0, target)])
+        best, meet = (0.0, source) if source == target else (INF, None)
+        while heaps[0] or heaps[1]:
+            side = 0 if heaps[0] and (not heaps[1] or heaps[0][0][0] <= heaps[1][0][0]) else 1
+            heap = heaps[side]
+            d, x = heapq.heappop(heap)
+            if d >= best:
+                heap.clear()
+                continue
+            mine = dist[side]
+            if d > mine[x]:
+                continue
+            other = dist[1 - side].get(x)
+            if other is not None and d + other < best:
+                best, meet = d + other, x
+            edges = range(offsets[x], offsets[x + 1])
+            # Stall-on-demand: tới được x rẻ hơn qua node cao hơn -> x không nằm trên đường ngắn nhất
+            for i in edges:
+                if mine.get(targets[i], INF) + weights[i] < d:
+                    break
+            else:
+                prev = parent[side]
+                for i in edges:
+                    y = targets[i]
+                    nd = d + weights[i]
+                    if nd < mine.get(y, INF):
+                        mine[y] = nd
+                        prev[y] = (x, i)
+                        heapq.heappush(heap, (nd, y))
+        return best, meet, parent
+
+    def _up_index(self, low, high):
+        """Chỉ số cạnh lên low -> high (low co trước high)"""
+        for i in range(self._offsets[low], self._offsets[low + 1]):
+            if self._targets[i] == high:
+                return i
+        raise KeyError((low, high))
+
+    def _unpack(self, hops):
+        """[(a, b, cạnh lên)] theo chiều đi -> [(cạnh gốc, node bắt đầu)] theo chiều đi"""
+        edges = []
+        stack = list(reversed(hops))
+        while stack:
+            a, b, i = stack.pop()
+            if self._mid[i] < 0:
+                edges.append((self._edge[i], a))
+                continue
+            mid = self._mid[i]
+            stack.append((mid, b, self._up_index(mid, b)))
+            stack.append((a, mid, self._up_index(mid, a)))
+        return edges
+
+    def path_edges(self, source, target):
+        """(giây, [(cạnh gốc, node bắt đầu)]) của đường ngắn nhất node -> node; không tới được: (inf, None)"""
+        seconds, meet, parent = self._search(source, target)
+        if meet is None:
+            return INF, None
+        hops = []
+        x = meet
+        while parent[0][x] is not None:
+            prev, i = parent[0][x]
+            hops.append((prev, x, i))
+            x = prev
+        hops.reverse()
+        x = meet
+        while parent[1][x] is not None:
+            prev, i = parent[1][x]
+            hops.append((x, prev, i))
+            x = prev
+        return seconds, self._unpack(hops)
+
+    def distance(self, source, target):
+        """Thời gian (giây) ngắn nhất node -> node, inf nếu không liên thông"""
+        return self._search(source, target)[0]
+
+    def one_to_many(self, source, targets):
+        """Thời gian (giây) từ source tới từng node trong targets (inf nếu không tới được)
+        Many-to-many theo bucket: lượt lên từ mỗi đích ghi (đích, giây) vào bucket các node đã duyệt,
+        1 lượt lên từ source quét bucket của các node nó duyệt"""
+        buckets = {}
+        for j, target in enumerate(targets):
+            for x, d in self._upward(target).items():
+                bucket = buckets.get(x)
+                if bucket is None:
+                    buckets[x] = [(j, d)]
+                else:
+                    bucket.append((j, d))
+        result = [INF] * len(targets)
+        for x, d in self._upward(source).items():
+            for j, back in buckets.get(x, ()):
+                if d + back < result[j]:
+                    result[j] = d + back
+        return result
+
+    def route(self, lat1, lon1, lat2, lon2):
+        """Lộ trình giữa 2 điểm (bắt vào node gần nhất): dict seconds, meters, coordinates [[lon, lat]...],
+        roads [{name, ref, road_type, meters}] (gộp đoạn liền nhau cùng đường), snap_m; None nếu không liên thông"""
+        source, snap_source = self.nearest_node(lat1, lon1)
+        target, snap_target = self.nearest_node(lat2, lon2)
+        seconds, edges = self.path_edges(source, target)
+        if edges is None:
+            return None
+        line = [[float(self.node_lon[source]), float(self.node_lat[source])]]
+        roads = []
+        for e, start in edges:
+            part = self.coords[self.edge_first[e]:self.edge_last[e] + 1]
+            if start != self.edge_u[e]:
+                part = part[::-1]
+            line.extend(part[1:].tolist())
+            key = self.roads[self.edge_road[e]]
+            meters = float(self.edge_length[e])
+            if roads and (roads[-1]['name'], roads[-1]['ref'], roads[-1]['road_type']) == key:
+                roads[-1]['meters'] += meters
+            else:
+                roads.append({'name': key[0], 'ref': key[1], 'road_type': key[2], 'meters': meters})
+        return {'seconds': seconds, 'meters': sum(r['meters'] for r in roads), 'coordinates': line,
+                'roads': roads, 'snap_m': [snap_source, snap_target]}
+
+
+# --- KIỂM TRA / ĐO ---
+
+def dijkstra(router, source, target=None):
+    """Dijkstra thường trên đồ thị gốc (để đối chiếu): {node: giây} hoặc giây tới target"""
+    if not hasattr(router, '_plain'):
+        n = len(router)
+        src = np.concatenate([router.edge_u, router.edge_v])
+        dst = np.concatenate([router.edge_v, router.edge_u])
+        offsets, dst, weight = csr(src, n, dst, np.concatenate([router.edge_weight, router.edge_weight]))
+        router._plain = (offsets.tolist(), dst.tolist(), weight.tolist())
+    offsets, targets, weights = router._plain
+    dist = {source: 0.0}
+    heap = [(0.0, source)]
+    while heap:
+        d, x = heapq.heappop(heap)
+        if d > dist[x]:
+            continue
+        if x == target:
+            return d
+        for i in range(offsets[x], offsets[x + 1]):
+            y = targets[i]
+            nd = d + weights[i]
+            if nd < dist.get(y, INF):
+                dist[y] = nd
+                heapq.heappush(heap, (nd, y))
+    return INF if target is not None else dist
+
+
+def verify(router, pairs=200, seed=0, many=50):
+    """So CH với Dijkstra thường trên các cặp node ngẫu nhiên; lộ trình bung ra phải liền mạch
+    và có tổng thời gian đúng bằng kết quả; số shortcut / cạnh không vượt MAX_SHORTCUT_RATIO. Trả về số lỗi"""
+    rng = random.Random(seed)
+    n = len(router)
+    errors = 0
+    ratio = sum(mid >= 0 for mid in router._mid) / max(len(router.edge_u), 1)
+    if ratio > MAX_SHORTCUT_RATIO:
+        errors += 1
+        print(f"  ❌ {ratio:.2f} shortcut / cạnh (tối đa {MAX_SHORTCUT_RATIO})")
+    for _ in range(pairs):
+        s, t = rng.randrange(n), rng.randrange(n)
+        expected = dijkstra(router, s, t)
+        seconds, edges = router.path_edges(s, t)
+        if not np.isclose(seconds, expected, rtol=1e-9, atol=1e-6) and not (seconds == expected == INF):
+            errors += 1
+            print(f"  ❌ {s} -> {t}: CH {seconds:.3f}s, Dijkstra {expected:.3f}s")
+            continue
+        if edges is None:
+            continue
+        node, total = s, 0.0
+        for e, start in edges:
+            u, v = int(router.edge_u[e]), int(router.edge_v[e])
+            if start != node or node not in (u, v):
+                errors += 1
+                print(f"  ❌ {s} -> {t}: lộ trình đứt tại node {node}")
+                break
+            node = v if node == u else u
+            total += float(router.edge_weight[e])
+        else:
+            if node != t or not np.isclose(total, seconds, rtol=1e-9, atol=1e-6):
+                errors += 1
+                print(f"  ❌ {s} -> {t}: lộ trình {total:.3f}s khác kết quả {seconds:.3f}s")
+    source = rng.randrange(n)
+    targets = [rng.randrange(n) for _ in range(many)]
+    expected = dijkstra(router, source)
+    for target, seconds in zip(targets, router.one_to_many(source, targets)):
+        want = expected.get(target, INF)
+        if not (seconds == want == INF or np.isclose(seconds, want, rtol=1e-9, atol=1e-6)):
+            errors += 1
+            print(f"  ❌ one-to-many {source} -> {target}: CH {seconds:.3f}s, Dijkstra {want:.3f}s")
+    return errors
+
+
+def write_sample_network(path, size=200, seed=0, spacing=0.045):
+    """Mạng đường giả dạng lưới size x size giao lộ (~size² node như trunk/primary toàn quốc) ở dạng
+    ways.ndjson: mỗi hàng / cột là 1 tuyến chia thành nhiều way, có điểm hình dạng giữa các giao lộ,
+    lưới bị xô lệch và khuyết ngẫu nhiên; 1/8 tuyến là trunk, còn lại primary"""
+    rng = random.Random(seed)
+    grid = {}
+    for i in range(size):
+        for j in range(size):
+            grid[i, j] = (round(102.5 + j * spacing + rng.uniform(-0.3, 0.3) * spacing, 7),
+                          round(9.0 + i * spacing + rng.uniform(-0.3, 0.3) * spacing, 7))
+    roads = {}
+    next_node, next_way = size * size + 1, 1
+    for direction in range(2):
+        for line in range(size):
+            highway = 'trunk' if line % 8 == 0 else 'primary'
+            key = (f"Đường {'ngang' if direction == 0 else 'dọc'} {line}", f"QL{line}" if highway == 'trunk' else '',
+                   highway)
+            points = [(line, k) if direction == 0 else (k, line) for k in range(size)]
+            k = 0
+            while k < size - 1:
+                span = rng.randint(2, 8)
+                if rng.random() < 0.08: # Khuyết 1 đoạn
+                    k += span
+                    continue
+                nodes, coords = [], []
+                for p in range(k, min(k + span, size - 1) + 1):
+                    if nodes:
+                        (lon1, lat1), (lon2, lat2) = coords[-1], grid[points[p]]
+                        for f in (0.33, 0.67): # Điểm hình dạng (không phải giao lộ)
+                            nodes.append(next_node)
+                            coords.append([round(lon1 + (lon2 - lon1) * f + rng.uniform(-2e-3, 2e-3), 7),
+                                           round(lat1 + (lat2 - lat1) * f + rng.uniform(-2e-3, 2e-3), 7)])
+                            next_node += 1
+                    nodes.append(points[p][0] * size + points[p][1] + 1)
+                    coords.append(list(grid[points[p]]))
+                roads.setdefault(key, []).append([next_way, nodes[0], nodes[-1], coords, nodes])
+                next_way += 1
+                k += span
+    with open(path, 'w', encoding='utf-8') as f:
+        for key in sorted(roads):
+            f.write(json.dumps([list(key), roads[key]], ensure_ascii=False))
+            f.write('\n')
+    return sum(len(ways) for ways in roads.values())
+
+
+def percentiles(values):
+    values = sorted(values)
+    return ', '.join(f"p{p} {values[min(len(values) - 1, len(values) * p // 100)] * 1000:.2f} ms"
+                     for p in (50, 90, 99))
+
+
+def bench(router, queries=500, many=100, seed=0):
+    rng = random.Random(seed)
+    n = len(router)
+    times = []
+    for _ in range(queries):
+        s, t = rng.randrange(n), rng.randrange(n)
+        start = time.perf_counter()
+        router.path_edges(s, t)
+        times.append(time.perf_counter() - start)
+    print(f"  Điểm -> điểm ({queries} truy vấn, gồm bung lộ trình): {percentiles(times)}")
+    times = []
+    for _ in range(20):
+        s = rng.randrange(n)
+        start = time.perf_counter()
+        dijkstra(router, s, rng.randrange(n))
+        times.append(time.perf_counter() - start)
+    print(f"  Dijkstra thường (đối chiếu, 20 truy vấn): {percentiles(times)}")
+    source, targets = rng.randrange(n), [rng.randrange(n) for _ in range(many)]
+    start = time.perf_counter()
+    router.one_to_many(source, targets)
+    print(f"  1 -> {many} đích: {(time.perf_counter() - start) * 1000:.1f} ms")
+    start = time.perf_counter()
+    for _ in range(100):
+        router.nearest_node(rng.uniform(9, 18), rng.uniform(102.5, 111))
+    print(f"  Bắt điểm vào node: {(time.perf_counter() - start) * 10:.2f} ms/lần")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Đồ thị đường đi được + contraction hierarchies")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('build', help="Dựng đồ thị + CH từ trạng thái way (vn_roads_full.ways.ndjson)")
+    p.add_argument('--ways', default=ways_path(ROADS_FILE))
+    p.add_argument('--output', default=GRAPH_FILE)
+    p.add_argument('--road-types', nargs='+', metavar='TYPE', help="Chỉ lấy các loại đường này")
+    p.add_argument('--settle', type=int, default=WITNESS_SETTLE, help="Giới hạn node mỗi witness search")
+    p = sub.add_parser('route', help="Lộ trình giữa 2 điểm")
+    for name in ('lat1', 'lon1', 'lat2', 'lon2'):
+        p.add_argument(name, type=float)
+    p.add_argument('--graph', default=GRAPH_FILE)
+    p.add_argument('--geojson', metavar='FILE', help="Ghi lộ trình ra GeoJSON")
+    p = sub.add_parser('verify', help="So CH với Dijkstra thường trên các cặp ngẫu nhiên")
+    p.add_argument('--graph', default=GRAPH_FILE)
+    p.add_argument('--pairs', type=int, default=200)
+    p.add_argument('--seed', type=int, default=0)
+    p = sub.add_parser('bench', help="Đo truy vấn (mặc định trên mạng lưới giả cỡ trunk/primary toàn quốc)")
+    p.add_argument('--graph', help="File đồ thị có sẵn (không có: dựng mạng giả)")
+    p.add_argument('--size', type=int, default=200, help="Cạnh lưới giao lộ của mạng giả")
+    p.add_argument('--queries', type=int, default=500)
+    p.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        if not os.path.exists(args.ways):
+            print(f"❌ Không có {args.ways} -> chạy tools/download_vn_roads_full.py trước")
+            return 1
+        print(f"Dựng đồ thị từ {args.ways}" + (f" ({', '.join(args.road_types)})" if args.road_types else ""))
+        build(args.ways, args.output, args.road_types, args.settle)
+    elif args.command == 'route':
+        router = Router(args.graph)
+        start = time.perf_counter()
+        result = router.route(args.lat1, args.lon1, args.lat2, args.lon2)
+        seconds = time.perf_counter() - start
+        if result is None:
+            print("❌ 2 điểm không liên thông trên đồ thị")
+            return 1
+        print(f"{result['meters'] / 1000:.1f} km, {result['seconds'] / 60:.0f} phút "
+              f"(bắt điểm {result['snap_m'][0]:.0f} m / {result['snap_m'][1]:.0f} m, truy vấn {seconds * 1000:.1f} ms)")
+        for road in result['roads']:
+            label = ' '.join(filter(None, (road['ref'], road['name']))) or '(không tên)'
+            print(f"  {road['meters'] / 1000:7.1f} km  {label} [{road['road_type']}]")
+        if args.geojson:
+            with open(args.geojson, 'w', encoding='utf-8') as f:
+                json.dump({'type': 'Feature', 'properties': {k: result[k] for k in ('seconds', 'meters', 'roads')},
+                           'geometry': {'type': 'LineString', 'coordinates': result['coordinates']}},
+                          f, ensure_ascii=False)
+            print(f"  → {args.geojson}")
+    elif args.command == 'verify':
+        router = Router(args.graph)
+        errors = verify(router, args.pairs, args.seed)
+        print(f"{'✅' if not errors else '❌'} {args.pairs} cặp + one-to-many: {errors} lỗi ({len(router)} node)")
+        return 1 if errors else 0
+    elif args.command == 'bench':
+        graph = args.graph
+        if graph is None:
+            work = tempfile.mkdtemp(prefix='road_graph_')
+            ways_file, graph = os.path.join(work, 'sample.ways.ndjson'), os.path.join(work, 'sample.graph.npz')
+            count = write_sample_network(ways_file, args.size, args.seed)
+            print(f"Mạng giả {args.size}x{args.size} giao lộ, {count} way ({work})")
+            build(ways_file, graph)
+        router = Router(graph)
+        bench(router, args.queries, seed=args.seed)
+        errors = verify(router, 100, args.seed)
+        print(f"{'✅' if not errors else '❌'} Đối chiếu Dijkstra 100 cặp + one-to-many: {errors} lỗi")
+        return 1 if errors else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
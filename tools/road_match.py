@@ -0,0 +1,609 @@
+"""
+Bắt điểm GPS vào đường (map matching) theo lô: mỗi điểm -> name/ref/road_type của đường gần nhất.
+
+Chỉ mục (vn_roads_full.match.npz, dựng 1 lần từ vn_roads_full.json):
+  - mọi đoạn thẳng (2 điểm liên tiếp) của các đường: vertex đầu + chỉ số đường
+  - lưới đều CELL_SIZE độ phủ GRID_BOUNDS (= VN_BOUNDS): mỗi đoạn được ghi vào mọi ô mà bbox
+    của nó nới thêm MAX_DISTANCE_M chạm tới -> mỗi điểm chỉ cần xét danh sách của đúng 1 ô
+  - ô -> đoạn lưu dạng CSR (cell_offsets, cell_segments)
+Khoảng cách điểm-đoạn tính vector hóa trên mọi cặp (điểm, đoạn ứng viên) của cả lô, trong mặt phẳng
+chiếu cục bộ tại điểm (sai số không đáng kể ở cự ly vài chục mét); điểm xa hơn MAX_DISTANCE_M -> không bắt.
+
+Chế độ hmm (vết GPS): mỗi điểm lấy tối đa CANDIDATES đường gần nhất, chọn chuỗi đường bằng Viterbi:
+  phát xạ   Gauss theo khoảng cách tới đường (GPS_SIGMA_M)
+  chuyển    |quãng giữa 2 điểm bắt - quãng giữa 2 điểm GPS| / TRANSITION_BETA_M + ROAD_CHANGE_COST khi đổi đường
+(giống Newson & Krumm nhưng dùng khoảng cách thẳng thay cho quãng đường đi: file đường đã gộp
+không còn kết nối). Các điểm liên tiếp cùng giá trị --trace-field là 1 vết; lô không cắt ngang vết.
+
+Dùng:
+    python tools/road_match.py index
+    python tools/road_match.py run points.csv -o points_road.csv
+    python tools/road_match.py run traces.ndjson -o out.ndjson --mode hmm --trace-field trace_id
+    python tools/road_match.py point 21.0285 105.8542
+    python tools/road_match.py bench --points 1000000
+CSV cần cột lat, lon (đổi bằng --lat-col/--lon-col); NDJSON cần khóa lat, lon.
+Kết quả thêm: road_name, road_ref, road_type, road_distance_m (rỗng nếu không có đường đủ gần).
+"""
+import argparse
+import collections
+import concurrent.futures
+import csv
+import io
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from geo_arrays import EARTH_RADIUS_M, lines_array, segment_lengths
+from reverse_geocode import iter_line_chunks
+from road_provinces import iter_feature_bodies
+
+ROADS_FILE = 'assets/roads/vn_roads_full.json'
+INDEX_VERSION = 1
+GRID_BOUNDS = (8.0, 102.0, 24.0, 110.0) # min_lat, min_lon, max_lat, max_lon (= VN_BOUNDS)
+CELL_SIZE = 0.005 # Độ (~550 m): ô nhỏ -> ít ứng viên mỗi điểm ở đô thị dày đường
+MAX_DISTANCE_M = 50.0 # Xa hơn -> coi như không nằm trên đường nào
+CHUNK_LINES = 100_000 # Số dòng mỗi lô gửi cho 1 process
+PAIR_BATCH = 2_000_000 # Số cặp (điểm, đoạn) tính cùng lúc (giới hạn RAM tạm)
+CANDIDATES = 4 # Số đường ứng viên mỗi điểm (hmm)
+GPS_SIGMA_M = 10.0
+TRANSITION_BETA_M = 20.0
+ROAD_CHANGE_COST = 2.0
+OUTPUT_FIELDS = ('road_name', 'road_ref', 'road_type', 'road_distance_m')
+METERS_PER_DEGREE = np.radians(1) * EARTH_RADIUS_M
+
+
+def index_path(json_path):
+    return os.path.splitext(json_path)[0] + '.match.npz'
+
+
+# --- CHỈ MỤC ---
+
+def load_roads(json_path, road_types=None):
+    """vn_roads_full.json -> (roads [(name, ref, road_type)], coords (n, 2), offsets part, part_road)"""
+    roads, lines, part_road = [], [], []
+    for body in iter_feature_bodies(json_path):
+        feature = json.loads(body)
+        if road_types and feature['road_type'] not in road_types:
+            continue
+        parts = feature['geometry']['coordinates']
+        part_road.extend([len(roads)] * len(parts))
+        lines.extend(parts)
+        roads.append((feature['name'], feature['ref'], feature['road_type']))
+    coords, offsets = lines_array(lines)
+    return roads, coords, offsets, np.array(part_road, dtype=np.int64)
+
+
+def build_index(roads, coords, offsets, part_road, cell_size=CELL_SIZE, max_distance=MAX_DISTANCE_M,
+                bounds=GRID_BOUNDS):
+    """Các mảng của chỉ mục (dict, xem đầu file)"""
+    min_lat, min_lon, max_lat, max_lon = bounds
+    nx = int(np.ceil((max_lon - min_lon) / cell_size))
+    ny = int(np.ceil((max_lat - min_lat) / cell_size))
+    valid = np.ones(max(len(coords) - 1, 0), dtype=bool)
+    valid[offsets[1:-1][(offsets[1:-1] > 0) & (offsets[1:-1] <= len(valid))] - 1] = False
+    seg_start = np.flatnonzero(valid)
+    seg_road = np.repeat(part_road, np.maximum(np.diff(offsets) - 1, 0))
+    a, b = coords[seg_start], coords[seg_start + 1]
+    lo, hi = np.minimum(a, b), np.maximum(a, b)
+    pad_lat = max_distance / METERS_PER_DEGREE
+    pad_lon = pad_lat / np.cos(np.radians(np.minimum(np.abs(hi[:, 1]) + pad_lat, 89.0)))
+    ix0 = np.clip(np.floor((lo[:, 0] - pad_lon - min_lon) / cell_size), 0, nx - 1).astype(np.int64)
+    ix1 = np.clip(np.floor((hi[:, 0] + pad_lon - min_lon) / cell_size), 0, nx - 1).astype(np.int64)
+    iy0 = np.clip(np.floor((lo[:, 1] - pad_lat - min_lat) / cell_size), 0, ny - 1).astype(np.int64)
+    iy1 = np.clip(np.floor((hi[:, 1] + pad_lat - min_lat) / cell_size), 0, ny - 1).astype(np.int64)
+    inside = (hi[:, 0] + pad_lon >= min_lon) & (lo[:, 0] - pad_lon <= max_lon) & \
+        (hi[:, 1] + pad_lat >= min_lat) & (lo[:, 1] - pad_lat <= max_lat)
+    width = (ix1 - ix0 + 1) * inside
+    counts = width * (iy1 - iy0 + 1)
+    # Trải mỗi đoạn ra các ô trong khung [ix0, ix1] x [iy0, iy1]
+    owner = np.repeat(np.arange(len(seg_start)), counts)
+    k = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+    cells = (iy0[owner] + k // width[owner]) * nx + ix0[owner] + k % width[owner]
+    order = np.argsort(cells, kind='stable')
+    index_dtype = np.int32 if max(len(cells), len(seg_start)) < 2 ** 31 else np.int64 # Lưới dày: offsets 4 byte/ô
+    cell_offsets = np.zeros(nx * ny + 1, dtype=index_dtype)
+    np.cumsum(np.bincount(cells, minlength=nx * ny), out=cell_offsets[1:])
+    return {
+        'version': np.array(INDEX_VERSION), 'grid': np.array([min_lat, min_lon, cell_size, nx, ny]),
+        'max_distance': np.array(max_distance), 'roads': np.array(json.dumps(roads, ensure_ascii=False)),
+        'coords': coords, 'seg_start': seg_start, 'seg_road': seg_road.astype(np.int32),
+        'cell_offsets': cell_offsets, 'cell_segments': owner[order].astype(index_dtype),
+    }
+
+
+def write_index(json_path, out_path=None, road_types=None, cell_size=CELL_SIZE, max_distance=MAX_DISTANCE_M):
+    out_path = out_path or index_path(json_path)
+    arrays = build_index(*load_roads(json_path, road_types), cell_size=cell_size, max_distance=max_distance)
+    tmp_path = out_path + '.part.npz' # np.savez tự thêm đuôi .npz
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, out_path)
+    return arrays
+
+
+class RoadMatcher:
+    """Điểm -> đường gần nhất / các đường ứng viên trên 1 chỉ mục"""
+
+    def __init__(self, arrays):
+        if int(arrays['version']) != INDEX_VERSION:
+            raise ValueError(f"Chỉ mục phiên bản {int(arrays['version'])} (cần {INDEX_VERSION}) -> dựng lại")
+        self.roads = [tuple(key) for key in json.loads(str(arrays['roads']))]
+        min_lat, min_lon, cell_size, nx, ny = arrays['grid'].tolist()
+        self.min_lat, self.min_lon, self.cell_size, self.nx, self.ny = min_lat, min_lon, cell_size, int(nx), int(ny)
+        self.max_distance = float(arrays['max_distance'])
+        self.coords = arrays['coords']
+        self.seg_start = arrays['seg_start']
+        self.seg_road = arrays['seg_road']
+        self.cell_offsets = arrays['cell_offsets']
+        self.cell_segments = arrays['cell_segments']
+        self._csv_suffixes = None
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls({name: data[name] for name in data.files})
+
+    def __len__(self):
+        return len(self.seg_start)
+
+    def _pairs(self, lats, lons):
+        """Duyệt theo lô các cặp (điểm, đoạn) trong bán kính: (pt, seg, khoảng cách m, lon, lat điểm bắt),
+        pt tăng dần, các cặp của cùng 1 điểm nằm liền nhau"""
+        ix = np.floor((lons - self.min_lon) / self.cell_size)
+        iy = np.floor((lats - self.min_lat) / self.cell_size)
+        inside = np.flatnonzero((ix >= 0) & (ix < self.nx) & (iy >= 0) & (iy < self.ny)) # NaN -> False
+        cells = iy[inside].astype(np.int64) * self.nx + ix[inside].astype(np.int64)
+        starts = self.cell_offsets[cells]
+        counts = self.cell_offsets[cells + 1] - starts
+        budget = np.cumsum(counts)
+        first = 0
+        while first < len(inside):
+            last = max(int(np.searchsorted(budget, budget[first] - counts[first] + PAIR_BATCH, side='right')),
+                       first + 1)
+            c = counts[first:last]
+            pt = np.repeat(inside[first:last], c)
+            k = np.arange(int(c.sum())) - np.repeat(np.cumsum(c) - c, c)
+            seg = self.cell_segments[np.repeat(starts[first:last], c) + k]
+            first = last
+            if not len(seg):
+                continue
+            lat, lon = lats[pt], lons[pt]
+            scale = np.cos(np.radians(lat))
+            v = self.seg_start[seg]
+            ax, ay = (self.coords[v, 0] - lon) * scale, self.coords[v, 1] - lat
+            dx, dy = (self.coords[v + 1, 0] - lon) * scale - ax, self.coords[v + 1, 1] - lat - ay
+            norm = dx * dx + dy * dy
+            t = np.clip(-(ax * dx + ay * dy) / np.where(norm > 0, norm, 1.0), 0.0, 1.0)
+            px, py = ax + t * dx, ay + t * dy
+            dist = np.hypot(px, py) * METERS_PER_DEGREE
+            near = dist <= self.max_distance
+            yield pt[near], seg[near], dist[near], lon[near] + px[near] / scale[near], lat[near] + py[near]
+
+    def nearest(self, lats, lons):
+        """(chỉ số đường (-1: không có), khoảng cách m, lon, lat điểm bắt) cho mảng lat/lon"""
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        road = np.full(len(lats), -1, dtype=np.int64)
+        dist = np.full(len(lats), np.nan)
+        snap_lon, snap_lat = np.full(len(lats), np.nan), np.full(len(lats), np.nan)
+        for pt, seg, d, x, y in self._pairs(lats, lons):
+            if not len(pt):
+                continue
+            # Cặp gần nhất của mỗi điểm: min theo nhóm liền nhau rồi lấy cặp đầu tiên đạt min
+            group_starts = np.flatnonzero(np.r_[True, pt[1:] != pt[:-1]])
+            best = np.minimum.reduceat(d, group_starts)
+            sizes = np.diff(np.r_[group_starts, len(pt)])
+            hit = np.flatnonzero(d == np.repeat(best, sizes))
+            hit = hit[np.r_[True, pt[hit[1:]] != pt[hit[:-1]]]]
+            p = pt[hit]
+            road[p], dist[p], snap_lon[p], snap_lat[p] = self.seg_road[seg[hit]], d[hit], x[hit], y[hit]
+        return road, dist, snap_lon, snap_lat
+
+    def candidates(self, lats, lons, k=CANDIDATES):
+        """Tối đa k đường gần nhất mỗi điểm (mỗi đường lấy đoạn gần nhất), sắp theo (điểm, khoảng cách):
+        (pt, road, khoảng cách m, lon, lat điểm bắt)"""
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        out = [[] for _ in range(5)]
+        for pt, seg, d, x, y in self._pairs(lats, lons):
+            road = self.seg_road[seg]
+            order = np.lexsort((d, road, pt))
+            pt, road, d, x, y = pt[order], road[order], d[order], x[order], y[order]
+            keep = np.r_[True, (pt[1:] != pt[:-1]) | (road[1:] != road[:-1])]
+            pt, road, d, x, y = pt[keep], road[keep], d[keep], x[keep], y[keep]
+            order = np.lexsort((d, pt))
+            pt, road, d, x, y = pt[order], road[order], d[order], x[order], y[order]
+            group_starts = np.flatnonzero(np.r_[True, pt[1:] != pt[:-1]])
+            rank = np.arange(len(pt)) - np.repeat(group_starts, np.diff(np.r_[group_starts, len(pt)]))
+            keep = rank < k
+            for column, values in zip(out, (pt, road, d, x, y)):
+                column.append(values[keep])
+        return tuple(np.concatenate(column) if column else np.zeros(0) for column in out)
+
+    def match_trace(self, lats, lons, k=CANDIDATES):
+        """Viterbi trên 1 vết GPS (điểm theo thứ tự thời gian) -> giống nearest()
+        Điểm không có ứng viên cắt vết thành các đoạn độc lập"""
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        n = len(lats)
+        pt, road, d, x, y = self.candidates(lats, lons, k)
+        pt = pt.astype(np.int64)
+        slot = np.arange(len(pt)) - np.searchsorted(pt, pt)
+        cand_road = np.full((n, k), -1, dtype=np.int64)
+        emission = np.full((n, k), np.inf)
+        cand_x, cand_y, cand_d = np.zeros((n, k)), np.zeros((n, k)), np.zeros((n, k))
+        cand_road[pt, slot] = road
+        emission[pt, slot] = 0.5 * (d / GPS_SIGMA_M) ** 2
+        cand_x[pt, slot], cand_y[pt, slot], cand_d[pt, slot] = x, y, d
+        result = (np.full(n, -1, dtype=np.int64), np.full(n, np.nan), np.full(n, np.nan), np.full(n, np.nan))
+        if n == 0:
+            return result
+        # Chi phí chuyển của mọi bước (n - 1, k, k), tính 1 lần
+        step = segment_lengths(np.column_stack([lons, lats])) if n >= 2 else np.zeros(0)
+        lat1, lat2 = np.radians(cand_y[:-1, :, None]), np.radians(cand_y[1:, None, :])
+        dlon = np.radians(cand_x[1:, None, :] - cand_x[:-1, :, None])
+        h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+        snapped = 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+        transition = np.abs(snapped - step[:, None, None]) / TRANSITION_BETA_M + \
+            ROAD_CHANGE_COST * (cand_road[:-1, :, None] != cand_road[1:, None, :])
+        back = np.zeros((n, k), dtype=np.int64)
+        score = np.empty((n, k))
+        score[0] = emission[0]
+        starts = [0]
+        columns = np.arange(k)
+        for t in range(1, n):
+            total = score[t - 1][:, None] + transition[t - 1]
+            back[t] = np.argmin(total, axis=0)
+            score[t] = total[back[t], columns] + emission[t]
+            if not np.isfinite(score[t]).any(): # Đứt vết: bắt đầu lại từ điểm t
+                starts.append(t)
+                score[t] = emission[t]
+        for begin, end in zip(starts, starts[1:] + [n]):
+            j = int(np.argmin(score[end - 1]))
+            if not np.isfinite(score[end - 1, j]): # Đoạn toàn điểm không có ứng viên
+                continue
+            for t in range(end - 1, begin - 1, -1):
+                result[0][t], result[1][t] = cand_road[t, j], cand_d[t, j]
+                result[2][t], result[3][t] = cand_x[t, j], cand_y[t, j]
+                j = int(back[t, j])
+        return result
+
+    def csv_suffixes(self):
+        """Phần đuôi CSV ",name,ref,road_type," của từng đường (phần tử cuối: không bắt được)"""
+        if self._csv_suffixes is None:
+            out = io.StringIO()
+            csv.writer(out, lineterminator='\n').writerows(('',) + road + ('',) for road in self.roads)
+            self._csv_suffixes = out.getvalue().splitlines() + [',,,,']
+        return self._csv_suffixes
+
+    def fields(self, road, dist):
+        """Giá trị OUTPUT_FIELDS cho từng điểm"""
+        empty = ('', '', '', '')
+        return [self.roads[r] + (round(m, 1),) if r >= 0 else empty
+                for r, m in zip(road.tolist(), dist.tolist())]
+
+
+# --- XỬ LÝ FILE THEO LÔ (PROCESS POOL) ---
+
+_matcher = None # Mỗi process nạp chỉ mục 1 lần (initializer)
+
+
+def _init_worker(index_file):
+    global _matcher
+    _matcher = RoadMatcher.load(index_file)
+
+
+def _parse_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float('nan')
+
+
+def _match(lats, lons, traces, mode):
+    """(chỉ số đường, khoảng cách m) của từng điểm theo chế độ nearest / hmm"""
+    lats = np.array(lats, dtype=np.float64)
+    lons = np.array(lons, dtype=np.float64)
+    if mode == 'nearest':
+        return _matcher.nearest(lats, lons)[:2]
+    road, dist = np.full(len(lats), -1, dtype=np.int64), np.full(len(lats), np.nan)
+    bounds = [i for i in range(1, len(traces)) if traces[i] != traces[i - 1]]
+    for begin, end in zip([0] + bounds, bounds + [len(traces)]):
+        road[begin:end], dist[begin:end] = _matcher.match_trace(lats[begin:end], lons[begin:end])[:2]
+    return road, dist
+
+
+def match_csv_lines(lines, lat_col, lon_col, trace_col, mode):
+    """Các dòng CSV (không header) -> text CSV có thêm OUTPUT_FIELDS"""
+    rows = list(csv.reader(lines))
+    lats = [_parse_float(row[lat_col]) if len(row) > lat_col else float('nan') for row in rows]
+    lons = [_parse_float(row[lon_col]) if len(row) > lon_col else float('nan') for row in rows]
+    traces = [row[trace_col] if trace_col is not None and len(row) > trace_col else None for row in rows]
+    road, dist = _match(lats, lons, traces, mode)
+    if len(rows) == len(lines):
+        # Mỗi bản ghi đúng 1 dòng: nối phần cột mới (đã dựng sẵn theo đường) vào dòng gốc, không ghi lại cả dòng
+        suffixes, eol = _matcher.csv_suffixes(), '\r\n'
+        return ''.join(f"{line.rstrip(eol)}{suffixes[r]}{d:.1f}\n" if r >= 0 else f"{line.rstrip(eol)}{suffixes[r]}\n"
+                       for line, r, d in zip(lines, road.tolist(), dist.tolist()))
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator='\n')
+    writer.writerows(row + list(values) for row, values in zip(rows, _matcher.fields(road, dist)))
+    return out.getvalue()
+
+
+def match_ndjson_lines(lines, lat_key, lon_key, trace_key, mode):
+    """Các dòng NDJSON -> NDJSON có thêm OUTPUT_FIELDS (road_distance_m = null nếu không bắt được)"""
+    records = [json.loads(line) for line in lines if line.strip()]
+    lats = [_parse_float(r.get(lat_key)) for r in records]
+    lons = [_parse_float(r.get(lon_key)) for r in records]
+    traces = [r.get(trace_key) for r in records] if trace_key else [None] * len(records)
+    out = []
+    for record, values in zip(records, _matcher.fields(*_match(lats, lons, traces, mode))):
+        record.update(zip(OUTPUT_FIELDS, values))
+        if values[3] == '':
+            record['road_distance_m'] = None
+        out.append(json.dumps(record, ensure_ascii=False))
+    return '\n'.join(out) + '\n' if out else ''
+
+
+def _run_chunk(task):
+    fmt, lines, lat, lon, trace, mode = task
+    if fmt == 'csv':
+        return len(lines), match_csv_lines(lines, lat, lon, trace, mode)
+    return len(lines), match_ndjson_lines(lines, lat, lon, trace, mode)
+
+
+def iter_trace_chunks(f, size, trace_of):
+    """Như iter_line_chunks nhưng kéo dài lô tới hết vết đang dở (chỉ parse vài dòng ở mép lô)"""
+    chunk, tail = [], None
+    for line in f:
+        if tail is not None and trace_of(line) != tail:
+            yield chunk
+            chunk, tail = [], None
+        chunk.append(line)
+        if tail is None and len(chunk) >= size:
+            tail = trace_of(line)
+    if chunk:
+        yield chunk
+
+
+def match_file(input_path, output_path, index_file, fmt=None, workers=None, lat_field='lat', lon_field='lon',
+               trace_field=None, mode='nearest', chunk_lines=CHUNK_LINES):
+    """Stream file CSV/NDJSON qua process pool, giữ nguyên thứ tự dòng. Trả về số điểm đã xử lý"""
+    if fmt is None:
+        fmt = 'ndjson' if input_path.endswith(('.ndjson', '.jsonl')) else 'csv'
+    workers = workers or os.cpu_count() or 1
+    src = sys.stdin if input_path == '-' else open(input_path, 'r', encoding='utf-8', newline='')
+    dst = sys.stdout if output_path == '-' else open(output_path, 'w', encoding='utf-8', newline='')
+    try:
+        lat, lon, trace = lat_field, lon_field, trace_field
+        if fmt == 'csv':
+            header = next(csv.reader([src.readline()]))
+            missing = [f for f in (lat_field, lon_field, trace_field) if f is not None and f not in header]
+            if missing:
+                raise ValueError(f"CSV thiếu cột {missing} (có: {header})")
+            lat, lon = header.index(lat_field), header.index(lon_field)
+            trace = header.index(trace_field) if trace_field else None
+            csv.writer(dst, lineterminator='\n').writerow(header + list(OUTPUT_FIELDS))
+        if mode == 'hmm' and trace is not None:
+            if fmt == 'csv':
+                def trace_of(line):
+                    row = next(csv.reader([line]), [])
+                    return row[trace] if len(row) > trace else None
+            else:
+                def trace_of(line):
+                    return json.loads(line).get(trace) if line.strip() else None
+            chunks = iter_trace_chunks(src, chunk_lines, trace_of)
+        else:
+            chunks = iter_line_chunks(src, chunk_lines)
+        tasks = ((fmt, chunk, lat, lon, trace, mode) for chunk in chunks)
+
+        total = 0
+        if workers == 1:
+            _init_worker(index_file)
+            for count, text in map(_run_chunk, tasks):
+                dst.write(text)
+                total += count
+            return total
+
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_worker, initargs=(index_file,)) as executor:
+            # Giới hạn số lô đang chờ để không đọc cả file vào RAM; ghi theo đúng thứ tự
+            in_flight = collections.deque()
+            for task in tasks:
+                in_flight.append(executor.submit(_run_chunk, task))
+                if len(in_flight) >= 2 * workers:
+                    count, text = in_flight.popleft().result()
+                    dst.write(text)
+                    total += count
+            while in_flight:
+                count, text = in_flight.popleft().result()
+                dst.write(text)
+                total += count
+        return total
+    finally:
+        if src is not sys.stdin:
+            src.close()
+        if dst is not sys.stdout:
+            dst.close()
+
+
+# --- KIỂM TRA / BENCHMARK ---
+
+def sample_network(roads=100_000, seed=0):
+    """Mạng đường giả cỡ toàn quốc: polyline ~100 m/bước dồn quanh vài chục "đô thị" (dày như nội thành)
+    -> (roads, coords, offsets, part_road) như load_roads"""
+    rng = np.random.default_rng(seed)
+    centers = np.column_stack([rng.uniform(102.5, 109.0, 40), rng.uniform(8.8, 23.0, 40)])
+    sizes = rng.integers(4, 30, roads)
+    origin = centers[rng.integers(0, len(centers), roads)] + rng.normal(0, 0.15, (roads, 2))
+    heading = rng.uniform(0, 2 * np.pi, roads)
+    offsets = np.zeros(roads + 1, dtype=np.int64)
+    np.cumsum(sizes, out=offsets[1:])
+    owner = np.repeat(np.arange(roads), sizes)
+    turn = np.repeat(heading, sizes) + rng.normal(0, 0.2, len(owner))
+    step = np.column_stack([np.cos(turn), np.sin(turn)]) * 0.0009
+    step[offsets[:-1]] = 0
+    coords = np.repeat(origin, sizes, axis=0) + np.cumsum(step, axis=0) - \
+        np.repeat(np.cumsum(step, axis=0)[offsets[:-1]], sizes, axis=0)
+    types = ('motorway', 'trunk', 'primary', 'secondary', 'tertiary')
+    keys = [(f"Đường {i}", f"QL{i}" if i % 10 == 0 else '', types[i % len(types)]) for i in range(roads)]
+    return keys, np.round(coords, 7), offsets, np.arange(roads)
+
+
+def points_near_roads(matcher, count, noise_m=15.0, seed=0):
+    """Điểm GPS giả: điểm ngẫu nhiên trên các đoạn + nhiễu Gauss noise_m"""
+    rng = np.random.default_rng(seed)
+    seg = rng.integers(0, len(matcher), count)
+    v = matcher.seg_start[seg]
+    t = rng.uniform(0, 1, (count, 1))
+    points = matcher.coords[v] + t * (matcher.coords[v + 1] - matcher.coords[v])
+    lat_noise = rng.normal(0, noise_m, count) / METERS_PER_DEGREE
+    lon_noise = rng.normal(0, noise_m, count) / METERS_PER_DEGREE / np.cos(np.radians(points[:, 1]))
+    return points[:, 1] + lat_noise, points[:, 0] + lon_noise
+
+
+def verify_matcher(matcher, lats, lons):
+    """So nearest() với duyệt mọi đoạn: khoảng cách phải bằng min thật (trong bán kính). Trả về số lỗi"""
+    road, dist, _, _ = matcher.nearest(lats, lons)
+    a = matcher.coords[matcher.seg_start]
+    b = matcher.coords[matcher.seg_start + 1]
+    bad = 0
+    for i, (lat, lon) in enumerate(zip(lats.tolist(), lons.tolist())):
+        scale = np.cos(np.radians(lat))
+        ax, ay = (a[:, 0] - lon) * scale, a[:, 1] - lat
+        dx, dy = (b[:, 0] - lon) * scale - ax, b[:, 1] - lat - ay
+        norm = dx * dx + dy * dy
+        t = np.clip(-(ax * dx + ay * dy) / np.where(norm > 0, norm, 1.0), 0.0, 1.0)
+        d = np.hypot(ax + t * dx, ay + t * dy) * METERS_PER_DEGREE
+        j = int(np.argmin(d))
+        expected = d[j] if d[j] <= matcher.max_distance else np.nan
+        if not (np.isnan(expected) and road[i] < 0 or np.isclose(expected, dist[i], atol=1e-6)):
+            bad += 1
+    return bad
+
+
+def sample_trace(matcher, road_parts, length, noise_m, seed):
+    """Vết GPS giả dọc 1 part dài (điểm mỗi ~20 m + nhiễu): (lats, lons, đường thật)"""
+    rng = np.random.default_rng(seed)
+    coords, offsets, part_road = road_parts
+    long_parts = np.flatnonzero(np.diff(offsets) >= 10)
+    part = int(rng.choice(long_parts))
+    line = coords[offsets[part]:offsets[part + 1]]
+    cum = np.r_[0, np.cumsum(segment_lengths(line))]
+    at = np.linspace(0, cum[-1], min(length, max(int(cum[-1] / 20), 2)))
+    points = np.column_stack([np.interp(at, cum, line[:, 0]), np.interp(at, cum, line[:, 1])])
+    lats = points[:, 1] + rng.normal(0, noise_m, len(at)) / METERS_PER_DEGREE
+    lons = points[:, 0] + rng.normal(0, noise_m, len(at)) / METERS_PER_DEGREE / np.cos(np.radians(points[:, 1]))
+    return lats, lons, int(part_road[part])
+
+
+def bench(args):
+    start = time.time()
+    if args.roads:
+        network = load_roads(args.roads)
+        label = args.roads
+    else:
+        network = sample_network(args.sample_roads, args.seed)
+        label = f"mạng giả {args.sample_roads} đường"
+    arrays = build_index(*network)
+    matcher = RoadMatcher(arrays)
+    cells = np.diff(matcher.cell_offsets)
+    print(f"Chỉ mục ({label}): {len(matcher)} đoạn, {int((cells > 0).sum())} ô có đoạn, trung bình "
+          f"{cells[cells > 0].mean():.1f} / tối đa {int(cells.max())} đoạn mỗi ô, {time.time() - start:.1f}s")
+
+    lats, lons = points_near_roads(matcher, args.points, seed=args.seed)
+    start = time.perf_counter()
+    road, _, _, _ = matcher.nearest(lats, lons)
+    elapsed = time.perf_counter() - start
+    print(f"Bắt {args.points} điểm (1 process, chưa tính đọc/ghi file): {elapsed:.2f}s = "
+          f"{args.points / elapsed:,.0f} điểm/s ({int((road >= 0).sum())} điểm bắt được)")
+    start = time.perf_counter()
+    matcher.candidates(lats[:100_000], lons[:100_000])
+    elapsed = time.perf_counter() - start
+    print(f"  {CANDIDATES} ứng viên/điểm (hmm): {min(args.points, 100_000) / elapsed:,.0f} điểm/s")
+
+    hits = {'nearest': 0, 'hmm': 0}
+    total = 0
+    start = time.perf_counter()
+    for i in range(args.traces):
+        t_lats, t_lons, truth = sample_trace(matcher, network[1:], 200, args.noise, args.seed + i)
+        total += len(t_lats)
+        hits['nearest'] += int((matcher.nearest(t_lats, t_lons)[0] == truth).sum())
+        hits['hmm'] += int((matcher.match_trace(t_lats, t_lons)[0] == truth).sum())
+    elapsed = time.perf_counter() - start
+    print(f"Vết GPS (nhiễu {args.noise:g} m, {args.traces} vết / {total} điểm, {total / elapsed:,.0f} điểm/s): "
+          f"đúng đường {hits['nearest'] / max(total, 1):.1%} (gần nhất) -> {hits['hmm'] / max(total, 1):.1%} (hmm)")
+
+    sample = min(args.points, 500)
+    bad = verify_matcher(matcher, lats[:sample], lons[:sample])
+    print(f"{'✅' if not bad else '❌'} Đối chiếu {sample} điểm với duyệt mọi đoạn: {bad} sai lệch")
+    return 1 if bad else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bắt điểm GPS vào đường (map matching) theo lô")
+    parser.add_argument('--roads', default=ROADS_FILE, help="File đường (vn_roads_full.json)")
+    parser.add_argument('--index', help="File chỉ mục (mặc định: cạnh file đường, .match.npz)")
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p = sub.add_parser('index', help="Dựng chỉ mục đoạn đường")
+    p.add_argument('--road-types', nargs='+', metavar='TYPE', help="Chỉ lấy các loại đường này")
+    p.add_argument('--cell-size', type=float, default=CELL_SIZE)
+    p.add_argument('--max-distance', type=float, default=MAX_DISTANCE_M, help="Bán kính bắt điểm (m)")
+    p = sub.add_parser('run', help="Xử lý file CSV / NDJSON ('-' = stdin/stdout)")
+    p.add_argument('input')
+    p.add_argument('-o', '--output', default='-')
+    p.add_argument('--format', choices=('csv', 'ndjson'))
+    p.add_argument('--mode', choices=('nearest', 'hmm'), default='nearest')
+    p.add_argument('--trace-field', help="Cột/khóa id vết (hmm); không có: mỗi lô là 1 vết")
+    p.add_argument('--workers', type=int, default=None, help="Số process (mặc định: số CPU)")
+    p.add_argument('--lat-col', default='lat')
+    p.add_argument('--lon-col', default='lon')
+    p.add_argument('--chunk-lines', type=int, default=CHUNK_LINES)
+    p = sub.add_parser('point', help="Bắt 1 điểm")
+    p.add_argument('lat', type=float)
+    p.add_argument('lon', type=float)
+    p = sub.add_parser('bench', help="Đo tốc độ + độ đúng (mặc định trên mạng đường giả cỡ toàn quốc)")
+    p.add_argument('--roads', dest='bench_roads', metavar='FILE', help="Dùng file đường thật thay mạng giả")
+    p.add_argument('--sample-roads', type=int, default=100_000)
+    p.add_argument('--points', type=int, default=1_000_000)
+    p.add_argument('--traces', type=int, default=50)
+    p.add_argument('--noise', type=float, default=20.0, help="Nhiễu GPS của vết giả (m)")
+    p.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    index_file = args.index or index_path(args.roads)
+
+    if args.cmd == 'index':
+        start = time.time()
+        arrays = write_index(args.roads, index_file, args.road_types, args.cell_size, args.max_distance)
+        print(f"✅ {len(arrays['seg_start'])} đoạn, {len(arrays['cell_segments'])} mục ô "
+              f"({time.time() - start:.1f}s, {os.path.getsize(index_file) / (1024 * 1024):.1f} MB) → {index_file}")
+    elif args.cmd in ('run', 'point'):
+        if not os.path.exists(index_file):
+            print(f"Chưa có {index_file} -> dựng từ {args.roads}", file=sys.stderr)
+            write_index(args.roads, index_file)
+        if args.cmd == 'point':
+            matcher = RoadMatcher.load(index_file)
+            road, dist, lon, lat = matcher.nearest([args.lat], [args.lon])
+            if road[0] < 0:
+                print(f"(không có đường trong {matcher.max_distance:g} m)")
+                return 1
+            name, ref, road_type = matcher.roads[road[0]]
+            print(f"{' '.join(filter(None, (ref, name))) or '(không tên)'} [{road_type}], "
+                  f"{dist[0]:.1f} m, điểm bắt {lat[0]:.7f}, {lon[0]:.7f}")
+            return 0
+        start = time.time()
+        total = match_file(args.input, args.output, index_file, args.format, args.workers, args.lat_col,
+                           args.lon_col, args.trace_field, args.mode, args.chunk_lines)
+        elapsed = time.time() - start
+        print(f"✅ {total} điểm trong {elapsed:.1f}s ({total / max(elapsed, 1e-9):,.0f} điểm/s)", file=sys.stderr)
+    elif args.cmd == 'bench':
+        args.roads = args.bench_roads
+        return bench(args)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,367 @@
+"""
+Ghép không gian đường × tỉnh: mỗi con đường đi qua những tỉnh nào, bao nhiêu mét trong từng tỉnh.
+
+Tính sẵn 1 lần cho cả 2 bộ ranh giới (63 tỉnh cũ và 34 đơn vị 2025):
+  - STRtree các polygon tỉnh (đã prepare), truy vấn theo lô MultiLineString
+  - đường nằm trọn trong 1 tỉnh (contains_properly) -> chiều dài cả đường, không cần cắt
+  - đường cắt ranh giới -> shapely.intersection vector hóa trên các cặp (đường, tỉnh),
+    chiều dài từng phần cắt tính bằng haversine (geo_arrays.part_lengths)
+  - các lô feature chạy song song trên process pool (mỗi process nạp ranh giới 1 lần)
+
+Kết quả:
+  vn_roads_full.provinces.ndjson  dòng i = feature i của vn_roads_full.json (cùng chỉ số .vngb/.rtree):
+      {"i", "name", "ref", "road_type", "length_m",
+       "provinces": [{"name", "length_m"}...], "provinces_old": [...]}
+  road_provinces_summary.csv      boundary, province, road_type, roads, length_km
+
+Dùng:
+    python tools/road_provinces.py run
+    python tools/road_provinces.py query "Lâm Đồng" --ref QL
+    python tools/road_provinces.py verify --sample 2000
+"""
+import argparse
+import collections
+import concurrent.futures
+import csv
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from geo_arrays import lines_array, part_lengths
+from road_search import normalize, split_refs
+
+try:
+    import shapely
+    from shapely.geometry import shape
+    from road_shards import road_geometries
+except ImportError:
+    shapely = None
+
+ROADS_FILE = 'assets/roads/vn_roads_full.json'
+BOUNDARIES_FILE = 'assets/boundaries/vn_boundaries.json'
+BOUNDARIES_2025_FILE = 'assets/boundaries/vn_boundaries_2025.json'
+SUMMARY_FILE = 'assets/roads/road_provinces_summary.csv'
+CHUNK_FEATURES = 2000 # Số đường mỗi lô gửi cho 1 process
+MIN_LENGTH_M = 1.0    # Bỏ phần giao ngắn hơn (đường chỉ chạm / chạy sát ranh giới)
+# (khóa trong file kết quả, nhãn trong bảng tổng hợp)
+BOUNDARY_SETS = (('provinces', '2025'), ('provinces_old', '63 tỉnh'))
+
+
+def sidecar_path(json_path):
+    return os.path.splitext(json_path)[0] + '.provinces.ndjson'
+
+
+def iter_feature_bodies(json_path):
+    """Dòng feature (bytes, chưa parse) của file do RoadsJsonWriter ghi - parse trong worker"""
+    with open(json_path, 'rb') as f:
+        for line in f:
+            stripped = line.strip()
+            if stripped.startswith(b'{"'):
+                yield stripped[:-1] if stripped.endswith(b',') else stripped
+
+
+def geodesic_lengths(geoms):
+    """Chiều dài (mét, haversine) của từng geometry; chỉ tính phần LineString
+    (kết quả intersection có thể là GeometryCollection lẫn điểm)"""
+    parts, owner = shapely.get_parts(geoms, return_index=True)
+    parts, inner = shapely.get_parts(parts, return_index=True)
+    owner = owner[inner]
+    lines = shapely.get_type_id(parts) == 1
+    parts, owner = parts[lines], owner[lines]
+    result = np.zeros(len(geoms))
+    if not len(parts):
+        return result
+    coords, part_idx = shapely.get_coordinates(parts, return_index=True)
+    offsets = np.zeros(len(parts) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(part_idx, minlength=len(parts)), out=offsets[1:])
+    return np.bincount(owner, weights=part_lengths(coords, offsets), minlength=len(geoms))
+
+
+class ProvinceJoin:
+    """Lô đường -> các cặp (đường, tỉnh, mét) cho 1 file ranh giới"""
+
+    def __init__(self, boundaries_file):
+        with open(boundaries_file, 'r', encoding='utf-8') as f:
+            features = [feat for feat in json.load(f).get('features', [])
+                        if feat.get('type') == 'province']
+        self.names = [feat['name'] for feat in features]
+        self.polygons = np.array([shape(feat['geometry']) for feat in features], dtype=object)
+        shapely.prepare(self.polygons)
+        self.tree = shapely.STRtree(self.polygons)
+
+    def join(self, geoms, road_lengths):
+        road_idx, province_idx = self.tree.query(geoms, predicate='intersects')
+        inside = shapely.contains_properly(self.polygons[province_idx], geoms[road_idx])
+        lengths = np.empty(len(road_idx))
+        lengths[inside] = road_lengths[road_idx[inside]]
+        cut = ~inside
+        if cut.any():
+            clipped = shapely.intersection(geoms[road_idx[cut]], self.polygons[province_idx[cut]])
+            lengths[cut] = geodesic_lengths(clipped)
+        keep = lengths >= MIN_LENGTH_M
+        return road_idx[keep], province_idx[keep], lengths[keep]
+
+
+class RoadProvinceJoiner:
+    """Ghép cùng lúc với cả 2 bộ ranh giới (thứ tự như BOUNDARY_SETS)"""
+
+    def __init__(self, new_file=BOUNDARIES_2025_FILE, old_file=BOUNDARIES_FILE):
+        self.joins = [ProvinceJoin(new_file), ProvinceJoin(old_file)]
+
+    def join_features(self, features):
+        """-> list (name, ref, road_type, length_m, [[(tỉnh, mét)...] cho mỗi bộ ranh giới])"""
+        counts = [len(feat['geometry']['coordinates']) for feat in features]
+        coords, offsets = lines_array([seg for feat in features for seg in feat['geometry']['coordinates']])
+        geoms = road_geometries(coords, offsets, counts)
+        road_parts = np.zeros(len(features) + 1, dtype=np.int64)
+        np.cumsum(counts, out=road_parts[1:])
+        road_lengths = np.add.reduceat(part_lengths(coords, offsets), road_parts[:-1])
+
+        per_set = []
+        for join in self.joins:
+            rows = [[] for _ in features]
+            for r, p, m in zip(*(a.tolist() for a in join.join(geoms, road_lengths))):
+                rows[r].append((p, m))
+            per_set.append(rows)
+        return [(feat.get('name'), feat.get('ref'), feat.get('road_type'), float(road_lengths[i]),
+                 [rows[i] for rows in per_set])
+                for i, feat in enumerate(features)]
+
+
+# --- XỬ LÝ THEO LÔ (PROCESS POOL) ---
+
+_joiner = None # Mỗi process nạp ranh giới 1 lần (initializer)
+
+
+def _init_worker(new_file, old_file):
+    global _joiner
+    _joiner = RoadProvinceJoiner(new_file, old_file)
+
+
+def _join_chunk(bodies):
+    return _joiner.join_features([json.loads(body) for body in bodies])
+
+
+def _iter_chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_joined(json_path, workers=None, new_file=BOUNDARIES_2025_FILE, old_file=BOUNDARIES_FILE,
+                chunk_features=CHUNK_FEATURES):
+    """Stream kết quả ghép theo đúng thứ tự feature trong file"""
+    workers = workers or os.cpu_count() or 1
+    chunks = _iter_chunks(iter_feature_bodies(json_path), chunk_features)
+    if workers == 1:
+        _init_worker(new_file, old_file)
+        for chunk in chunks:
+            yield from _join_chunk(chunk)
+        return
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                                initargs=(new_file, old_file)) as executor:
+        # Giới hạn số lô đang chờ để không đọc cả file vào RAM
+        in_flight = collections.deque()
+        for chunk in chunks:
+            in_flight.append(executor.submit(_join_chunk, chunk))
+            if len(in_flight) >= 2 * workers:
+                yield from in_flight.popleft().result()
+        while in_flight:
+            yield from in_flight.popleft().result()
+
+
+def province_names(new_file=BOUNDARIES_2025_FILE, old_file=BOUNDARIES_FILE):
+    names = []
+    for path in (new_file, old_file):
+        with open(path, 'r', encoding='utf-8') as f:
+            names.append([feat['name'] for feat in json.load(f).get('features', [])
+                          if feat.get('type') == 'province'])
+    return names
+
+
+def run(json_path=ROADS_FILE, out_path=None, summary_path=SUMMARY_FILE, workers=None,
+        new_file=BOUNDARIES_2025_FILE, old_file=BOUNDARIES_FILE):
+    """Ghi file kết quả theo từng đường + bảng tổng hợp. Trả về bảng tổng hợp
+    {(nhãn bộ ranh giới, tỉnh, road_type): [số đường, mét]}"""
+    out_path = out_path or sidecar_path(json_path)
+    names = province_names(new_file, old_file)
+    summary = collections.defaultdict(lambda: [0, 0.0])
+    outside = [0.0, 0.0]
+    total_m = 0.0
+    count = 0
+    start = time.time()
+    with open(out_path + '.part', 'w', encoding='utf-8') as f:
+        for i, (name, ref, road_type, length, sets) in enumerate(
+                iter_joined(json_path, workers, new_file, old_file)):
+            record = {'i': i, 'name': name, 'ref': ref, 'road_type': road_type, 'length_m': round(length, 1)}
+            for s, ((key, label), rows) in enumerate(zip(BOUNDARY_SETS, sets)):
+                rows = sorted(rows, key=lambda row: -row[1])
+                record[key] = [{'name': names[s][p], 'length_m': round(m, 1)} for p, m in rows]
+                for p, m in rows:
+                    entry = summary[(label, names[s][p], road_type)]
+                    entry[0] += 1
+                    entry[1] += m
+                outside[s] += max(0.0, length - sum(m for _, m in rows))
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            total_m += length
+            count += 1
+    os.replace(out_path + '.part', out_path)
+
+    with open(summary_path + '.part', 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(['boundary', 'province', 'road_type', 'roads', 'length_km'])
+        for (label, province, road_type), (roads, meters) in sorted(summary.items()):
+            writer.writerow([label, province, road_type, roads, f"{meters / 1000:.3f}"])
+    os.replace(summary_path + '.part', summary_path)
+
+    elapsed = time.time() - start
+    print(f"✅ {count} con đường, {total_m / 1000:,.0f} km trong {elapsed:.1f}s "
+          f"({count / max(elapsed, 1e-9):,.0f} đường/s) → {out_path}")
+    for s, (_, label) in enumerate(BOUNDARY_SETS):
+        print(f"  {label}: {outside[s] / 1000:,.1f} km nằm ngoài mọi tỉnh")
+    print(f"  Bảng tổng hợp → {summary_path}")
+    return summary
+
+
+def print_summary(summary, label=BOUNDARY_SETS[0][1]):
+    """Bảng km đường theo tỉnh (1 bộ ranh giới), cột theo road_type"""
+    totals = collections.defaultdict(float)
+    by_type = collections.defaultdict(dict)
+    types = set()
+    for (set_label, province, road_type), (_, meters) in summary.items():
+        if set_label != label:
+            continue
+        totals[province] += meters
+        by_type[province][road_type] = meters
+        types.add(road_type)
+    types = sorted(types, key=lambda t: -sum(by_type[p].get(t, 0) for p in by_type))
+    print(f"\n{'Tỉnh (' + label + ')':<28} {'Tổng km':>10}" + ''.join(f" {t[:12]:>12}" for t in types))
+    for province in sorted(totals, key=lambda p: -totals[p]):
+        print(f"{province:<28} {totals[province] / 1000:>10,.1f}" +
+              ''.join(f" {by_type[province].get(t, 0) / 1000:>12,.1f}" for t in types))
+
+
+def load_summary(path=SUMMARY_FILE):
+    summary = {}
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            summary[(row['boundary'], row['province'], row['road_type'])] = \
+                [int(row['roads']), float(row['length_km']) * 1000]
+    return summary
+
+
+def query(path, province, ref_prefix=None, road_type=None, old=False, limit=30):
+    """Các đường (gộp theo ref, không có ref thì theo tên) đi qua tỉnh khớp `province`,
+    kèm số km trong tỉnh đó"""
+    key = BOUNDARY_SETS[1][0] if old else BOUNDARY_SETS[0][0]
+    wanted = normalize(province)
+    prefix = normalize(ref_prefix) if ref_prefix else None
+    totals = collections.defaultdict(float)
+    matched = set()
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            if road_type and record['road_type'] != road_type:
+                continue
+            for entry in record[key]:
+                if wanted not in normalize(entry['name']):
+                    continue
+                matched.add(entry['name'])
+                refs = [r for r in split_refs(record['ref']) if r]
+                if prefix:
+                    refs = [r for r in refs if normalize(r).startswith(prefix)]
+                    if not refs:
+                        continue
+                for label in refs or [record['name'] or '(không tên)']:
+                    totals[label] += entry['length_m']
+    return sorted(matched), sorted(totals.items(), key=lambda kv: -kv[1])[:limit]
+
+
+def verify(json_path=ROADS_FILE, sample=1000, new_file=BOUNDARIES_2025_FILE, old_file=BOUNDARIES_FILE):
+    """Đối chiếu với cách làm trực tiếp (intersection với mọi tỉnh, không STRtree, không
+    bỏ qua đường nằm trọn) trên `sample` đường đầu tiên. Trả về số sai lệch"""
+    features = []
+    for body in iter_feature_bodies(json_path):
+        features.append(json.loads(body))
+        if len(features) >= sample:
+            break
+    joiner = RoadProvinceJoiner(new_file, old_file)
+    start = time.perf_counter()
+    results = joiner.join_features(features)
+    elapsed = time.perf_counter() - start
+
+    geoms = np.array([shape(feat['geometry']) for feat in features], dtype=object)
+    bad = 0
+    for s, join in enumerate(joiner.joins):
+        expected = np.stack([geodesic_lengths(shapely.intersection(geoms, polygon))
+                             for polygon in join.polygons], axis=1)
+        for i, (_, _, _, length, sets) in enumerate(results):
+            got = np.zeros(len(join.polygons))
+            for p, m in sets[s]:
+                got[p] = m
+            want = np.where(expected[i] >= MIN_LENGTH_M, expected[i], 0.0)
+            if not np.allclose(got, want, rtol=1e-6, atol=1e-3) or got.sum() > length + 1e-3:
+                bad += 1
+    print(f"Ghép {len(features)} đường: {elapsed:.2f}s ({len(features) / max(elapsed, 1e-9):,.0f} đường/s)")
+    print(f"{'✅' if not bad else '❌'} Đối chiếu với intersection trực tiếp: {bad} sai lệch")
+    return bad
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ghép đường × tỉnh (63 tỉnh và 2025), chiều dài theo tỉnh")
+    parser.add_argument('--old', default=BOUNDARIES_FILE, help="File ranh giới 63 tỉnh")
+    parser.add_argument('--new', default=BOUNDARIES_2025_FILE, help="File ranh giới 2025")
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p = sub.add_parser('run', help="Ghép toàn bộ file đường, ghi kết quả + bảng tổng hợp")
+    p.add_argument('roads', nargs='?', default=ROADS_FILE)
+    p.add_argument('-o', '--output', help="Mặc định: <roads>.provinces.ndjson")
+    p.add_argument('--summary', default=SUMMARY_FILE)
+    p.add_argument('--workers', type=int, default=None, help="Số process (mặc định: số CPU)")
+    p = sub.add_parser('summary', help="In bảng km đường theo tỉnh từ file tổng hợp")
+    p.add_argument('--summary', default=SUMMARY_FILE)
+    p.add_argument('--old-set', action='store_true', help="Theo 63 tỉnh cũ thay vì 2025")
+    p = sub.add_parser('query', help="Các đường đi qua 1 tỉnh, km trong tỉnh")
+    p.add_argument('province', help="Tên tỉnh (không cần dấu, khớp 1 phần)")
+    p.add_argument('--ref', help="Chỉ lấy ref bắt đầu bằng (vd. QL, ĐT)")
+    p.add_argument('--type', help="Chỉ lấy road_type (vd. trunk)")
+    p.add_argument('--old-set', action='store_true', help="Theo 63 tỉnh cũ thay vì 2025")
+    p.add_argument('--input', default=sidecar_path(ROADS_FILE))
+    p.add_argument('--limit', type=int, default=30)
+    p = sub.add_parser('verify', help="Đối chiếu với intersection trực tiếp trên 1 mẫu")
+    p.add_argument('roads', nargs='?', default=ROADS_FILE)
+    p.add_argument('--sample', type=int, default=1000)
+    args = parser.parse_args()
+
+    if args.cmd == 'summary':
+        print_summary(load_summary(args.summary), BOUNDARY_SETS[1 if args.old_set else 0][1])
+        return 0
+    if args.cmd == 'query':
+        provinces, rows = query(args.input, args.province, args.ref, args.type, args.old_set, args.limit)
+        if not provinces:
+            print(f"❌ Không có đường nào qua tỉnh khớp '{args.province}'")
+            return 1
+        print(f"Tỉnh: {', '.join(provinces)}")
+        for label, meters in rows:
+            print(f"  {label:<30} {meters / 1000:10,.2f} km")
+        return 0
+
+    if shapely is None:
+        print("❌ Cần shapely >= 2.0 (pip install shapely)")
+        return 1
+    if args.cmd == 'run':
+        summary = run(args.roads, args.output, args.summary, args.workers, args.new, args.old)
+        print_summary(summary)
+        return 0
+    return 1 if verify(args.roads, args.sample, args.new, args.old) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,306 @@
+"""
+Chỉ mục tìm kiếm đường dựng sẵn lúc build (không phân biệt dấu).
+
+App (lib/data/vn_roads.dart, getSuggestions) chuẩn hóa name/ref của mọi con đường
+ở mỗi lần gõ phím rồi chạy `contains` trên toàn bộ danh sách. File chỉ mục này
+làm sẵn phần đó:
+  - refs:  mảng key đã sắp xếp (QL1A -> "ql1a", ĐT741 -> "dt741") -> exact/prefix bằng tìm nhị phân
+  - names: tên đã bỏ dấu + chỉ mục trigram -> "contains" chỉ kiểm tra vài ứng viên
+Thứ tự kết quả giống hệt Dart: khớp chính xác > bắt đầu bằng > ref chứa > tên chứa,
+kể cả giới hạn dừng sớm ở 30 kết quả (theo thứ tự feature trong file).
+
+Khác Dart duy nhất ở bước chuẩn hóa: bỏ dấu tiếng Việt (đ -> d) trước khi lọc [a-z0-9],
+nên "Đường Láng" tìm được bằng "duong lang" (Dart cũ chỉ còn "nglng").
+
+Dùng:
+    python tools/road_search.py build assets/roads/vn_roads_full.json
+    python tools/road_search.py query assets/roads/vn_roads_full.search.json "QL1"
+    python tools/road_search.py verify assets/roads/vn_roads_full.json
+"""
+import argparse
+import bisect
+import heapq
+import json
+import os
+import random
+import re
+import time
+import unicodedata
+
+FORMAT_VERSION = 1
+ROAD_PREFIXES = ('ct', 'ql', 'tl', 'hl', 'dt', 'ah') # Giống roadPrefixes trong vn_roads.dart
+MAX_SUGGESTIONS = 10
+EARLY_STOP = 30 # Dart dừng quét khi đã gom đủ 30 kết quả
+NAME_POS = 1 << 30 # Trong 1 feature, Dart xét ref trước rồi mới tới tên
+
+_NON_ALNUM = re.compile(r'[^a-z0-9]')
+_REF_SPLIT = re.compile(r'[;,]')
+
+# Nhóm ưu tiên
+EXACT, PREFIX, REF_CONTAINS, NAME_CONTAINS = range(4)
+
+
+def normalize(text):
+    """Chữ thường, bỏ dấu, chỉ giữ [a-z0-9]: "ĐT.741" -> "dt741", "Đường Láng" -> "duonglang" """
+    text = unicodedata.normalize('NFD', text.lower().replace('đ', 'd'))
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return _NON_ALNUM.sub('', text)
+
+
+def split_refs(ref):
+    """Tách ref đa trị giống Dart: "QL.10;QL.37B" -> ["QL.10", "QL.37B"] (giữ cả phần rỗng)"""
+    return [r.strip() for r in _REF_SPLIT.split(ref or '')]
+
+
+def name_suggestion(name, refs):
+    primary = refs[0] if refs else ''
+    return f"{primary} {name}" if primary else name
+
+
+def trigrams(key):
+    return {key[i:i + 3] for i in range(len(key) - 2)}
+
+
+def index_path(data_path):
+    return os.path.splitext(data_path)[0] + '.search.json'
+
+
+def build_search_index(records):
+    """records: iterable (name, ref) theo đúng thứ tự feature trong file đường"""
+    refs = {} # (key, ref) -> [[feature, vị trí trong ref đa trị], ...]
+    names = {} # (key, suggestion) -> [feature, ...]
+    count = 0
+    for fid, (name, ref) in enumerate(records):
+        count += 1
+        parts = split_refs(ref)
+        for pos, clean in enumerate(parts):
+            if clean:
+                refs.setdefault((normalize(clean), clean), []).append([fid, pos])
+        key = normalize(name or '')
+        if key:
+            names.setdefault((key, name_suggestion(name, parts)), []).append(fid)
+
+    ref_entries = [[key, label, postings] for (key, label), postings in sorted(refs.items())]
+    name_entries = [[key, label, postings] for (key, label), postings in names.items()]
+    return {
+        'version': FORMAT_VERSION,
+        'features': count,
+        'refs': ref_entries,
+        'ref_trigrams': _trigram_postings(ref_entries),
+        'names': name_entries,
+        'name_trigrams': _trigram_postings(name_entries),
+    }
+
+
+def _trigram_postings(entries):
+    postings = {}
+    for i, entry in enumerate(entries):
+        for tri in sorted(trigrams(entry[0])):
+            postings.setdefault(tri, []).append(i)
+    return postings
+
+
+def write_search_index(path, records):
+    index = build_search_index(records)
+    tmp_path = path + '.part'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, path)
+    return index
+
+
+class RoadSearchIndex:
+    def __init__(self, index):
+        if isinstance(index, str):
+            with open(index, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        if index.get('version') != FORMAT_VERSION:
+            raise ValueError(f"Phiên bản chỉ mục tìm kiếm {index.get('version')} không hỗ trợ")
+        self.refs = index['refs']
+        self.ref_keys = [entry[0] for entry in self.refs]
+        self.ref_trigrams = index['ref_trigrams']
+        self.names = index['names']
+        self.name_trigrams = index['name_trigrams']
+        # Key ngắn hơn 3 ký tự không có trigram nào
+        self.short_refs = [i for i, entry in enumerate(self.refs) if len(entry[0]) < 3]
+        self.short_names = [i for i, entry in enumerate(self.names) if len(entry[0]) < 3]
+
+    def _contains(self, entries, postings, short, query):
+        """Chỉ số các entry có key chứa query, lọc ứng viên bằng trigram"""
+        if len(query) < 3:
+            # Key chứa query ngắn <=> có 1 trigram chứa query (hoặc key ngắn hơn 3 ký tự)
+            candidates = set()
+            for tri, hits in postings.items():
+                if query in tri:
+                    candidates.update(hits)
+            candidates.update(i for i in short if query in entries[i][0])
+            return candidates
+        candidates = None
+        for tri in sorted(trigrams(query), key=lambda t: len(postings.get(t, ()))):
+            hits = postings.get(tri)
+            if not hits:
+                return []
+            candidates = set(hits) if candidates is None else candidates.intersection(hits)
+            if not candidates:
+                return []
+        return [i for i in candidates if query in entries[i][0]]
+
+    def suggestions(self, query, limit=MAX_SUGGESTIONS):
+        """Gợi ý theo đúng thứ tự ưu tiên của getSuggestions() trong vn_roads.dart"""
+        q = normalize(query)
+        if not q:
+            return []
+        is_road_code = q.startswith(ROAD_PREFIXES)
+
+        # Mỗi entry khớp đóng góp đúng 1 nhãn, tại feature đầu tiên của nó
+        # -> chỉ cần (feature đầu, vị trí, nhóm, nhãn) cho mỗi entry
+        events = []
+        ref_hits = []
+        lo = bisect.bisect_left(self.ref_keys, q)
+        hi = bisect.bisect_left(self.ref_keys, q + '\x7f')
+        for i in range(lo, hi):
+            key, label, postings = self.refs[i]
+            ref_hits.append(postings)
+            events.append((*postings[0], EXACT if key == q else PREFIX, label))
+        if not is_road_code:
+            for i in self._contains(self.refs, self.ref_trigrams, self.short_refs, q):
+                key, label, postings = self.refs[i]
+                if not key.startswith(q):
+                    ref_hits.append(postings)
+                    events.append((*postings[0], REF_CONTAINS, label))
+            # Thêm entry tên chỉ làm ngưỡng dừng sớm nhỏ đi -> ngưỡng tính từ ref là cận trên
+            bound = _cutoff(events)
+            ref_matched = {fid for postings in ref_hits for fid, _ in postings if fid <= bound}
+            for i in self._contains(self.names, self.name_trigrams, self.short_names, q):
+                _, label, postings = self.names[i]
+                if postings[0] > bound:
+                    continue
+                # Feature đã khớp theo ref thì Dart không xét tên
+                fid = next((f for f in postings if f not in ref_matched), None)
+                if fid is not None and fid <= bound:
+                    events.append((fid, NAME_POS, NAME_CONTAINS, label))
+        if len(events) > EARLY_STOP:
+            # Dart dừng sau feature làm tổng đạt EARLY_STOP: giữ mọi entry tới feature đó
+            cutoff = _cutoff(events)
+            events = [e for e in events if e[0] <= cutoff]
+        events.sort()
+        return _rank(events, limit)
+
+
+def _cutoff(events):
+    """Feature mà tại đó Dart đã gom đủ EARLY_STOP kết quả (vô cùng nếu chưa đủ)"""
+    if len(events) < EARLY_STOP:
+        return float('inf')
+    return heapq.nsmallest(EARLY_STOP, events)[-1][0]
+
+
+def _rank(events, limit):
+    """Ghép 4 nhóm theo thứ tự ưu tiên (events đã sắp theo feature, mỗi nhãn 1 lần)"""
+    groups = ([], [], [], [])
+    for _, _, group, label in events:
+        groups[group].append(label)
+    groups[PREFIX].sort(key=lambda label: len(normalize(label)))
+    return [label for group in groups for label in group][:limit]
+
+
+def scan_suggestions(records, query, limit=MAX_SUGGESTIONS):
+    """Bản dịch thẳng getSuggestions() (quét toàn bộ) để đối chiếu với chỉ mục"""
+    q = normalize(query)
+    if not q:
+        return []
+    is_road_code = q.startswith(ROAD_PREFIXES)
+    groups = ([], [], [], [])
+    for name, ref in records:
+        parts = split_refs(ref)
+        ref_matched = False
+        for clean in parts:
+            if not clean:
+                continue
+            key = normalize(clean)
+            if key == q:
+                group = EXACT
+            elif key.startswith(q):
+                group = PREFIX
+            elif not is_road_code and q in key:
+                group = REF_CONTAINS
+            else:
+                continue
+            if clean not in groups[group]:
+                groups[group].append(clean)
+            ref_matched = True
+        if not ref_matched and not is_road_code and q in normalize(name or ''):
+            suggestion = name_suggestion(name, parts)
+            if suggestion not in groups[NAME_CONTAINS]:
+                groups[NAME_CONTAINS].append(suggestion)
+        if sum(len(g) for g in groups) >= EARLY_STOP:
+            break
+    groups[PREFIX].sort(key=lambda label: len(normalize(label)))
+    return [label for group in groups for label in group][:limit]
+
+
+def read_records(json_path):
+    with open(json_path, 'r', encoding='utf-8') as f:
+        features = json.load(f).get('features', [])
+    return [(feat.get('name', ''), feat.get('ref', '')) for feat in features]
+
+
+def verify(records, index, samples=500, seed=0):
+    """So kết quả chỉ mục với bản quét toàn bộ trên các truy vấn lấy từ chính dữ liệu"""
+    rng = random.Random(seed)
+    pool = [text for record in records for text in record if text]
+    queries = ['ql1', 'ct', 'dt7', 'ah', 'duong', 'cau', 'a', '1']
+    for _ in range(samples):
+        key = normalize(rng.choice(pool)) if pool else ''
+        if key:
+            start = rng.randrange(len(key))
+            queries.append(key[start:start + rng.randint(1, 6)])
+    mismatches = 0
+    for q in queries:
+        expected = scan_suggestions(records, q)
+        got = index.suggestions(q)
+        if got != expected:
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"❌ '{q}': chỉ mục {got} != quét {expected}")
+    return len(queries), mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chỉ mục tìm kiếm tên/ref đường")
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p = sub.add_parser('build', help="Dựng file .search.json từ file JSON đường")
+    p.add_argument('json_path')
+    p.add_argument('out_path', nargs='?')
+    p = sub.add_parser('query', help="Gợi ý cho 1 từ khóa")
+    p.add_argument('index_path')
+    p.add_argument('query')
+    p = sub.add_parser('verify', help="Đối chiếu chỉ mục với bản quét toàn bộ")
+    p.add_argument('json_path')
+    p.add_argument('--samples', type=int, default=500)
+    args = parser.parse_args()
+
+    if args.cmd == 'build':
+        start = time.time()
+        out_path = args.out_path or index_path(args.json_path)
+        index = write_search_index(out_path, read_records(args.json_path))
+        print(f"✅ {len(index['refs'])} ref, {len(index['names'])} tên → {out_path} "
+              f"({os.path.getsize(out_path) / 1024:.0f} KB, {time.time() - start:.2f}s)")
+    elif args.cmd == 'query':
+        index = RoadSearchIndex(args.index_path)
+        start = time.perf_counter()
+        result = index.suggestions(args.query)
+        print(f"({(time.perf_counter() - start) * 1e3:.2f} ms)")
+        for label in result:
+            print(f"  {label}")
+    elif args.cmd == 'verify':
+        records = read_records(args.json_path)
+        index = RoadSearchIndex(build_search_index(records))
+        total, mismatches = verify(records, index, args.samples)
+        if mismatches:
+            print(f"❌ {mismatches}/{total} truy vấn khác kết quả")
+            raise SystemExit(1)
+        print(f"✅ {total} truy vấn khớp hoàn toàn với bản quét toàn bộ")
+
+
+if __name__ == '__main__':
+    main()
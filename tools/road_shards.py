@@ -0,0 +1,441 @@
+"""
+Chia file đường theo vùng (shard) để client chỉ tải phần nằm trong khung nhìn.
+
+Mỗi shard là 1 tỉnh 2025 (mode 'province', polygon lấy từ vn_boundaries_2025.json)
+hoặc 1 ô lưới GRID_SIZE độ (mode 'grid'). Shard chỉ chứa feature nằm trong nó;
+đường cắt qua ranh giới được cắt (clip) thành các phần nằm trong từng shard
+("clipped": true, bbox tính lại). Đường không thuộc shard nào vào shard 'khac'.
+
+File shard cùng bố cục với vn_roads_full.json (header + mỗi feature 1 dòng + total),
+kèm manifest.json: bbox [min_lat, min_lon, max_lat, max_lon], số feature, số byte,
+sha1 nội dung feature. Shard có nội dung không đổi giữ nguyên file cũ (không ghi lại),
+shard không còn trong manifest mới bị xóa.
+
+Dùng:
+    python tools/road_shards.py build assets/roads/vn_roads_full.json --mode grid
+    python tools/road_shards.py verify assets/roads/shards
+    python tools/road_shards.py info assets/roads/shards
+"""
+import argparse
+import collections
+import hashlib
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from geo_arrays import lines_array
+from road_search import normalize
+from spatial_index import scan_json_features
+
+try:
+    import shapely
+    from shapely.geometry import shape
+except ImportError: # Không có shapely -> không chia shard được (vẫn import được module)
+    shapely = None
+
+SHARD_DIR = 'assets/roads/shards'
+MANIFEST_FILE = 'manifest.json'
+BOUNDARIES_2025_FILE = 'assets/boundaries/vn_boundaries_2025.json'
+MODES = ('province', 'grid')
+GRID_SIZE = 1.0                    # Cạnh ô lưới (độ) cho mode 'grid'
+GRID_BOUNDS = (8.0, 102.0, 24.0, 110.0) # min_lat, min_lon, max_lat, max_lon
+OTHER_KEY = 'khac'                 # Shard cho đường không nằm trong vùng nào
+MANIFEST_VERSION = 1
+COORD_DIGITS = 7                   # Làm tròn toạ độ các điểm cắt mới sinh ra
+MAX_OPEN_SHARDS = 64               # Số file shard mở cùng lúc (lưới nhỏ có thể có hàng nghìn ô)
+VERIFY_TOLERANCE = 1e-6            # Độ (≈ 0.1 m), bù sai số làm tròn khi kiểm tra
+NAME_PREFIXES = ('Thành phố ', 'Tỉnh ')
+
+
+def shard_slug(name):
+    """"Thành phố Hà Nội" -> "ha-noi" (tên file ổn định, không dấu)"""
+    for prefix in NAME_PREFIXES:
+        if name.startswith(prefix):
+            name = name[len(prefix):]
+            break
+    return '-'.join(filter(None, (normalize(word) for word in name.split())))
+
+
+def grid_key(lat, lon):
+    return f"grid_{lat:g}_{lon:g}"
+
+
+def province_regions(boundaries_file=BOUNDARIES_2025_FILE):
+    """[(key, tên, geometry shapely)] cho 34 tỉnh 2025"""
+    with open(boundaries_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    regions = []
+    for feat in data.get('features', []):
+        if feat.get('type') == 'province':
+            regions.append((shard_slug(feat['name']), feat['name'], shape(feat['geometry'])))
+    return regions
+
+
+def grid_regions(grid_size=GRID_SIZE, bounds=GRID_BOUNDS):
+    min_lat, min_lon, max_lat, max_lon = bounds
+    lats = np.arange(min_lat, max_lat, grid_size)
+    lons = np.arange(min_lon, max_lon, grid_size)
+    return [(grid_key(lat, lon), f"{lat:g},{lon:g} +{grid_size:g}°",
+             shapely.box(lon, lat, lon + grid_size, lat + grid_size))
+            for lat in lats.tolist() for lon in lons.tolist()]
+
+
+def load_regions(mode, boundaries_file=BOUNDARIES_2025_FILE, grid_size=GRID_SIZE, bounds=GRID_BOUNDS):
+    if mode == 'province':
+        return province_regions(boundaries_file)
+    if mode == 'grid':
+        return grid_regions(grid_size, bounds)
+    raise ValueError(f"mode shard không hợp lệ: {mode}")
+
+
+def line_bbox(coords):
+    """bbox [min_lat, min_lon, max_lat, max_lon] của mảng (n, 2) [lon, lat]"""
+    lo, hi = coords.min(axis=0), coords.max(axis=0)
+    return [float(lo[1]), float(lo[0]), float(hi[1]), float(hi[0])]
+
+
+def road_geometries(coords, offsets, counts):
+    """Mảng MultiLineString shapely, 1 phần tử / đường (counts = số segment của từng đường)"""
+    line_ids = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    lines = shapely.linestrings(coords, indices=line_ids)
+    return shapely.multilinestrings(lines, indices=np.repeat(np.arange(len(counts)), counts))
+
+
+def read_header(json_path):
+    """Các khóa trước "features" của file do RoadsJsonWriter ghi (version, generated, source...)"""
+    lines = []
+    with open(json_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip().startswith('"features"'):
+                break
+            lines.append(line)
+    text = ''.join(lines).strip().lstrip('{').rstrip().rstrip(',')
+    return json.loads('{' + text + '}')
+
+
+def load_manifest(shard_dir):
+    path = os.path.join(shard_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class _ShardFile:
+    """1 file shard ghi streaming; mở lại ở chế độ append khi bị đóng bớt (MAX_OPEN_SHARDS)"""
+
+    def __init__(self, path, header):
+        self.path = path
+        self.tmp_path = path + '.part'
+        self.header = header
+        self.f = None
+        self.features = 0
+        self.clipped = 0
+        self.bbox = None
+        self.sha1 = hashlib.sha1()
+
+    def open(self):
+        if self.features:
+            self.f = open(self.tmp_path, 'ab')
+            return
+        self.f = open(self.tmp_path, 'wb')
+        self.f.write(b'{\n')
+        for key, value in self.header.items():
+            self.f.write(f'  {json.dumps(key)}: {json.dumps(value, ensure_ascii=False)},\n'.encode('utf-8'))
+        self.f.write(b'  "features": [')
+
+    def add(self, feature, clipped):
+        self.add_text(json.dumps(feature, ensure_ascii=False), feature['bbox'], clipped)
+
+    def add_text(self, text, bbox, clipped=False):
+        body = text.encode('utf-8')
+        self.sha1.update(body)
+        self.f.write(b',\n    ' if self.features else b'\n    ')
+        self.f.write(body)
+        self.features += 1
+        self.clipped += clipped
+        if self.bbox is None:
+            self.bbox = list(bbox)
+        else:
+            self.bbox = [min(self.bbox[0], bbox[0]), min(self.bbox[1], bbox[1]),
+                         max(self.bbox[2], bbox[2]), max(self.bbox[3], bbox[3])]
+
+    def suspend(self):
+        self.f.close()
+        self.f = None
+
+    def close(self, old_sha1=None):
+        """Ghi xong; trả về True nếu file thay đổi (nội dung giống cũ -> giữ file cũ)"""
+        if self.f is None:
+            self.f = open(self.tmp_path, 'ab')
+        self.f.write(f'\n  ],\n  "total": {self.features}\n}}\n'.encode('utf-8'))
+        self.f.close()
+        self.f = None
+        if old_sha1 == self.sha1.hexdigest() and os.path.exists(self.path):
+            os.remove(self.tmp_path)
+            return False
+        os.replace(self.tmp_path, self.path)
+        return True
+
+
+class ShardWriter:
+    """Nhận các lô feature đường (cùng lô numpy với write_roads_json), phân vào shard
+
+    Truy vấn STRtree lấy các cặp (feature, vùng) giao nhau; feature nằm trọn trong vùng
+    (contains_properly, polygon đã prepare) ghi nguyên, còn lại mới phải cắt bằng
+    shapely.intersection - thường chỉ vài % số đường (đường cắt qua ranh giới)."""
+
+    def __init__(self, shard_dir=SHARD_DIR, mode='province', boundaries_file=BOUNDARIES_2025_FILE,
+                 grid_size=GRID_SIZE, bounds=GRID_BOUNDS, header=None):
+        if shapely is None:
+            raise RuntimeError("Cần shapely để chia shard (pip install shapely)")
+        self.shard_dir = shard_dir
+        self.mode = mode
+        self.grid_size = grid_size
+        self.header = dict(header or {})
+        regions = load_regions(mode, boundaries_file, grid_size, bounds)
+        self.keys = [key for key, _, _ in regions]
+        self.names = {key: name for key, name, _ in regions}
+        self.names[OTHER_KEY] = 'Ngoài các vùng'
+        self.geometries = np.array([geom for _, _, geom in regions], dtype=object)
+        shapely.prepare(self.geometries)
+        self.tree = shapely.STRtree(self.geometries)
+        self.files = {}
+        self.open_files = collections.OrderedDict()
+        self.roads = 0
+        self.cut = 0
+        self.start = time.time()
+        os.makedirs(shard_dir, exist_ok=True)
+
+    def _file(self, key):
+        shard = self.files.get(key)
+        if shard is None:
+            header = dict(self.header, shard={'key': key, 'name': self.names[key], 'mode': self.mode})
+            shard = self.files[key] = _ShardFile(os.path.join(self.shard_dir, key + '.json'), header)
+        if shard.f is None:
+            if len(self.open_files) >= MAX_OPEN_SHARDS:
+                _, oldest = self.open_files.popitem(last=False)
+                oldest.suspend()
+            shard.open()
+            self.open_files[key] = shard
+        else:
+            self.open_files.move_to_end(key)
+        return shard
+
+    def add_batch(self, features, arrays=None, road_parts=None, texts=None):
+        """features: list feature đường (MultiLineString); arrays: (coords, offsets) của
+        mọi segment theo thứ tự (geo_arrays.lines_array) nếu đã có sẵn.
+        Từ write_roads_json: road_parts (segment của từng đường) + texts (JSON đã render)
+        thay cho geometry -> features chỉ cần name/ref/road_type/bbox"""
+        if not features:
+            return
+        if road_parts is not None:
+            counts = np.diff(road_parts)
+        else:
+            counts = [len(feat['geometry']['coordinates']) for feat in features]
+        if arrays is None:
+            arrays = lines_array([seg for feat in features for seg in feat['geometry']['coordinates']])
+        coords, offsets = arrays
+        geoms = road_geometries(coords, offsets, counts)
+
+        def add_whole(key, i):
+            if texts is not None:
+                self._file(key).add_text(texts[i], features[i]['bbox'])
+            else:
+                self._file(key).add(features[i], False)
+
+        feature_idx, region_idx = self.tree.query(geoms, predicate='intersects')
+        inside = shapely.contains_properly(self.geometries[region_idx], geoms[feature_idx])
+        placed = np.zeros(len(features), dtype=bool)
+        for i, j, whole in zip(feature_idx.tolist(), region_idx.tolist(), inside.tolist()):
+            if whole:
+                add_whole(self.keys[j], i)
+            else:
+                feature = self._clip(features[i], geoms[i], self.geometries[j])
+                if feature is None: # Chỉ chạm ranh giới (giao là điểm)
+                    continue
+                self.cut += 1
+                self._file(self.keys[j]).add(feature, True)
+            placed[i] = True
+        for i in np.flatnonzero(~placed).tolist():
+            add_whole(OTHER_KEY, i)
+        self.roads += len(features)
+
+    @staticmethod
+    def _clip(feature, geom, region):
+        parts = shapely.get_parts(shapely.get_parts(shapely.intersection(geom, region)))
+        parts = parts[(shapely.get_type_id(parts) == 1) & ~shapely.is_empty(parts)]
+        if not len(parts):
+            return None
+        segments = [np.round(shapely.get_coordinates(part), COORD_DIGITS) for part in parts]
+        bbox = line_bbox(np.concatenate(segments))
+        clipped = {key: value for key, value in feature.items() if key not in ('bbox', 'geometry')}
+        clipped['bbox'] = bbox
+        clipped['clipped'] = True
+        clipped['geometry'] = {'type': 'MultiLineString', 'coordinates': [seg.tolist() for seg in segments]}
+        return clipped
+
+    def close(self):
+        """Đóng mọi shard, ghi manifest.json (atomic), xóa shard cũ không còn dùng"""
+        old = load_manifest(self.shard_dir) or {}
+        old_sha1 = {entry['key']: entry.get('sha1') for entry in old.get('shards', [])}
+        entries, changed = [], 0
+        order = {key: i for i, key in enumerate(self.keys + [OTHER_KEY])}
+        for key in sorted(self.files, key=order.get):
+            shard = self.files[key]
+            changed += shard.close(old_sha1.get(key))
+            entries.append({
+                'key': key,
+                'name': self.names[key],
+                'file': os.path.basename(shard.path),
+                'bbox': [round(v, COORD_DIGITS) for v in shard.bbox],
+                'features': shard.features,
+                'clipped': shard.clipped,
+                'bytes': os.path.getsize(shard.path),
+                'sha1': shard.sha1.hexdigest(),
+            })
+        self.open_files.clear()
+        manifest = {
+            'version': MANIFEST_VERSION,
+            'generated': time.strftime("%Y-%m-%d"),
+            'mode': self.mode,
+            'roads': self.roads,
+            'total': sum(entry['features'] for entry in entries),
+            'shards': entries,
+        }
+        if self.mode == 'grid':
+            manifest['grid_size'] = self.grid_size
+        path = os.path.join(self.shard_dir, MANIFEST_FILE)
+        with open(path + '.part', 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+        os.replace(path + '.part', path)
+
+        current = {entry['file'] for entry in entries}
+        removed = 0
+        for entry in old.get('shards', []):
+            stale = os.path.join(self.shard_dir, entry['file'])
+            if entry['file'] not in current and os.path.exists(stale):
+                os.remove(stale)
+                removed += 1
+        print(f"  Shard ({self.mode}): {len(entries)} shard, {manifest['total']} feature "
+              f"({self.cut} phần cắt từ đường qua ranh giới), {changed} file thay đổi, {removed} file cũ bị xóa, "
+              f"{time.time() - self.start:.1f}s → {self.shard_dir}")
+        return manifest
+
+
+def build_from_json(json_path, shard_dir=SHARD_DIR, mode='province', boundaries_file=BOUNDARIES_2025_FILE,
+                    grid_size=GRID_SIZE, batch_size=5000):
+    """Chia shard lại từ file vn_roads_full.json có sẵn (không cần tải / đọc PBF lại)"""
+    writer = ShardWriter(shard_dir, mode, boundaries_file, grid_size, header=read_header(json_path))
+    batch = []
+    for _, _, feature in scan_json_features(json_path):
+        batch.append(feature)
+        if len(batch) >= batch_size:
+            writer.add_batch(batch)
+            batch = []
+    writer.add_batch(batch)
+    return writer.close()
+
+
+def verify_shards(shard_dir=SHARD_DIR, boundaries_file=BOUNDARIES_2025_FILE):
+    """Danh sách lỗi: manifest khớp file (số feature, byte, sha1), feature nằm trong bbox
+    shard và (nếu có shapely) nằm trong vùng của shard"""
+    manifest = load_manifest(shard_dir)
+    if manifest is None:
+        return [f"Không có {MANIFEST_FILE} trong {shard_dir}"]
+    errors = []
+    regions = {}
+    if shapely is not None:
+        try:
+            regions = {key: geom for key, _, geom in
+                       load_regions(manifest['mode'], boundaries_file, manifest.get('grid_size', GRID_SIZE))}
+        except OSError as e:
+            print(f"⚠️ Bỏ qua kiểm tra theo vùng: {e}")
+    total = 0
+    for entry in manifest['shards']:
+        path = os.path.join(shard_dir, entry['file'])
+        if not os.path.exists(path):
+            errors.append(f"{entry['key']}: thiếu file {entry['file']}")
+            continue
+        if os.path.getsize(path) != entry['bytes']:
+            errors.append(f"{entry['key']}: {os.path.getsize(path)} byte, manifest ghi {entry['bytes']}")
+        sha1 = hashlib.sha1()
+        count = 0
+        geoms = []
+        min_lat, min_lon, max_lat, max_lon = entry['bbox']
+        with open(path, 'rb') as f:
+            for offset, length, feature in scan_json_features(path):
+                f.seek(offset)
+                sha1.update(f.read(length))
+                count += 1
+                b = feature['bbox']
+                if b[0] < min_lat or b[1] < min_lon or b[2] > max_lat or b[3] > max_lon:
+                    errors.append(f"{entry['key']}: feature {count - 1} ({feature.get('name')}) "
+                                  f"ra ngoài bbox shard")
+                if entry['key'] in regions:
+                    geoms.append(shape(feature['geometry']))
+        if count != entry['features']:
+            errors.append(f"{entry['key']}: {count} feature, manifest ghi {entry['features']}")
+        if sha1.hexdigest() != entry['sha1']:
+            errors.append(f"{entry['key']}: sha1 không khớp manifest")
+        if geoms:
+            region = shapely.buffer(regions[entry['key']], VERIFY_TOLERANCE)
+            outside = np.flatnonzero(~shapely.covers(region, np.array(geoms, dtype=object)))
+            for i in outside[:5].tolist():
+                errors.append(f"{entry['key']}: feature {i} nằm ngoài vùng shard")
+        total += count
+    if total != manifest['total']:
+        errors.append(f"Tổng {total} feature, manifest ghi {manifest['total']}")
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chia file đường thành shard theo tỉnh 2025 / ô lưới")
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p = sub.add_parser('build', help="Chia shard từ file JSON đường có sẵn")
+    p.add_argument('json_path')
+    p.add_argument('--out', default=SHARD_DIR, help=f"Thư mục shard (mặc định {SHARD_DIR})")
+    p.add_argument('--mode', choices=MODES, default='province')
+    p.add_argument('--grid-size', type=float, default=GRID_SIZE, help="Cạnh ô lưới (độ) cho --mode grid")
+    p.add_argument('--boundaries', default=BOUNDARIES_2025_FILE)
+    p = sub.add_parser('verify', help="Kiểm tra manifest và nội dung các shard")
+    p.add_argument('shard_dir', nargs='?', default=SHARD_DIR)
+    p.add_argument('--boundaries', default=BOUNDARIES_2025_FILE)
+    p = sub.add_parser('info', help="Liệt kê các shard trong manifest")
+    p.add_argument('shard_dir', nargs='?', default=SHARD_DIR)
+    args = parser.parse_args()
+
+    if args.cmd == 'build':
+        if shapely is None:
+            print("❌ Cần shapely để chia shard (pip install shapely)")
+            return 1
+        build_from_json(args.json_path, args.out, args.mode, args.boundaries, args.grid_size)
+        return 0
+
+    if args.cmd == 'verify':
+        errors = verify_shards(args.shard_dir, args.boundaries)
+        for error in errors[:50]:
+            print(f"❌ {error}")
+        if errors:
+            print(f"❌ {len(errors)} lỗi")
+            return 1
+        print(f"✅ Shard hợp lệ ({args.shard_dir})")
+        return 0
+
+    manifest = load_manifest(args.shard_dir)
+    if manifest is None:
+        print(f"❌ Không có {MANIFEST_FILE} trong {args.shard_dir}")
+        return 1
+    print(f"Mode {manifest['mode']}, {len(manifest['shards'])} shard, {manifest['total']} feature "
+          f"(từ {manifest['roads']} con đường), {manifest['generated']}")
+    for entry in sorted(manifest['shards'], key=lambda e: -e['bytes']):
+        print(f"  {entry['key']:<24} {entry['features']:>7} feature ({entry['clipped']:>5} cắt) "
+              f"{entry['bytes'] / (1024*1024):8.2f} MB  {entry['name']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,695 @@
+"""
+Cập nhật tăng dần dữ liệu đường từ luồng thay đổi OSM, thay cho tải lại toàn bộ ô / PBF.
+
+Mỗi lần dựng (download_vn_roads_full.py) ghi kèm trạng thái mức way:
+    vn_roads_full.ways.ndjson   các way đã khử trùng, cùng bố cục chunk: [[name, ref, highway], ways]
+                                way = [way_id, first_node, last_node, coords, nodes]
+    vn_roads_full.state.json    mốc dữ liệu OSM (osm_timestamp), nguồn, road_types, số đường / way
+Lần cập nhật (--update):
+    1. lấy way đổi từ mốc: Overpass [adiff:"mốc"] (out geom, kèm tọa độ) hoặc file osmChange (.osc)
+    2. áp lên trạng thái theo way id: bỏ way bị xóa / sửa / có node bị dời, dựng lại các way đó
+       (node thiếu tọa độ tra trong trạng thái, rồi trong file PBF gốc) -> 2 chunk, ghi lại file
+       đích như lần dựng đầy đủ (đường gộp theo key nên chỉ key bị đổi là khác)
+    3. so file cũ / mới theo key -> patch (feature thêm / sửa / xóa) trong assets/roads/patches/
+apply_patch(file cũ, patch) cho lại đúng file mới (kiểm tra sha1 cả 2 đầu) -> app chỉ cần tải patch.
+
+Dùng:
+    python tools/download_vn_roads_full.py --update                       # Overpass adiff
+    python tools/download_vn_roads_full.py --update --osc 123.osc.gz --pbf  # file .osc + PBF gốc
+    python tools/road_updates.py apply assets/roads/vn_roads_full.json PATCH
+    python tools/road_updates.py selftest      # cập nhật (.osc / adiff) == dựng lại, patch == file mới
+"""
+import argparse
+import collections
+import gzip
+import hashlib
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from json.decoder import scanstring
+
+import numpy as np
+
+import pbf_roads
+from road_shards import read_header
+
+PATCH_DIR = 'assets/roads/patches'
+STATE_VERSION = 1
+PATCH_VERSION = 1
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ' # Cùng dạng mốc thời gian của Overpass / osmosis
+MIN_POINTS = 2 # Way còn ít hơn số node có tọa độ này thì bỏ (như pbf_roads)
+KEY_PREFIXES = ('{"name": "', ', "ref": "', ', "road_type": "')
+
+
+def state_path(output_file):
+    return os.path.splitext(output_file)[0] + '.state.json'
+
+
+def ways_path(output_file):
+    return os.path.splitext(output_file)[0] + '.ways.ndjson'
+
+
+def patch_path(output_file, since, until, patch_dir=PATCH_DIR):
+    """vn_roads_full.20261001T000000Z_20261008T000000Z.patch.json"""
+    def compact(stamp):
+        return (stamp or 'unknown').replace('-', '').replace(':', '')
+    stem = os.path.splitext(os.path.basename(output_file))[0]
+    return os.path.join(patch_dir, f"{stem}.{compact(since)}_{compact(until)}.patch.json")
+
+
+def file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_json_atomic(path, data):
+    with open(path + '.part', 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(path + '.part', path)
+
+
+# --- TRẠNG THÁI MỨC WAY ---
+
+class StateWriter:
+    """Ghi ways.ndjson trong lúc stream các đường (đã khử trùng), đóng lại thì ghi .state.json
+    meta: osm_timestamp, source, road_types... (xem download_vn_roads_full.write_outputs)"""
+
+    def __init__(self, output_file, meta):
+        self.path = ways_path(output_file)
+        self.state_file = state_path(output_file)
+        self.meta = dict(meta)
+        self.roads = 0
+        self.ways = 0
+        self.f = open(self.path + '.part', 'w', encoding='utf-8')
+
+    def add(self, key, ways):
+        self.f.write(json.dumps([list(key), ways], ensure_ascii=False))
+        self.f.write('\n')
+        self.roads += 1
+        self.ways += len(ways)
+
+    def close(self):
+        self.f.close()
+        os.replace(self.path + '.part', self.path)
+        state = {'version': STATE_VERSION}
+        state.update(self.meta)
+        state.update(generated=time.strftime(TIME_FORMAT, time.gmtime()), roads=self.roads, ways=self.ways)
+        write_json_atomic(self.state_file, state)
+        return state
+
+
+def load_state(output_file):
+    path = state_path(output_file)
+    if not os.path.exists(path) or not os.path.exists(ways_path(output_file)):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        state = json.load(f)
+    return state if state.get('version') == STATE_VERSION else None
+
+
+def iter_rows(path):
+    """Các dòng [[name, ref, highway], ways] của ways.ndjson / chunk -> (key, ways)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            key, ways = json.loads(line)
+            yield tuple(key), ways
+
+
+# --- LUỒNG THAY ĐỔI ---
+
+class Changes:
+    """Thay đổi gom theo id, bản sau cùng thắng
+    ways       {way_id: element kiểu Overpass JSON ('nodes', 'tags', 'geometry' nếu có) | None (xóa)}
+    nodes      {node_id: [lon, lat] | None (xóa)} - chỉ có với .osc (adiff đã kèm tọa độ trong way)
+    timestamp  mốc dữ liệu sau khi áp (osm_base của adiff / timestamp lớn nhất trong .osc)"""
+
+    def __init__(self):
+        self.ways = {}
+        self.nodes = {}
+        self.timestamp = None
+        self.counts = collections.Counter() # (action, loại) -> số lượng
+
+    def stamp(self, timestamp):
+        if timestamp and (self.timestamp is None or timestamp > self.timestamp):
+            self.timestamp = timestamp
+
+    def summary(self):
+        return ', '.join(f"{action} {kind}: {count}" for (action, kind), count in sorted(self.counts.items())) \
+            or "không có thay đổi"
+
+
+def way_element(el):
+    """<way> (XML OSM) -> dict như element của Overpass JSON; nd có lat/lon (out geom) -> 'geometry'"""
+    nodes, geometry = [], []
+    for nd in el.iter('nd'):
+        nodes.append(int(nd.get('ref')))
+        if nd.get('lat') is not None:
+            geometry.append({'lat': float(nd.get('lat')), 'lon': float(nd.get('lon'))})
+    element = {'type': 'way', 'id': int(el.get('id')), 'nodes': nodes,
+               'tags': {tag.get('k'): tag.get('v') for tag in el.iter('tag')}}
+    if geometry:
+        element['geometry'] = geometry
+    return element
+
+
+def parse_adiff(root, changes=None):
+    """Augmented diff của Overpass ([adiff:...] + out geom): mỗi <action> create / modify / delete.
+    Way ra khỏi tập query (đổi tag) cũng là delete. root: Element hoặc bytes/str XML"""
+    if not isinstance(root, ET.Element):
+        root = ET.fromstring(root)
+    changes = Changes() if changes is None else changes
+    remark = root.find('remark')
+    if remark is not None and (remark.text or '').strip():
+        raise ValueError(f"Overpass báo lỗi: {remark.text.strip()}")
+    meta = root.find('meta')
+    if meta is not None:
+        changes.stamp(meta.get('osm_base'))
+    for action in root.iter('action'):
+        kind = action.get('type')
+        new = action if kind == 'create' else action.find('new')
+        way = new.find('way') if new is not None else None
+        if way is None:
+            way = action.find('old/way')
+        if way is None: # node / relation: tọa độ mới đã nằm trong way bị ảnh hưởng
+            continue
+        changes.ways[int(way.get('id'))] = None if kind == 'delete' else way_element(way)
+        changes.counts[(kind, 'way')] += 1
+    return changes
+
+
+def read_adiff(path, changes=None):
+    with open(path, 'rb') as f:
+        return parse_adiff(f.read(), changes)
+
+
+def read_osc(paths, changes=None):
+    """Các file osmChange (.osc / .osc.gz, vd. bản diff phút/ngày) theo thứ tự áp dụng.
+    Giữ mọi node (tọa độ để dời node / dựng way mới) và way; relation bỏ qua"""
+    changes = Changes() if changes is None else changes
+    for path in paths:
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rb') as f:
+            action = None
+            for event, el in ET.iterparse(f, events=('start', 'end')):
+                if event == 'start':
+                    if el.tag in ('create', 'modify', 'delete'):
+                        action = el.tag
+                    continue
+                if el.tag not in ('node', 'way', 'relation') or action is None:
+                    continue
+                changes.stamp(el.get('timestamp'))
+                changes.counts[(action, el.tag)] += 1
+                if el.tag == 'node':
+                    changes.nodes[int(el.get('id'))] = \
+                        None if action == 'delete' else [float(el.get('lon')), float(el.get('lat'))]
+                elif el.tag == 'way':
+                    changes.ways[int(el.get('id'))] = None if action == 'delete' else way_element(el)
+                el.clear()
+    return changes
+
+
+# --- ÁP THAY ĐỔI ---
+
+def _inside(elements, mask):
+    """Giữ element có ít nhất 1 node trong lãnh thổ (như pbf_roads / area của Overpass)"""
+    if mask is None or not elements:
+        return elements
+    counts = [len(el['geometry']) for el in elements]
+    points = [p for el in elements for p in el['geometry']]
+    inside = mask.contains_points(np.array([p['lon'] for p in points]), np.array([p['lat'] for p in points]))
+    if inside is None:
+        return elements
+    starts = np.cumsum([0] + counts[:-1])
+    return [el for el, ok in zip(elements, np.logical_or.reduceat(inside, starts).tolist()) if ok]
+
+
+def apply_changes(ways_file, changes, road_types, process, base_path, mask=None, node_source=None,
+                  workers=None):
+    """Áp changes lên trạng thái ways_file:
+    - ghi base_path: các đường cũ (đã sắp xếp theo key) bỏ đi way bị xóa / sửa / có node bị dời
+    - trả về (processed, stats): processed = process(element của các way cần dựng lại) - cùng dạng
+      process_elements, ghi ra chunk thứ 2 rồi merge như lần dựng đầy đủ
+    Node không có tọa độ (.osc chỉ ghi node đổi): tra trong trạng thái, rồi trong node_source
+    (file PBF của lần dựng trước); thiếu node_source mà vẫn cần -> ValueError"""
+    stats = collections.Counter()
+    touched = set(changes.nodes)
+    pending = {way_id: el for way_id, el in changes.ways.items() if el is not None}
+    needed = {n for el in pending.values() if 'geometry' not in el for n in el['nodes']
+              if n not in changes.nodes}
+    known = {}
+    with open(base_path + '.part', 'w', encoding='utf-8') as out:
+        for key, ways in iter_rows(ways_file):
+            kept = []
+            for way in ways:
+                nodes = way[4] if len(way) > 4 else []
+                if needed and not needed.isdisjoint(nodes):
+                    known.update((n, c) for n, c in zip(nodes, way[3]) if n in needed)
+                if way[0] in changes.ways:
+                    stats['removed' if changes.ways[way[0]] is None else 'modified'] += 1
+                    continue
+                if touched and not touched.isdisjoint(nodes):
+                    # Node bị dời: dựng lại way với tag cũ, tọa độ cũ cho các node không đổi
+                    known.update(zip(nodes, way[3]))
+                    pending[way[0]] = {'type': 'way', 'id': way[0], 'nodes': nodes,
+                                       'tags': {'name': key[0], 'ref': key[1], 'highway': key[2]}}
+                    stats['moved'] += 1
+                    continue
+                if touched and not nodes:
+                    stats['no_nodes'] += 1
+                kept.append(way)
+            stats['kept'] += len(kept)
+            if kept:
+                out.write(json.dumps([list(key), kept], ensure_ascii=False))
+                out.write('\n')
+    os.replace(base_path + '.part', base_path)
+
+    missing = {n for el in pending.values() if 'geometry' not in el for n in el['nodes']
+               if n not in changes.nodes and n not in known}
+    if missing:
+        if node_source is None:
+            raise ValueError(f"{len(missing)} node của way đổi không có tọa độ trong .osc / trạng thái "
+                             f"-> cần file PBF của lần dựng trước (--pbf) hoặc dựng lại đầy đủ")
+        found = pbf_roads.lookup_nodes(node_source, missing, workers)
+        stats['looked_up'] = len(found)
+        known.update(found)
+
+    elements = []
+    for way_id in sorted(pending):
+        el = pending[way_id]
+        if 'geometry' not in el:
+            nodes, geometry = [], []
+            for n in el['nodes']:
+                coord = changes.nodes[n] if n in changes.nodes else known.get(n)
+                if coord is not None: # Node bị xóa / không có trong extract: bỏ như pbf_roads
+                    nodes.append(n)
+                    geometry.append({'lon': coord[0], 'lat': coord[1]})
+            el = dict(el, nodes=nodes, geometry=geometry)
+        if el['tags'].get('highway') in road_types and len(el['geometry']) >= MIN_POINTS:
+            elements.append(el)
+    elements = _inside(elements, mask)
+    processed = process(elements)
+    stats['rebuilt'] = sum(len(ways) for ways in processed.values())
+    return processed, stats
+
+
+def print_apply_stats(stats):
+    print(f"  Trạng thái: giữ {stats['kept']} way, bỏ {stats['removed']} way bị xóa, "
+          f"{stats['modified']} way sửa, {stats['moved']} way có node bị dời")
+    print(f"  Dựng lại {stats['rebuilt']} way" +
+          (f" (tra {stats['looked_up']} node trong PBF gốc)" if stats['looked_up'] else ""))
+    if stats['no_nodes']:
+        print(f"  ⚠️ {stats['no_nodes']} way trong trạng thái không có danh sách node "
+              f"-> không dời node được (dựng lại đầy đủ 1 lần)")
+
+
+# --- PATCH ---
+
+def feature_key(body):
+    """(name, ref, road_type) từ text JSON 1 feature, không parse cả feature"""
+    values = []
+    end = 0
+    for prefix in KEY_PREFIXES:
+        if not body.startswith(prefix, end):
+            feature = json.loads(body)
+            return feature['name'], feature['ref'], feature['road_type']
+        value, end = scanstring(body, end + len(prefix))
+        values.append(value)
+    return tuple(values)
+
+
+def iter_feature_lines(path):
+    """(key, text JSON) từng feature của file do RoadsJsonWriter ghi (mỗi feature 1 dòng, theo key)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.startswith('    {'):
+                body = line.strip()
+                if body.endswith(','):
+                    body = body[:-1]
+                yield feature_key(body), body
+
+
+def diff_roads(old_path, new_path):
+    """So 2 file đường (đều sắp xếp theo key): (removed keys, modified texts, added texts, số feature cũ, mới)"""
+    removed, modified, added = [], [], []
+    totals = [0, 0]
+    old_iter, new_iter = iter_feature_lines(old_path), iter_feature_lines(new_path)
+    old, new = next(old_iter, None), next(new_iter, None)
+    while old is not None or new is not None:
+        if new is None or (old is not None and old[0] < new[0]):
+            removed.append(old[0])
+            old = next(old_iter, None)
+            totals[0] += 1
+        elif old is None or new[0] < old[0]:
+            added.append(new[1])
+            new = next(new_iter, None)
+            totals[1] += 1
+        else:
+            if old[1] != new[1]:
+                modified.append(new[1])
+            old, new = next(old_iter, None), next(new_iter, None)
+            totals[0] += 1
+            totals[1] += 1
+    return removed, modified, added, totals[0], totals[1]
+
+
+def write_patch(old_path, new_path, path, since=None, until=None):
+    """Ghi patch từ file cũ -> mới (mỗi key / feature 1 dòng). Trả về (removed, modified, added)"""
+    removed, modified, added, old_total, new_total = diff_roads(old_path, new_path)
+    head = {
+        'version': PATCH_VERSION,
+        'from': {'osm_timestamp': since, 'sha1': file_sha1(old_path), 'total': old_total},
+        'to': {'osm_timestamp': until, 'sha1': file_sha1(new_path), 'total': new_total,
+               'header': read_header(new_path)},
+    }
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    sections = (('removed', [json.dumps(list(key), ensure_ascii=False) for key in removed]),
+                ('modified', modified), ('added', added))
+    with open(path + '.part', 'w', encoding='utf-8') as f:
+        f.write('{\n')
+        for key, value in head.items():
+            f.write(f'  {json.dumps(key)}: {json.dumps(value, ensure_ascii=False)},\n')
+        for i, (name, lines) in enumerate(sections):
+            f.write(f'  "{name}": [')
+            for j, line in enumerate(lines):
+                f.write((',\n    ' if j else '\n    ') + line)
+            f.write('\n  ]' if lines else ']')
+            f.write(',\n' if i < len(sections) - 1 else '\n')
+        f.write('}\n')
+    os.replace(path + '.part', path)
+    return len(removed), len(modified), len(added)
+
+
+def load_patch(patch):
+    if not isinstance(patch, dict):
+        with open(patch, 'r', encoding='utf-8') as f:
+            patch = json.load(f)
+    if patch.get('version') != PATCH_VERSION:
+        raise ValueError(f"Patch phiên bản {patch.get('version')} không hỗ trợ (cần {PATCH_VERSION})")
+    return patch
+
+
+def apply_patch(old_path, patch, out_path=None):
+    """Áp patch lên file đường cũ -> file mới (mặc định ghi đè old_path), giống từng byte file dựng lại.
+    patch: đường dẫn hoặc dict đã load. Sai sha1 file gốc / kết quả -> ValueError, không ghi gì.
+    Trả về số feature của file mới"""
+    patch = load_patch(patch)
+    if file_sha1(old_path) != patch['from']['sha1']:
+        raise ValueError(f"{old_path} không phải bản gốc của patch (sha1 khác) -> tải lại file đầy đủ")
+    removed = {tuple(key) for key in patch['removed']}
+    upserts = sorted(((f['name'], f['ref'], f['road_type']), json.dumps(f, ensure_ascii=False))
+                     for f in patch['modified'] + patch['added'])
+
+    def merged():
+        i = 0
+        for key, body in iter_feature_lines(old_path):
+            while i < len(upserts) and upserts[i][0] < key:
+                yield upserts[i][1]
+                i += 1
+            if i < len(upserts) and upserts[i][0] == key:
+                yield upserts[i][1]
+                i += 1
+            elif key not in removed:
+                yield body
+        for _, body in upserts[i:]:
+            yield body
+
+    out_path = out_path or old_path
+    digest = hashlib.sha1()
+    total = 0
+    with open(out_path + '.part', 'wb') as f:
+        def write(text):
+            data = text.encode('utf-8')
+            digest.update(data)
+            f.write(data)
+        # Cùng bố cục với RoadsJsonWriter của download_vn_roads_full.py
+        write('{\n')
+        for key, value in patch['to']['header'].items():
+            write(f'  {json.dumps(key)}: {json.dumps(value, ensure_ascii=False)},\n')
+        write('  "features": [')
+        for body in merged():
+            write((',\n    ' if total else '\n    ') + body)
+            total += 1
+        write(f'\n  ],\n  "total": {total}\n}}\n')
+    if digest.hexdigest() != patch['to']['sha1']:
+        os.remove(out_path + '.part')
+        raise ValueError("Kết quả áp patch khác file đích (sha1) -> tải lại file đầy đủ")
+    os.replace(out_path + '.part', out_path)
+    return total
+
+
+# --- TỰ KIỂM TRA ---
+
+SELFTEST_SINCE = '2026-10-01T00:00:00Z'
+SELFTEST_UNTIL = '2026-10-08T00:00:00Z'
+SELFTEST_ARGS = ['--no-metrics', '--no-lod', '--no-binary', '--no-index', '--no-search', '--shards', 'none',
+                 '--workers', '1']
+
+
+def sample_changes(nodes, way_list, seed=0):
+    """Biến đổi dữ liệu pbf_roads.sample_osm như 1 tuần sửa bản đồ: xóa / đổi tên / đổi loại đường,
+    nối thêm node, dời node, thêm way mới (dùng cả node cũ không thuộc đường nào đang giữ).
+    Trả về (nodes mới, ways mới, osc) - osc: {'create'|'modify'|'delete': ({node_id: coord}, {way_id: way})}"""
+    rng = random.Random(seed + 1)
+    new_nodes = dict(nodes)
+    ways = {way_id: (list(refs), dict(tags)) for way_id, refs, tags in way_list}
+    osc = {action: ({}, {}) for action in ('create', 'modify', 'delete')}
+    next_node = max(nodes) + 1
+    next_way = max(ways) + 7
+
+    def add_node(lon, lat):
+        nonlocal next_node
+        node_id, next_node = next_node, next_node + 1
+        new_nodes[node_id] = osc['create'][0][node_id] = (round(lon, 7), round(lat, 7))
+        return node_id
+
+    for node_id in rng.sample(sorted(nodes), len(nodes) // 50): # Dời node (way chứa nó không đổi)
+        lon, lat = nodes[node_id]
+        new_nodes[node_id] = osc['modify'][0][node_id] = \
+            (round(lon + rng.uniform(-1e-3, 1e-3), 7), round(lat + rng.uniform(-1e-3, 1e-3), 7))
+    way_ids = sorted(ways)
+    all_nodes = sorted(nodes)
+    for way_id in rng.sample(way_ids, len(way_ids) // 30):
+        osc['delete'][1][way_id] = ways.pop(way_id)
+    for way_id in rng.sample(sorted(ways), len(ways) // 15):
+        refs, tags = ways[way_id]
+        change = rng.randrange(5)
+        if change == 0:
+            tags['name'] = f"Đường {rng.randint(2001, 2100)}"
+        elif change == 1:
+            tags['highway'] = rng.choice(pbf_roads.SAMPLE_HIGHWAYS)
+        elif change == 2:
+            tags.pop('name', None)
+            tags.pop('ref', None)
+        elif change == 3 and refs[-1] in new_nodes: # Mẫu có cả ref tới node không tồn tại
+            lon, lat = new_nodes[refs[-1]]
+            refs.append(add_node(lon + 0.0011, lat + 0.0009))
+        else:
+            refs.append(rng.choice(all_nodes))
+        osc['modify'][1][way_id] = (refs, tags)
+    for _ in range(len(way_ids) // 50):
+        lat, lon = rng.uniform(8.5, 23.3), rng.uniform(102.2, 109.4)
+        refs = [add_node(lon + j * 0.0013, lat + j * 0.0007) for j in range(rng.randint(2, 8))]
+        refs.insert(rng.randrange(len(refs) + 1), rng.choice(all_nodes))
+        tags = {'highway': rng.choice(pbf_roads.SAMPLE_HIGHWAYS), 'name': f"Đường mới {rng.randint(1, 50)}"}
+        ways[next_way] = osc['create'][1][next_way] = (refs, tags)
+        next_way += 7
+    # Node chỉ thuộc way đã xóa cũng bị xóa theo
+    used = {n for refs, _ in ways.values() for n in refs}
+    for refs, _ in osc['delete'][1].values():
+        for n in refs:
+            if n not in used and n in new_nodes:
+                osc['delete'][0][n] = new_nodes.pop(n)
+                osc['modify'][0].pop(n, None)
+    return new_nodes, [(way_id, refs, tags) for way_id, (refs, tags) in sorted(ways.items())], osc
+
+
+def _xml_way(parent, way_id, refs, tags, timestamp, nodes=None):
+    way = ET.SubElement(parent, 'way', id=str(way_id), version='2', timestamp=timestamp)
+    for ref in refs:
+        if nodes is None:
+            ET.SubElement(way, 'nd', ref=str(ref))
+        elif ref in nodes:
+            lon, lat = nodes[ref]
+            ET.SubElement(way, 'nd', ref=str(ref), lat=f"{lat:.7f}", lon=f"{lon:.7f}")
+    for k, v in tags.items():
+        ET.SubElement(way, 'tag', k=k, v=v)
+    return way
+
+
+def write_osc(path, osc, timestamp):
+    root = ET.Element('osmChange', version='0.6', generator='road_updates selftest')
+    for action in ('create', 'modify', 'delete'):
+        nodes, ways = osc[action]
+        section = ET.SubElement(root, action)
+        for node_id, (lon, lat) in sorted(nodes.items()):
+            ET.SubElement(section, 'node', id=str(node_id), version='2', timestamp=timestamp,
+                          lat=f"{lat:.7f}", lon=f"{lon:.7f}")
+        for way_id, (refs, tags) in sorted(ways.items()):
+            _xml_way(section, way_id, refs, tags, timestamp)
+    ET.ElementTree(root).write(path, encoding='utf-8', xml_declaration=True)
+
+
+def write_adiff(path, old, new, road_types, timestamp):
+    """Augmented diff như Overpass trả cho query way["highway"~road_types] + out geom giữa 2 bản dữ liệu
+    old/new: (nodes, way_list)"""
+    def query_set(nodes, way_list):
+        return {way_id: (refs, tags, [nodes.get(r) for r in refs])
+                for way_id, refs, tags in way_list if tags.get('highway') in road_types}
+    before, after = query_set(*old), query_set(*new)
+    root = ET.Element('osm', version='0.6', generator='road_updates selftest')
+    ET.SubElement(root, 'meta', osm_base=timestamp)
+    for way_id in sorted(set(before) | set(after)):
+        if way_id in after and before.get(way_id) == after[way_id]:
+            continue
+        kind = 'modify' if way_id in before and way_id in after else 'create' if way_id in after else 'delete'
+        action = ET.SubElement(root, 'action', type=kind)
+        if kind == 'create':
+            _xml_way(action, way_id, *after[way_id][:2], timestamp, new[0])
+            continue
+        _xml_way(ET.SubElement(action, 'old'), way_id, *before[way_id][:2], timestamp, old[0])
+        if kind == 'modify':
+            _xml_way(ET.SubElement(action, 'new'), way_id, *after[way_id][:2], timestamp, new[0])
+    ET.ElementTree(root).write(path, encoding='utf-8', xml_declaration=True)
+
+
+def selftest(ways=3000, seed=0, workdir=None):
+    """Dữ liệu giả v1 -> v2 (pbf_roads.sample_osm + sample_changes):
+    dựng v1, cập nhật bằng .osc (+ PBF gốc) và bằng adiff, so từng byte với dựng lại từ v2
+    (file JSON + trạng thái way); áp patch lên file v1 phải ra đúng file v2"""
+    if pbf_roads.osmium is None:
+        print("Lỗi: Chưa cài thư viện 'osmium'.")
+        print("Vui lòng chạy: pip install osmium")
+        return 1
+    tools = os.path.dirname(os.path.abspath(__file__))
+    repo = os.path.dirname(tools)
+    script = os.path.join(tools, 'download_vn_roads_full.py')
+    import download_vn_roads_full as dl
+    work = workdir or tempfile.mkdtemp(prefix='road_updates_')
+    os.makedirs(work, exist_ok=True)
+
+    nodes, way_list = pbf_roads.sample_osm(ways, seed)
+    new_nodes, new_ways, osc = sample_changes(nodes, way_list, seed)
+    v1, v2 = os.path.join(work, 'v1.osm.pbf'), os.path.join(work, 'v2.osm.pbf')
+    osc_file, adiff_file = os.path.join(work, 'changes.osc.gz'), os.path.join(work, 'changes.adiff.xml')
+    pbf_roads.write_osm(v1, nodes, way_list, SELFTEST_SINCE)
+    pbf_roads.write_osm(v2, new_nodes, new_ways, SELFTEST_UNTIL)
+    write_osc(osc_file[:-3], osc, SELFTEST_UNTIL)
+    with open(osc_file[:-3], 'rb') as src, gzip.open(osc_file, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    write_adiff(adiff_file, (nodes, way_list), (new_nodes, new_ways), dl.ROAD_TYPES, SELFTEST_UNTIL)
+    print(f"Dữ liệu: {len(way_list)} way -> {len(new_ways)} way, "
+          f"{sum(len(n) + len(w) for n, w in osc.values())} thay đổi ({work})")
+
+    def run(name, *extra, base=None):
+        directory = os.path.join(work, name)
+        if base is not None:
+            shutil.copytree(os.path.join(work, base), directory)
+        else:
+            os.makedirs(os.path.join(directory, os.path.dirname(dl.BOUNDARIES_FILE)))
+            shutil.copyfile(os.path.join(repo, dl.BOUNDARIES_FILE), os.path.join(directory, dl.BOUNDARIES_FILE))
+        start = time.time()
+        result = subprocess.run([sys.executable, script, *extra, *SELFTEST_ARGS], cwd=directory,
+                                capture_output=True, text=True)
+        if result.returncode != 0 or '❌' in result.stdout:
+            print(result.stdout[-2000:] + result.stderr[-2000:])
+            raise RuntimeError(f"Chạy {name} lỗi")
+        print(f"  {name:<12} {time.time() - start:6.2f}s")
+        return directory
+
+    def outputs(directory):
+        return os.path.join(directory, dl.OUTPUT_FILE), ways_path(os.path.join(directory, dl.OUTPUT_FILE))
+
+    full1 = run('full_v1', '--pbf', v1)
+    full2 = run('full_v2', '--pbf', v2)
+    updated = {'osc': run('update_osc', '--update', '--osc', osc_file, '--pbf', v1, base='full_v1'),
+               'adiff': run('update_adiff', '--update', '--adiff', adiff_file, base='full_v1')}
+    failures = 0
+    expected = [file_sha1(p) for p in outputs(full2)]
+    for mode, directory in updated.items():
+        with open(state_path(os.path.join(directory, dl.OUTPUT_FILE)), 'r', encoding='utf-8') as f:
+            stamp = json.load(f).get('osm_timestamp')
+        same = [file_sha1(p) for p in outputs(directory)] == expected and stamp == SELFTEST_UNTIL
+        failures += not same
+        print(f"{'✅' if same else '❌'} Cập nhật bằng {mode} {'==' if same else '!='} dựng lại từ v2 "
+              f"(JSON + trạng thái way, mốc {stamp})")
+
+    old_json = outputs(full1)[0]
+    patches = os.path.join(updated['osc'], PATCH_DIR)
+    patch_file = os.path.join(patches, os.listdir(patches)[0])
+    patched = os.path.join(work, 'patched.json')
+    try:
+        total = apply_patch(old_json, patch_file, patched)
+        same = file_sha1(patched) == expected[0]
+    except ValueError as e:
+        total, same = 0, False
+        print(f"  {e}")
+    failures += not same
+    patch = load_patch(patch_file)
+    print(f"{'✅' if same else '❌'} apply_patch(v1, patch) {'==' if same else '!='} v2: {total} đường, "
+          f"patch {os.path.getsize(patch_file) / 1024:.1f} KB / file {os.path.getsize(old_json) / 1024:.1f} KB "
+          f"(xóa {len(patch['removed'])}, sửa {len(patch['modified'])}, thêm {len(patch['added'])})")
+    try:
+        apply_patch(outputs(full2)[0], patch_file, patched)
+        print("❌ Patch áp được lên file không phải bản gốc")
+        failures += 1
+    except ValueError:
+        print("✅ Từ chối patch khi file gốc không khớp")
+    if workdir is None and not failures:
+        shutil.rmtree(work)
+    return 1 if failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cập nhật tăng dần dữ liệu đường (patch giữa 2 bản)")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('diff', help="Tạo patch từ 2 file đường (cũ, mới)")
+    p.add_argument('old')
+    p.add_argument('new')
+    p.add_argument('-o', '--output', required=True)
+    p = sub.add_parser('apply', help="Áp patch lên file đường cũ")
+    p.add_argument('old')
+    p.add_argument('patch')
+    p.add_argument('-o', '--output', help="File kết quả (mặc định ghi đè file cũ)")
+    p = sub.add_parser('info', help="Tóm tắt 1 patch")
+    p.add_argument('patch')
+    p = sub.add_parser('selftest', help="Cập nhật (.osc / adiff) == dựng lại, patch == file mới (cần pyosmium)")
+    p.add_argument('--ways', type=int, default=3000)
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--keep', metavar='DIR', help="Giữ thư mục làm việc tại DIR")
+    args = parser.parse_args()
+
+    if args.command == 'diff':
+        counts = write_patch(args.old, args.new, args.output)
+        print(f"✅ Xóa {counts[0]}, sửa {counts[1]}, thêm {counts[2]} đường → {args.output} "
+              f"({os.path.getsize(args.output) / 1024:.1f} KB)")
+    elif args.command == 'apply':
+        try:
+            total = apply_patch(args.old, args.patch, args.output)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return 1
+        print(f"✅ {total} con đường → {args.output or args.old}")
+    elif args.command == 'info':
+        patch = load_patch(args.patch)
+        for side in ('from', 'to'):
+            print(f"{side:>4}: mốc {patch[side]['osm_timestamp']}, {patch[side]['total']} đường, "
+                  f"sha1 {patch[side]['sha1']}")
+        print(f"Xóa {len(patch['removed'])}, sửa {len(patch['modified'])}, thêm {len(patch['added'])} đường")
+    elif args.command == 'selftest':
+        return selftest(args.ways, args.seed, args.keep)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
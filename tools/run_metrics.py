@@ -0,0 +1,264 @@
+"""
+Số liệu chạy (metrics) dạng NDJSON + lấy mẫu RSS + profiler lấy mẫu, chỉ dùng thư viện chuẩn.
+
+Mỗi dòng trong file metrics là 1 sự kiện JSON có 'event' và 't' (giây từ lúc bắt đầu):
+    request  1 lần gửi HTTP: server, status, wait (chờ slot + token bucket), seconds, bytes
+    tile     1 ô đã xử lý xong: server, attempts, wait, http, total, bytes, elements,
+             parse (json.loads), merge (process_elements + ghi chunk), outcome (ok/split/failed/cache)
+    rss      mẫu bộ nhớ tiến trình (MB), mỗi RSS_SAMPLE_SECONDS giây
+    phase    1 giai đoạn (cache, download, write...): seconds, rss đầu/cuối
+Xem lại 1 lần chạy:
+    python tools/run_metrics.py summary assets/roads/run_metrics.ndjson
+"""
+import argparse
+import collections
+import json
+import os
+import sys
+import threading
+import time
+
+RSS_SAMPLE_SECONDS = 1.0
+PROFILE_INTERVAL = 0.005 # giây giữa 2 lần lấy mẫu stack
+PERCENTILES = (50, 90, 99)
+# Hàm lá của thread đang chờ (không tốn CPU), bỏ khỏi bảng top của profiler
+IDLE_FUNCTIONS = {'wait', 'select', 'poll', '_worker', 'get', 'acquire', 'sleep', 'accept', 'readinto'}
+
+
+def current_rss_mb():
+    """RSS hiện tại (MB): /proc/self/statm trên Linux, không có thì lấy max RSS của resource"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def percentile(sorted_values, p):
+    """Percentile kiểu nearest-rank trên list đã sắp xếp"""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-p * len(sorted_values) // 100))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def format_percentiles(values):
+    values = sorted(values)
+    return ', '.join(f"p{p} {percentile(values, p):.2f}s" for p in PERCENTILES) if values else '-'
+
+
+class MetricsRecorder:
+    """Ghi sự kiện ra NDJSON (an toàn khi gọi từ nhiều thread). Dùng với `with`"""
+
+    def __init__(self, path, rss_interval=RSS_SAMPLE_SECONDS):
+        self.path = path
+        self.start = time.monotonic()
+        self.lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.f = open(path, 'w', encoding='utf-8')
+        self._stop = threading.Event()
+        self._sampler = None
+        if rss_interval:
+            self._sampler = threading.Thread(target=self._sample_rss, args=(rss_interval,), daemon=True)
+            self._sampler.start()
+
+    def record(self, event, **fields):
+        entry = {'event': event, 't': round(time.monotonic() - self.start, 4)}
+        entry.update(fields)
+        line = json.dumps(entry, ensure_ascii=False)
+        with self.lock:
+            self.f.write(line + '\n')
+
+    def rss(self):
+        return round(current_rss_mb(), 1)
+
+    def _sample_rss(self, interval):
+        while not self._stop.wait(interval):
+            self.record('rss', rss_mb=self.rss())
+
+    def phase(self, name):
+        return _Phase(self, name)
+
+    def close(self):
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        self.record('rss', rss_mb=self.rss())
+        with self.lock:
+            self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class NullRecorder:
+    """Cùng giao diện MetricsRecorder nhưng không ghi gì (--no-metrics)"""
+    path = None
+
+    def record(self, event, **fields):
+        pass
+
+    def rss(self):
+        return None
+
+    def phase(self, name):
+        return _Phase(self, name)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+class _Phase:
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        self.rss_start = self.recorder.rss()
+        return self
+
+    def __exit__(self, *exc):
+        self.recorder.record('phase', name=self.name, seconds=round(time.monotonic() - self.start, 3),
+                             rss_start_mb=self.rss_start, rss_end_mb=self.recorder.rss())
+
+
+# --- PROFILER LẤY MẪU ---
+
+class StackSampler:
+    """Profiler lấy mẫu: 1 thread nền chụp stack của mọi thread mỗi `interval` giây
+    (sys._current_frames), nên chi phí thấp và thấy được cả thread xử lý ô lẫn event loop.
+    Kết quả ghi dạng "collapsed stack" (1 dòng = stack;stack;hàm số_mẫu), mở bằng
+    speedscope.app hoặc flamegraph.pl."""
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def top(self, limit=15):
+        """(hàm, số mẫu tự thân, số mẫu tổng) - bỏ các thread đang ngủ chờ (hàm lá là wait/select)"""
+        own, total = collections.Counter(), collections.Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(';')
+            if frames[-1].split(' ')[0] in IDLE_FUNCTIONS:
+                continue
+            own[frames[-1]] += count
+            for name in set(frames):
+                total[name] += count
+        return [(name, own[name], total[name]) for name, _ in own.most_common(limit)]
+
+
+def print_profile(sampler, path, limit=15):
+    sampler.write(path)
+    print(f"\nProfiler: {sampler.samples} lần lấy mẫu (mỗi {sampler.interval * 1000:.0f} ms) → {path}")
+    busy = sum(own for _, own, _ in sampler.top(None)) or 1
+    for name, own, total in sampler.top(limit):
+        print(f"  {own / busy * 100:5.1f}% tự thân  {total / busy * 100:5.1f}% tổng  {name}")
+
+
+# --- TÓM TẮT ---
+
+def load_events(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize(events, slowest=5):
+    """Các dòng tóm tắt: theo server (percentile độ trễ), theo ô, giai đoạn, bộ nhớ"""
+    lines = []
+    requests = [e for e in events if e['event'] == 'request']
+    tiles = [e for e in events if e['event'] == 'tile']
+    by_server = collections.defaultdict(list)
+    for e in requests:
+        by_server[e.get('server')].append(e)
+    if by_server:
+        lines.append("Server (độ trễ HTTP các request thành công / thời gian chờ slot):")
+    for server, reqs in sorted(by_server.items(), key=lambda kv: str(kv[0])):
+        statuses = collections.Counter(str(e.get('status')) for e in reqs)
+        ok = [e['seconds'] for e in reqs if e.get('status') == 200]
+        mb = sum(e.get('bytes') or 0 for e in reqs) / (1024 * 1024)
+        lines.append(f"  {server}: {len(reqs)} request ({', '.join(f'{k}: {v}' for k, v in sorted(statuses.items()))}), "
+                     f"{mb:.1f} MB")
+        lines.append(f"      trễ {format_percentiles(ok)} | chờ {format_percentiles([e['wait'] for e in reqs])}")
+
+    if tiles:
+        outcomes = collections.Counter(e['outcome'] for e in tiles)
+        lines.append(f"Ô: {len(tiles)} ({', '.join(f'{k}: {v}' for k, v in sorted(outcomes.items()))})")
+        # Ô lấy từ cache không có số liệu tải, nhưng vẫn có parse / ghi chunk
+        for field, label in (('total', 'tải (gồm thử lại)'), ('parse', 'parse JSON'), ('merge', 'xử lý + ghi chunk')):
+            values = [e[field] for e in tiles if e.get(field) is not None]
+            if values:
+                lines.append(f"  {label:<18} tổng {sum(values):8.1f}s  {format_percentiles(values)}")
+        downloaded = [e for e in tiles if e.get('total') is not None]
+        for e in sorted(downloaded, key=lambda e: -e['total'])[:slowest]:
+            lines.append(f"  chậm: ô {e['tile']} {e.get('total', 0):.1f}s qua {e.get('server')} "
+                         f"({e.get('attempts')} lần, {e['outcome']}{', ' + e['error'] if e.get('error') else ''})")
+
+    for e in (e for e in events if e['event'] == 'phase'):
+        lines.append(f"Giai đoạn {e['name']:<10} {e['seconds']:8.1f}s  RSS {e.get('rss_start_mb')} -> "
+                     f"{e.get('rss_end_mb')} MB")
+    rss = [e['rss_mb'] for e in events if e['event'] == 'rss' and e.get('rss_mb') is not None]
+    if rss:
+        lines.append(f"RSS: đỉnh {max(rss):.0f} MB, cuối {rss[-1]:.0f} MB ({len(rss)} mẫu)")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Xem số liệu 1 lần chạy tải đường (NDJSON)")
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p = sub.add_parser('summary', help="Tóm tắt file metrics")
+    p.add_argument('path')
+    p.add_argument('--slowest', type=int, default=5, help="Số ô chậm nhất cần liệt kê")
+    args = parser.parse_args()
+    if args.cmd == 'summary':
+        for line in summarize(load_events(args.path), args.slowest):
+            print(line)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
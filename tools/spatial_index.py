@@ -0,0 +1,406 @@
+"""
+Chỉ mục không gian tĩnh (packed Hilbert R-tree, kiểu Flatbush) cho bbox các feature.
+
+File sidecar .rtree nằm cạnh file dữ liệu chính:
+    vn_roads_full.json -> vn_roads_full.rtree
+Kết quả truy vấn là chỉ số feature (dùng trực tiếp với GeoBinaryReader.feature(i))
+kèm vị trí byte [offset, length) của feature đó trong file JSON (đọc 1 dòng, không parse cả file).
+
+Bố cục (little-endian):
+    HEADER      magic 'VNRT', version, node_size, num_items, num_nodes, num_levels
+    LEVELS      u64[num_levels]      vị trí kết thúc của từng tầng
+    BOXES       f64[num_nodes, 4]    (min_lon, min_lat, max_lon, max_lat)
+    INDICES     u32[num_nodes]       lá: chỉ số feature, nút trong: vị trí con đầu tiên
+    OFFSETS     u64[num_items, 2]    (byte offset, byte length) trong file JSON
+
+Dùng:
+    python tools/spatial_index.py build assets/roads/vn_roads_full.json
+    python tools/spatial_index.py query assets/roads/vn_roads_full.rtree 20.9 105.7 21.1 105.9
+    python tools/spatial_index.py nearest assets/roads/vn_roads_full.rtree 21.028 105.854 -k 5
+    (nearest đo tới geometry thật, đọc từ .vngb/.json cạnh .rtree; --bbox-only: chỉ lọc ứng viên theo bbox)
+"""
+import argparse
+import heapq
+import json
+import math
+import mmap
+import os
+import struct
+import time
+
+import numpy as np
+
+from geo_arrays import geometry_array
+
+MAGIC = b'VNRT'
+FORMAT_VERSION = 1
+NODE_SIZE = 16
+HEADER_STRUCT = struct.Struct('<4sHHQQQ')
+HILBERT_MAX = (1 << 16) - 1
+
+
+def index_path(data_path):
+    return os.path.splitext(data_path)[0] + '.rtree'
+
+
+def hilbert_index(x, y):
+    """Giá trị Hilbert 32-bit của lưới 16-bit (vector hóa, thuật toán giống Flatbush)"""
+    x = x.astype(np.uint32)
+    y = y.astype(np.uint32)
+    a = x ^ y
+    b = 0xFFFF ^ a
+    c = 0xFFFF ^ (x | y)
+    d = x & (y ^ 0xFFFF)
+
+    A = a | (b >> 1)
+    B = (a >> 1) ^ a
+    C = ((c >> 1) ^ (b & (d >> 1))) ^ c
+    D = ((a & (c >> 1)) ^ (d >> 1)) ^ d
+
+    a, b, c, d = A, B, C, D
+    A = (a & (a >> 2)) ^ (b & (b >> 2))
+    B = (a & (b >> 2)) ^ (b & ((a ^ b) >> 2))
+    C ^= (a & (c >> 2)) ^ (b & (d >> 2))
+    D ^= (b & (c >> 2)) ^ ((a ^ b) & (d >> 2))
+
+    a, b, c, d = A, B, C, D
+    A = (a & (a >> 4)) ^ (b & (b >> 4))
+    B = (a & (b >> 4)) ^ (b & ((a ^ b) >> 4))
+    C ^= (a & (c >> 4)) ^ (b & (d >> 4))
+    D ^= (b & (c >> 4)) ^ ((a ^ b) & (d >> 4))
+
+    a, b, c, d = A, B, C, D
+    C ^= (a & (c >> 8)) ^ (b & (d >> 8))
+    D ^= (b & (c >> 8)) ^ ((a ^ b) & (d >> 8))
+
+    a = C ^ (C >> 1)
+    b = D ^ (D >> 1)
+
+    i0 = x ^ y
+    i1 = b | (0xFFFF ^ (i0 | a))
+
+    def spread(v):
+        v = (v | (v << 8)) & 0x00FF00FF
+        v = (v | (v << 4)) & 0x0F0F0F0F
+        v = (v | (v << 2)) & 0x33333333
+        v = (v | (v << 1)) & 0x55555555
+        return v
+
+    return (spread(i1) << 1) | spread(i0)
+
+
+def build_tree(bboxes, node_size=NODE_SIZE):
+    """bboxes: mảng (n, 4) theo quy ước của dự án [south, west, north, east]
+    Trả về (level_bounds, boxes, indices)"""
+    bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+    n = len(bboxes)
+    # Chuyển sang (min_x, min_y, max_x, max_y) = (west, south, east, north)
+    leaf = bboxes[:, [1, 0, 3, 2]]
+    if n == 0:
+        return np.zeros(0, dtype=np.uint64), np.zeros((0, 4)), np.zeros(0, dtype=np.uint32)
+
+    cx = (leaf[:, 0] + leaf[:, 2]) / 2
+    cy = (leaf[:, 1] + leaf[:, 3]) / 2
+    def norm(v):
+        lo, hi = v.min(), v.max()
+        return np.floor(HILBERT_MAX * (v - lo) / (hi - lo)) if hi > lo else np.zeros_like(v)
+    order = np.argsort(hilbert_index(norm(cx), norm(cy)), kind='stable')
+
+    levels_boxes = [leaf[order]]
+    levels_idx = [order.astype(np.uint32)]
+    level_bounds = [n]
+    pos = n
+    while len(levels_boxes[-1]) > 1:
+        child = levels_boxes[-1]
+        starts = np.arange(0, len(child), node_size)
+        parent = np.empty((len(starts), 4))
+        parent[:, 0] = np.minimum.reduceat(child[:, 0], starts)
+        parent[:, 1] = np.minimum.reduceat(child[:, 1], starts)
+        parent[:, 2] = np.maximum.reduceat(child[:, 2], starts)
+        parent[:, 3] = np.maximum.reduceat(child[:, 3], starts)
+        child_level_start = pos - len(child)
+        levels_boxes.append(parent)
+        levels_idx.append((child_level_start + starts).astype(np.uint32))
+        pos += len(parent)
+        level_bounds.append(pos)
+    return (np.array(level_bounds, dtype=np.uint64),
+            np.concatenate(levels_boxes),
+            np.concatenate(levels_idx))
+
+
+def write_index(path, bboxes, offsets=None, node_size=NODE_SIZE):
+    """Ghi file .rtree. offsets: list (byte_offset, byte_length) của từng feature trong JSON"""
+    level_bounds, boxes, indices = build_tree(bboxes, node_size)
+    n = len(bboxes)
+    if offsets is None:
+        offsets = np.zeros((n, 2), dtype=np.uint64)
+    offsets = np.asarray(offsets, dtype='<u8').reshape(-1, 2)
+    tmp_path = path + '.part'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER_STRUCT.pack(MAGIC, FORMAT_VERSION, node_size, n, len(boxes), len(level_bounds)))
+        f.write(level_bounds.astype('<u8').tobytes())
+        f.write(boxes.astype('<f8').tobytes())
+        f.write(indices.astype('<u4').tobytes())
+        pad = (-f.tell()) % 8
+        f.write(b'\0' * pad)
+        f.write(offsets.tobytes())
+    os.replace(tmp_path, path)
+    return len(boxes)
+
+
+class SpatialIndex:
+    """Đọc .rtree qua mmap. Tọa độ vào/ra theo quy ước dự án: lat/lon, bbox [south, west, north, east]"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.node_size, self.num_items, num_nodes, num_levels = \
+            HEADER_STRUCT.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: không phải file VNRT")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{path}: phiên bản {version} không hỗ trợ")
+        pos = HEADER_STRUCT.size
+        self.level_bounds = np.frombuffer(self._mm, '<u8', num_levels, pos)
+        pos += 8 * num_levels
+        self.boxes = np.frombuffer(self._mm, '<f8', num_nodes * 4, pos).reshape(-1, 4)
+        pos += 32 * num_nodes
+        self.indices = np.frombuffer(self._mm, '<u4', num_nodes, pos)
+        pos += 4 * num_nodes
+        pos += (-pos) % 8
+        self.offsets = np.frombuffer(self._mm, '<u8', self.num_items * 2, pos).reshape(-1, 2)
+        # Bản sao dạng list Python: duyệt cây nhanh hơn so với truy cập từng phần tử numpy
+        self._boxes = self.boxes.tolist()
+        self._indices = self.indices.tolist()
+        self._level_bounds = self.level_bounds.tolist()
+
+    def close(self):
+        self.level_bounds = self.boxes = self.indices = self.offsets = None
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _level_end(self, pos):
+        for end in self._level_bounds:
+            if pos < end:
+                return end
+        return self._level_bounds[-1]
+
+    def query_bbox(self, south, west, north, east):
+        """Chỉ số các feature có bbox giao với vùng [south, west, north, east]"""
+        if not self.num_items:
+            return []
+        boxes, indices, n = self._boxes, self._indices, self.num_items
+        root = len(boxes) - 1
+        b = boxes[root]
+        if east < b[0] or north < b[1] or west > b[2] or south > b[3]:
+            return []
+        if root < n: # Cây chỉ có 1 lá
+            return [indices[root]]
+        results = []
+        stack = [root]
+        while stack:
+            start = indices[stack.pop()]
+            end = min(start + self.node_size, self._level_end(start))
+            for pos in range(start, end):
+                b = boxes[pos]
+                if east < b[0] or north < b[1] or west > b[2] or south > b[3]:
+                    continue
+                if pos < n:
+                    results.append(indices[pos])
+                else:
+                    stack.append(pos)
+        return results
+
+    def nearest(self, lat, lon, k=1, max_distance=None, distance_fn=None):
+        """k feature gần điểm (lat, lon) nhất, trả về list (chỉ số, khoảng cách độ).
+
+        distance_fn(item) -> khoảng cách thật tới geometry (>= khoảng cách bbox, vd. geometry_distance):
+        kết quả được xếp theo khoảng cách thật, bbox chỉ dùng để cắt nhánh.
+        Không có distance_fn: khoảng cách tới bbox (kinh độ co theo cos(lat)) - chỉ là bước lọc ứng viên,
+        mọi feature có bbox chứa điểm đều cách 0.0° và ra theo thứ tự bất kỳ.
+        """
+        if not self.num_items:
+            return []
+        boxes, indices, n = self._boxes, self._indices, self.num_items
+        kx = math.cos(math.radians(lat))
+
+        def box_dist(b):
+            dx = (b[0] - lon if lon < b[0] else lon - b[2] if lon > b[2] else 0.0) * kx
+            dy = b[1] - lat if lat < b[1] else lat - b[3] if lat > b[3] else 0.0
+            return math.sqrt(dx * dx + dy * dy)
+
+        # heap: (khoảng cách, loại, vị trí): loại 0 = nút, 1 = lá (bbox), 2 = lá (khoảng cách thật)
+        heap = [(box_dist(boxes[-1]), 0, len(boxes) - 1)]
+        results = []
+        while heap and len(results) < k:
+            dist, kind, pos = heapq.heappop(heap)
+            if max_distance is not None and dist > max_distance:
+                break
+            if kind == 2 or (kind == 1 and distance_fn is None):
+                results.append((indices[pos], dist))
+                continue
+            if kind == 1:
+                heapq.heappush(heap, (distance_fn(indices[pos]), 2, pos))
+                continue
+            if pos < n: # Cây chỉ có 1 lá
+                heapq.heappush(heap, (dist, 1, pos))
+                continue
+            start = indices[pos]
+            end = min(start + self.node_size, self._level_end(start))
+            for child in range(start, end):
+                heapq.heappush(heap, (box_dist(boxes[child]), 1 if child < n else 0, child))
+        return results
+
+    def read_json_feature(self, json_path, item):
+        """Đọc đúng 1 feature từ file JSON nhờ byte offset (không parse cả file)"""
+        offset, length = (int(v) for v in self.offsets[item])
+        if not length:
+            raise ValueError("Chỉ mục không có byte offset cho file JSON")
+        with open(json_path, 'rb') as f:
+            f.seek(offset)
+            return json.loads(f.read(length).decode('utf-8'))
+
+
+def geometry_distance(lat, lon, geometry):
+    """Khoảng cách (độ, kinh độ co theo cos(lat) như nearest) từ điểm tới geometry GeoJSON.
+    Điểm nằm trong Polygon/MultiPolygon -> 0"""
+    coords, offsets = geometry_array(geometry)
+    if not len(coords):
+        return math.inf
+    p = (coords - (lon, lat)) * (math.cos(math.radians(lat)), 1.0)
+    best = float((p * p).sum(axis=1).min())
+    a, b = p[:-1], p[1:]
+    # Bỏ đoạn nối điểm cuối part này với điểm đầu part sau
+    valid = np.ones(len(a), dtype=bool)
+    valid[offsets[1:-1] - 1] = False
+    a, b = a[valid], b[valid]
+    if len(a):
+        d = b - a
+        dd = (d * d).sum(axis=1)
+        t = np.clip(-(a * d).sum(axis=1) / np.where(dd > 0, dd, 1.0), 0.0, 1.0)
+        q = a + t[:, None] * d
+        best = min(best, float((q * q).sum(axis=1).min()))
+        if geometry.get('type') in ('Polygon', 'MultiPolygon'):
+            # Chẵn-lẻ số lần tia +x từ điểm cắt các cạnh ring (lỗ thủng tự trừ ra)
+            cross = (a[:, 1] > 0) != (b[:, 1] > 0)
+            x = a[cross, 0] - a[cross, 1] * d[cross, 0] / d[cross, 1]
+            if int((x > 0).sum()) % 2:
+                return 0.0
+    return math.sqrt(best)
+
+
+def feature_loader(index_path, data_path=None):
+    """Hàm item -> feature, đọc từ .vngb (ưu tiên) hoặc .json cùng tên với .rtree.
+    Trả về (loader, đường dẫn, reader cần đóng) hoặc (None, None, None) nếu không có file dữ liệu"""
+    stem = os.path.splitext(index_path)[0]
+    candidates = [data_path] if data_path else [stem + '.vngb', stem + '.json']
+    for path in candidates:
+        if not os.path.exists(path):
+            continue
+        if path.endswith('.vngb'):
+            from geo_binary import GeoBinaryReader
+            reader = GeoBinaryReader(path)
+            return reader.feature, path, reader
+        with SpatialIndex(index_path) as index:
+            offsets = index.offsets.copy()
+        if not offsets[:, 1].any():
+            continue # Chỉ mục không có byte offset -> không đọc lẻ từng feature được
+        def load(item, path=path, offsets=offsets):
+            offset, length = (int(v) for v in offsets[item])
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                return json.loads(f.read(length).decode('utf-8'))
+        return load, path, None
+    return None, None, None
+
+
+def scan_json_features(json_path):
+    """Duyệt file JSON do RoadsJsonWriter ghi (mỗi feature 1 dòng): (offset, length, feature)"""
+    with open(json_path, 'rb') as f:
+        offset = 0
+        for line in f:
+            stripped = line.strip()
+            if stripped.startswith(b'{"'):
+                start = offset + line.index(b'{')
+                body = stripped[:-1] if stripped.endswith(b',') else stripped
+                yield start, len(body), json.loads(body.decode('utf-8'))
+            offset += len(line)
+
+
+def build_from_json(json_path, out_path=None):
+    bboxes, offsets = [], []
+    for offset, length, feature in scan_json_features(json_path):
+        bboxes.append(feature['bbox'])
+        offsets.append((offset, length))
+    if not bboxes:
+        # File JSON không theo dạng mỗi feature 1 dòng -> chỉ dựng chỉ mục, không có offset
+        with open(json_path, 'r', encoding='utf-8') as f:
+            bboxes = [feat['bbox'] for feat in json.load(f).get('features', [])]
+        offsets = None
+    out_path = out_path or index_path(json_path)
+    write_index(out_path, bboxes, offsets)
+    return out_path, len(bboxes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chỉ mục R-tree tĩnh cho bbox các feature")
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p = sub.add_parser('build', help="Dựng file .rtree từ file JSON")
+    p.add_argument('json_path')
+    p.add_argument('out_path', nargs='?')
+    p = sub.add_parser('query', help="Tìm feature giao với bbox")
+    p.add_argument('index_path')
+    p.add_argument('bbox', nargs=4, type=float, metavar=('SOUTH', 'WEST', 'NORTH', 'EAST'))
+    p = sub.add_parser('nearest', help="Tìm feature gần điểm nhất (theo geometry)")
+    p.add_argument('index_path')
+    p.add_argument('lat', type=float)
+    p.add_argument('lon', type=float)
+    p.add_argument('-k', type=int, default=1)
+    p.add_argument('--data', help="File .vngb/.json chứa geometry (mặc định: cùng tên với .rtree)")
+    p.add_argument('--bbox-only', action='store_true',
+                   help="Chỉ xếp theo khoảng cách tới bbox (lọc ứng viên, không đọc geometry)")
+    args = parser.parse_args()
+
+    if args.cmd == 'build':
+        start = time.time()
+        out_path, count = build_from_json(args.json_path, args.out_path)
+        print(f"✅ Chỉ mục {count} feature → {out_path} ({time.time() - start:.2f}s)")
+    elif args.cmd == 'query':
+        with SpatialIndex(args.index_path) as index:
+            start = time.perf_counter()
+            items = index.query_bbox(*args.bbox)
+            elapsed = (time.perf_counter() - start) * 1e6
+            print(f"{len(items)} feature ({elapsed:.0f} µs): {items[:50]}")
+    elif args.cmd == 'nearest':
+        load, data_path, reader = (None, None, None) if args.bbox_only else feature_loader(args.index_path, args.data)
+        if load is None and not args.bbox_only:
+            print("⚠️  Không có file geometry cạnh chỉ mục (dùng --data) -> chỉ xếp theo bbox")
+        if load is not None:
+            def distance_fn(item):
+                return geometry_distance(args.lat, args.lon, load(item)['geometry'])
+        else:
+            distance_fn = None
+        try:
+            with SpatialIndex(args.index_path) as index:
+                start = time.perf_counter()
+                items = index.nearest(args.lat, args.lon, args.k, distance_fn=distance_fn)
+                elapsed = (time.perf_counter() - start) * 1e6
+                mode = f"geometry từ {data_path}" if load is not None else "bbox"
+                print(f"({elapsed:.0f} µs, khoảng cách tới {mode})")
+                for item, dist in items:
+                    name = load(item).get('name', '') if load is not None else ''
+                    print(f"  #{item}: {dist:.5f}° (~{dist * 111_320:.0f} m) {name}".rstrip())
+        finally:
+            if reader is not None:
+                reader.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Cache từng ô lưới Overpass trên đĩa + manifest ghi lại trạng thái tải.
+
+Key của mỗi ô = hash(bbox, tập loại đường, hash câu query), nên khi đổi
+ROAD_TYPES hoặc câu query thì ô cũ tự động bị coi là "chưa có".
+Manifest (manifest.json) lưu: status, bytes, elements, fetched_at, fetch_seconds.
+"""
+import hashlib
+import json
+import os
+import time
+
+MANIFEST_NAME = 'manifest.json'
+
+STATUS_OK = 'ok'
+STATUS_FAILED = 'failed'
+STATUS_SPLIT = 'split' # Ô bị timeout/quá lớn -> đã chia thành 4 ô con
+
+
+def query_hash(query):
+    """Hash câu query (bỏ khoảng trắng thừa để format lại code không làm mất cache)"""
+    normalized = ' '.join(query.split())
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:16]
+
+
+def tile_key(bbox, road_types, qhash):
+    raw = json.dumps([list(bbox), sorted(road_types), qhash])
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:20]
+
+
+class TileCache:
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.manifest_path = os.path.join(cache_dir, MANIFEST_NAME)
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        self.tiles = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                self.tiles = json.load(f).get('tiles', {})
+
+    def data_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def entry(self, key):
+        return self.tiles.get(key)
+
+    def is_ok(self, key):
+        """Ô đã tải thành công VÀ file dữ liệu vẫn còn trên đĩa"""
+        entry = self.tiles.get(key)
+        return (entry is not None
+                and entry.get('status') == STATUS_OK
+                and os.path.exists(self.data_path(key)))
+
+    def load(self, key):
+        with open(self.data_path(key), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def store(self, key, bbox, road_types, qhash, raw, elements, fetch_seconds):
+        """Lưu nguyên bytes response (không serialize lại) + cập nhật manifest"""
+        path = self.data_path(key)
+        with open(path + '.part', 'wb') as f:
+            f.write(raw)
+        os.replace(path + '.part', path)
+        self.tiles[key] = {
+            'bbox': list(bbox),
+            'road_types': sorted(road_types),
+            'query_hash': qhash,
+            'status': STATUS_OK,
+            'bytes': len(raw),
+            'elements': elements,
+            'fetched_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'fetch_seconds': round(fetch_seconds, 2),
+        }
+        self.save()
+
+    def mark_failed(self, key, bbox, road_types, qhash, error, fetch_seconds):
+        self.tiles[key] = {
+            'bbox': list(bbox),
+            'road_types': sorted(road_types),
+            'query_hash': qhash,
+            'status': STATUS_FAILED,
+            'error': str(error),
+            'fetched_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'fetch_seconds': round(fetch_seconds, 2),
+        }
+        self.save()
+
+    def mark_split(self, key, bbox, road_types, qhash, reason, fetch_seconds):
+        self.mark_failed(key, bbox, road_types, qhash, reason, fetch_seconds)
+        self.tiles[key]['status'] = STATUS_SPLIT
+        self.save()
+
+    def hints(self, qhash=None):
+        """bbox -> entry, dùng để lập kế hoạch chia ô (ưu tiên entry của query hiện tại)"""
+        result = {}
+        for entry in self.tiles.values():
+            bbox = tuple(entry['bbox'])
+            if bbox not in result or entry.get('query_hash') == qhash:
+                result[bbox] = entry
+        return result
+
+    def save(self):
+        """Ghi manifest atomic sau mỗi ô -> chết giữa chừng vẫn không mất tiến độ"""
+        tmp_path = self.manifest_path + '.part'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'tiles': self.tiles}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.manifest_path)
+
+    def summary(self):
+        ok = sum(1 for e in self.tiles.values() if e.get('status') == STATUS_OK)
+        failed = sum(1 for e in self.tiles.values() if e.get('status') == STATUS_FAILED)
+        total_bytes = sum(e.get('bytes', 0) for e in self.tiles.values())
+        return ok, failed, total_bytes
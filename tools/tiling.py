@@ -0,0 +1,160 @@
+"""
+Chia ô lưới thích ứng (quadtree) cho việc tải Overpass.
+
+- Bỏ các ô không giao với lãnh thổ Việt Nam (biển, Lào, Campuchia...)
+- Ô bị timeout / quá lớn -> chia 4 (quadrant) và tải lại
+- Ô thưa (tổng số đường của 4 ô con nhỏ) -> gộp lại thành ô cha ở lần lập kế hoạch sau
+
+Một ô (tile) là tuple (lat, lon, size) với (lat, lon) là góc tây nam.
+Kích thước luôn là ROOT_TILE_SIZE / 2^k nên bbox luôn là số thực chính xác
+(dùng được làm key cache).
+"""
+import json
+
+try:
+    from shapely.geometry import shape, box
+    from shapely.prepared import prep
+    import shapely
+except ImportError: # Không có shapely -> không lọc theo lãnh thổ (vẫn chạy được)
+    shape = None
+
+COUNTRY_NAME = 'Việt Nam'
+
+ROOT_TILE_SIZE = 2.0     # Ô gốc (độ)
+MIN_TILE_SIZE = 0.125    # Không chia nhỏ hơn mức này
+MERGE_ELEMENTS = 4000    # Tổng số way của 4 ô con dưới ngưỡng này -> gộp thành ô cha
+COUNTRY_BUFFER = 0.02    # Nới rộng lãnh thổ (độ) để không bỏ sót đường sát biên/bờ biển
+
+
+def tile_bbox(tile):
+    lat, lon, size = tile
+    return (lat, lon, lat + size, lon + size)
+
+
+def quadrants(tile):
+    lat, lon, size = tile
+    half = size / 2
+    return [
+        (lat, lon, half),
+        (lat, lon + half, half),
+        (lat + half, lon, half),
+        (lat + half, lon + half, half),
+    ]
+
+
+def can_split(tile):
+    return tile[2] / 2 >= MIN_TILE_SIZE
+
+
+class CountryMask:
+    """Kiểm tra ô có giao với lãnh thổ VN không (prepared geometry của shapely)"""
+
+    def __init__(self, boundaries_file):
+        self.prepared = None
+        self.geometry = None
+        if shape is None:
+            print("⚠️ Chưa cài shapely -> không lọc ô theo lãnh thổ (pip install shapely)")
+            return
+        with open(boundaries_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        for feat in data.get('features', []):
+            if feat.get('type') == 'country' and feat.get('name') == COUNTRY_NAME:
+                self.geometry = shape(feat['geometry']).buffer(COUNTRY_BUFFER)
+                self.prepared = prep(self.geometry)
+                break
+        if self.prepared is None:
+            print(f"⚠️ Không tìm thấy '{COUNTRY_NAME}' trong {boundaries_file} -> không lọc ô")
+
+    def intersects(self, tile):
+        if self.prepared is None:
+            return True
+        lat, lon, size = tile
+        return self.prepared.intersects(box(lon, lat, lon + size, lat + size))
+
+    def contains_points(self, lons, lats):
+        """Mảng bool: điểm nào nằm trong lãnh thổ (đã nới rộng) - vector hóa, cần shapely 2"""
+        if self.geometry is None:
+            return None
+        shapely.prepare(self.geometry)
+        return shapely.intersects_xy(self.geometry, lons, lats)
+
+
+def root_tiles(bounds, mask):
+    tiles = []
+    lat = bounds[0]
+    while lat < bounds[2]:
+        lon = bounds[1]
+        while lon < bounds[3]:
+            tile = (lat, lon, ROOT_TILE_SIZE)
+            if mask.intersects(tile):
+                tiles.append(tile)
+            lon += ROOT_TILE_SIZE
+        lat += ROOT_TILE_SIZE
+    return tiles
+
+
+def split_tile(tile, mask):
+    """Chia 4 ô, bỏ các ô con nằm ngoài lãnh thổ"""
+    return [q for q in quadrants(tile) if mask.intersects(q)]
+
+
+def plan_tiles(bounds, mask, hints, is_cached):
+    """Lập danh sách ô cần xử lý từ quadtree + kinh nghiệm các lần chạy trước
+
+    hints: dict bbox -> {'status': 'ok'|'split'|'failed', 'elements': n}
+           (lấy từ manifest, kể cả các lần chạy với ROAD_TYPES khác)
+    is_cached(tile): ô đã có dữ liệu hợp lệ trong cache cho query hiện tại
+    """
+    def known_elements(tile):
+        """Tổng số way đã biết của cả cây con (None nếu chưa biết đủ)"""
+        hint = hints.get(tile_bbox(tile))
+        if hint and hint.get('status') == 'ok':
+            return hint.get('elements', 0)
+        if not can_split(tile):
+            return None
+        total = 0
+        for child in split_tile(tile, mask):
+            n = known_elements(child)
+            if n is None:
+                return None
+            total += n
+        return total
+
+    def has_hints_below(tile):
+        if not can_split(tile):
+            return False
+        return any(hints.get(tile_bbox(c)) or has_hints_below(c) for c in split_tile(tile, mask))
+
+    def subtree_cached(tile):
+        if is_cached(tile):
+            return True
+        hint = hints.get(tile_bbox(tile))
+        if hint and hint.get('status') == 'ok':
+            return False
+        children = split_tile(tile, mask) if can_split(tile) else []
+        return bool(children) and all(subtree_cached(c) for c in children)
+
+    def expand(tile):
+        if is_cached(tile):
+            return [tile]
+        hint = hints.get(tile_bbox(tile))
+        children = split_tile(tile, mask) if can_split(tile) else []
+        if hint and hint.get('status') == 'split' and children:
+            return [t for c in children for t in expand(c)]
+        if hint and hint.get('status') == 'ok':
+            return [tile]
+        if children and has_hints_below(tile):
+            # Lần trước đã chia nhỏ ô này. Nếu các ô con đã nằm sẵn trong cache thì
+            # dùng lại; nếu phải tải lại mà tổng số đường nhỏ -> gộp (ô thưa).
+            if subtree_cached(tile):
+                return [t for c in children for t in expand(c)]
+            total = known_elements(tile)
+            if total is not None and total < MERGE_ELEMENTS:
+                return [tile]
+            return [t for c in children for t in expand(c)]
+        return [tile]
+
+    plan = []
+    for root in root_tiles(bounds, mask):
+        plan.extend(expand(root))
+    return plan
@@ -0,0 +1,783 @@
+"""
+Cắt dữ liệu đường + ranh giới thành vector tile (Mapbox Vector Tile) và ghi ra file MBTiles.
+
+App chỉ cần đọc đúng các tile đang hiển thị (đã cắt, đã simplify theo zoom) thay vì
+parse cả file JSON đường ~150 MB rồi vẽ polyline lớn.
+
+- Mỗi tác vụ là 1 dải tile (cùng zoom, cùng cột x, một đoạn hàng y) -> chạy trên process pool.
+  Worker chỉ đọc các đường giao với dải đó nhờ chỉ mục .rtree (byte offset vào file JSON),
+  chiếu sang Web Mercator 1 lần rồi cắt / simplify từng tile bằng shapely (vector hóa).
+- Mã hóa lệnh geometry MVT (MoveTo / LineTo / ClosePath, delta + zigzag + varint) bằng numpy
+  cho cả layer cùng lúc.
+- Process chính ghi tile (gzip) vào SQLite theo lô executemany trong 1 transaction.
+
+Layer:
+    roads       LineString  name, ref, road_type (road_type xuất hiện từ ROAD_MIN_ZOOM)
+    boundaries  Polygon     name, type, admin_level
+
+Dùng:
+    python tools/vector_tiles.py build --roads assets/roads/vn_roads_full.json \\
+        --boundaries assets/boundaries/vn_boundaries.json --output assets/vietnam_vector.mbtiles
+    python tools/vector_tiles.py verify assets/vietnam_vector.mbtiles --roads ... --boundaries ...
+    python tools/vector_tiles.py info assets/vietnam_vector.mbtiles
+    python tools/vector_tiles.py decode assets/vietnam_vector.mbtiles 10 812 451
+"""
+import argparse
+import collections
+import concurrent.futures
+import json
+import math
+import os
+import sqlite3
+import time
+import zlib
+
+import numpy as np
+
+try:
+    import shapely
+except ImportError:
+    shapely = None
+
+from geo_arrays import lines_array
+from osm_pbf import decode_packed_python, iter_fields
+from spatial_index import SpatialIndex, build_from_json, index_path
+
+# --- CẤU HÌNH ---
+MIN_ZOOM = 5
+MAX_ZOOM = 12 # App tự phóng to (overzoom) tile zoom 12 cho các mức lớn hơn
+EXTENT = 4096 # Số đơn vị mỗi cạnh tile (chuẩn MVT)
+BUFFER = 64 # Đơn vị vẽ thêm ra ngoài mép tile (tránh hở nét ở biên tile)
+SIMPLIFY_UNITS = 1.0 # Sai số simplify (đơn vị tile) - nhỏ hơn thì mắt thường không thấy
+ROWS_PER_TASK = 32 # Số tile (hàng y) mỗi tác vụ gửi cho 1 process
+INSERT_BATCH = 500 # Số tile mỗi lượt executemany
+ROAD_CACHE_FEATURES = 5000 # Số đường đã chiếu giữ trong RAM mỗi worker (LRU)
+MAX_LAT = 85.0511287798 # Giới hạn Web Mercator
+
+# Zoom nhỏ nhất hiển thị từng loại đường (zoom nhỏ chỉ giữ trục chính -> tile nhẹ)
+ROAD_MIN_ZOOM = {
+    'motorway': 5,
+    'trunk': 5,
+    'primary': 7,
+    'secondary': 9,
+    'tertiary': 10,
+}
+ROAD_PROPS = ('name', 'ref', 'road_type')
+BOUNDARY_PROPS = ('name', 'type', 'admin_level')
+
+GEOM_LINESTRING = 2
+GEOM_POLYGON = 3
+CMD_MOVE_TO, CMD_LINE_TO, CMD_CLOSE_PATH = 1, 2, 7
+
+
+# --- WEB MERCATOR ---
+
+def project(lon, lat):
+    """lon/lat (mảng) -> tọa độ Web Mercator chuẩn hóa [0, 1] (y hướng xuống)"""
+    lat = np.clip(lat, -MAX_LAT, MAX_LAT)
+    x = (np.asarray(lon) + 180.0) / 360.0
+    y = 0.5 - np.log(np.tan(np.pi / 4 + np.radians(lat) / 2)) / (2 * np.pi)
+    return x, y
+
+
+def tile_range(bbox, zoom):
+    """bbox [south, west, north, east] -> (x_min, y_min, x_max, y_max) các tile phủ bbox"""
+    south, west, north, east = bbox
+    n = 1 << zoom
+    x0, y0 = project(west, north)
+    x1, y1 = project(east, south)
+    clamp = lambda v: min(max(int(math.floor(v * n)), 0), n - 1)
+    return clamp(x0), clamp(y0), clamp(x1), clamp(y1)
+
+
+def tile_lonlat_bbox(z, x, y, buffer=0.0):
+    """[south, west, north, east] của tile (nới thêm buffer, đơn vị: phần cạnh tile)"""
+    n = 1 << z
+    def lat(v):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * v / n))))
+    return [lat(y + 1 + buffer), (x - buffer) / n * 360.0 - 180.0,
+            lat(y - buffer), (x + 1 + buffer) / n * 360.0 - 180.0]
+
+
+# --- MÃ HÓA PROTOBUF / MVT ---
+
+def _encode_varint(value):
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+_SMALL_VARINTS = [_encode_varint(v) for v in range(1 << 14)] # Tra bảng: nhanh hơn tính lại
+
+
+def encode_varint(value):
+    return _SMALL_VARINTS[value] if value < 16384 else _encode_varint(value)
+
+
+def field_bytes(field, data):
+    return encode_varint(field << 3 | 2) + encode_varint(len(data)) + data
+
+
+def field_varint(field, value):
+    return encode_varint(field << 3) + encode_varint(value)
+
+
+def encode_varints(values):
+    """Mảng số nguyên không âm (< 2^35) -> (bytes varint nối liền, byte offset của từng số)"""
+    values = np.asarray(values, dtype=np.uint64)
+    nbytes = np.ones(len(values), dtype=np.int64)
+    for bits in (7, 14, 21, 28):
+        nbytes += values >= (1 << bits)
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    np.cumsum(nbytes, out=offsets[1:])
+    owner = np.repeat(np.arange(len(values)), nbytes)
+    pos = np.arange(offsets[-1]) - offsets[owner]
+    out = ((values[owner] >> (7 * pos).astype(np.uint64)) & np.uint64(0x7F)).astype(np.uint8)
+    out[pos < nbytes[owner] - 1] |= 0x80
+    return out.tobytes(), offsets
+
+
+def command(cmd, count):
+    return (cmd & 0x7) | (count << 3)
+
+
+def zigzag32(values):
+    return ((values << 1) ^ (values >> 31)).astype(np.int64) & 0xFFFFFFFF
+
+
+def _part_sums(values, offsets):
+    """Tổng values theo từng part (part rỗng -> 0)"""
+    cum = np.zeros(len(values) + 1, dtype=np.result_type(values, np.int64))
+    np.cumsum(values, out=cum[1:])
+    return cum[offsets[1:]] - cum[offsets[:-1]]
+
+
+def _dedupe(points, offsets, ring=False):
+    """Bỏ điểm lặp liên tiếp (sau khi làm tròn về lưới tile) trong từng part.
+    ring: ring không lặp điểm đóng -> bỏ cả điểm cuối trùng điểm đầu"""
+    keep = np.ones(len(points), dtype=bool)
+    keep[1:] = (points[1:] != points[:-1]).any(axis=1)
+    nonempty = np.diff(offsets) > 0
+    keep[offsets[:-1][nonempty]] = True
+    if ring:
+        first, last = offsets[:-1][nonempty], offsets[1:][nonempty] - 1
+        keep[last] &= (points[last] != points[first]).any(axis=1) | (last == first)
+    counts = _part_sums(keep, offsets)
+    new_offsets = np.zeros(len(offsets), dtype=np.int64)
+    np.cumsum(counts, out=new_offsets[1:])
+    return points[keep], new_offsets
+
+
+def _ring_areas(points, offsets):
+    """Diện tích có dấu (công thức shoelace, hệ tọa độ tile: y hướng xuống) của từng ring"""
+    if not len(points):
+        return np.zeros(len(offsets) - 1)
+    nxt = np.arange(1, len(points) + 1)
+    nonempty = np.diff(offsets) > 0
+    nxt[offsets[1:][nonempty] - 1] = offsets[:-1][nonempty] # Điểm cuối ring nối về điểm đầu
+    cross = points[:, 0] * points[nxt, 1] - points[nxt, 0] * points[:, 1]
+    return _part_sums(cross, offsets) / 2.0
+
+
+def encode_geometries(points, offsets, part_feature, polygon, exterior=None):
+    """Chuỗi lệnh geometry MVT của nhiều feature trong 1 lượt numpy.
+
+    points: mảng int (n, 2) tọa độ tile, part i là points[offsets[i]:offsets[i+1]]
+    part_feature: feature của từng part (tăng dần); polygon: các part là ring
+    (không lặp điểm đóng), exterior: bool từng ring là vỏ ngoài.
+    Trả về (bytes, byte offset bắt đầu từng part, byte offset kết thúc từng part)."""
+    counts = np.diff(offsets)
+    if polygon:
+        # Vỏ ngoài: diện tích dương (chiều kim đồng hồ khi y hướng xuống), lỗ: âm
+        areas = _ring_areas(points, offsets)
+        flip = np.flatnonzero((areas > 0) != exterior)
+        for i in flip.tolist():
+            points[offsets[i]:offsets[i + 1]] = points[offsets[i]:offsets[i + 1]][::-1].copy()
+    # Delta so với điểm trước đó trong cùng feature (con trỏ reset về 0 ở đầu mỗi feature)
+    deltas = np.diff(points, axis=0, prepend=np.zeros((1, 2), dtype=points.dtype))
+    first_part = np.ones(len(part_feature), dtype=bool)
+    first_part[1:] = part_feature[1:] != part_feature[:-1]
+    feature_starts = offsets[:-1][first_part]
+    deltas[feature_starts] = points[feature_starts]
+
+    lengths = 2 + 2 * counts + (1 if polygon else 0) # MoveTo, x, y, LineTo, ... (+ ClosePath)
+    part_start = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=part_start[1:])
+    ints = np.zeros(part_start[-1], dtype=np.int64)
+    ints[part_start[:-1]] = command(CMD_MOVE_TO, 1)
+    ints[part_start[:-1] + 3] = command(CMD_LINE_TO, 1) + ((counts - 2) << 3)
+    if polygon:
+        ints[part_start[1:] - 1] = command(CMD_CLOSE_PATH, 1)
+    owner = np.repeat(np.arange(len(counts)), counts)
+    k = np.arange(len(points)) - offsets[owner]
+    pos = part_start[owner] + 1 + 2 * k + (k >= 1)
+    zz = zigzag32(deltas)
+    ints[pos] = zz[:, 0]
+    ints[pos + 1] = zz[:, 1]
+    data, byte_offsets = encode_varints(ints)
+    return data, byte_offsets[part_start[:-1]], byte_offsets[part_start[1:]]
+
+
+class LayerBuilder:
+    """Gom feature của 1 layer: bảng key / value dùng chung, mỗi feature là tags + geometry"""
+
+    def __init__(self, name):
+        self.name = name
+        self.keys = {}
+        self.values = {}
+        self.features = []
+        self._tags = {} # id(props) -> tags đã mã hóa (props sống suốt vòng đời layer)
+
+    def _index(self, table, item):
+        idx = table.get(item)
+        if idx is None:
+            idx = table[item] = len(table)
+        return idx
+
+    def add(self, props, geom_type, geometry):
+        """props: dict thuộc tính (bỏ qua giá trị rỗng), geometry: bytes lệnh đã mã hóa"""
+        tags = self._tags.get(id(props))
+        if tags is None:
+            ids = []
+            for key, value in props.items():
+                if value is None or value == '':
+                    continue
+                ids.append(self._index(self.keys, key))
+                ids.append(self._index(self.values, value))
+            tags = field_bytes(2, b''.join(map(encode_varint, ids))) if ids else b''
+            self._tags[id(props)] = tags
+        self.features.append(b''.join((tags, field_varint(3, geom_type), field_bytes(4, geometry))))
+
+    def encode(self):
+        parts = [field_varint(15, 2), field_bytes(1, self.name.encode('utf-8'))]
+        parts.extend(field_bytes(2, f) for f in self.features)
+        parts.extend(field_bytes(3, k.encode('utf-8')) for k in self.keys)
+        for value in self.values:
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                parts.append(field_bytes(4, field_bytes(1, str(value).encode('utf-8'))))
+            elif isinstance(value, int) and value >= 0:
+                parts.append(field_bytes(4, field_varint(5, value))) # uint_value
+            else:
+                parts.append(field_bytes(4, field_bytes(1, str(value).encode('utf-8'))))
+        parts.append(field_varint(5, EXTENT))
+        return b''.join(parts)
+
+
+# --- DỮ LIỆU CỦA WORKER ---
+
+class Source:
+    """Geometry đã chiếu sang Mercator chuẩn hóa: mỗi part 1 geometry shapely + STRtree
+    props[i]: thuộc tính feature i, owners[j]: feature của part j (không giảm)"""
+
+    def __init__(self, props, geoms, owners, polygon):
+        self.props = props
+        self.geoms = geoms
+        self.owners = np.asarray(owners, dtype=np.int64)
+        self.polygon = polygon
+        self.tree = shapely.STRtree(geoms)
+
+
+def _projected(coords):
+    """list [[lon, lat], ...] -> mảng (n, 2) Mercator chuẩn hóa"""
+    arr = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    return np.column_stack(project(arr[:, 0], arr[:, 1]))
+
+
+def boundary_source(features):
+    """Ranh giới: mỗi polygon (của Polygon / MultiPolygon) là 1 part"""
+    props, geoms, owners = [], [], []
+    for feature in features:
+        geometry = feature.get('geometry', {})
+        coords = geometry.get('coordinates', [])
+        polygons = [coords] if geometry.get('type') == 'Polygon' else coords
+        for rings in polygons:
+            if rings and len(rings[0]) >= 4:
+                geoms.append(shapely.Polygon(_projected(rings[0]), [_projected(r) for r in rings[1:]]))
+                owners.append(len(props))
+        props.append(feature['props'])
+    return Source(props, np.array(geoms, dtype=object), owners, True)
+
+
+def load_boundaries(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return [{'props': {k: feat.get(k) for k in BOUNDARY_PROPS}, 'geometry': feat.get('geometry', {})}
+            for feat in data.get('features', [])]
+
+
+_state = {}
+
+
+def _init_worker(roads_path, boundaries_path):
+    _state.clear()
+    _state['roads_path'] = roads_path
+    _state['roads_index'] = SpatialIndex(index_path(roads_path)) if roads_path else None
+    _state['road_cache'] = collections.OrderedDict()
+    _state['boundaries'] = boundary_source(load_boundaries(boundaries_path)) if boundaries_path else None
+
+
+def load_road(f, index, item):
+    """1 đường đã chiếu: (zoom nhỏ nhất, props, coords, offsets, bbox từng part).
+    Cache LRU trong worker: đường dài (QL1...) giao rất nhiều dải, chỉ parse JSON 1 lần."""
+    cache = _state['road_cache']
+    road = cache.get(item)
+    if road is not None:
+        cache.move_to_end(item)
+        return road
+    offset, length = (int(v) for v in index.offsets[item])
+    f.seek(offset)
+    feature = json.loads(f.read(length))
+    min_zoom = ROAD_MIN_ZOOM.get(feature.get('road_type'), MAX_ZOOM + 1)
+    parts = [p for p in feature['geometry'].get('coordinates', []) if len(p) >= 2]
+    coords, offsets = lines_array(parts)
+    coords = np.column_stack(project(coords[:, 0], coords[:, 1])) if len(coords) else coords
+    lo = np.minimum.reduceat(coords, offsets[:-1]) if parts else np.zeros((0, 2))
+    hi = np.maximum.reduceat(coords, offsets[:-1]) if parts else np.zeros((0, 2))
+    road = (min_zoom, {k: feature.get(k, '') for k in ROAD_PROPS}, coords, offsets, np.hstack([lo, hi]))
+    cache[item] = road
+    if len(cache) > ROAD_CACHE_FEATURES:
+        cache.popitem(last=False)
+    return road
+
+
+def road_source(bbox, box, zoom):
+    """Source các part đường giao dải tile: bbox [south, west, north, east] để tra .rtree,
+    box (minx, miny, maxx, maxy) Mercator để lọc từng part"""
+    index = _state['roads_index']
+    items = sorted(index.query_bbox(*bbox), key=lambda i: int(index.offsets[i][0]))
+    props, lines, owners = [], [], []
+    with open(_state['roads_path'], 'rb') as f:
+        for item in items:
+            min_zoom, road_props, coords, offsets, part_boxes = load_road(f, index, item)
+            if min_zoom > zoom:
+                continue
+            hit = np.flatnonzero((part_boxes[:, 0] <= box[2]) & (part_boxes[:, 2] >= box[0]) &
+                                 (part_boxes[:, 1] <= box[3]) & (part_boxes[:, 3] >= box[1]))
+            if not len(hit):
+                continue
+            for i in hit.tolist():
+                lines.append(coords[offsets[i]:offsets[i + 1]])
+                owners.append(len(props))
+            props.append(road_props)
+    if not lines:
+        return None
+    lengths = [len(line) for line in lines]
+    geoms = shapely.linestrings(np.concatenate(lines), indices=np.repeat(np.arange(len(lines)), lengths))
+    return Source(props, geoms, owners, False)
+
+
+# --- CẮT TILE ---
+
+def clip_source(source, box):
+    """Cắt trước theo cả dải tile: polygon lớn (cả nước) chỉ bị cắt toàn bộ 1 lần mỗi dải,
+    từng tile sau đó cắt trên mảnh nhỏ"""
+    hits = source.tree.query(shapely.box(*box))
+    if not len(hits):
+        return None
+    hits.sort()
+    geoms = shapely.clip_by_rect(source.geoms[hits], *box)
+    keep = ~shapely.is_empty(geoms)
+    return Source(source.props, geoms[keep], source.owners[hits][keep], source.polygon) if keep.any() else None
+
+
+def _layer_parts(source, z, x, y):
+    """Cắt + simplify các part giao tile, trả về (mảng int (n, 2), offsets, feature, exterior)"""
+    n = 1 << z
+    pad = BUFFER / EXTENT
+    box = ((x - pad) / n, (y - pad) / n, (x + 1 + pad) / n, (y + 1 + pad) / n)
+    hits = source.tree.query(shapely.box(*box))
+    if not len(hits):
+        return None
+    hits.sort()
+    clipped = shapely.clip_by_rect(source.geoms[hits], *box)
+    tolerance = SIMPLIFY_UNITS / (EXTENT * n)
+    clipped = shapely.simplify(clipped, tolerance, preserve_topology=source.polygon)
+    parts, part_owner = shapely.get_parts(clipped, return_index=True)
+    wanted = (shapely.get_type_id(parts) == (3 if source.polygon else 1)) & ~shapely.is_empty(parts)
+    parts, part_owner = parts[wanted], source.owners[hits][part_owner[wanted]]
+    if not len(parts):
+        return None
+    exterior = None
+    if source.polygon:
+        parts, ring_polygon = shapely.get_rings(parts, return_index=True)
+        exterior = np.ones(len(parts), dtype=bool)
+        exterior[1:] = ring_polygon[1:] != ring_polygon[:-1] # Ring đầu của mỗi polygon là vỏ ngoài
+        part_owner = part_owner[ring_polygon]
+    coords, index = shapely.get_coordinates(parts, return_index=True)
+    offsets = np.zeros(len(parts) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(index, minlength=len(parts)), out=offsets[1:])
+    points = np.empty(coords.shape, dtype=np.int64)
+    points[:, 0] = np.round((coords[:, 0] * n - x) * EXTENT)
+    points[:, 1] = np.round((coords[:, 1] * n - y) * EXTENT)
+    if source.polygon: # Bỏ điểm đóng ring (ClosePath thay thế)
+        keep = np.ones(len(points), dtype=bool)
+        keep[offsets[1:] - 1] = False
+        points = points[keep]
+        offsets = offsets - np.arange(len(offsets))
+    points, offsets = _dedupe(points, offsets, source.polygon)
+    counts = np.diff(offsets)
+    valid = counts >= (3 if source.polygon else 2)
+    if source.polygon:
+        valid &= _ring_areas(points, offsets) != 0
+        # Vỏ ngoài suy biến -> bỏ luôn các lỗ của polygon đó
+        polygon_id = np.cumsum(exterior) - 1
+        bad_polygon = np.zeros(polygon_id[-1] + 1, dtype=bool)
+        bad_polygon[polygon_id[exterior & ~valid]] = True
+        valid &= ~bad_polygon[polygon_id]
+        exterior = exterior[valid]
+    if not valid.any():
+        return None
+    # hits đã sắp xếp -> các part cùng feature luôn liền nhau, giữ nguyên thứ tự
+    points = points[np.repeat(valid, counts)]
+    offsets = np.zeros(int(valid.sum()) + 1, dtype=np.int64)
+    np.cumsum(counts[valid], out=offsets[1:])
+    return points, offsets, part_owner[valid], exterior
+
+
+def _encode_layer(name, source, z, x, y):
+    result = _layer_parts(source, z, x, y)
+    if result is None:
+        return None
+    points, offsets, part_owner, exterior = result
+    data, starts, ends = encode_geometries(points, offsets, part_owner, source.polygon, exterior)
+    layer = LayerBuilder(name)
+    geom_type = GEOM_POLYGON if source.polygon else GEOM_LINESTRING
+    boundaries = np.flatnonzero(np.diff(part_owner)) + 1
+    first = np.concatenate([[0], boundaries]).tolist()
+    last = np.concatenate([boundaries, [len(part_owner)]]).tolist()
+    for a, b in zip(first, last):
+        layer.add(source.props[part_owner[a]], geom_type, data[starts[a]:ends[b - 1]])
+    return layer.encode()
+
+
+def build_tiles(task):
+    """1 dải tile -> list (z, x, y_tms, dữ liệu gzip, số byte chưa nén)"""
+    z, x, y_first, y_last = task
+    sources = []
+    n, pad = 1 << z, BUFFER / EXTENT
+    box = ((x - pad) / n, (y_first - pad) / n, (x + 1 + pad) / n, (y_last + 1 + pad) / n)
+    if _state.get('roads_index') is not None:
+        bbox = tile_lonlat_bbox(z, x, y_first, pad)
+        bbox[0] = tile_lonlat_bbox(z, x, y_last, pad)[0]
+        roads = road_source(bbox, box, z)
+        if roads is not None:
+            sources.append(('roads', roads))
+    if _state.get('boundaries') is not None:
+        boundaries = clip_source(_state['boundaries'], box)
+        if boundaries is not None:
+            sources.append(('boundaries', boundaries))
+    tiles = []
+    for y in range(y_first, y_last + 1):
+        layers = [_encode_layer(name, source, z, x, y) for name, source in sources]
+        raw = b''.join(field_bytes(3, layer) for layer in layers if layer)
+        if raw:
+            gz = zlib.compressobj(6, zlib.DEFLATED, 31) # gzip: chuẩn của MBTiles vector
+            tiles.append((z, x, (1 << z) - 1 - y, gz.compress(raw) + gz.flush(), len(raw)))
+    return tiles
+
+
+# --- MBTILES ---
+
+def data_bbox(roads_path, boundaries_path):
+    boxes = []
+    if boundaries_path:
+        with open(boundaries_path, 'r', encoding='utf-8') as f:
+            boxes.extend(feat['bbox'] for feat in json.load(f).get('features', []) if feat.get('bbox'))
+    if roads_path:
+        with SpatialIndex(index_path(roads_path)) as index:
+            if index.num_items:
+                w, s, e, n = index.boxes[-1].tolist()
+                boxes.append([s, w, n, e])
+    arr = np.asarray(boxes)
+    return [arr[:, 0].min(), arr[:, 1].min(), arr[:, 2].max(), arr[:, 3].max()]
+
+
+def plan_tasks(bbox, min_zoom, max_zoom, rows_per_task=ROWS_PER_TASK):
+    tasks = []
+    for z in range(min_zoom, max_zoom + 1):
+        x0, y0, x1, y1 = tile_range(bbox, z)
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1, rows_per_task):
+                tasks.append((z, x, y, min(y + rows_per_task - 1, y1)))
+    return tasks
+
+
+def run_tasks(tasks, workers, initargs):
+    """Kết quả từng tác vụ (không cần giữ thứ tự: mỗi tile là 1 dòng độc lập trong SQLite)"""
+    if workers <= 1:
+        _init_worker(*initargs)
+        yield from map(build_tiles, tasks)
+        return
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                                initargs=initargs) as executor:
+        pending = set()
+        tasks = iter(tasks)
+        for task in tasks:
+            pending.add(executor.submit(build_tiles, task))
+            if len(pending) >= 4 * workers:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in concurrent.futures.as_completed(pending):
+            yield future.result()
+
+
+def metadata(bbox, min_zoom, max_zoom, roads, boundaries):
+    south, west, north, east = bbox
+    layers = []
+    if roads:
+        layers.append({'id': 'roads', 'fields': {k: 'String' for k in ROAD_PROPS},
+                       'minzoom': min(ROAD_MIN_ZOOM.values()), 'maxzoom': max_zoom})
+    if boundaries:
+        layers.append({'id': 'boundaries', 'fields': {'name': 'String', 'type': 'String', 'admin_level': 'Number'},
+                       'minzoom': min_zoom, 'maxzoom': max_zoom})
+    return {
+        'name': 'Vietnam Vector',
+        'type': 'overlay',
+        'version': '1',
+        'description': f'iDMAV vector tiles (Zoom {min_zoom}-{max_zoom})',
+        'format': 'pbf',
+        'minzoom': str(min_zoom),
+        'maxzoom': str(max_zoom),
+        'bounds': f'{west:.6f},{south:.6f},{east:.6f},{north:.6f}',
+        'center': f'{(west + east) / 2:.6f},{(south + north) / 2:.6f},{min_zoom}',
+        'json': json.dumps({'vector_layers': layers}, ensure_ascii=False),
+    }
+
+
+def write_mbtiles(output, roads_path=None, boundaries_path=None, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM,
+                  workers=None, bbox=None):
+    """Dựng file MBTiles, trả về dict số liệu (số tile, byte, thời gian từng zoom)"""
+    if shapely is None:
+        raise RuntimeError("Cần shapely 2: pip install shapely")
+    workers = workers or os.cpu_count() or 1
+    if roads_path and not os.path.exists(index_path(roads_path)):
+        print(f"  Chưa có chỉ mục {index_path(roads_path)} -> dựng từ {roads_path}")
+        build_from_json(roads_path)
+    bbox = bbox or data_bbox(roads_path, boundaries_path)
+    tasks = plan_tasks(bbox, min_zoom, max_zoom)
+
+    tmp_path = output + '.part'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    db = sqlite3.connect(tmp_path)
+    db.execute('PRAGMA journal_mode = OFF') # File tạm, lỗi giữa chừng thì dựng lại
+    db.execute('PRAGMA synchronous = OFF')
+    db.execute('CREATE TABLE metadata (name text, value text)')
+    db.execute('CREATE TABLE tiles (zoom_level integer, tile_column integer, tile_row integer, tile_data blob)')
+    db.executemany('INSERT INTO metadata (name, value) VALUES (?, ?)',
+                   metadata(bbox, min_zoom, max_zoom, roads_path, boundaries_path).items())
+
+    stats = {'tasks': len(tasks), 'tiles': 0, 'bytes': 0, 'raw_bytes': 0,
+             'zooms': collections.defaultdict(lambda: [0, 0])}
+    start = time.time()
+    batch = []
+    done = 0
+    for tiles in run_tasks(tasks, workers, (roads_path, boundaries_path)):
+        for z, x, y, data, raw_size in tiles:
+            batch.append((z, x, y, data))
+            stats['tiles'] += 1
+            stats['bytes'] += len(data)
+            stats['raw_bytes'] += raw_size
+            stats['zooms'][z][0] += 1
+            stats['zooms'][z][1] += len(data)
+        if len(batch) >= INSERT_BATCH:
+            db.executemany('INSERT INTO tiles VALUES (?, ?, ?, ?)', batch)
+            batch = []
+        done += 1
+        if done % 50 == 0 or done == len(tasks):
+            print(f"\r  Tiến độ: {done}/{len(tasks)} tác vụ, {stats['tiles']} tile, "
+                  f"{time.time() - start:.1f}s   ", end='', flush=True)
+    if batch:
+        db.executemany('INSERT INTO tiles VALUES (?, ?, ?, ?)', batch)
+    print()
+    # Tạo chỉ mục sau khi chèn xong: nhanh hơn cập nhật chỉ mục theo từng dòng
+    db.execute('CREATE UNIQUE INDEX tile_index on tiles (zoom_level, tile_column, tile_row)')
+    db.commit()
+    db.close()
+    os.replace(tmp_path, output)
+    stats['seconds'] = time.time() - start
+    return stats
+
+
+# --- GIẢI MÃ (KIỂM TRA) ---
+
+def decode_tile(data):
+    """Tile MVT (đã gzip hoặc chưa) -> {layer: [(props, geom_type, [[(x, y), ...], ...])]}"""
+    if data[:2] == b'\x1f\x8b':
+        data = zlib.decompress(data, 31)
+    result = {}
+    for field, _, (ls, le) in iter_fields(data):
+        if field != 3:
+            continue
+        layer = data[ls:le]
+        name, keys, values, features = '', [], [], []
+        for f, _, v in iter_fields(layer):
+            if f == 1:
+                name = layer[v[0]:v[1]].decode('utf-8')
+            elif f == 2:
+                features.append(layer[v[0]:v[1]])
+            elif f == 3:
+                keys.append(layer[v[0]:v[1]].decode('utf-8'))
+            elif f == 4:
+                raw = layer[v[0]:v[1]]
+                for vf, _, vv in iter_fields(raw):
+                    values.append(raw[vv[0]:vv[1]].decode('utf-8') if vf == 1 else vv)
+        decoded = []
+        for feat in features:
+            tags, geom_type, geometry = [], 0, []
+            for f, _, v in iter_fields(feat):
+                if f == 2:
+                    tags = decode_packed_python(feat, *v)
+                elif f == 3:
+                    geom_type = v
+                elif f == 4:
+                    geometry = decode_packed_python(feat, *v)
+            props = {keys[tags[i]]: values[tags[i + 1]] for i in range(0, len(tags), 2)}
+            decoded.append((props, geom_type, _decode_commands(geometry)))
+        result[name] = decoded
+    return result
+
+
+def _decode_commands(ints):
+    parts, cx, cy, i = [], 0, 0, 0
+    while i < len(ints):
+        cmd, count = ints[i] & 7, ints[i] >> 3
+        i += 1
+        if cmd == CMD_CLOSE_PATH:
+            parts[-1].append(parts[-1][0])
+            continue
+        for _ in range(count):
+            dx, dy = ints[i], ints[i + 1]
+            cx += (dx >> 1) ^ -(dx & 1)
+            cy += (dy >> 1) ^ -(dy & 1)
+            i += 2
+            if cmd == CMD_MOVE_TO:
+                parts.append([(cx, cy)])
+            else:
+                parts[-1].append((cx, cy))
+    return parts
+
+
+def read_tile(path, z, x, y):
+    """Tile theo tọa độ XYZ (y hướng xuống) từ file MBTiles (lưu theo TMS)"""
+    with sqlite3.connect(path) as db:
+        row = db.execute('SELECT tile_data FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?',
+                         (z, x, (1 << z) - 1 - y)).fetchone()
+    return row[0] if row else None
+
+
+def verify_tiles(path, roads_path=None, boundaries_path=None, sample=200, seed=0):
+    """Giải mã ngẫu nhiên các tile, so với cắt shapely (không simplify) của dữ liệu gốc:
+    chiều dài đường và diện tích ranh giới mỗi tile lệch < 2%, vỏ ngoài / lỗ đúng chiều.
+    Trả về list lỗi (rỗng = đạt)"""
+    import random
+    with sqlite3.connect(path) as db:
+        rows = db.execute('SELECT zoom_level, tile_column, tile_row, tile_data FROM tiles').fetchall()
+    random.Random(seed).shuffle(rows)
+    _init_worker(roads_path, boundaries_path)
+    errors = []
+    for z, x, tms_y, data in rows[:sample]:
+        n, pad = 1 << z, BUFFER / EXTENT
+        y = n - 1 - tms_y
+        box = ((x - pad) / n, (y - pad) / n, (x + 1 + pad) / n, (y + 1 + pad) / n)
+        decoded = decode_tile(data)
+        expected = {}
+        if roads_path:
+            bbox = tile_lonlat_bbox(z, x, y, pad)
+            source = road_source(bbox, box, z)
+            if source is not None:
+                expected['roads'] = shapely.length(shapely.clip_by_rect(source.geoms, *box)).sum() * n * EXTENT
+        if boundaries_path:
+            source = _state['boundaries']
+            expected['boundaries'] = shapely.area(shapely.clip_by_rect(source.geoms, *box)).sum() * (n * EXTENT) ** 2
+        for name, features in decoded.items():
+            total = 0.0
+            for _, geom_type, parts in features:
+                if geom_type == GEOM_LINESTRING:
+                    total += sum(shapely.length(shapely.linestrings(p)) for p in parts)
+                    continue
+                outer = None
+                for ring in parts:
+                    area = _ring_areas(np.asarray(ring[:-1]), np.array([0, len(ring) - 1]))[0]
+                    if outer is None or area > 0:
+                        outer = area
+                        if area <= 0:
+                            errors.append(f"{z}/{x}/{y} {name}: vỏ ngoài sai chiều ({area})")
+                    total += area
+            want = expected.get(name, 0.0)
+            if abs(total - want) > 0.02 * want + EXTENT:
+                errors.append(f"{z}/{x}/{y} {name}: {total:.0f} so với {want:.0f}")
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tạo vector tile (MVT) MBTiles cho đường và ranh giới")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('build', help="Cắt dữ liệu thành tile và ghi file MBTiles")
+    p.add_argument('--roads', help="File JSON đường (vn_roads_full.json), tự dựng .rtree nếu chưa có")
+    p.add_argument('--boundaries', help="File JSON ranh giới (vn_boundaries.json)")
+    p.add_argument('--output', default='assets/vietnam_vector.mbtiles')
+    p.add_argument('--min-zoom', type=int, default=MIN_ZOOM)
+    p.add_argument('--max-zoom', type=int, default=MAX_ZOOM)
+    p.add_argument('--workers', type=int)
+    p = sub.add_parser('verify', help="Giải mã tile ngẫu nhiên và so với dữ liệu gốc")
+    p.add_argument('mbtiles')
+    p.add_argument('--roads')
+    p.add_argument('--boundaries')
+    p.add_argument('--sample', type=int, default=200)
+    p = sub.add_parser('info', help="Số tile và dung lượng theo zoom")
+    p.add_argument('mbtiles')
+    p = sub.add_parser('decode', help="In nội dung 1 tile (z x y theo XYZ)")
+    p.add_argument('mbtiles')
+    p.add_argument('z', type=int)
+    p.add_argument('x', type=int)
+    p.add_argument('y', type=int)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        if not args.roads and not args.boundaries:
+            parser.error("Cần ít nhất --roads hoặc --boundaries")
+        print(f"🗺️  Tạo vector tile zoom {args.min_zoom}-{args.max_zoom} → {args.output}")
+        stats = write_mbtiles(args.output, args.roads, args.boundaries, args.min_zoom, args.max_zoom, args.workers)
+        for z in sorted(stats['zooms']):
+            count, size = stats['zooms'][z]
+            print(f"  Zoom {z:2d}: {count:6d} tile, {size / 1024:9.1f} KB")
+        print(f"✅ {stats['tiles']} tile ({stats['tasks']} tác vụ) trong {stats['seconds']:.1f}s, "
+              f"{stats['bytes'] / (1024 * 1024):.2f} MB gzip ({stats['raw_bytes'] / (1024 * 1024):.2f} MB thô)")
+        return 0
+
+    if args.command == 'verify':
+        errors = verify_tiles(args.mbtiles, args.roads, args.boundaries, args.sample)
+        for error in errors[:20]:
+            print(f"❌ {error}")
+        if errors:
+            return 1
+        print(f"✅ {args.sample} tile khớp dữ liệu gốc")
+        return 0
+
+    if args.command == 'info':
+        with sqlite3.connect(args.mbtiles) as db:
+            for name, value in db.execute('SELECT name, value FROM metadata'):
+                print(f"  {name}: {value if len(value) < 120 else value[:117] + '...'}")
+            for z, count, size in db.execute('SELECT zoom_level, COUNT(*), SUM(LENGTH(tile_data)) '
+                                             'FROM tiles GROUP BY zoom_level ORDER BY zoom_level'):
+                print(f"  Zoom {z:2d}: {count:6d} tile, {size / 1024:9.1f} KB")
+        return 0
+
+    data = read_tile(args.mbtiles, args.z, args.x, args.y)
+    if data is None:
+        print("❌ Không có tile này")
+        return 1
+    for name, features in decode_tile(data).items():
+        print(f"Layer {name}: {len(features)} feature")
+        for props, geom_type, parts in features[:20]:
+            print(f"  {props} type={geom_type} {len(parts)} part, {sum(map(len, parts))} điểm")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())